@@ -1,13 +1,15 @@
 from dotenv import load_dotenv
 import os
-from flask import Flask
+from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
+from flask_migrate import Migrate
 from config import Config
 from models.base import db
 from datetime import timedelta
 
-from utils.token_manager import TokenManager
+from utils.token_manager import TokenManager, RevokedTokenIndex, TOKEN_CLEANUP_INTERVAL_SECONDS
+from utils.scheduler import Programador
 
 load_dotenv()
 
@@ -22,6 +24,15 @@ from controllers.notification_controller import notification_bp
 from controllers.mapa_controller import parcela_bp
 from controllers.organizador_controller import organizador_bp
 from controllers.pago_controller import pago_bp
+from utils.reserva_parcelas import ReservaParcelas, RESERVA_BARRIDO_SEGUNDOS
+from utils.fotos_service import FotosService, MIGRACION_FOTOS_LOTE, FOTOS_MAX_REQUEST_BYTES, BLOB_BARRIDO_SEGUNDOS
+from utils.catalogos import Catalogos
+from utils.perfil_consultas import PerfilConsultas
+from utils.webhook_inbox import WebhookInbox, WEBHOOK_LIMPIEZA_SEGUNDOS
+from utils.aprobacion_pagos import ServicioAprobacionPagos, PAGO_AUTO_APROBACION_BARRIDO_SEGUNDOS
+from utils.mapa_relay import MapaRelay, MAPA_EVENTOS_LIMPIEZA_SEGUNDOS
+import click
+import threading
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
@@ -35,8 +46,27 @@ app.config["JWT_COOKIE_CSRF_PROTECT"] = False
 app.config["JWT_COOKIE_SAMESITE"] = "Lax"
 app.config["JWT_ACCESS_COOKIE_NAME"] = "access_token"
 
+# Detrás de nginx/apache con X-Sendfile el proxy sirve los archivos de fotos
+app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE", "false").lower() == "true"
+
+# Werkzeug corta el body al pasar este límite (también sin Content-Length)
+app.config["MAX_CONTENT_LENGTH"] = FOTOS_MAX_REQUEST_BYTES
+
+@app.before_request
+def rechazar_body_demasiado_grande():
+    """Con Content-Length declarado se rechaza antes de leer un solo byte"""
+    if request.content_length and request.content_length > app.config["MAX_CONTENT_LENGTH"]:
+        return jsonify({'msg': 'La solicitud supera el tamaño máximo permitido'}), 413
+
+@app.errorhandler(413)
+def body_demasiado_grande(error):
+    return jsonify({'msg': 'La solicitud supera el tamaño máximo permitido'}), 413
+
 jwt = JWTManager(app)
 db.init_app(app)
+# Cambios de esquema sobre bases existentes: flask db upgrade (ver migrations/)
+migrate = Migrate(app, db)
+PerfilConsultas.registrar(app)
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
@@ -94,10 +124,59 @@ with app.app_context():
             print("Tokens expirados limpiados al iniciar")
         else:
             print("No se pudieron limpiar tokens expirados")
+
+        RevokedTokenIndex.load()
+        Catalogos.cargar()
             
     except Exception as e:
         print(f"Error al inicializar base de datos: {str(e)}")
 
+# Tareas periódicas
+Programador.registrar('expirar_reservas_parcelas', RESERVA_BARRIDO_SEGUNDOS, ReservaParcelas.barrer_reservas_vencidas)
+Programador.registrar('limpiar_tokens', TOKEN_CLEANUP_INTERVAL_SECONDS, TokenManager.cleanup_expired_tokens)
+Programador.registrar('purgar_webhooks', WEBHOOK_LIMPIEZA_SEGUNDOS, WebhookInbox.purgar)
+Programador.registrar('auto_aprobar_pagos', PAGO_AUTO_APROBACION_BARRIDO_SEGUNDOS, ServicioAprobacionPagos.auto_aprobar_pendientes)
+Programador.registrar('purgar_eventos_mapa', MAPA_EVENTOS_LIMPIEZA_SEGUNDOS, MapaRelay.purgar)
+Programador.registrar('barrer_blobs_huerfanos', BLOB_BARRIDO_SEGUNDOS, FotosService.barrer_blobs_huerfanos)
+
+_tareas_iniciadas = False
+_tareas_lock = threading.Lock()
+
+@app.before_request
+def iniciar_tareas_de_fondo():
+    """
+    El programador y los workers de webhooks arrancan con el primer request
+    que atiende el proceso, no al importar app.py: así no corren durante
+    `flask db upgrade`, `flask migrar-fotos` ni en el proceso padre del
+    reloader, y con gunicorn arrancan en cada worker después del fork.
+    """
+    global _tareas_iniciadas
+    if _tareas_iniciadas:
+        return
+    with _tareas_lock:
+        if _tareas_iniciadas:
+            return
+        _tareas_iniciadas = True
+    Programador.iniciar(app)
+    # Workers que aplican las notificaciones de MercadoPago guardadas por /webhook
+    WebhookInbox.iniciar(app)
+    # Cambios del mapa hechos por otros workers (cache y clientes SSE de este)
+    MapaRelay.iniciar(app)
+
+
+@app.cli.command('limpiar-tokens')
+def limpiar_tokens_command():
+    """Borra los tokens vencidos (misma tarea que corre el programador)"""
+    TokenManager.cleanup_expired_tokens()
+    print(f"Limpieza de tokens: {TokenManager.cleanup_stats}")
+
+@app.cli.command('migrar-fotos')
+@click.option('--lote', default=MIGRACION_FOTOS_LOTE, help='Fotos por transacción')
+def migrar_fotos_command(lote):
+    """Pasa las fotos guardadas en base64 al blob store"""
+    migradas = FotosService.migrar_base64(lote)
+    print(f"Migración de fotos terminada: {migradas} foto(s)")
+
 if __name__ == '__main__':
     print("   http://localhost:5000/api/test-connection")
     print("   http://localhost:5000/api/init-db")
@@ -0,0 +1,129 @@
+# bench/hash_contrasenas.py
+"""
+Throughput y latencia del hash de contraseñas por política (esquema y
+costo), simulando N requests que hashean a la vez en un worker de gunicorn.
+Con --gevent se parchea todo como en los workers gevent de gunicorn.conf.py
+y cada request es un greenlet; un latido que duerme 10 ms mide cuánto se
+atrasa el loop (lo que espera cualquier otro request del worker, incluso
+el SSE del mapa). Compara:
+
+- en el request: el hash corre donde corre el request (con gevent,
+  bloquea el loop)
+- hilos nativos: HilosNativos.ejecutar, lo que hace PasswordPolicy para
+  los esquemas que sueltan el GIL
+- pool de procesos: ProcessPoolExecutor (spawn), lo que hace PasswordPolicy
+  para los que no lo sueltan
+
+Por defecto recorre las políticas de POLITICAS; PASSWORD_SCHEME y
+PASSWORD_ROUNDS eligen una sola. logins/s/CPU divide por las CPUs del host.
+
+    python bench/hash_contrasenas.py --gevent --hilos 8 --hashes 200
+    PASSWORD_SCHEME=pbkdf2_sha256 python bench/hash_contrasenas.py
+"""
+import sys
+
+if '--gevent' in sys.argv:
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse
+import os
+import statistics
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.password_policy import PasswordPolicy, _configuracion, _crear_contexto, _hash
+from utils.hilos_nativos import HilosNativos
+
+# (esquema, rondas): None = costo por defecto de passlib
+POLITICAS = (
+    ('sha256_crypt', None),
+    ('sha512_crypt', None),
+    ('pbkdf2_sha256', None),
+    ('pbkdf2_sha256', 100000),
+)
+
+LATIDO_SEGUNDOS = 0.01
+
+
+def correr(hilos, hashes, calcular):
+    """hashes repartidos en hilos concurrentes; devuelve (hashes/s, latencias en ms, atraso máximo del latido en ms)"""
+    latencias = []
+    atrasos = [0.0]
+    lock = threading.Lock()
+    terminado = threading.Event()
+    por_hilo = max(1, hashes // hilos)
+
+    def trabajo():
+        for i in range(por_hilo):
+            inicio = time.perf_counter()
+            calcular(f'clave-{i}')
+            with lock:
+                latencias.append((time.perf_counter() - inicio) * 1000)
+
+    def latido():
+        while not terminado.is_set():
+            inicio = time.perf_counter()
+            time.sleep(LATIDO_SEGUNDOS)
+            atrasos.append((time.perf_counter() - inicio - LATIDO_SEGUNDOS) * 1000)
+
+    monitor = threading.Thread(target=latido)
+    monitor.start()
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabajo) for _ in range(hilos)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    por_segundo = len(latencias) / (time.perf_counter() - inicio)
+    terminado.set()
+    monitor.join()
+    return por_segundo, latencias, max(atrasos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del hash de contraseñas')
+    parser.add_argument('--hilos', type=int, default=8, help='Requests concurrentes')
+    parser.add_argument('--hashes', type=int, default=200, help='Hashes por variante')
+    parser.add_argument('--gevent', action='store_true', help='Monkey-patch de gevent, como los workers de gunicorn')
+    args = parser.parse_args()
+
+    if os.getenv('PASSWORD_SCHEME'):
+        politicas = [(_configuracion()['esquema'], _configuracion()['rondas'])]
+    else:
+        politicas = POLITICAS
+    cpus = os.cpu_count() or 1
+    print(f"{args.hilos} requests concurrentes, {args.hashes} hashes por variante, {cpus} CPU(s), "
+          f"{'gevent' if args.gevent else 'threads'}")
+    print(f"{'política':<24} {'variante':<18} {'hash/s':>7} {'logins/s/CPU':>12} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'latido máx ms':>13}")
+
+    for esquema, rondas in politicas:
+        config = {'esquema': esquema, 'rondas': rondas}
+        contexto = _crear_contexto(config)
+        # Cada política tiene su pool: PasswordPolicy usa la del entorno
+        PasswordPolicy._config, PasswordPolicy._contexto = config, contexto
+        variantes = {
+            'en el request': lambda clave: contexto.hash(clave),
+            'hilos nativos': lambda clave: HilosNativos.ejecutar(_hash, config, clave),
+            'pool de procesos': lambda clave: PasswordPolicy._procesos().submit(_hash, config, clave).result(),
+        }
+        # Arranque de los procesos fuera de la medición
+        for _ in range(PasswordPolicy._procesos()._max_workers):
+            variantes['pool de procesos']('calentar')
+
+        nombre_politica = f"{esquema}/{rondas or contexto.handler().default_rounds}"
+        for nombre, calcular in variantes.items():
+            # Los esquemas lentos con menos hashes, para que termine en minutos
+            cantidad = args.hashes if esquema == 'pbkdf2_sha256' else max(args.hilos, args.hashes // 10)
+            por_segundo, latencias, atraso = correr(args.hilos, cantidad, calcular)
+            p95 = sorted(latencias)[max(0, int(len(latencias) * 0.95) - 1)]
+            print(f"{nombre_politica:<24} {nombre:<18} {por_segundo:>7.1f} {por_segundo / cpus:>12.1f} "
+                  f"{statistics.median(latencias):>8.1f} {p95:>8.1f} {atraso:>13.1f}")
+        PasswordPolicy._cerrar_procesos()
+
+
+if __name__ == '__main__':
+    main()
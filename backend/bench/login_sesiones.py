@@ -0,0 +1,178 @@
+# bench/login_sesiones.py
+"""
+Throughput de /auth/login con apertura de sesión en una transacción
+(TokenManager.open_session) frente a la secuencia anterior
+(can_user_login + add_active_session). Cada thread tiene sus propios
+usuarios y hace login y logout en ciclo; también se miden el login sobre
+una sesión vencida sin logout y el rechazado (409) de un usuario con
+sesión vigente. Por request se cuentan sentencias (X-DB-Queries) y commits.
+
+El hash de contraseñas se abarata (pbkdf2_sha256 con 1000 rondas) para
+que la medición sea la de las sesiones; con PASSWORD_SCHEME y
+PASSWORD_ROUNDS se usa otra política. App en proceso sobre una base
+sqlite temporal o BENCH_DATABASE_URL (se modifica: no usar la de
+producción).
+
+    python bench/login_sesiones.py --hilos 4 --logins 500
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+_TEMPORAL = tempfile.mkdtemp(prefix='ferias-bench-')
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', 'sqlite:///' + os.path.join(_TEMPORAL, 'bench.db'))
+os.environ['SCHEDULER_ACTIVO'] = 'false'
+os.environ['WEBHOOK_WORKERS'] = '0'
+os.environ['PERFIL_CONSULTAS'] = 'true'
+os.environ.setdefault('PASSWORD_SCHEME', 'pbkdf2_sha256')
+os.environ.setdefault('PASSWORD_ROUNDS', '1000')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app
+from models.base import db
+from models.usuario import Usuario
+from models.active_token import ActiveToken
+from utils.token_manager import TokenManager
+
+PASSWORD = 'bench123'
+
+_commits = threading.local()
+
+
+def contar_commit(conn):
+    if has_request_context() and request.path == '/auth/login':
+        _commits.cantidad = getattr(_commits, 'cantidad', 0) + 1
+
+
+def secuencia_anterior(usuario_id, jti, expires_at):
+    """Lo que hacía el login antes de open_session"""
+    if not TokenManager.can_user_login(usuario_id):
+        return False
+    return TokenManager.add_active_session(usuario_id, jti, expires_at)
+
+
+def crear_usuarios(cantidad):
+    with app.app_context():
+        usuarios = []
+        for i in range(cantidad):
+            usuario = Usuario(email=f'login{i}@bench.com', estado_id=1, rol_id=1)
+            usuario.set_password(PASSWORD)
+            usuarios.append(usuario)
+        db.session.add_all(usuarios)
+        db.session.commit()
+        return [usuario.email for usuario in usuarios]
+
+
+def login(cliente, email):
+    """(respuesta, ms, commits del request)"""
+    _commits.cantidad = 0
+    inicio = time.perf_counter()
+    respuesta = cliente.post('/auth/login', json={'email': email, 'password': PASSWORD})
+    return respuesta, (time.perf_counter() - inicio) * 1000, _commits.cantidad
+
+
+def correr(emails, hilos, logins):
+    """Ciclos login/logout en paralelo; devuelve (logins/s, latencias, sentencias, commits, errores)"""
+    latencias, sentencias, commits, errores = [], [], [], []
+    lock = threading.Lock()
+    por_hilo = logins // hilos
+
+    def trabajo(mios):
+        cliente = app.test_client()
+        for i in range(por_hilo):
+            email = mios[i % len(mios)]
+            respuesta, ms, cantidad = login(cliente, email)
+            with lock:
+                if respuesta.status_code != 200:
+                    errores.append(respuesta.status_code)
+                    continue
+                latencias.append(ms)
+                sentencias.append(int(respuesta.headers['X-DB-Queries']))
+                commits.append(cantidad)
+            token = respuesta.json['access_token']
+            cliente.post('/auth/logout', headers={'Authorization': f'Bearer {token}'})
+
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabajo, args=(emails[h::hilos],)) for h in range(hilos)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencias) / (time.perf_counter() - inicio), latencias, sentencias, commits, errores
+
+
+def rechazado(email):
+    """Sentencias y commits de un login con sesión vigente (409)"""
+    cliente = app.test_client()
+    primera, _, _ = login(cliente, email)
+    respuesta, _, cantidad = login(cliente, email)
+    assert respuesta.status_code == 409, respuesta.get_data(as_text=True)
+    cliente.post('/auth/logout', headers={'Authorization': f"Bearer {primera.json['access_token']}"})
+    return int(respuesta.headers['X-DB-Queries']), cantidad
+
+
+def sobre_vencida(email):
+    """Sentencias y commits de un login cuya sesión anterior venció sin logout"""
+    cliente = app.test_client()
+    login(cliente, email)
+    with app.app_context():
+        usuario_id = Usuario.query.filter_by(email=email).one().usuario_id
+        ActiveToken.query.filter_by(usuario_id=usuario_id).update(
+            {'expires_at': datetime.utcnow() - timedelta(minutes=1)}
+        )
+        db.session.commit()
+    respuesta, _, cantidad = login(cliente, email)
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    cliente.post('/auth/logout', headers={'Authorization': f"Bearer {respuesta.json['access_token']}"})
+    return int(respuesta.headers['X-DB-Queries']), cantidad
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput del login con sesión única')
+    parser.add_argument('--hilos', type=int, default=4)
+    parser.add_argument('--logins', type=int, default=500, help='Logins por variante')
+    parser.add_argument('--usuarios', type=int, default=8, help='Usuarios por thread')
+    args = parser.parse_args()
+
+    cliente = app.test_client()
+    respuesta = cliente.get('/api/init-db')
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    emails = crear_usuarios(args.hilos * args.usuarios)
+    event.listen(Engine, 'commit', contar_commit)
+
+    variantes = {
+        'secuencia anterior': secuencia_anterior,
+        'open_session': TokenManager.open_session,
+    }
+    print(f"{args.hilos} threads, {args.logins} logins por variante, {os.environ['PASSWORD_SCHEME']}, "
+          f"{os.environ['DATABASE_URL'].split(':')[0]}")
+    print(f"{'variante':<20} {'login/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'sentencias':>10} {'commits':>7} "
+          f"{'vencida: sent./commits':>22} {'409: sent.':>10} {'errores':>7}")
+    try:
+        for nombre, abrir in variantes.items():
+            # El login llama a TokenManager.open_session
+            TokenManager.open_session = staticmethod(abrir)
+            por_segundo, latencias, sentencias, commits, errores = correr(emails, args.hilos, args.logins)
+            sentencias_vencida, commits_vencida = sobre_vencida(emails[0])
+            sentencias_409, _ = rechazado(emails[0])
+            latencias.sort()
+            print(f"{nombre:<20} {por_segundo:>8.1f} {statistics.median(latencias):>7.2f} "
+                  f"{latencias[int(len(latencias) * 0.95) - 1]:>7.2f} {statistics.mean(sentencias):>10.1f} "
+                  f"{statistics.mean(commits):>7.1f} {f'{sentencias_vencida}/{commits_vencida}':>22} "
+                  f"{sentencias_409:>10} {len(errores):>7}")
+    finally:
+        TokenManager.open_session = staticmethod(variantes['open_session'])
+
+
+if __name__ == '__main__':
+    main()
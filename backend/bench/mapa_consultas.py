@@ -0,0 +1,134 @@
+# bench/mapa_consultas.py
+"""
+Consultas y tiempo del armado del mapa (/api/v1/mapa/parcelas y
+/api/v1/admin/parcelas) según el tamaño de la grilla, con la app en
+proceso sobre una base sqlite temporal (o BENCH_DATABASE_URL, que se
+modifica: no usar la de producción). Cada medición es en frío, con el
+cache del mapa invalidado.
+
+    python bench/mapa_consultas.py --tamanios 10,25,50,100 --ocupacion 0.3
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+_TEMPORAL = tempfile.mkdtemp(prefix='ferias-bench-')
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', 'sqlite:///' + os.path.join(_TEMPORAL, 'bench.db'))
+os.environ['SCHEDULER_ACTIVO'] = 'false'
+os.environ['WEBHOOK_WORKERS'] = '0'
+os.environ['PERFIL_CONSULTAS'] = 'true'
+os.environ['TOKEN_REVOCATION_SYNC_SECONDS'] = '3600'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from app import app
+from models.base import db
+from models.mapa import Mapa
+from models.parcela import Parcela
+from models.usuario import Usuario
+from models.artesano import Artesano
+from models.solicitud import Solicitud
+from models.solicitud_parcela import SolicitudParcela
+from utils.catalogos import Catalogos, ESTADO_SOLICITUD_APROBADA
+from utils.mapa_service import MapaCache
+from utils.ocupacion_parcelas import OcupacionParcelas
+
+
+def autenticar(cliente):
+    """Token del organizador del init-db y de un administrador creado por él"""
+    respuesta = cliente.post('/auth/login', json={'email': 'organizador@feria.com', 'password': 'org123'})
+    organizador = {'Authorization': 'Bearer ' + respuesta.json['access_token']}
+    cliente.post('/api/usuarios/crear', headers=organizador, json={
+        'email': 'admin@bench.com', 'password': 'bench123', 'rol_id': 2, 'nombre': 'Admin bench'
+    })
+    respuesta = cliente.post('/auth/login', json={'email': 'admin@bench.com', 'password': 'bench123'})
+    return organizador, {'Authorization': 'Bearer ' + respuesta.json['access_token']}
+
+
+def crear_solicitud():
+    """Una solicitud aprobada a la que se asignan las parcelas ocupadas"""
+    with app.app_context():
+        usuario = Usuario(email='artesano@bench.com', contraseña='-', estado_id=1, rol_id=1)
+        db.session.add(usuario)
+        db.session.flush()
+        artesano = Artesano(usuario_id=usuario.usuario_id, nombre='Art bench', dni='99999999', telefono='1')
+        db.session.add(artesano)
+        db.session.flush()
+        solicitud = Solicitud(
+            artesano_id=artesano.artesano_id,
+            estado_solicitud_id=Catalogos.estado_solicitud_id(ESTADO_SOLICITUD_APROBADA),
+            rubro_id=1,
+            costo_total=0,
+            terminos_aceptados=True
+        )
+        db.session.add(solicitud)
+        db.session.commit()
+        return solicitud.solicitud_id
+
+
+def ocupar(solicitud_id, fraccion):
+    """Asigna a la solicitud una parcela de cada 1/fraccion todavía libres"""
+    with app.app_context():
+        temporada = OcupacionParcelas.temporada_actual()
+        ocupadas = OcupacionParcelas.consulta(SolicitudParcela.parcela_id, temporada=temporada)
+        libres = db.session.query(Parcela.parcela_id).filter(
+            Parcela.mapa_id == Mapa.query.first().mapa_id,
+            ~Parcela.parcela_id.in_(ocupadas)
+        ).order_by(Parcela.parcela_id).all()
+        paso = max(1, round(1 / fraccion)) if fraccion > 0 else None
+        filas = [
+            {'solicitud_id': solicitud_id, 'parcela_id': parcela_id, 'temporada': temporada}
+            for i, (parcela_id,) in enumerate(libres) if paso and i % paso == 0
+        ]
+        if filas:
+            db.session.execute(insert(SolicitudParcela), filas)
+        db.session.commit()
+
+
+def medir(cliente, url, auth, repeticiones):
+    """(consultas, ms de base, ms totales) medianos de requests en frío"""
+    cliente.get(url, headers=auth)
+    consultas, base, total = [], [], []
+    for _ in range(repeticiones):
+        MapaCache.invalidar()
+        inicio = time.perf_counter()
+        respuesta = cliente.get(url, headers=auth)
+        total.append((time.perf_counter() - inicio) * 1000)
+        assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+        consultas.append(int(respuesta.headers['X-DB-Queries']))
+        base.append(float(respuesta.headers['X-DB-Time-Ms']))
+    return statistics.median(consultas), statistics.median(base), statistics.median(total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consultas del mapa según el tamaño de la grilla')
+    parser.add_argument('--tamanios', default='10,25,50,100', help='Lados de la grilla, crecientes')
+    parser.add_argument('--ocupacion', type=float, default=0.3, help='Fracción de parcelas ocupadas')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    cliente = app.test_client()
+    respuesta = cliente.get('/api/init-db')
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    organizador, administrador = autenticar(cliente)
+    solicitud_id = crear_solicitud()
+
+    print(f"{'grilla':>8} {'endpoint':<24} {'consultas':>9} {'ms base':>8} {'ms total':>9}")
+    for lado in (int(t) for t in args.tamanios.split(',')):
+        # Crecientes: no se puede achicar el mapa con parcelas ocupadas
+        respuesta = cliente.post('/api/mapa/configurar', json={'filas': lado, 'columnas': lado}, headers=organizador)
+        assert respuesta.status_code in (200, 201), respuesta.get_data(as_text=True)
+        ocupar(solicitud_id, args.ocupacion)
+
+        for url in ('/api/v1/mapa/parcelas', '/api/v1/admin/parcelas'):
+            consultas, base, total = medir(cliente, url, administrador, args.repeticiones)
+            print(f"{lado:>3}x{lado:<4} {url:<24} {consultas:>9.0f} {base:>8.1f} {total:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
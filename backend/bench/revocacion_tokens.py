@@ -0,0 +1,111 @@
+# bench/revocacion_tokens.py
+"""
+Latencia de requests autenticados según cómo se chequea la revocación del
+JWT (token_in_blocklist_loader): con el índice en memoria
+(RevokedTokenIndex, lo que hace TokenManager.is_token_revoked) o con la
+consulta a tokens_blacklist por request que había antes. App en proceso
+sobre una base sqlite temporal o BENCH_DATABASE_URL (se modifica: no usar
+la de producción); con MySQL en otra máquina la diferencia incluye el
+round-trip de red.
+
+    python bench/revocacion_tokens.py --requests 2000 --revocados 10000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+_TEMPORAL = tempfile.mkdtemp(prefix='ferias-bench-')
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', 'sqlite:///' + os.path.join(_TEMPORAL, 'bench.db'))
+os.environ['SCHEDULER_ACTIVO'] = 'false'
+os.environ['WEBHOOK_WORKERS'] = '0'
+os.environ['PERFIL_CONSULTAS'] = 'true'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from app import app
+from models.base import db
+from models.usuario import Usuario
+from models.token_blacklist import TokensBlacklist
+from utils.token_manager import TokenManager, RevokedTokenIndex
+
+ENDPOINTS = ('/auth/check-auth', '/api/v1/mapa/parcelas')
+
+
+def consulta_por_request(jti):
+    """El chequeo anterior al índice: un SELECT por jti en cada request"""
+    if not jti:
+        return True
+    return TokensBlacklist.query.filter_by(jti=jti).first() is not None
+
+
+def revocar(cantidad):
+    """Llena tokens_blacklist con revocaciones vigentes de otros tokens"""
+    with app.app_context():
+        usuario_id = Usuario.query.filter_by(email='organizador@feria.com').one().usuario_id
+        vence = datetime.utcnow() + timedelta(hours=1)
+        filas = [
+            {'jti': str(uuid.uuid4()), 'usuario_id': usuario_id, 'expires_at': vence}
+            for _ in range(cantidad)
+        ]
+        for inicio in range(0, len(filas), 1000):
+            db.session.execute(insert(TokensBlacklist), filas[inicio:inicio + 1000])
+        db.session.commit()
+        RevokedTokenIndex.load()
+
+
+def medir(cliente, url, auth, cantidad):
+    """(p50 ms, p95 ms, consultas por request)"""
+    latencias, consultas = [], []
+    for _ in range(cantidad):
+        inicio = time.perf_counter()
+        respuesta = cliente.get(url, headers=auth)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        assert respuesta.status_code in (200, 304), respuesta.get_data(as_text=True)
+        consultas.append(int(respuesta.headers['X-DB-Queries']))
+    latencias.sort()
+    return statistics.median(latencias), latencias[int(len(latencias) * 0.95) - 1], statistics.mean(consultas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latencia del chequeo de revocación de tokens')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests por endpoint y variante')
+    parser.add_argument('--revocados', type=int, default=10000, help='Filas vigentes en tokens_blacklist')
+    args = parser.parse_args()
+
+    cliente = app.test_client()
+    respuesta = cliente.get('/api/init-db')
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    revocar(args.revocados)
+
+    respuesta = cliente.post('/auth/login', json={'email': 'organizador@feria.com', 'password': 'org123'})
+    auth = {'Authorization': 'Bearer ' + respuesta.json['access_token']}
+    cliente.post('/api/mapa/configurar', json={'filas': 10, 'columnas': 10}, headers=auth)
+
+    variantes = {
+        'consulta por request': consulta_por_request,
+        'índice en memoria': TokenManager.is_token_revoked,
+    }
+    print(f"{args.revocados} tokens revocados, {args.requests} requests por fila, {os.environ['DATABASE_URL'].split(':')[0]}")
+    print(f"{'variante':<22} {'endpoint':<24} {'p50 ms':>7} {'p95 ms':>7} {'consultas':>9}")
+    try:
+        for nombre, chequeo in variantes.items():
+            # El loader de app.py llama a TokenManager.is_token_revoked
+            TokenManager.is_token_revoked = staticmethod(chequeo)
+            for url in ENDPOINTS:
+                medir(cliente, url, auth, 50)
+                p50, p95, consultas = medir(cliente, url, auth, args.requests)
+                print(f"{nombre:<22} {url:<24} {p50:>7.2f} {p95:>7.2f} {consultas:>9.1f}")
+    finally:
+        TokenManager.is_token_revoked = staticmethod(variantes['índice en memoria'])
+        cliente.post('/auth/logout', headers=auth)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# bench/sse_carga.py
+"""
+Prueba de carga de /mapa/stream contra una instancia corriendo, por
+ejemplo con los workers gevent de gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py app:app
+    python bench/sse_carga.py --url http://localhost:5000 --clientes 500 \\
+        --cambios 20 --email admin@feria.com --password ... --parcela 12
+
+Abre --clientes conexiones SSE y, con el usuario indicado (administrador),
+cambia --cambios veces el rubro de una parcela libre. Para cada cambio
+mide cuántos clientes recibieron el evento y en cuánto tiempo. Con varios
+workers los clientes quedan repartidos entre ellos y el cambio se hace en
+uno solo: a los demás les llega por Mapa_Evento (MapaRelay), así que la
+latencia incluye MAPA_RELAY_POLL_SEGUNDOS.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+
+import requests
+
+
+def iniciar_sesion(url, email, password):
+    respuesta = requests.post(f'{url}/auth/login', json={'email': email, 'password': password}, timeout=10)
+    respuesta.raise_for_status()
+    return respuesta.json()['access_token']
+
+
+def escuchar(url, token, parcela_id, recibidos, conectados, detener):
+    """Un cliente SSE: anota (índice de evento, hora de llegada) de cada cambio de la parcela"""
+    try:
+        with requests.get(
+            f'{url}/api/v1/mapa/stream', cookies={'access_token': token}, stream=True, timeout=(10, 60)
+        ) as respuesta:
+            respuesta.raise_for_status()
+            conectados.release()
+            evento = None
+            vistos = 0
+            for linea in respuesta.iter_lines(decode_unicode=True):
+                if detener.is_set():
+                    return
+                if linea.startswith('event: '):
+                    evento = linea[7:]
+                elif linea.startswith('data: ') and evento == 'parcelas':
+                    datos = json.loads(linea[6:])
+                    if any(p['parcela_id'] == parcela_id for p in datos.get('parcelas', [])):
+                        recibidos.append((vistos, time.perf_counter()))
+                        vistos += 1
+    except Exception as e:
+        if not detener.is_set():
+            print(f"Cliente SSE cortado: {e}")
+            conectados.release()
+
+
+def percentil(valores, p):
+    if not valores:
+        return float('nan')
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga de /mapa/stream')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--url-cambios', help='Instancia donde se hacen los cambios (por defecto --url)')
+    parser.add_argument('--clientes', type=int, default=200)
+    parser.add_argument('--cambios', type=int, default=10)
+    parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos entre cambios')
+    parser.add_argument('--email', required=True, help='Usuario administrador')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--parcela', type=int, required=True, help='Parcela libre cuyo rubro se alterna')
+    parser.add_argument('--rubros', default='1,2', help='Dos rubros entre los que se alterna')
+    args = parser.parse_args()
+
+    # Un usuario tiene una sola sesión activa: se cierra al terminar
+    token = iniciar_sesion(args.url, args.email, args.password)
+    try:
+        medir(args, token)
+    finally:
+        requests.post(f'{args.url}/auth/logout', headers={'Authorization': f'Bearer {token}'}, timeout=10)
+
+
+def medir(args, token):
+    rubros = [int(r) for r in args.rubros.split(',')]
+
+    recibidos = [[] for _ in range(args.clientes)]
+    conectados = threading.Semaphore(0)
+    detener = threading.Event()
+    inicio = time.perf_counter()
+    hilos = [
+        threading.Thread(
+            target=escuchar, args=(args.url, token, args.parcela, recibidos[i], conectados, detener), daemon=True
+        )
+        for i in range(args.clientes)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    for _ in range(args.clientes):
+        conectados.acquire()
+    print(f"{args.clientes} clientes conectados en {time.perf_counter() - inicio:.2f}s")
+
+    sesion = requests.Session()
+    sesion.headers['Authorization'] = f'Bearer {token}'
+    enviados = []
+    for i in range(args.cambios):
+        time.sleep(args.intervalo)
+        enviados.append(time.perf_counter())
+        respuesta = sesion.post(f'{args.url_cambios or args.url}/api/v1/admin/parcelas/asignar-rubro', json={
+            'parcela_id': args.parcela, 'rubro_id': rubros[i % len(rubros)]
+        }, timeout=10)
+        respuesta.raise_for_status()
+
+    time.sleep(args.intervalo + 3)
+    detener.set()
+
+    print(f"{'cambio':>6} {'recibido':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    todas = []
+    for i, enviado in enumerate(enviados):
+        latencias = [
+            (llegada - enviado) * 1000
+            for eventos in recibidos for indice, llegada in eventos if indice == i
+        ]
+        todas.extend(latencias)
+        print(f"{i + 1:>6} {len(latencias):>4}/{args.clientes:<4} {percentil(latencias, 0.5):>8.1f} "
+              f"{percentil(latencias, 0.95):>8.1f} {max(latencias, default=float('nan')):>8.1f}")
+
+    esperados = args.clientes * args.cambios
+    print(f"Entregados {len(todas)}/{esperados}; "
+          f"p50 {statistics.median(todas) if todas else float('nan'):.1f} ms, "
+          f"p95 {percentil(todas, 0.95):.1f} ms, max {max(todas, default=float('nan')):.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+# bench/webhook_duplicados.py
+"""
+Throughput de /api/v1/pago/webhook cuando MercadoPago repite una misma
+notificación (reintentos, entregas duplicadas): el endpoint solo hace el
+INSERT en Webhook_Evento y los duplicados no agregan trabajo a la bandeja.
+Se comparan tres escenarios de N notificaciones: todas iguales del mismo
+pago, alternando dos cuerpos distintos del mismo pago (cada cambio puede
+re-activar el evento) y de N pagos distintos (sin deduplicación posible).
+Por escenario: notificaciones/s y latencias del endpoint, sentencias por
+request (X-DB-Queries: no cuenta el INSERT que choca con la clave única),
+resultados de registrar y, con workers que procesan la bandeja mientras
+llegan las notificaciones (como WEBHOOK_WORKERS), cuántas veces se
+consultó a MP y cuánto tardó en vaciarse la cola después de la última.
+
+MercadoPago es el cliente local con --latencia-ms por consulta; los pagos
+no tienen un Pago en la base, así que aplicarlos termina en "Pago no
+encontrado": se mide la bandeja, no la asignación de parcelas. App en
+proceso sobre una base sqlite temporal o BENCH_DATABASE_URL (se modifica:
+no usar la de producción).
+
+    python bench/webhook_duplicados.py --notificaciones 1000 --hilos 4
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+_TEMPORAL = tempfile.mkdtemp(prefix='ferias-bench-')
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', 'sqlite:///' + os.path.join(_TEMPORAL, 'bench.db'))
+os.environ['SCHEDULER_ACTIVO'] = 'false'
+os.environ['WEBHOOK_WORKERS'] = '0'
+os.environ['PERFIL_CONSULTAS'] = 'true'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from models.base import db
+from models.webhook_evento import WebhookEvento
+from utils.mercadopago_cliente import ClienteMercadoPagoLocal, configurar_cliente_mp
+from utils.webhook_inbox import WebhookInbox
+
+
+def duplicados(escenario, n):
+    """La misma notificación n veces"""
+    return [{'type': 'payment', 'action': 'payment.created', 'data': {'id': f'{escenario}-1'}}] * n
+
+
+def alternados(escenario, n):
+    """Dos notificaciones distintas del mismo pago, intercaladas"""
+    acciones = ('payment.created', 'payment.updated')
+    return [{'type': 'payment', 'action': acciones[i % 2], 'data': {'id': f'{escenario}-1'}} for i in range(n)]
+
+
+def distintos(escenario, n):
+    """Una notificación por pago"""
+    return [{'type': 'payment', 'action': 'payment.created', 'data': {'id': f'{escenario}-{i}'}} for i in range(n)]
+
+
+ESCENARIOS = {
+    'duplicados': duplicados,
+    'alternados': alternados,
+    'distintos': distintos,
+}
+
+
+def recibir(cuerpos, hilos):
+    """POST de los cuerpos repartidos entre threads; devuelve (por segundo, latencias, sentencias, resultados, errores)"""
+    latencias, sentencias, resultados, errores = [], [], Counter(), []
+    lock = threading.Lock()
+
+    def trabajo(mios):
+        cliente = app.test_client()
+        for cuerpo in mios:
+            inicio = time.perf_counter()
+            respuesta = cliente.post('/api/v1/pago/webhook', json=cuerpo)
+            ms = (time.perf_counter() - inicio) * 1000
+            with lock:
+                if respuesta.status_code != 200:
+                    errores.append(respuesta.status_code)
+                    continue
+                latencias.append(ms)
+                sentencias.append(int(respuesta.headers['X-DB-Queries']))
+                resultados[respuesta.json['evento']] += 1
+
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabajo, args=(cuerpos[h::hilos],)) for h in range(hilos)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencias) / (time.perf_counter() - inicio), latencias, sentencias, resultados, errores
+
+
+class Workers:
+    """Workers de la bandeja mientras llegan las notificaciones, como con WEBHOOK_WORKERS"""
+
+    def __init__(self, cantidad):
+        self.recepcion_terminada = threading.Event()
+        self.threads = [threading.Thread(target=self._bucle) for _ in range(cantidad)]
+
+    def _bucle(self):
+        with app.app_context():
+            while True:
+                if WebhookInbox.procesar_siguiente():
+                    continue
+                if self.recepcion_terminada.is_set():
+                    break
+                time.sleep(0.005)
+            db.session.remove()
+
+    def iniciar(self):
+        for thread in self.threads:
+            thread.start()
+
+    def vaciar(self):
+        """Espera a que la bandeja quede vacía; devuelve los segundos que tardó"""
+        inicio = time.perf_counter()
+        self.recepcion_terminada.set()
+        for thread in self.threads:
+            thread.join()
+        return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput del webhook de MercadoPago con notificaciones repetidas')
+    parser.add_argument('--notificaciones', type=int, default=1000, help='Notificaciones por escenario')
+    parser.add_argument('--hilos', type=int, default=4, help='Threads que envían notificaciones')
+    parser.add_argument('--workers', type=int, default=2, help='Workers de la bandeja')
+    parser.add_argument('--latencia-ms', type=float, default=50, help='Latencia simulada de cada consulta a MP')
+    args = parser.parse_args()
+
+    respuesta = app.test_client().get('/api/init-db')
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+
+    print(f"{args.notificaciones} notificaciones por escenario, {args.hilos} threads, {args.workers} workers, "
+          f"MP local a {args.latencia_ms:g} ms, {os.environ['DATABASE_URL'].split(':')[0]}")
+    print(f"{'escenario':<11} {'notif/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'sentencias':>10} "
+          f"{'nuevo/reactivado/duplicado':>26} {'filas':>6} {'consultas MP':>12} {'cola s':>6} {'errores':>7}")
+    for nombre, generar in ESCENARIOS.items():
+        mercadopago = ClienteMercadoPagoLocal(latencia_ms=args.latencia_ms)
+        configurar_cliente_mp(mercadopago)
+        cuerpos = generar(nombre, args.notificaciones)
+        for cuerpo in cuerpos:
+            payment_id = cuerpo['data']['id']
+            mercadopago.registrar_pago(payment_id, 'approved', f'PREF-{payment_id}')
+
+        workers = Workers(args.workers)
+        workers.iniciar()
+        por_segundo, latencias, sentencias, resultados, errores = recibir(cuerpos, args.hilos)
+        # Lo que quedó en la bandeja al terminar de recibir
+        segundos = workers.vaciar()
+        with app.app_context():
+            filas = WebhookEvento.query.filter(WebhookEvento.payment_id.like(f'{nombre}-%')).count()
+            db.session.remove()
+        consultas_mp = mercadopago.metricas.metricas().get('obtener_pago', {}).get('llamadas', 0)
+
+        latencias.sort()
+        conteo = f"{resultados['nuevo']}/{resultados['reactivado']}/{resultados['duplicado']}"
+        print(f"{nombre:<11} {por_segundo:>8.1f} {statistics.median(latencias):>7.2f} "
+              f"{latencias[int(len(latencias) * 0.95) - 1]:>7.2f} {statistics.mean(sentencias):>10.1f} "
+              f"{conteo:>26} {filas:>6} {consultas_mp:>12} {segundos:>6.2f} {len(errores):>7}")
+    configurar_cliente_mp(None)
+
+
+if __name__ == '__main__':
+    main()
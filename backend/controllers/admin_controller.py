@@ -16,8 +16,10 @@ from models.solicitud_parcela import SolicitudParcela
 from models.color import Color
 from sqlalchemy import or_, func, and_
 from datetime import datetime, timedelta
-from sqlalchemy.orm import joinedload 
+from sqlalchemy.orm import joinedload, selectinload
+import base64
 import io
+import json
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
@@ -28,6 +30,11 @@ from utils.token_manager import TokenManager
 from utils.token_manager import TokenManager
 from models.active_token import ActiveToken
 from models.token_blacklist import TokensBlacklist
+from utils.mapa_service import MapaService, CAMBIO_HABILITADA, CAMBIO_DESHABILITADA, CAMBIO_RUBRO, CAMBIO_DATOS, CAMBIO_LIBERADA
+from utils.reserva_parcelas import ReservaParcelas, ESTADOS_QUE_LIBERAN
+from utils.ocupacion_parcelas import OcupacionParcelas
+from utils.capacidad_rubros import CapacidadRubros
+from utils.catalogos import Catalogos, ESTADO_SOLICITUD_APROBADA, ESTADO_SOLICITUD_PENDIENTE
 
 try:
     from session_manager import session_manager
@@ -44,6 +51,41 @@ except ImportError as e:
 # Blueprint con prefix
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/v1') 
 
+# Paginación del dashboard de solicitudes
+DASHBOARD_LIMITE_DEFECTO = 50
+DASHBOARD_LIMITE_MAXIMO = 200
+
+class CursorInvalidoError(ValueError):
+    """El cursor de paginación no se pudo decodificar"""
+
+def codificar_cursor(solicitud):
+    """Cursor opaco con la clave de orden (fecha_solicitud, solicitud_id) de la última fila"""
+    fecha = solicitud.fecha_solicitud.isoformat() if solicitud.fecha_solicitud else None
+    clave = {'f': fecha, 'id': solicitud.solicitud_id}
+    return base64.urlsafe_b64encode(json.dumps(clave).encode('utf-8')).decode('ascii')
+
+def decodificar_cursor(cursor):
+    try:
+        clave = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        fecha = datetime.fromisoformat(clave['f']) if clave['f'] is not None else None
+        return fecha, int(clave['id'])
+    except Exception:
+        raise CursorInvalidoError(cursor)
+
+def filtro_despues_del_cursor(fecha_cursor, id_cursor):
+    """
+    Filas que siguen a la clave del cursor en el orden (fecha_solicitud
+    DESC, solicitud_id DESC). Las solicitudes sin fecha van al final, como
+    las ordenan MySQL y sqlite en DESC, y entre ellas por id.
+    """
+    if fecha_cursor is None:
+        return and_(Solicitud.fecha_solicitud.is_(None), Solicitud.solicitud_id < id_cursor)
+    return or_(
+        Solicitud.fecha_solicitud < fecha_cursor,
+        and_(Solicitud.fecha_solicitud == fecha_cursor, Solicitud.solicitud_id < id_cursor),
+        Solicitud.fecha_solicitud.is_(None)
+    )
+
 def get_usuario_actual():
     """Obtiene el usuario actual desde el token JWT"""
     user_identity = get_jwt_identity()
@@ -96,69 +138,48 @@ class AdminController:
         """
         Obtiene el límite activo actual para un rubro
         """
-        try:
-            limite_activo = LimiteRubro.query.filter_by(
-                rubro_id=rubro_id,
-                es_activo=True
-            ).first()
-            
-            if limite_activo:
-                return limite_activo.max_puestos, limite_activo.limite_id
-            return None, None
-            
-        except Exception as e:
-            print(f"Error al obtener límite activo para rubro {rubro_id}: {str(e)}")
-            return None, None
+        return CapacidadRubros.limite_activo(rubro_id)
 
     @staticmethod
     def verificar_limite_rubro(rubro_id):
         """
-        Verifica si se ha alcanzado el límite máximo de puestos para un rubro - ACTUALIZADO
+        Verifica si se ha alcanzado el límite máximo de puestos para un rubro.
+        Devuelve (limite_alcanzado, aprobadas, limite_maximo)
         """
         try:
-            # Obtener el límite activo para el rubro
-            limite_maximo, limite_id = AdminController.get_limite_activo_rubro(rubro_id)
-            
-            if not limite_maximo:
-                return False, 0, 0  # Sin límite configurado
-
-            # Contar solicitudes aprobadas para este rubro
-            estado_aprobada = EstadoSolicitud.query.filter_by(nombre='Aprobada').first()
-            count_aprobadas = db.session.query(func.count(Solicitud.solicitud_id)).filter(
-                Solicitud.rubro_id == rubro_id,
-                Solicitud.estado_solicitud_id == estado_aprobada.estado_solicitud_id
-            ).scalar() or 0
-
-            limite_alcanzado = count_aprobadas == limite_maximo
-            
-            return limite_alcanzado, count_aprobadas, limite_maximo
-
+            return CapacidadRubros.verificar(rubro_id)
         except Exception as e:
             print(f"Error al verificar límite de rubro: {str(e)}")
             return False, 0, 0
 
     @staticmethod
-    def get_solicitudes_dashboard(filtro_estado=None, busqueda_termino=None):
+    def get_solicitudes_dashboard(filtro_estado=None, busqueda_termino=None, cursor=None, limite=None):
+        """
+        Sin cursor ni limite devuelve la lista completa (como siempre).
+        Con alguno de los dos devuelve una página ordenada por
+        (fecha_solicitud, solicitud_id) descendente: la página siguiente
+        arranca desde la clave de la última fila (keyset), así el costo no
+        depende de cuántas filas quedan antes. El total sale de un COUNT aparte.
+        """
         usuario = get_usuario_actual()
         permisos = AdminController._check_admin_permissions(usuario)
         if not isinstance(permisos, Administrador):
             return permisos
 
+        paginado = cursor is not None or limite is not None
+
         try:
-            query = Solicitud.query.options(
-                joinedload(Solicitud.estado_rel),
-                joinedload(Solicitud.rubro_rel),
-                joinedload(Solicitud.artesano_rel)
-            )
-            query = query.join(Solicitud.estado_rel).join(Solicitud.rubro_rel).join(Solicitud.artesano_rel)
+            query = Solicitud.query.join(Solicitud.estado_rel).join(Solicitud.rubro_rel).join(Solicitud.artesano_rel)
 
             # Filtrar estados válidos (excluyendo Pendiente por Modificación)
             if filtro_estado and filtro_estado != 'all':
                 if filtro_estado == 'Pendiente':
                     # Solo mostrar Pendiente, no Pendiente por Modificación
-                    query = query.filter(EstadoSolicitud.nombre == 'Pendiente')
+                    query = query.filter(
+                        Solicitud.estado_solicitud_id == Catalogos.estado_solicitud_id(ESTADO_SOLICITUD_PENDIENTE)
+                    )
                 else:
-                    query = query.filter(EstadoSolicitud.nombre == filtro_estado)
+                    query = query.filter(Solicitud.estado_solicitud_id == Catalogos.estado_solicitud_id(filtro_estado))
 
             if busqueda_termino:
                 term = f"%{busqueda_termino.lower()}%"
@@ -170,14 +191,36 @@ class AdminController:
                 
             query = query.filter(EstadoSolicitud.nombre != 'Pendiente por Modificación')
 
-            solicitudes = query.order_by(Solicitud.fecha_solicitud.desc()).all()
+            total = None
+            if paginado:
+                limite = max(1, min(int(limite or DASHBOARD_LIMITE_DEFECTO), DASHBOARD_LIMITE_MAXIMO))
+                total = query.with_entities(func.count(Solicitud.solicitud_id)).scalar() or 0
+
+                if cursor:
+                    query = query.filter(filtro_despues_del_cursor(*decodificar_cursor(cursor)))
+
+            query = query.options(
+                joinedload(Solicitud.estado_rel),
+                joinedload(Solicitud.rubro_rel),
+                joinedload(Solicitud.artesano_rel),
+                selectinload(Solicitud.fotos_rel)
+            ).order_by(Solicitud.fecha_solicitud.desc(), Solicitud.solicitud_id.desc())
+
+            if paginado:
+                # Una fila de más indica si hay página siguiente
+                solicitudes = query.limit(limite + 1).all()
+                hay_mas = len(solicitudes) > limite
+                solicitudes = solicitudes[:limite]
+            else:
+                solicitudes = query.all()
 
             data = []
             for s in solicitudes: 
                 artesano = s.artesano_rel
                 
-                foto_principal = s.fotos_rel[0] if s.fotos_rel else None
-                foto_url = foto_principal.get_image_url() if foto_principal else None
+                # Solo URLs: la imagen se descarga aparte y queda en caché del navegador
+                fotos_urls = [foto.get_image_url('media') for foto in s.fotos_rel]
+                foto_url = fotos_urls[0] if fotos_urls else None
                 
                 # Verificar límite de rubro para esta solicitud
                 limite_alcanzado, count_actual, limite_maximo = AdminController.verificar_limite_rubro(s.rubro_id)
@@ -194,7 +237,8 @@ class AdminController:
                     'fecha_solicitud': s.fecha_solicitud.isoformat() if s.fecha_solicitud else None,
                     'notas_admin': s.comentarios_admin or "",
                     'foto_puesto': foto_url,
-                    'fotos': [foto.get_image_url() for foto in s.fotos_rel] if s.fotos_rel else [],
+                    'fotos': fotos_urls,
+                    'fotos_detalle': [foto.to_descriptor() for foto in s.fotos_rel],
                     'limite_rubro_alcanzado': limite_alcanzado,
                     'count_actual_rubro': count_actual,
                     'limite_maximo_rubro': limite_maximo
@@ -230,8 +274,18 @@ class AdminController:
                     'limite_rubro_alcanzado': limite_alcanzado
                 })
             
-            return data, 200
+            if not paginado:
+                return data, 200
+
+            return {
+                'solicitudes': data,
+                'total': total,
+                'limite': limite,
+                'siguiente_cursor': codificar_cursor(solicitudes[-1]) if hay_mas else None
+            }, 200
 
+        except CursorInvalidoError:
+            return {'msg': 'Cursor de paginación inválido'}, 400
         except Exception as e:
             print(f"Error al obtener solicitudes: {str(e)}")
             return {'msg': 'Error interno al obtener las solicitudes.', 'detalle': str(e)}, 500
@@ -255,7 +309,7 @@ class AdminController:
         if not estado_nombre_nuevo:
             return {'msg': 'El campo "estado_solicitud" es requerido.'}, 400
 
-        nuevo_estado = EstadoSolicitud.query.filter_by(nombre=estado_nombre_nuevo).first()
+        nuevo_estado = Catalogos.estados_solicitud.por_nombre(estado_nombre_nuevo)
         if not nuevo_estado:
             print(f"DEBUG: Estado '{estado_nombre_nuevo}' no encontrado en la base de datos")
             return {'msg': f'El estado "{estado_nombre_nuevo}" no es válido.'}, 400
@@ -282,11 +336,18 @@ class AdminController:
                     }, 400
 
             # Actualizar el estado
-            solicitud.estado_solicitud_id = nuevo_estado.estado_solicitud_id
+            solicitud.estado_solicitud_id = nuevo_estado.id
             solicitud.comentarios_admin = comentarios_admin
             solicitud.administrador_id = administrador.administrador_id 
             solicitud.fecha_gestion = datetime.utcnow()
 
+            # Una solicitud rechazada o cancelada libera sus parcelas: las
+            # filas quedan marcadas como liberadas (la ocupación de
+            # OcupacionParcelas no distingue estados)
+            parcelas_liberadas = []
+            if estado_nombre_nuevo in ESTADOS_QUE_LIBERAN:
+                parcelas_liberadas = ReservaParcelas.liberar_solicitud(solicitud_id)
+
             # Crear notificación para el artesano
             if solicitud.artesano_id:
                 mensaje_notificacion = f"El estado de tu solicitud cambió de '{estado_anterior}' a '{estado_nombre_nuevo}'."
@@ -300,6 +361,14 @@ class AdminController:
                 )
 
             db.session.commit()
+            CapacidadRubros.invalidar()
+            # El estado define si sus parcelas figuran como ocupadas en el mapa
+            if parcelas_liberadas:
+                MapaService.registrar_cambios(parcelas_liberadas, CAMBIO_LIBERADA)
+            else:
+                MapaService.registrar_cambios(
+                    MapaService.parcelas_de_solicitudes([solicitud_id]), CAMBIO_DATOS
+                )
             print(f"DEBUG: Solicitud {solicitud_id} actualizada exitosamente a {estado_nombre_nuevo}")
             return {'msg': f'Estado de la solicitud {solicitud_id} actualizado a {estado_nombre_nuevo}'}, 200
 
@@ -397,15 +466,10 @@ class AdminController:
             configuraciones = []
 
             for rubro in rubros:
-                # Obtener límite activo para el rubro
-                limite_activo, limite_id = AdminController.get_limite_activo_rubro(rubro.rubro_id)
-                
-                # Contar puestos aprobados
-                estado_aprobada = EstadoSolicitud.query.filter_by(nombre='Aprobada').first()
-                count_aprobadas = db.session.query(func.count(Solicitud.solicitud_id)).filter(
-                    Solicitud.rubro_id == rubro.rubro_id,
-                    Solicitud.estado_solicitud_id == estado_aprobada.estado_solicitud_id
-                ).scalar() or 0
+                # Límite activo y puestos aprobados (calculados para todos los rubros juntos)
+                capacidad = CapacidadRubros.para_rubro(rubro.rubro_id)
+                limite_activo, limite_id = capacidad['limite'], capacidad['limite_id']
+                count_aprobadas = capacidad['aprobadas']
 
                 # Verificar disponibilidad
                 disponible = True
@@ -472,6 +536,8 @@ class AdminController:
                         db.session.add(nuevo_limite_rubro)
 
             db.session.commit()
+            CapacidadRubros.invalidar()
+            Catalogos.rubros.invalidar()
 
             return {
                 'msg': f'Configuración del rubro {rubro.tipo} actualizada correctamente.',
@@ -502,24 +568,11 @@ class AdminController:
             
             resultado = []
             for rubro in rubros_activos:
-                total_solicitudes = db.session.query(func.count(Solicitud.solicitud_id)).filter(
-                    Solicitud.rubro_id == rubro.rubro_id
-                ).scalar() or 0
-                
-                estado_aprobada = EstadoSolicitud.query.filter_by(nombre='Aprobada').first()
-                aprobadas = db.session.query(func.count(Solicitud.solicitud_id)).filter(
-                    Solicitud.rubro_id == rubro.rubro_id,
-                    Solicitud.estado_solicitud_id == estado_aprobada.estado_solicitud_id
-                ).scalar() or 0
-                
-                estado_pendiente = EstadoSolicitud.query.filter_by(nombre='Pendiente').first()
-                
-                pendientes = db.session.query(func.count(Solicitud.solicitud_id)).filter(
-                    Solicitud.rubro_id == rubro.rubro_id,
-                    Solicitud.estado_solicitud_id == estado_pendiente.estado_solicitud_id
-                ).scalar() or 0
-                
-                limite_activo, _ = AdminController.get_limite_activo_rubro(rubro.rubro_id)
+                capacidad = CapacidadRubros.para_rubro(rubro.rubro_id)
+                total_solicitudes = capacidad['total']
+                aprobadas = capacidad['aprobadas']
+                pendientes = capacidad['pendientes']
+                limite_activo = capacidad['limite']
                 
                 limite_alcanzado = False
                 disponibilidad = "Sin límite"
@@ -747,7 +800,7 @@ class AdminController:
 
         try:
             # Obtener artesanos aprobados
-            estado_aprobada = EstadoSolicitud.query.filter_by(nombre='Aprobada').first()
+            id_aprobada = Catalogos.estado_solicitud_id(ESTADO_SOLICITUD_APROBADA)
             
             artesanos_aprobados = db.session.query(
                 Artesano.nombre,
@@ -757,7 +810,7 @@ class AdminController:
                 Solicitud.descripcion
             ).join(Solicitud, Solicitud.artesano_id == Artesano.artesano_id
             ).join(Rubro, Rubro.rubro_id == Solicitud.rubro_id
-            ).filter(Solicitud.estado_solicitud_id == estado_aprobada.estado_solicitud_id
+            ).filter(Solicitud.estado_solicitud_id == id_aprobada
             ).order_by(Artesano.nombre).all()
 
             # Crear PDF
@@ -833,8 +886,7 @@ class AdminController:
                 Rubro.tipo.label('rubro'),
                 func.count(Solicitud.solicitud_id).label('total')
             ).join(Solicitud, Solicitud.rubro_id == Rubro.rubro_id
-            ).join(EstadoSolicitud, EstadoSolicitud.estado_solicitud_id == Solicitud.estado_solicitud_id
-            ).filter(EstadoSolicitud.nombre == 'Aprobada'
+            ).filter(Solicitud.estado_solicitud_id == Catalogos.estado_solicitud_id(ESTADO_SOLICITUD_APROBADA)
             ).group_by(Rubro.tipo).all()
             
             resultado = {est.rubro: est.total for est in estadisticas}
@@ -908,10 +960,14 @@ def get_diversidad_rubros_route():
 def get_solicitudes_route():
     filtro = request.args.get('filtro_estado')
     busqueda = request.args.get('busqueda_termino')
+    limite = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
     
     data, status = AdminController.get_solicitudes_dashboard(
         filtro_estado=filtro, 
-        busqueda_termino=busqueda
+        busqueda_termino=busqueda,
+        cursor=cursor,
+        limite=limite
     )
     return jsonify(data), status
 
@@ -942,11 +998,7 @@ def obtener_fotos_solicitud(solicitud_id):
         
         fotos = SolicitudFoto.query.filter_by(solicitud_id=solicitud_id).all()
         
-        fotos_respuesta = []
-        for foto in fotos:
-            foto_data = foto.to_dict()
-            foto_data['image_url'] = foto.get_image_url()
-            fotos_respuesta.append(foto_data)
+        fotos_respuesta = [foto.to_descriptor() for foto in fotos]
         
         return jsonify({
             'fotos': fotos_respuesta
@@ -1126,77 +1178,16 @@ def obtener_parcelas_admin():
             
         print(f"Administrador autorizado: {administrador.nombre}")
         
-        # OBTENER DATOS DEL MAPA - MANERA DIRECTA
-        mapa = Mapa.query.first()
-        if not mapa:
+        # Snapshot del mapa (con artesanos) cacheado por versión
+        snapshot = MapaService.obtener_snapshot(admin=True)
+        if not snapshot:
             return jsonify({'error': 'No se ha configurado el mapa'}), 404
             
-        print(f"Mapa encontrado: {mapa.mapa_id} - {mapa.cant_total_filas}x{mapa.cant_total_columnas}")
-        
-        # Obtener parcelas
-        parcelas = Parcela.query.filter_by(mapa_id=mapa.mapa_id).all()
-        print(f"Parcelas encontradas: {len(parcelas)}")
-        
-        # Procesar parcelas
-        parcelas_data = []
-        for parcela in parcelas:
-            parcela_data = {
-                'parcela_id': parcela.parcela_id,
-                'fila': parcela.fila,
-                'columna': parcela.columna,
-                'habilitada': parcela.habilitada,
-                'rubro_id': parcela.rubro_id,
-                'mapa_id': parcela.mapa_id,
-                'tipo_parcela_id': parcela.tipo_parcela_id
-            }
-            
-            # Obtener información del rubro DIRECTAMENTE
-            rubro = Rubro.query.get(parcela.rubro_id)
-            if rubro:
-                color = Color.query.get(rubro.color_id)
-                parcela_data['rubro_info'] = {
-                    'tipo': rubro.tipo,
-                    'color': color.codigo_hex if color else '#CCCCCC'
-                }
-            
-            # Verificar si está ocupada - CONSULTA DIRECTA
-            solicitud_ocupada = db.session.query(SolicitudParcela).join(
-                Solicitud, SolicitudParcela.solicitud_id == Solicitud.solicitud_id
-            ).join(
-                EstadoSolicitud, Solicitud.estado_solicitud_id == EstadoSolicitud.estado_solicitud_id
-            ).filter(
-                SolicitudParcela.parcela_id == parcela.parcela_id,
-                EstadoSolicitud.nombre == 'Aprobada'
-            ).first()
-            
-            parcela_data['ocupada'] = solicitud_ocupada is not None
-            
-            # Si está ocupada, obtener info del artesano
-            if solicitud_ocupada:
-                solicitud = Solicitud.query.get(solicitud_ocupada.solicitud_id)
-                if solicitud and solicitud.artesano_id:
-                    artesano = Artesano.query.get(solicitud.artesano_id)
-                    if artesano:
-                        parcela_data['artesano_info'] = {
-                            'artesano_id': artesano.artesano_id,
-                            'nombre': artesano.nombre,
-                            'dni': artesano.dni,
-                            'telefono': artesano.telefono
-                        }
-            
-            parcelas_data.append(parcela_data)
+        print(f"Snapshot del mapa: versión {snapshot.version}")
         
         print("FINALIZADO EXITOSAMENTE")
         
-        return jsonify({
-            'parcelas': parcelas_data,
-            'mapa': {
-                'mapa_id': mapa.mapa_id,
-                'cant_total_filas': mapa.cant_total_filas,
-                'cant_total_columnas': mapa.cant_total_columnas
-            },
-            'total': len(parcelas_data)
-        }), 200
+        return MapaService.responder_snapshot(snapshot)
         
     except Exception as e:
         import traceback
@@ -1229,16 +1220,7 @@ def deshabilitar_parcelas():
                 continue
                 
             # Verificar si está ocupada - CONSULTA DIRECTA SIN RELACIONES
-            solicitud_ocupada = db.session.query(SolicitudParcela).join(
-                Solicitud, SolicitudParcela.solicitud_id == Solicitud.solicitud_id
-            ).join(
-                EstadoSolicitud, Solicitud.estado_solicitud_id == EstadoSolicitud.estado_solicitud_id
-            ).filter(
-                SolicitudParcela.parcela_id == parcela_id,
-                EstadoSolicitud.nombre == 'Aprobada'
-            ).first()
-            
-            if solicitud_ocupada:
+            if OcupacionParcelas.esta_ocupada(parcela_id):
                 parcelas_ocupadas.append(parcela_id)
         
         if parcelas_ocupadas:
@@ -1254,6 +1236,7 @@ def deshabilitar_parcelas():
                 parcela.habilitada = False
         
         db.session.commit()
+        MapaService.registrar_cambios(parcelas_ids, CAMBIO_DESHABILITADA)
         
         return jsonify({
             'message': f'{len(parcelas_ids)} parcelas deshabilitadas correctamente'
@@ -1289,6 +1272,7 @@ def habilitar_parcelas():
                 parcela.habilitada = True
         
         db.session.commit()
+        MapaService.registrar_cambios(parcelas_ids, CAMBIO_HABILITADA)
         
         return jsonify({
             'message': f'{len(parcelas_ids)} parcelas habilitadas correctamente'
@@ -1325,16 +1309,7 @@ def asignar_rubro_parcela():
             return jsonify({"error": "Parcela no encontrada"}), 404
 
         # Si está ocupada, no se puede tocar
-        solicitud_ocupada = db.session.query(SolicitudParcela).join(
-            Solicitud, SolicitudParcela.solicitud_id == Solicitud.solicitud_id
-        ).join(
-            EstadoSolicitud, Solicitud.estado_solicitud_id == EstadoSolicitud.estado_solicitud_id
-        ).filter(
-            SolicitudParcela.parcela_id == parcela_id,
-            EstadoSolicitud.nombre == 'Aprobada'
-        ).first()
-
-        if solicitud_ocupada:
+        if OcupacionParcelas.esta_ocupada(parcela_id):
             return jsonify({
                 "error": "La parcela está ocupada por un artesano. No se puede modificar."
             }), 400
@@ -1344,6 +1319,7 @@ def asignar_rubro_parcela():
             parcela.habilitada = False
             parcela.rubro_id = None
             db.session.commit()
+            MapaService.registrar_cambios([parcela.parcela_id], CAMBIO_DESHABILITADA)
             return jsonify({
                 "message": "Parcela deshabilitada correctamente (calle).",
                 "parcela_id": parcela.parcela_id
@@ -1354,8 +1330,7 @@ def asignar_rubro_parcela():
 
         # ASIGNAR O REMOVER RUBRO
         if rubro_id:
-            rubro = Rubro.query.get(rubro_id)
-            if not rubro:
+            if not Catalogos.rubros.por_id(rubro_id):
                 return jsonify({"error": "Rubro no encontrado"}), 404
 
             parcela.rubro_id = rubro_id
@@ -1365,6 +1340,7 @@ def asignar_rubro_parcela():
             parcela.rubro_id = None
 
         db.session.commit()
+        MapaService.registrar_cambios([parcela.parcela_id], CAMBIO_RUBRO)
 
         return jsonify({
             "message": "Parcela actualizada correctamente",
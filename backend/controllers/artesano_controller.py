@@ -3,6 +3,8 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models.base import db
 from models.artesano import Artesano
+from models.solicitud import Solicitud
+from utils.mapa_service import MapaService, CAMBIO_DATOS
 
 # Crear blueprint directamente
 artesano_bp = Blueprint('artesano_bp', __name__, url_prefix='/artesano')
@@ -72,6 +74,14 @@ def actualizar_perfil():
             artesano.telefono = data['telefono']
         
         db.session.commit()
+
+        # El mapa de admin muestra nombre y teléfono del artesano
+        solicitudes = db.session.query(Solicitud.solicitud_id).filter_by(
+            artesano_id=artesano.artesano_id
+        ).all()
+        MapaService.registrar_cambios(
+            MapaService.parcelas_de_solicitudes([s.solicitud_id for s in solicitudes]), CAMBIO_DATOS
+        )
         
         return jsonify({
             'msg': 'Perfil actualizado exitosamente',
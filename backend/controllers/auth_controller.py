@@ -29,8 +29,6 @@ def handle_options():
 def can_user_login(usuario_id):
     """Verifica si un usuario puede hacer login (no tiene sesión activa)"""
     try:
-        TokenManager.cleanup_expired_tokens()
-        
         active_session = TokenManager.get_active_session(usuario_id)
         
         if active_session:
@@ -89,13 +87,17 @@ def login():
             return jsonify({'msg': 'Faltan email o contraseña'}), 400
 
         user = Usuario.query.filter_by(email=email).first()
+        # check_password actualiza el hash si quedó con la política anterior;
+        # el cambio se guarda con el commit de open_session
         if not user or not user.check_password(password):
             return jsonify({'msg': 'Credenciales inválidas'}), 401
 
-        if not TokenManager.can_user_login(user.usuario_id):
-            return jsonify({'msg': 'Usuario ya tiene una sesión activa. Cierre sesión en otros dispositivos.'}), 409
-
         jti = str(uuid.uuid4())
+        expires_at = datetime.now(timezone.utc) + timedelta(minutes=5)# Esta con poco tiempo para hacer pruebas sinoexpires_at = datetime.now(timezone.utc) + timedelta(hours=24)
+
+        # Chequeo de sesión activa + upsert de la nueva en una sola transacción
+        if not TokenManager.open_session(user.usuario_id, jti, expires_at):
+            return jsonify({'msg': 'Usuario ya tiene una sesión activa. Cierre sesión en otros dispositivos.'}), 409
         
         additional_claims = {
             "jti": jti,
@@ -110,9 +112,6 @@ def login():
             expires_delta=timedelta(minutes=5)# Esta con poco tiempo para hacer pruebas sino expires_delta=timedelta(hours=24) 
         )
 
-        expires_at = datetime.now(timezone.utc) + timedelta(minutes=5)# Esta con poco tiempo para hacer pruebas sinoexpires_at = datetime.now(timezone.utc) + timedelta(hours=24)
-        TokenManager.add_active_session(user.usuario_id, jti, expires_at)
-
         response = jsonify({
             'access_token': access_token,
             'rol_id': user.rol_id,
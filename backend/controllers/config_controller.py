@@ -1,6 +1,6 @@
 # controllers/config_controller.py
 from flask import Blueprint, jsonify
-from models.rubro import Rubro
+from utils.catalogos import Catalogos
 
 # Crear blueprint directamente
 config_bp = Blueprint('config_bp', __name__, url_prefix='/config')
@@ -9,7 +9,13 @@ config_bp = Blueprint('config_bp', __name__, url_prefix='/config')
 def obtener_rubros():
     """Público - para que los artesanos vean los rubros disponibles"""
     try:
-        rubros = Rubro.query.filter_by(es_activo=True).all()
-        return jsonify([r.to_dict() for r in rubros]), 200
+        rubros = Catalogos.rubros.activos()
+        return jsonify([{
+            'rubro_id': r.id,
+            'tipo': r.nombre,
+            'precio_parcela': r.precio_parcela,
+            'color_id': r.color_id,
+            'es_activo': r.es_activo
+        } for r in rubros]), 200
     except Exception as e:
         return jsonify({'msg': 'Error al obtener rubros', 'error': str(e)}), 500
\ No newline at end of file
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models.base import db
 from models.parcela import Parcela
@@ -6,10 +6,13 @@ from models.mapa import Mapa
 from models.artesano import Artesano
 from models.usuario import Usuario
 from models.solicitud import Solicitud
-from models.estado_solicitud import EstadoSolicitud
 from models.rubro import Rubro
 from models.solicitud_parcela import SolicitudParcela
-from models.color import Color
+from utils.mapa_service import MapaService, MapaCache, CAMBIO_OCUPADA, CAMBIO_LIBERADA, CAMBIO_RUBRO
+from utils.mapa_eventos import MapaEventosHub
+from utils.reserva_parcelas import ReservaParcelas, ParcelaOcupadaError
+from utils.catalogos import Catalogos, ESTADO_SOLICITUD_APROBADA, ESTADO_SOLICITUD_PARCIAL
+import json
 
 parcela_bp = Blueprint('parcela', __name__, url_prefix='/api/v1')
 
@@ -31,65 +34,69 @@ def get_artesano_from_user():
 @jwt_required()
 def obtener_parcelas_mapa():
     try:
-        user_identity = get_jwt_identity()
+        # Snapshot cacheado por versión; 304 si el cliente ya lo tiene
+        snapshot = MapaService.obtener_snapshot()
+        if not snapshot:
+            return jsonify({'error': 'No se ha configurado el mapa'}), 404
 
-        # Extraer ID del usuario
-        if isinstance(user_identity, str) and user_identity.startswith('user_'):
-            usuario_id = int(user_identity.split('_')[1])
-        else:
-            usuario_id = int(user_identity)
+        return MapaService.responder_snapshot(snapshot)
 
-        mapa = Mapa.query.first()
-        if not mapa:
-            return jsonify({'error': 'No se ha configurado el mapa'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        parcelas = Parcela.query.filter_by(mapa_id=mapa.mapa_id).all()
 
-        parcelas_data = []
-        for parcela in parcelas:
-            parcela_data = {
-                'parcela_id': parcela.parcela_id,
-                'fila': parcela.fila,
-                'columna': parcela.columna,
-                'habilitada': parcela.habilitada,
-                'rubro_id': parcela.rubro_id
-            }
+@parcela_bp.route('/mapa/cambios', methods=['GET'])
+@jwt_required()
+def obtener_cambios_mapa():
+    """
+    Celdas que cambiaron desde la versión 'desde' del cliente, que debe
+    mandar también su 'epoca'. Si falta la época, no coincide (las
+    versiones de otro proceso no son comparables) o el log no alcanza
+    (cliente muy atrasado o cambio estructural) devuelve el mapa completo
+    con 'completo': true.
+    """
+    try:
+        desde = request.args.get('desde', type=int)
+        epoca = request.args.get('epoca')
 
-            # Info del rubro
-            rubro = Rubro.query.get(parcela.rubro_id)
-            if rubro:
-                color = Color.query.get(rubro.color_id)
-                parcela_data['rubro_info'] = {
-                    'tipo': rubro.tipo,
-                    'color': color.codigo_hex if color else '#CCCCCC'
-                }
+        payload = None
+        if desde is not None and epoca == MapaCache.epoca:
+            payload = MapaService.obtener_cambios(desde)
 
-            # Verificar si está ocupada
-            solicitud_ocupada = db.session.query(SolicitudParcela).join(
-                Solicitud, SolicitudParcela.solicitud_id == Solicitud.solicitud_id
-            ).join(
-                EstadoSolicitud, Solicitud.estado_solicitud_id == EstadoSolicitud.estado_solicitud_id
-            ).filter(
-                SolicitudParcela.parcela_id == parcela.parcela_id,
-                EstadoSolicitud.nombre == 'Aprobada'
-            ).first()
+        if payload is not None:
+            return jsonify(payload), 200
 
-            parcela_data['ocupada'] = solicitud_ocupada is not None
-            parcelas_data.append(parcela_data)
+        snapshot = MapaService.obtener_snapshot()
+        if not snapshot:
+            return jsonify({'error': 'No se ha configurado el mapa'}), 404
 
-        return jsonify({
-            'parcelas': parcelas_data,
-            'mapa': {
-                'mapa_id': mapa.mapa_id,
-                'cant_total_filas': mapa.cant_total_filas,
-                'cant_total_columnas': mapa.cant_total_columnas
-            },
-            'total': len(parcelas_data)
-        }), 200
+        payload = json.loads(snapshot.body)
+        payload['completo'] = True
+        return jsonify(payload), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@parcela_bp.route('/mapa/stream', methods=['GET'])
+@jwt_required()
+def stream_mapa():
+    """
+    Server-Sent Events con los cambios de ocupación del mapa.
+    Eventos: 'parcelas' (celdas cambiadas, mismo formato que /mapa/cambios)
+    y 'resync' (el cliente debe volver a pedir /mapa/parcelas).
+    EventSource no manda headers, por eso el token se toma de la cookie.
+    """
+    ultimo_id = request.headers.get('Last-Event-ID', type=int)
+
+    response = Response(
+        MapaEventosHub.escuchar(ultimo_id),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # Evita que nginx bufferee el stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @parcela_bp.route('/parcelas/<int:parcela_id>/seleccionar', methods=['POST'])
 @jwt_required()
 def seleccionar_parcela(parcela_id):
@@ -98,82 +105,95 @@ def seleccionar_parcela(parcela_id):
         if not artesano:
             return jsonify({'error': 'Artesano no encontrado'}), 404
 
-        estado_aprobada = EstadoSolicitud.query.filter_by(nombre='Aprobada').first()
-        solicitud_aprobada = Solicitud.query.filter(
-            Solicitud.artesano_id == artesano.artesano_id,
-            Solicitud.estado_solicitud_id == estado_aprobada.estado_solicitud_id
-        ).first()
-
-        if not solicitud_aprobada:
-            return jsonify({
-                'error': 'No tienes una solicitud APROBADA.'
-            }), 400
-
-        parcela = Parcela.query.get(parcela_id)
-        if not parcela:
-            return jsonify({'error': 'Parcela no encontrada'}), 404
-
-        if not parcela.habilitada:
-            return jsonify({'error': 'Esta parcela no está habilitada'}), 400
-
-        # Verificar si la parcela ya está ocupada
-        ocupada = db.session.query(SolicitudParcela).join(
-            Solicitud
-        ).filter(
-            SolicitudParcela.parcela_id == parcela_id,
-            Solicitud.estado_solicitud_id == estado_aprobada.estado_solicitud_id
-        ).first()
+        # Unidad de trabajo completa: se repite si la base aborta por deadlock
+        cuerpo, status = ReservaParcelas.con_reintentos(
+            _reservar_parcela_artesano, artesano.artesano_id, parcela_id
+        )
+        return jsonify(cuerpo), status
 
-        if ocupada:
-            return jsonify({'error': 'Esta parcela ya está ocupada'}), 400
+    except ParcelaOcupadaError:
+        return jsonify({'error': 'Esta parcela ya está ocupada'}), 409
 
-        # Verificar rubro
-        if parcela.rubro_id != solicitud_aprobada.rubro_id:
-            return jsonify({'error': 'Rubro incompatible con tu solicitud'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
 
-        # VERIFICACIÓN MODIFICADA: Permitir múltiples parcelas hasta el límite necesario
-        parcelas_ya_asignadas = db.session.query(SolicitudParcela).join(
-            Solicitud
-        ).filter(
-            Solicitud.artesano_id == artesano.artesano_id,
-            Solicitud.estado_solicitud_id == estado_aprobada.estado_solicitud_id
-        ).count()
 
-        # Verificar si ya alcanzó el límite de parcelas
-        if parcelas_ya_asignadas >= solicitud_aprobada.parcelas_necesarias:
-            return jsonify({
-                'error': f'Ya has alcanzado el límite de {solicitud_aprobada.parcelas_necesarias} parcela(s) para tu solicitud'
-            }), 400
+def _reservar_parcela_artesano(artesano_id, parcela_id):
+    """Verifica y asigna la parcela con bloqueo de fila; devuelve (cuerpo, status)"""
+    # El bloqueo sobre la solicitud va primero: serializa los clics
+    # concurrentes del mismo artesano antes de cualquier lectura
+    solicitud_aprobada = Solicitud.query.filter(
+        Solicitud.artesano_id == artesano_id,
+        Solicitud.estado_solicitud_id == Catalogos.estado_solicitud_id(ESTADO_SOLICITUD_APROBADA)
+    ).with_for_update().first()
 
-        # Crear asignación
-        nueva = SolicitudParcela(
-            solicitud_id=solicitud_aprobada.solicitud_id,
-            parcela_id=parcela_id
-        )
+    if not solicitud_aprobada:
+        db.session.rollback()
+        return {'error': 'No tienes una solicitud APROBADA.'}, 400
 
-        db.session.add(nueva)
-        db.session.commit()
+    parcela = Parcela.query.filter_by(parcela_id=parcela_id).with_for_update().first()
+    if not parcela:
+        db.session.rollback()
+        return {'error': 'Parcela no encontrada'}, 404
 
-        # Verificar si ya completó todas las parcelas necesarias
-        parcelas_actuales = parcelas_ya_asignadas + 1
-        if parcelas_actuales == solicitud_aprobada.parcelas_necesarias:
-            # Cambiar estado a "Parcialmente Asignada" o "Completada"
-            estado_completado = EstadoSolicitud.query.filter_by(nombre='Parcialmente Asignada').first()
-            if estado_completado:
-                solicitud_aprobada.estado_solicitud_id = estado_completado.estado_solicitud_id
-                db.session.commit()
+    if not parcela.habilitada:
+        db.session.rollback()
+        return {'error': 'Esta parcela no está habilitada'}, 400
 
-        return jsonify({
-            'success': True,
-            'message': f'¡Parcela seleccionada exitosamente! ({parcelas_actuales}/{solicitud_aprobada.parcelas_necesarias})',
-            'solicitud_parcela_id': nueva.solicitud_parcela_id,
-            'parcelas_asignadas': parcelas_actuales,
-            'parcelas_necesarias': solicitud_aprobada.parcelas_necesarias
-        }), 200
+    # Verificar rubro
+    if parcela.rubro_id != solicitud_aprobada.rubro_id:
+        db.session.rollback()
+        return {'error': 'Rubro incompatible con tu solicitud'}, 400
+
+    # VERIFICACIÓN MODIFICADA: Permitir múltiples parcelas hasta el límite necesario
+    # (lectura con bloqueo para ver las asignaciones ya confirmadas)
+    parcelas_ya_asignadas = len(db.session.query(SolicitudParcela.parcela_id).join(
+        Solicitud
+    ).filter(
+        Solicitud.artesano_id == artesano_id,
+        Solicitud.estado_solicitud_id == solicitud_aprobada.estado_solicitud_id,
+        SolicitudParcela.activa == True
+    ).with_for_update().all())
+
+    # Verificar si ya alcanzó el límite de parcelas
+    if parcelas_ya_asignadas >= solicitud_aprobada.parcelas_necesarias:
+        db.session.rollback()
+        return {
+            'error': f'Ya has alcanzado el límite de {solicitud_aprobada.parcelas_necesarias} parcela(s) para tu solicitud'
+        }, 400
 
-    except Exception as e:
+    # Crear asignación
+    asignadas, conflictos = ReservaParcelas.reservar(solicitud_aprobada.solicitud_id, [parcela_id])
+    if conflictos:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 500
+        return {'error': 'Esta parcela ya está ocupada'}, 400
+
+    # Verificar si ya completó todas las parcelas necesarias
+    parcelas_actuales = parcelas_ya_asignadas + 1
+    if parcelas_actuales == solicitud_aprobada.parcelas_necesarias:
+        # Cambiar estado a "Parcialmente Asignada" o "Completada"
+        estado_completado = Catalogos.estados_solicitud.por_nombre(ESTADO_SOLICITUD_PARCIAL)
+        if estado_completado:
+            solicitud_aprobada.estado_solicitud_id = estado_completado.id
+
+    # Asignación y cambio de estado en un único commit
+    db.session.commit()
+    MapaService.registrar_cambios(
+        MapaService.parcelas_de_solicitudes([solicitud_aprobada.solicitud_id]), CAMBIO_OCUPADA
+    )
+
+    nueva = SolicitudParcela.query.filter_by(
+        solicitud_id=solicitud_aprobada.solicitud_id, parcela_id=parcela_id, activa=True
+    ).first()
+
+    return {
+        'success': True,
+        'message': f'¡Parcela seleccionada exitosamente! ({parcelas_actuales}/{solicitud_aprobada.parcelas_necesarias})',
+        'solicitud_parcela_id': nueva.solicitud_parcela_id,
+        'parcelas_asignadas': parcelas_actuales,
+        'parcelas_necesarias': solicitud_aprobada.parcelas_necesarias
+    }, 200
 
 
 @parcela_bp.route('/artesano/mi-parcela', methods=['GET'])
@@ -187,17 +207,17 @@ def obtener_mi_parcela():
         print(f"🔍 Buscando parcelas para artesano_id: {artesano.artesano_id}")
 
         # Buscar estados válidos - manejar caso donde no existen
-        estado_aprobada = EstadoSolicitud.query.filter_by(nombre='Aprobada').first()
-        estado_parcial = EstadoSolicitud.query.filter_by(nombre='Parcialmente Asignada').first()
+        estado_aprobada = Catalogos.estados_solicitud.por_nombre(ESTADO_SOLICITUD_APROBADA)
+        estado_parcial = Catalogos.estados_solicitud.por_nombre(ESTADO_SOLICITUD_PARCIAL)
         
         if not estado_aprobada:
             print("❌ Estado 'Aprobada' no encontrado en la base de datos")
             return jsonify({'error': 'Estado "Aprobada" no configurado'}), 500
 
         # Obtener estados válidos
-        estados_validos = [estado_aprobada.estado_solicitud_id]
+        estados_validos = [estado_aprobada.id]
         if estado_parcial:
-            estados_validos.append(estado_parcial.estado_solicitud_id)
+            estados_validos.append(estado_parcial.id)
             print(f"✅ Estados válidos: {estados_validos}")
 
         # Obtener solicitud activa primero
@@ -218,16 +238,18 @@ def obtener_mi_parcela():
 
         print(f"✅ Solicitud encontrada: {solicitud_activa.solicitud_id}, parcelas_necesarias: {solicitud_activa.parcelas_necesarias}")
 
-        # Obtener parcelas asignadas a esta solicitud
-        solicitudes_parcelas = SolicitudParcela.query.filter_by(
-            solicitud_id=solicitud_activa.solicitud_id
+        # Parcelas asignadas a esta solicitud (una sola consulta)
+        solicitudes_parcelas = db.session.query(SolicitudParcela, Parcela).outerjoin(
+            Parcela, Parcela.parcela_id == SolicitudParcela.parcela_id
+        ).filter(
+            SolicitudParcela.solicitud_id == solicitud_activa.solicitud_id,
+            SolicitudParcela.activa == True
         ).all()
 
         print(f"📦 Encontradas {len(solicitudes_parcelas)} relaciones SolicitudParcela")
 
         parcelas_data = []
-        for solicitud_parcela in solicitudes_parcelas:
-            parcela = Parcela.query.get(solicitud_parcela.parcela_id)
+        for solicitud_parcela, parcela in solicitudes_parcelas:
             if not parcela:
                 print(f"⚠️ Parcela {solicitud_parcela.parcela_id} no encontrada")
                 continue
@@ -243,12 +265,11 @@ def obtener_mi_parcela():
 
             # Info del rubro
             if parcela.rubro_id:
-                rubro = Rubro.query.get(parcela.rubro_id)
+                rubro = Catalogos.rubros.por_id(parcela.rubro_id)
                 if rubro:
-                    color = Color.query.get(rubro.color_id) if rubro.color_id else None
                     data['rubro_info'] = {
-                        'tipo': rubro.tipo,
-                        'color': color.codigo_hex if color else '#CCCCCC'
+                        'tipo': rubro.nombre,
+                        'color': rubro.codigo_hex or '#CCCCCC'
                     }
 
             parcelas_data.append(data)
@@ -283,20 +304,21 @@ def liberar_parcela():
         if not artesano:
             return jsonify({'error': 'Artesano no encontrado'}), 404
 
-        estado_aprobada = EstadoSolicitud.query.filter_by(nombre='Aprobada').first()
-
         solicitud_parcela = SolicitudParcela.query.join(
             Solicitud
         ).filter(
             Solicitud.artesano_id == artesano.artesano_id,
-            Solicitud.estado_solicitud_id == estado_aprobada.estado_solicitud_id
+            Solicitud.estado_solicitud_id == Catalogos.estado_solicitud_id(ESTADO_SOLICITUD_APROBADA),
+            SolicitudParcela.activa == True
         ).first()
 
         if not solicitud_parcela:
             return jsonify({'error': 'No tienes parcela asignada'}), 404
 
-        db.session.delete(solicitud_parcela)
+        parcela_liberada_id = solicitud_parcela.parcela_id
+        ReservaParcelas.liberar_solicitud(solicitud_parcela.solicitud_id, [parcela_liberada_id])
         db.session.commit()
+        MapaService.registrar_cambios([parcela_liberada_id], CAMBIO_LIBERADA)
 
         return jsonify({'message': 'Parcela liberada exitosamente'}), 200
 
@@ -322,17 +344,18 @@ def asignar_rubro(parcela_id):
         if not parcela:
             return jsonify({'error': 'Parcela no encontrada'}), 404
 
-        rubro = Rubro.query.get(rubro_id)
+        rubro = Catalogos.rubros.por_id(rubro_id)
         if not rubro:
             return jsonify({'error': 'Rubro no encontrado'}), 404
 
         parcela.rubro_id = rubro_id
         db.session.commit()
+        MapaService.registrar_cambios([parcela_id], CAMBIO_RUBRO)
 
         return jsonify({
             'message': 'Rubro asignado correctamente',
             'parcela_id': parcela.parcela_id,
-            'nuevo_rubro': rubro.tipo
+            'nuevo_rubro': rubro.nombre
         }), 200
 
     except Exception as e:
@@ -355,12 +378,17 @@ def asignar_color_rubro(rubro_id):
         if not rubro:
             return jsonify({"error": "Rubro no encontrado"}), 404
 
-        color = Color.query.filter_by(codigo_hex=color_hex).first()
+        color = Catalogos.colores.buscar(codigo_hex=color_hex)
         if not color:
             return jsonify({"error": "El color no existe en tabla Color"}), 404
 
-        rubro.color_id = color.color_id
+        rubro.color_id = color.id
         db.session.commit()
+        Catalogos.rubros.invalidar()
+
+        # El color se ve en todas las parcelas del rubro
+        parcelas_rubro = db.session.query(Parcela.parcela_id).filter_by(rubro_id=rubro_id).all()
+        MapaService.registrar_cambios([p.parcela_id for p in parcelas_rubro], CAMBIO_RUBRO)
 
         return jsonify({
             "message": "Color asignado correctamente al rubro",
@@ -383,30 +411,31 @@ def obtener_rubros():
         print("🔍 Intentando obtener rubros...")
         
         # Obtener solo rubros activos
-        rubros = Rubro.query.filter_by(es_activo=True).all()
+        rubros = Catalogos.rubros.activos()
         print(f"Se encontraron {len(rubros)} rubros activos")
         
         rubros_data = []
         for rubro in rubros:
-            print(f"📋 Procesando rubro: {rubro.tipo}")
+            print(f"📋 Procesando rubro: {rubro.nombre}")
             
             # Construir datos del rubro
             rubro_data = {
-                'rubro_id': rubro.rubro_id,
-                'tipo': rubro.tipo,
-                'precio_parcela': float(rubro.precio_parcela),
+                'rubro_id': rubro.id,
+                'tipo': rubro.nombre,
+                'precio_parcela': rubro.precio_parcela,
                 'color_id': rubro.color_id,
                 'es_activo': rubro.es_activo
             }
             
             # Incluir información del color relacionado
-            if hasattr(rubro, 'color_rel') and rubro.color_rel:
+            color = Catalogos.colores.por_id(rubro.color_id)
+            if color:
                 rubro_data['color_rel'] = {
-                    'color_id': rubro.color_rel.color_id,
-                    'codigo_hex': rubro.color_rel.codigo_hex,
-                    'nombre': rubro.color_rel.nombre
+                    'color_id': color.id,
+                    'codigo_hex': color.codigo_hex,
+                    'nombre': color.nombre
                 }
-                print(f"Color encontrado: {rubro.color_rel.codigo_hex}")
+                print(f"Color encontrado: {color.codigo_hex}")
             else:
                 print("No se pudo acceder al color_rel, usando color por defecto")
                 # Color por defecto si no hay relación
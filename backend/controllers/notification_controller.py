@@ -3,9 +3,9 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db
 from models.notificacion import Notificacion
-from models.estado_notificacion import EstadoNotificacion
 from models.artesano import Artesano
 from models.usuario import Usuario
+from utils.catalogos import Catalogos
 
 notification_bp = Blueprint('notification', __name__, url_prefix='/api/v1')
 
@@ -44,8 +44,9 @@ class NotificationController:
             notificaciones_data = []
             for notif in notificaciones:
                 notif_data = notif.to_dict()
-                estado = EstadoNotificacion.query.get(notif.estado_notificacion_id)
-                notif_data['estado_nombre'] = estado.nombre if estado else 'Desconocido'
+                notif_data['estado_nombre'] = Catalogos.estados_notificacion.nombre_de(
+                    notif.estado_notificacion_id, 'Desconocido'
+                )
                 notificaciones_data.append(notif_data)
             
             return jsonify({
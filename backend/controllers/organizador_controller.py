@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Usuario, Mapa, Parcela, Solicitud, SolicitudParcela, EstadoSolicitud
+from models import db, Usuario, Mapa
+from utils.mapa_service import MapaService
+from utils.grilla_mapa import GrillaMapa, ParcelasOcupadasError, ParcelasConHistorialError
 
 organizador_bp = Blueprint('organizador_bp', __name__)
 
@@ -42,79 +44,37 @@ def configurar_mapa_organizador():
                 cant_total_columnas=nuevas_columnas
             )
             db.session.add(mapa)
-            db.session.commit()
+            db.session.flush()
 
-            for f in range(1, nuevas_filas + 1):
-                for c in range(1, nuevas_columnas + 1):
-                    db.session.add(Parcela(
-                        fila=f,
-                        columna=c,
-                        habilitada=True,
-                        mapa_id=mapa.mapa_id,
-                        rubro_id=None,
-                        tipo_parcela_id=None
-                    ))
+            GrillaMapa.reconfigurar(mapa, nuevas_filas, nuevas_columnas)
             db.session.commit()
+            MapaService.invalidar_cache()
 
             return jsonify({'message': 'Mapa configurado correctamente.'}), 201
 
-        filas_actuales = mapa.cant_total_filas
-        columnas_actuales = mapa.cant_total_columnas
-
-       
-        parcelas_sobrantes = Parcela.query.filter(
-            (Parcela.fila > nuevas_filas) |
-            (Parcela.columna > nuevas_columnas)
-        ).all()
-
-        ocupadas = []
-        for p in parcelas_sobrantes:
-            solicitud_ocupada = db.session.query(SolicitudParcela).join(
-                Solicitud, SolicitudParcela.solicitud_id == Solicitud.solicitud_id
-            ).join(
-                EstadoSolicitud, Solicitud.estado_solicitud_id == EstadoSolicitud.estado_solicitud_id
-            ).filter(
-                SolicitudParcela.parcela_id == p.parcela_id,
-                EstadoSolicitud.nombre == 'Aprobada'
-            ).first()
-
-            if solicitud_ocupada:
-                ocupadas.append({
-                    'parcela_id': p.parcela_id,
-                    'fila': p.fila,
-                    'columna': p.columna
-                })
-
-        if ocupadas:
+        try:
+            cambios = GrillaMapa.reconfigurar(mapa, nuevas_filas, nuevas_columnas)
+        except ParcelasOcupadasError as e:
+            db.session.rollback()
+            return jsonify({
+                'error': str(e),
+                'parcelas_ocupadas': e.ocupadas
+            }), 400
+        except ParcelasConHistorialError as e:
+            db.session.rollback()
             return jsonify({
-                'error': 'No se puede reducir el mapa: hay parcelas ocupadas.',
-                'parcelas_ocupadas': ocupadas
+                'error': str(e),
+                'parcelas_con_historial': e.parcelas
             }), 400
 
-        for p in parcelas_sobrantes:
-            db.session.delete(p)
-
-        for f in range(1, nuevas_filas + 1):
-            for c in range(1, nuevas_columnas + 1):
-                existente = Parcela.query.filter_by(
-                    fila=f, columna=c, mapa_id=mapa.mapa_id
-                ).first()
-
-                if not existente:
-                    db.session.add(Parcela(
-                        fila=f,
-                        columna=c,
-                        habilitada=True,
-                        mapa_id=mapa.mapa_id,
-                        rubro_id=None,
-                        tipo_parcela_id=None
-                    ))
-
-        mapa.cant_total_filas = nuevas_filas
-        mapa.cant_total_columnas = nuevas_columnas
         db.session.commit()
+        MapaService.invalidar_cache()
 
-        return jsonify({'message': 'Mapa actualizado correctamente.'}), 200
+        return jsonify({
+            'message': 'Mapa actualizado correctamente.',
+            'parcelas_creadas': cambios['creadas'],
+            'parcelas_eliminadas': cambios['eliminadas']
+        }), 200
 
     except Exception as e:
         db.session.rollback()
@@ -5,38 +5,55 @@ from models.base import db
 from models.pago import Pago
 from models.solicitud import Solicitud
 from models.artesano import Artesano
-from models.estado_pago import EstadoPago
-from models.estado_solicitud import EstadoSolicitud
 from models.usuario import Usuario
 from models.rubro import Rubro
 from models.parcela import Parcela
 from models.solicitud_parcela import SolicitudParcela
-import mercadopago
 import os
 from datetime import datetime, timedelta
 import json
 from sqlalchemy.exc import SQLAlchemyError
-import tempfile
-from flask import send_file
-from utils.pdf_generator import generar_comprobante_pago
+from utils.comprobantes_cache import CacheComprobantes
+from utils.mapa_service import MapaService, CAMBIO_RESERVADA, CAMBIO_LIBERADA
+from utils.reserva_parcelas import ReservaParcelas, ParcelaOcupadaError
+from utils.webhook_inbox import WebhookInbox
+from utils.mercadopago_cliente import obtener_cliente_mp, ErrorMercadoPago, RechazoMercadoPago, CircuitoAbiertoError
+from utils.aprobacion_pagos import (
+    ServicioAprobacionPagos, ESTADO_PAGO_POR_STATUS_MP, PAGO_AUTO_APROBACION, PAGO_AUTO_APROBACION_SEGUNDOS
+)
+from utils.catalogos import (
+    Catalogos, ESTADO_SOLICITUD_APROBADA,
+    ESTADO_PAGO_PENDIENTE, ESTADO_PAGO_PAGADO, ESTADO_PAGO_RECHAZADO, ESTADO_PAGO_CANCELADO
+)
 
 
 pago_bp = Blueprint("pago", __name__, url_prefix="/api/v1/pago")
 
 # -------------------------------------------
-#   SDK de MercadoPago
+#   Cliente de MercadoPago (utils/mercadopago_cliente.py)
 # -------------------------------------------
 ACCESS_TOKEN = os.getenv("MERCADOPAGO_ACCESS_TOKEN", "")
-mp = None
 
-if ACCESS_TOKEN:
+try:
+    if obtener_cliente_mp():
+        print(f"Cliente de MercadoPago inicializado. Modo: {'SANDBOX' if ACCESS_TOKEN.startswith('TEST') else 'PRODUCCIÓN'}")
+    else:
+        print("ADVERTENCIA: MERCADOPAGO_ACCESS_TOKEN no configurado. Pagos no funcionarán.")
+except Exception as e:
+    print(f"Error inicializando el cliente de MercadoPago: {e}")
+
+def liberar_reservas_solicitud(solicitud_id):
+    """Suelta las parcelas retenidas por la solicitud (commit propio)"""
     try:
-        mp = mercadopago.SDK(ACCESS_TOKEN)
-        print(f"SDK de MercadoPago inicializado. Modo: {'SANDBOX' if ACCESS_TOKEN.startswith('TEST') else 'PRODUCCIÓN'}")
+        liberadas = ReservaParcelas.liberar_reservas(solicitud_id)
+        db.session.commit()
+        if liberadas:
+            MapaService.registrar_cambios(liberadas, CAMBIO_LIBERADA)
+        return liberadas
     except Exception as e:
-        print(f"Error inicializando MercadoPago SDK: {e}")
-else:
-    print("ADVERTENCIA: MERCADOPAGO_ACCESS_TOKEN no configurado. Pagos no funcionarán.")
+        db.session.rollback()
+        print(f"Error liberando reservas de la solicitud {solicitud_id}: {e}")
+        return []
 
 # -------------------------------------------------
 # 1) Crear Preferencia de MercadoPago
@@ -44,6 +61,7 @@ else:
 @pago_bp.route("/crear-preferencia", methods=['POST'])
 @jwt_required()
 def crear_preferencia():
+    mp = obtener_cliente_mp()
     if not mp:
         return jsonify({"error": "MercadoPago no configurado"}), 500
     
@@ -94,14 +112,14 @@ def crear_preferencia():
             }), 404
         
         # Buscar estado "Aprobada" en EstadoSolicitud
-        estado_aprobada = EstadoSolicitud.query.filter_by(nombre='Aprobada').first()
+        estado_aprobada = Catalogos.estados_solicitud.por_nombre(ESTADO_SOLICITUD_APROBADA)
         if not estado_aprobada:
             return jsonify({"error": "Estado 'Aprobada' no encontrado en el sistema"}), 500
         
         # Buscar solicitud activa aprobada
         solicitud = Solicitud.query.filter_by(
             artesano_id=artesano.artesano_id,
-            estado_solicitud_id=estado_aprobada.estado_solicitud_id
+            estado_solicitud_id=estado_aprobada.id
         ).first()
         
         if not solicitud:
@@ -137,34 +155,19 @@ def crear_preferencia():
         if len(parcelas) != len(parcelas_ids):
             return jsonify({"error": "Algunas parcelas no existen"}), 400
         
-        # Verificar disponibilidad usando tu sistema existente (Solicitud_Parcela)
-        for parcela_id in parcelas_ids:
-            # Verificar si la parcela ya está asignada a alguna solicitud aprobada
-            parcela_ocupada = db.session.query(SolicitudParcela).join(
-                Solicitud, SolicitudParcela.solicitud_id == Solicitud.solicitud_id
-            ).join(
-                EstadoSolicitud, Solicitud.estado_solicitud_id == EstadoSolicitud.estado_solicitud_id
-            ).filter(
-                SolicitudParcela.parcela_id == parcela_id,
-                EstadoSolicitud.nombre == 'Aprobada'
-            ).first()
-            
-            if parcela_ocupada:
-                return jsonify({
-                    "error": f"Parcela {parcela_id} ya está ocupada",
-                    "parcela_id": parcela_id
-                }), 400
+        # La disponibilidad (ocupada o retenida por otro) se verifica al retener
+        for parcela in parcelas:
+            parcela_id = parcela.parcela_id
             
             # Verificar que la parcela sea del mismo rubro que la solicitud
-            parcela = Parcela.query.get(parcela_id)
-            if parcela and parcela.rubro_id != solicitud.rubro_id:
+            if parcela.rubro_id != solicitud.rubro_id:
                 return jsonify({
                     "error": f"Parcela {parcela_id} no es de tu rubro",
                     "detalle": f"Tu rubro es ID {solicitud.rubro_id}, la parcela es del rubro ID {parcela.rubro_id}"
                 }), 400
             
             # Verificar que la parcela esté habilitada
-            if parcela and not parcela.habilitada:
+            if not parcela.habilitada:
                 return jsonify({
                     "error": f"Parcela {parcela_id} no está habilitada",
                     "parcela_id": parcela_id
@@ -183,12 +186,14 @@ def crear_preferencia():
         pago_existente = Pago.query.filter_by(solicitud_id=solicitud.solicitud_id).first()
         
         if pago_existente:
-            estado = EstadoPago.query.get(pago_existente.estado_pago_id)
-            estado_nombre = estado.tipo if estado else "Desconocido"
+            estado = Catalogos.estados_pago.por_id(pago_existente.estado_pago_id)
+            estado_nombre = estado.nombre if estado else "Desconocido"
             
             print(f"Pago existente encontrado: ID {pago_existente.pago_id}, Estado: {estado_nombre}")
             
-            if pago_existente.estado_pago_id in [1, 2]:  # 1=Pendiente, 2=Aprobado
+            if pago_existente.estado_pago_id in (
+                Catalogos.estado_pago_id(ESTADO_PAGO_PENDIENTE), Catalogos.estado_pago_id(ESTADO_PAGO_PAGADO)
+            ):
                 return jsonify({
                     "error": "Ya tenés un pago generado",
                     "detalle": f"Tu pago anterior está en estado: {estado_nombre}",
@@ -197,6 +202,24 @@ def crear_preferencia():
                     "estado_id": pago_existente.estado_pago_id
                 }), 409
         
+        # Retener las parcelas antes de ir a MercadoPago: otro artesano no
+        # puede iniciar un checkout sobre ellas hasta que venza la retención
+        try:
+            retenidas, conflictos = ReservaParcelas.retener(solicitud.solicitud_id, parcelas_ids)
+        except ParcelaOcupadaError:
+            retenidas, conflictos = [], parcelas_ids
+        
+        if conflictos:
+            db.session.rollback()
+            return jsonify({
+                "error": f"Parcela {conflictos[0]} ya está ocupada o reservada por otro artesano",
+                "parcela_id": conflictos[0],
+                "parcelas_no_disponibles": conflictos
+            }), 400
+        
+        db.session.commit()
+        MapaService.registrar_cambios(retenidas, CAMBIO_RESERVADA)
+        
         frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173")
         backend_url = os.getenv("BACKEND_URL", "http://localhost:5000")
 
@@ -262,29 +285,33 @@ def crear_preferencia():
 
         print(f"Enviando a MercadoPago: {json.dumps(preference_data, indent=2)}")
         
-        # Crear preferencia
+        # Crear preferencia (timeouts, reintentos y circuit breaker en el cliente)
         try:
-            preference_response = mp.preference().create(preference_data)
-            print(f"Respuesta de MP: {json.dumps(preference_response, indent=2)}")
-        except Exception as mp_error:
-            print(f"Error de MercadoPago SDK: {mp_error}")
-            return jsonify({"error": "Error al conectar con MercadoPago", "detalle": str(mp_error)}), 500
-        
-        if "response" not in preference_response:
-            print(f"Respuesta inesperada de MP: {preference_response}")
-            return jsonify({"error": "Respuesta inesperada de MercadoPago"}), 500
-        
-        pref = preference_response["response"]
+            pref = mp.crear_preferencia(preference_data)
+            print(f"Respuesta de MP: {json.dumps(pref, indent=2)}")
+        except CircuitoAbiertoError as mp_error:
+            print(f"MercadoPago no disponible: {mp_error}")
+            liberar_reservas_solicitud(solicitud.solicitud_id)
+            return jsonify({"error": "MercadoPago no está disponible en este momento, intenta de nuevo en unos minutos"}), 503
+        except RechazoMercadoPago as mp_error:
+            print(f"MercadoPago rechazó la preferencia: {mp_error}")
+            liberar_reservas_solicitud(solicitud.solicitud_id)
+            return jsonify({"error": "MercadoPago rechazó la preferencia", "detalle": str(mp_error)}), 500
+        except ErrorMercadoPago as mp_error:
+            print(f"Error de MercadoPago: {mp_error}")
+            liberar_reservas_solicitud(solicitud.solicitud_id)
+            return jsonify({"error": "Error al conectar con MercadoPago", "detalle": str(mp_error)}), 502
         
         if "error" in pref:
             print(f"Error en preferencia MP: {pref['error']}")
+            liberar_reservas_solicitud(solicitud.solicitud_id)
             return jsonify({"error": f"MercadoPago: {pref.get('message', 'Error desconocido')}"}), 500
         
         # Guardar pago en base de datos
         pago = Pago(
             solicitud_id=solicitud.solicitud_id,
             monto=monto,
-            estado_pago_id=1,  # Pendiente
+            estado_pago_id=Catalogos.estado_pago_id(ESTADO_PAGO_PENDIENTE),
             preference_id=pref["id"],
             init_point=pref.get("init_point") or pref.get("sandbox_init_point", ""),
             fecha_creacion=datetime.now(),
@@ -298,6 +325,8 @@ def crear_preferencia():
         pago.set_parcelas_seleccionadas(parcelas_ids)
         
         db.session.add(pago)
+        db.session.flush()
+        ReservaParcelas.asociar_pago(solicitud.solicitud_id, pago.pago_id)
         db.session.commit()
         
         print(f"Pago creado en BD: ID {pago.pago_id}, Preference: {pref['id']}")
@@ -351,136 +380,31 @@ def crear_preferencia():
 # -------------------------------------------------
 @pago_bp.route("/webhook", methods=['POST'])
 def pago_webhook():
+    """
+    Solo guarda la notificación en la bandeja y responde: la consulta a
+    MercadoPago y la asignación de parcelas las hace WebhookInbox en
+    segundo plano. Si no se pudo guardar se responde 500 y MP reintenta.
+    """
     try:
         # MercadoPago puede enviar JSON o form-data
         if request.is_json:
-            data = request.get_json()
+            data = request.get_json(silent=True) or {}
         else:
             data = request.form.to_dict()
-        
-        print(f"Webhook recibido: {data}")
-        
-        # Extraer payment_id
-        payment_id = None
-        if data.get("type") == "payment":
-            payment_id = data.get("data", {}).get("id")
-        elif "id" in data:
-            payment_id = data.get("id")
-        
+
+        tipo, payment_id = WebhookInbox.extraer(data)
         if not payment_id:
-            print("No se pudo extraer payment_id del webhook")
-            return jsonify({"status": "ok"}), 200
-        
-        print(f" Procesando payment_id: {payment_id}")
-        
-        # Obtener información del pago desde MercadoPago
-        if not mp:
-            print(" MercadoPago SDK no inicializado")
+            print(f"Webhook sin payment_id: {data}")
             return jsonify({"status": "ok"}), 200
-        
-        try:
-            payment_info = mp.payment().get(payment_id)
-        except Exception as mp_error:
-            print(f"Error obteniendo pago de MP: {mp_error}")
-            return jsonify({"status": "ok"}), 200
-        
-        if "response" not in payment_info:
-            print(f" Respuesta inválida de MP: {payment_info}")
-            return jsonify({"status": "ok"}), 200
-        
-        payment_data = payment_info["response"]
-        
-        # Buscar pago por preference_id
-        preference_id = payment_data.get("preference_id")
-        if not preference_id:
-            print("No hay preference_id en la respuesta")
-            return jsonify({"status": "ok"}), 200
-        
-        pago = Pago.query.filter_by(preference_id=preference_id).first()
-        if not pago:
-            print(f"Pago no encontrado para preference_id: {preference_id}")
-            return jsonify({"status": "ok"}), 200
-        
-        estado_anterior = pago.estado_pago_id
-        
-        # Actualizar estado del pago
-        status = payment_data.get("status")
-        estado_map = {
-            "approved": 2,      # aprobado
-            "pending": 1,       # pendiente
-            "rejected": 3,      # rechazado
-            "cancelled": 4,     # cancelado
-        }
-        
-        nuevo_estado = estado_map.get(status, 4)
-        pago.estado_pago_id = nuevo_estado
-        pago.payment_id = payment_id
-        pago.fecha_pago = datetime.now()
-        
-        print(f"Pago {payment_id}: {status} (anterior: {estado_anterior}, nuevo: {nuevo_estado})")
-        
-        # Si el pago fue aprobado Y antes NO estaba aprobado
-        if status == "approved" and estado_anterior != 2:
-            # Obtener IDs de parcelas seleccionadas
-            parcelas_ids = pago.get_parcelas_seleccionadas()
-            
-            print(f" PAGO APROBADO para solicitud {pago.solicitud_id}")
-            print(f" Asignando parcelas: {parcelas_ids}")
-            
-            # Buscar estado "Pagada" o similar
-            estado_pagada = EstadoSolicitud.query.filter_by(nombre='Pagada').first()
-            if not estado_pagada:
-                # Buscar otros estados posibles
-                for estado_nombre in ['Completada', 'Parcialmente Asignada', 'Finalizada']:
-                    estado_pagada = EstadoSolicitud.query.filter_by(nombre=estado_nombre).first()
-                    if estado_pagada:
-                        break
-            
-            # Actualizar estado de la solicitud si encontramos un estado apropiado
-            solicitud = Solicitud.query.get(pago.solicitud_id)
-            if solicitud and estado_pagada:
-                estado_anterior_solicitud = solicitud.estado_solicitud_id
-                solicitud.estado_solicitud_id = estado_pagada.estado_solicitud_id
-                print(f" Solicitud {solicitud.solicitud_id}: {estado_anterior_solicitud} → {estado_pagada.estado_solicitud_id} ({estado_pagada.nombre})")
-            elif solicitud:
-                print(f" No se encontró estado 'Pagada' para actualizar solicitud {solicitud.solicitud_id}")
-            
-            # Crear registros en Solicitud_Parcela para asignar las parcelas
-            parcelas_asignadas = 0
-            for parcela_id in parcelas_ids:
-                # Verificar que la parcela no esté ya asignada
-                parcela_ya_asignada = db.session.query(SolicitudParcela).join(
-                    Solicitud, SolicitudParcela.solicitud_id == Solicitud.solicitud_id
-                ).join(
-                    EstadoSolicitud, Solicitud.estado_solicitud_id == EstadoSolicitud.estado_solicitud_id
-                ).filter(
-                    SolicitudParcela.parcela_id == parcela_id,
-                    EstadoSolicitud.nombre.in_(['Aprobada', 'Pagada', 'Completada', 'Parcialmente Asignada'])
-                ).first()
-                
-                if not parcela_ya_asignada:
-                    solicitud_parcela = SolicitudParcela(
-                        solicitud_id=pago.solicitud_id,
-                        parcela_id=parcela_id
-                    )
-                    db.session.add(solicitud_parcela)
-                    parcelas_asignadas += 1
-                    print(f"Parcela {parcela_id} asignada a solicitud {pago.solicitud_id}")
-                else:
-                    print(f"Parcela {parcela_id} ya está asignada a otra solicitud aprobada/pagada")
-            
-            print(f"Total parcelas asignadas: {parcelas_asignadas}/{len(parcelas_ids)}")
-        
-        db.session.commit()
-        print(f"Pago {payment_id} procesado correctamente")
-        
-        return jsonify({"status": "ok"}), 200
-        
+
+        resultado = WebhookInbox.registrar(tipo, payment_id, WebhookInbox.serializar(data))
+        print(f"Webhook {tipo}:{payment_id} {resultado}")
+
+        return jsonify({"status": "ok", "evento": resultado}), 200
+
     except Exception as e:
         print(f"Error en webhook: {str(e)}")
         db.session.rollback()
-        import traceback
-        traceback.print_exc()
         return jsonify({"error": "internal error"}), 500
 
 
@@ -510,14 +434,14 @@ def verificar_estado_pago():
             return jsonify({"estado": "sin_artesano"}), 200
         
         # Buscar estado "Aprobada"
-        estado_aprobada = EstadoSolicitud.query.filter_by(nombre='Aprobada').first()
+        estado_aprobada = Catalogos.estados_solicitud.por_nombre(ESTADO_SOLICITUD_APROBADA)
         if not estado_aprobada:
             return jsonify({"estado": "error_estado"}), 200
         
         # Buscar última solicitud aprobada
         solicitud = Solicitud.query.filter_by(
             artesano_id=artesano.artesano_id,
-            estado_solicitud_id=estado_aprobada.estado_solicitud_id
+            estado_solicitud_id=estado_aprobada.id
         ).order_by(Solicitud.fecha_solicitud.desc()).first()
         
         if not solicitud:
@@ -531,16 +455,16 @@ def verificar_estado_pago():
         if not pago:
             return jsonify({"estado": "sin_pago"}), 200
         
-        estado = EstadoPago.query.get(pago.estado_pago_id)
-        estado_solicitud = EstadoSolicitud.query.get(solicitud.estado_solicitud_id)
+        estado = Catalogos.estados_pago.por_id(pago.estado_pago_id)
+        estado_solicitud = Catalogos.estados_solicitud.por_id(solicitud.estado_solicitud_id)
         
         # Verificar si ya hay parcelas asignadas a esta solicitud
         parcelas_asignadas = SolicitudParcela.query.filter_by(
-            solicitud_id=solicitud.solicitud_id
+            solicitud_id=solicitud.solicitud_id, activa=True
         ).count()
         
         return jsonify({
-            "estado_pago": estado.tipo if estado else "Desconocido",
+            "estado_pago": estado.nombre if estado else "Desconocido",
             "estado_pago_id": pago.estado_pago_id,
             "estado_solicitud": estado_solicitud.nombre if estado_solicitud else "Desconocido",
             "estado_solicitud_id": solicitud.estado_solicitud_id,
@@ -556,10 +480,12 @@ def verificar_estado_pago():
             "pago_id": pago.pago_id,
             "solicitud_id": pago.solicitud_id,
             "parcelas_necesarias": solicitud.parcelas_necesarias,
-            "comprobante_disponible": pago.estado_pago_id == 2,
+            "comprobante_disponible": pago.estado_pago_id == Catalogos.estado_pago_id(ESTADO_PAGO_PAGADO),
             "numero_comprobante": f"PF-{pago.pago_id:06d}",
             "fecha_pago_formateada": pago.fecha_pago.strftime("%d/%m/%Y %H:%M") if pago.fecha_pago else None,
-            "puede_descargar_comprobante": pago.estado_pago_id == 2 and pago.fecha_pago is not None
+            "puede_descargar_comprobante": (
+                pago.estado_pago_id == Catalogos.estado_pago_id(ESTADO_PAGO_PAGADO) and pago.fecha_pago is not None
+            )
         }), 200
         
     except Exception as e:
@@ -593,14 +519,14 @@ def reiniciar_pago():
             return jsonify({"error": "Artesano no encontrado"}), 404
         
         # Buscar estado "Aprobada"
-        estado_aprobada = EstadoSolicitud.query.filter_by(nombre='Aprobada').first()
+        estado_aprobada = Catalogos.estados_solicitud.por_nombre(ESTADO_SOLICITUD_APROBADA)
         if not estado_aprobada:
             return jsonify({"error": "Estado 'Aprobada' no encontrado"}), 500
         
         # Buscar solicitud
         solicitud = Solicitud.query.filter_by(
             artesano_id=artesano.artesano_id,
-            estado_solicitud_id=estado_aprobada.estado_solicitud_id
+            estado_solicitud_id=estado_aprobada.id
         ).first()
         
         if not solicitud:
@@ -612,18 +538,22 @@ def reiniciar_pago():
             return jsonify({"error": "No hay pago para reiniciar"}), 404
         
         # Solo permitir reiniciar si está rechazado o cancelado
-        if pago.estado_pago_id not in [3, 4]:  # 3=Rechazado, 4=Cancelado
-            estado = EstadoPago.query.get(pago.estado_pago_id)
-            estado_nombre = estado.tipo if estado else "Desconocido"
+        if pago.estado_pago_id not in (
+            Catalogos.estado_pago_id(ESTADO_PAGO_RECHAZADO), Catalogos.estado_pago_id(ESTADO_PAGO_CANCELADO)
+        ):
+            estado = Catalogos.estados_pago.por_id(pago.estado_pago_id)
+            estado_nombre = estado.nombre if estado else "Desconocido"
             return jsonify({
                 "error": "No se puede reiniciar este pago",
                 "detalle": f"Estado actual: {estado_nombre}",
                 "estado_actual": pago.estado_pago_id
             }), 400
         
-        # Eliminar pago anterior
+        # Eliminar pago anterior y sus retenciones de parcelas
+        parcelas_liberadas = ReservaParcelas.liberar_reservas(solicitud.solicitud_id)
         db.session.delete(pago)
         db.session.commit()
+        MapaService.registrar_cambios(parcelas_liberadas, CAMBIO_LIBERADA)
         
         return jsonify({
             "success": True,
@@ -662,14 +592,14 @@ def cancelar_pago_actual():
             return jsonify({"error": "Artesano no encontrado"}), 404
         
         # Buscar estado "Aprobada"
-        estado_aprobada = EstadoSolicitud.query.filter_by(nombre='Aprobada').first()
+        estado_aprobada = Catalogos.estados_solicitud.por_nombre(ESTADO_SOLICITUD_APROBADA)
         if not estado_aprobada:
             return jsonify({"error": "Estado 'Aprobada' no encontrado"}), 500
         
         # Buscar solicitud
         solicitud = Solicitud.query.filter_by(
             artesano_id=artesano.artesano_id,
-            estado_solicitud_id=estado_aprobada.estado_solicitud_id
+            estado_solicitud_id=estado_aprobada.id
         ).first()
         
         if not solicitud:
@@ -680,29 +610,32 @@ def cancelar_pago_actual():
         if not pago:
             return jsonify({"error": "No hay pago para cancelar"}), 404
         
-        if pago.estado_pago_id != 1:  # 1 = Pendiente
-            estado = EstadoPago.query.get(pago.estado_pago_id)
-            estado_nombre = estado.tipo if estado else "Desconocido"
+        if pago.estado_pago_id != Catalogos.estado_pago_id(ESTADO_PAGO_PENDIENTE):
+            estado = Catalogos.estados_pago.por_id(pago.estado_pago_id)
+            estado_nombre = estado.nombre if estado else "Desconocido"
             return jsonify({
                 "error": "No se puede cancelar este pago",
                 "detalle": f"Solo se pueden cancelar pagos pendientes. Estado actual: {estado_nombre}",
                 "estado_actual": pago.estado_pago_id
             }), 400
         
-        pago.estado_pago_id = 4  # Cancelado
+        pago.estado_pago_id = Catalogos.estado_pago_id(ESTADO_PAGO_CANCELADO)
         pago.fecha_pago = datetime.now()
         
+        # El pago pendiente solo tenía parcelas retenidas, no asignadas
+        parcelas_liberadas = ReservaParcelas.liberar_reservas(solicitud.solicitud_id)
 
         print(f"Pago {pago.pago_id} cancelado. No se eliminan registros de Solicitud_Parcela porque el pago estaba pendiente.")
         
         db.session.commit()
+        MapaService.registrar_cambios(parcelas_liberadas, CAMBIO_LIBERADA)
         
         return jsonify({
             "success": True,
             "message": "Pago cancelado correctamente. Ahora podés crear un nuevo pago.",
             "pago_id": pago.pago_id,
-            "estado_anterior": 1,
-            "estado_nuevo": 4
+            "estado_anterior": Catalogos.estado_pago_id(ESTADO_PAGO_PENDIENTE),
+            "estado_nuevo": Catalogos.estado_pago_id(ESTADO_PAGO_CANCELADO)
         }), 200
         
     except Exception as e:
@@ -724,64 +657,27 @@ def simular_webhook(preference_id):
     if not pago:
         return jsonify({"error": "Pago no encontrado"}), 404
     
-    data = request.get_json() or {}
+    data = request.get_json(silent=True) or {}
     estado_simulado = data.get("estado", "approved")
+    if estado_simulado not in ESTADO_PAGO_POR_STATUS_MP:
+        estado_simulado = "approved"
     
-    estado_map = {
-        "approved": 2,
-        "pending": 1,
-        "rejected": 3,
-        "cancelled": 4,
-    }
-    
-    pago.estado_pago_id = estado_map.get(estado_simulado, 2)
-    pago.payment_id = f"SIMULATED_{datetime.now().timestamp()}"
-    pago.fecha_pago = datetime.now()
-    
-    if estado_simulado == "approved":
-        # Buscar estado "Pagada" o similar
-        estado_pagada = EstadoSolicitud.query.filter_by(nombre='Pagada').first()
-        if not estado_pagada:
-            estado_pagada = EstadoSolicitud.query.filter_by(nombre='Parcialmente Asignada').first()
-            if not estado_pagada:
-                estado_pagada = EstadoSolicitud.query.filter_by(nombre='Completada').first()
-        
-        # Marcar solicitud como pagada
-        solicitud = Solicitud.query.get(pago.solicitud_id)
-        if solicitud and estado_pagada:
-            solicitud.estado_solicitud_id = estado_pagada.estado_solicitud_id
-            print(f"Solicitud {solicitud.solicitud_id} marcada como {estado_pagada.nombre}")
-        
-        # Asignar parcelas usando tu sistema existente (Solicitud_Parcela)
-        parcelas_ids = pago.get_parcelas_seleccionadas()
-        print(f"Asignando parcelas: {parcelas_ids}")
-        
-        parcelas_asignadas = []
-        for parcela_id in parcelas_ids:
-            # Verificar que la parcela no esté ya asignada
-            parcela_ya_asignada = SolicitudParcela.query.filter_by(
-                parcela_id=parcela_id
-            ).first()
-            
-            if not parcela_ya_asignada:
-                solicitud_parcela = SolicitudParcela(
-                    solicitud_id=pago.solicitud_id,
-                    parcela_id=parcela_id
-                )
-                db.session.add(solicitud_parcela)
-                parcelas_asignadas.append(parcela_id)
-                print(f"Parcela {parcela_id} asignada a solicitud {pago.solicitud_id}")
-            else:
-                print(f"Parcela {parcela_id} ya estaba asignada a otra solicitud")
-    
-    db.session.commit()
+    try:
+        resultado = ServicioAprobacionPagos.aplicar_estado(
+            pago, estado_simulado, f"SIMULATED_{datetime.now().timestamp()}"
+        )
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error simulando webhook: {e}")
+        return jsonify({"error": str(e)}), 500
     
     return jsonify({
         "success": True,
         "message": f"Webhook simulado. Estado actualizado a: {estado_simulado}",
         "pago_id": pago.pago_id,
         "estado_id": pago.estado_pago_id,
-        "parcelas_asignadas": parcelas_asignadas if estado_simulado == "approved" else []
+        "parcelas_asignadas": resultado.asignadas,
+        "parcelas_en_conflicto": resultado.conflictos
     }), 200
 
 
@@ -795,7 +691,7 @@ def debug():
     return jsonify({
         "jwt_identity": current_user,
         "type": type(current_user).__name__,
-        "mp_configured": mp is not None,
+        "mp_configured": obtener_cliente_mp() is not None,
         "token_type": "SANDBOX" if ACCESS_TOKEN and ACCESS_TOKEN.startswith("TEST") else "PRODUCCIÓN" if ACCESS_TOKEN else "NO CONFIGURADO"
     }), 200
 
@@ -805,7 +701,7 @@ def health():
     return jsonify({
         "status": "ok",
         "service": "pago",
-        "mp_sdk": "loaded" if mp else "not_loaded",
+        "mp_sdk": "loaded" if obtener_cliente_mp() else "not_loaded",
         "timestamp": datetime.now().isoformat()
     }), 200
 
@@ -822,28 +718,14 @@ def aprobar_pago_facil(preference_id):
         if not pago:
             return jsonify({"error": "Pago no encontrado"}), 404
         
-        # Marcar como aprobado
-        pago.estado_pago_id = 2  # Aprobado
-        pago.payment_id = f"PAGOFACIL_{datetime.now().timestamp()}"
-        pago.fecha_pago = datetime.now()
-        
-        # Asignar parcelas
-        parcelas_ids = pago.get_parcelas_seleccionadas()
-        for parcela_id in parcelas_ids:
-            solicitud_parcela = SolicitudParcela(
-                solicitud_id=pago.solicitud_id,
-                parcela_id=parcela_id
-            )
-            db.session.add(solicitud_parcela)
-            print(f"Parcela {parcela_id} asignada")
-        
-        db.session.commit()
+        resultado = ServicioAprobacionPagos.aprobar(pago, f"PAGOFACIL_{datetime.now().timestamp()}")
         
         return jsonify({
             "success": True,
             "message": "Pago Fácil aprobado simuladamente",
             "pago_id": pago.pago_id,
-            "parcelas_asignadas": parcelas_ids
+            "parcelas_asignadas": resultado.asignadas,
+            "parcelas_en_conflicto": resultado.conflictos
         }), 200
         
     except Exception as e:
@@ -866,7 +748,7 @@ def auto_aprobar_pago_facil(preference_id):
             return jsonify({"error": "Pago no encontrado"}), 404
         
         # Verificar que esté pendiente
-        if pago.estado_pago_id != 1:
+        if pago.estado_pago_id != Catalogos.estado_pago_id(ESTADO_PAGO_PENDIENTE):
             print(f"Pago {pago.pago_id} ya tiene estado: {pago.estado_pago_id}")
             return jsonify({
                 "message": f"El pago ya está en estado: {pago.estado_pago_id}",
@@ -875,44 +757,7 @@ def auto_aprobar_pago_facil(preference_id):
         
         print(f"Auto-aprobando pago Pago Fácil: {pago.pago_id}, Monto: ${pago.monto}")
         
-        # MARCAR COMO APROBADO
-        pago.estado_pago_id = 2  # Aprobado
-        pago.payment_id = f"AUTO_PF_{datetime.now().timestamp()}"
-        pago.fecha_pago = datetime.now()
-        
-        # ASIGNAR PARCELAS
-        parcelas_ids = pago.get_parcelas_seleccionadas()
-        parcelas_asignadas = []
-        
-        for parcela_id in parcelas_ids:
-            # Verificar que no esté ya asignada
-            parcela_ya_asignada = SolicitudParcela.query.filter_by(
-                parcela_id=parcela_id
-            ).first()
-            
-            if not parcela_ya_asignada:
-                solicitud_parcela = SolicitudParcela(
-                    solicitud_id=pago.solicitud_id,
-                    parcela_id=parcela_id
-                )
-                db.session.add(solicitud_parcela)
-                parcelas_asignadas.append(parcela_id)
-                print(f"Parcela {parcela_id} asignada")
-            else:
-                print(f"Parcela {parcela_id} ya estaba asignada")
-        
-        # Actualizar estado de la solicitud si existe estado "Pagada"
-        estado_pagada = EstadoSolicitud.query.filter_by(nombre='Pagada').first()
-        if not estado_pagada:
-            estado_pagada = EstadoSolicitud.query.filter_by(nombre='Completada').first()
-        
-        if estado_pagada:
-            solicitud = Solicitud.query.get(pago.solicitud_id)
-            if solicitud:
-                solicitud.estado_solicitud_id = estado_pagada.estado_solicitud_id
-                print(f"Solicitud {solicitud.solicitud_id} marcada como {estado_pagada.nombre}")
-        
-        db.session.commit()
+        resultado = ServicioAprobacionPagos.aprobar(pago, f"AUTO_PF_{datetime.now().timestamp()}")
         
         print(f"Pago {pago.pago_id} auto-aprobado exitosamente")
         
@@ -921,7 +766,8 @@ def auto_aprobar_pago_facil(preference_id):
             "message": "Pago Fácil auto-aprobado exitosamente",
             "pago_id": pago.pago_id,
             "estado": "Aprobado",
-            "parcelas_asignadas": parcelas_asignadas,
+            "parcelas_asignadas": resultado.asignadas,
+            "parcelas_en_conflicto": resultado.conflictos,
             "monto": float(pago.monto),
             "referencia": preference_id[-8:]  
         }), 200
@@ -939,13 +785,18 @@ def auto_aprobar_pago_facil(preference_id):
 @pago_bp.route("/check-and-auto-approve/<string:preference_id>", methods=['GET'])
 @jwt_required()
 def check_and_auto_approve(preference_id):
-    """Verifica un pago y si está pendiente > 1 minuto, lo auto-aprueba"""
+    """
+    Estado de la aprobación automática de un pago. La aprobación la hace
+    el scheduler (ServicioAprobacionPagos.auto_aprobar_pendientes); si ya
+    venció el plazo y el barrido todavía no pasó, se aprueba acá mismo,
+    dentro del proceso.
+    """
     try:
         pago = Pago.query.filter_by(preference_id=preference_id).first()
         if not pago:
             return jsonify({"error": "Pago no encontrado"}), 404
         
-        if pago.estado_pago_id == 2:
+        if pago.estado_pago_id == Catalogos.estado_pago_id(ESTADO_PAGO_PAGADO):
             return jsonify({
                 "status": "already_approved",
                 "message": "El pago ya está aprobado",
@@ -954,29 +805,23 @@ def check_and_auto_approve(preference_id):
             }), 200
         
         tiempo_creacion = pago.fecha_creacion
-        tiempo_actual = datetime.now()
-        diferencia = tiempo_actual - tiempo_creacion
+        diferencia = datetime.now() - tiempo_creacion
+        pendiente = pago.estado_pago_id == Catalogos.estado_pago_id(ESTADO_PAGO_PENDIENTE)
         
-        if diferencia.total_seconds() > 60: 
+        if PAGO_AUTO_APROBACION and pendiente and datetime.now() >= ServicioAprobacionPagos.vence_auto_aprobacion(pago):
             print(f"Pago pendiente por {diferencia.total_seconds():.0f} segundos - auto-aprobando")
-            
-            import requests
-            auto_approve_url = f"http://localhost:5000/api/v1/pago/auto-aprobar-pago-facil/{preference_id}"
-            
-            try:
-                response = requests.post(auto_approve_url, timeout=10)
-                if response.status_code == 200:
-                    return jsonify({
-                        "status": "auto_approved",
-                        "message": "Pago auto-aprobado exitosamente",
-                        "pago_id": pago.pago_id
-                    }), 200
-            except Exception as api_error:
-                print(f"Error llamando a auto-aprobar: {api_error}")
+            pago = Pago.query.filter_by(pago_id=pago.pago_id).with_for_update().first()
+            if pago.estado_pago_id == Catalogos.estado_pago_id(ESTADO_PAGO_PENDIENTE):
+                ServicioAprobacionPagos.aprobar(pago, f"AUTO_PF_{datetime.now().timestamp()}")
+            else:
+                db.session.rollback()
+            return jsonify({
+                "status": "auto_approved",
+                "message": "Pago auto-aprobado exitosamente",
+                "pago_id": pago.pago_id
+            }), 200
     
-        segundos_restantes = 60 - diferencia.total_seconds()
-        if segundos_restantes < 0:
-            segundos_restantes = 0
+        segundos_restantes = max(PAGO_AUTO_APROBACION_SEGUNDOS - diferencia.total_seconds(), 0)
         
         return jsonify({
             "status": "pending",
@@ -987,6 +832,7 @@ def check_and_auto_approve(preference_id):
         }), 200
         
     except Exception as e:
+        db.session.rollback()
         print(f"Error en check-and-auto-approve: {e}")
         return jsonify({"error": str(e)}), 500
     
@@ -1029,59 +875,17 @@ def descargar_comprobante_pdf(pago_id):
             return jsonify({"error": "Este pago no pertenece a tu cuenta"}), 403
         
         # Verificar que el pago esté aprobado
-        if pago.estado_pago_id != 2:
+        if pago.estado_pago_id != Catalogos.estado_pago_id(ESTADO_PAGO_PAGADO):
             return jsonify({"error": "Solo se pueden descargar comprobantes de pagos aprobados"}), 400
         
-        # Obtener información adicional
-        rubro = Rubro.query.get(solicitud.rubro_id)
-        
-        # Obtener parcelas asignadas
-        solicitudes_parcelas = SolicitudParcela.query.filter_by(
-            solicitud_id=solicitud.solicitud_id
-        ).all()
-        
-        parcelas = []
-        for sp in solicitudes_parcelas:
-            parcela = Parcela.query.get(sp.parcela_id)
-            if parcela:
-                parcelas.append({
-                    "parcela_id": parcela.parcela_id,
-                    "fila": parcela.fila,
-                    "columna": parcela.columna
-                })
-        
-        print(f"Generando comprobante para pago {pago_id}...")
-        
-        # Generar PDF
-        pdf_path = generar_comprobante_pago(
-            pago=pago,
-            solicitud=solicitud,
-            artesano=artesano,
-            usuario=usuario,
-            rubro=rubro,
-            parcelas=parcelas
-        )
-        
         # Nombre del archivo
         fecha = datetime.now().strftime("%Y%m%d")
         filename = f"comprobante_pago_{pago.pago_id}_{fecha}.pdf"
         
-        # Enviar archivo
-        response = send_file(
-            pdf_path,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/pdf'
-        )
-        
-        # Configurar headers para descarga
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        
-        print(f"Comprobante generado: {filename}")
+        # Se genera una sola vez por versión del pago (caché en disco + ETag)
+        response = CacheComprobantes.enviar(pago, filename)
         
-        # El archivo temporal se eliminará automáticamente después de enviarlo
+        print(f"Comprobante enviado: {filename} ({response.status_code})")
         return response
         
     except Exception as e:
@@ -5,35 +5,34 @@ from models.base import db
 from models.solicitud import Solicitud
 from models.artesano import Artesano
 from models.rubro import Rubro
-from models.estado_solicitud import EstadoSolicitud
 from models.solicitud_foto import SolicitudFoto 
 from models.notificacion import Notificacion
 from models.usuario import Usuario
+from utils.mapa_service import MapaService, CAMBIO_LIBERADA, CAMBIO_DATOS
+from utils.fotos_service import FotosService, FotoInvalidaError, FotoDemasiadoGrandeError
+from werkzeug.exceptions import RequestEntityTooLarge
+from utils.blob_store import BlobNoEncontradoError
+from utils.catalogos import Catalogos, ESTADO_SOLICITUD_PENDIENTE, ESTADO_SOLICITUD_APROBADA
 from datetime import datetime
-import re
-import base64
 
 solicitud_bp = Blueprint('solicitud_bp', __name__, url_prefix='/solicitudes')
 
-def validar_extension(extension):
-    extensiones_permitidas = ['jpg', 'jpeg', 'png']  
-    return extension.lower() in extensiones_permitidas
-
-def validar_base64(base64_string):
-    try:
-        if len(base64_string) % 4 == 0 and re.match('^[A-Za-z0-9+/]*={0,2}$', base64_string):
-            base64.b64decode(base64_string)
-            return True
-        return False
-    except Exception:
-        return False
-
 def get_usuario_actual():
     """Obtiene el usuario actual desde el token JWT"""
     user_identity = get_jwt_identity()  # "user_123"
     usuario_id = int(user_identity.split('_')[1])
     return Usuario.query.get(usuario_id)
 
+def filtro_anio_solicitud(anio):
+    """
+    Solicitudes de un año como rango de fechas: a diferencia de
+    extract('year', ...) puede usar el índice (artesano_id, fecha_solicitud)
+    """
+    return db.and_(
+        Solicitud.fecha_solicitud >= datetime(anio, 1, 1),
+        Solicitud.fecha_solicitud < datetime(anio + 1, 1, 1)
+    )
+
 @solicitud_bp.route('', methods=['POST'])
 @jwt_required()
 def crear_solicitud():
@@ -86,7 +85,7 @@ def crear_solicitud():
         anio_actual = datetime.utcnow().year
         solicitud_existente = Solicitud.query.filter(
             Solicitud.artesano_id == artesano.artesano_id,
-            db.extract('year', Solicitud.fecha_solicitud) == anio_actual
+            filtro_anio_solicitud(anio_actual)
         ).first()
 
         if solicitud_existente:
@@ -125,14 +124,14 @@ def crear_solicitud():
         parcelas_necesarias = parcelas_largo * parcelas_ancho
         costo_total = parcelas_necesarias * float(rubro.precio_parcela)
 
-        estado_pendiente = EstadoSolicitud.query.filter_by(nombre='Pendiente').first()
+        estado_pendiente = Catalogos.estados_solicitud.por_nombre(ESTADO_SOLICITUD_PENDIENTE)
         if not estado_pendiente:
             db.session.rollback()
             return jsonify({'msg': 'Estado "Pendiente" no configurado'}), 500
 
         nueva_solicitud = Solicitud(
             artesano_id=artesano.artesano_id,
-            estado_solicitud_id=estado_pendiente.estado_solicitud_id,
+            estado_solicitud_id=estado_pendiente.id,
             descripcion=data['descripcion'],
             dimensiones_ancho=ancho,
             dimensiones_largo=largo,
@@ -154,41 +153,30 @@ def crear_solicitud():
             if not foto_file or foto_file.filename == '':
                 continue
 
-            extension = foto_file.filename.split('.')[-1].lower()
-            if extension == 'jpeg':
-                extension = 'jpg'
-
-            if not validar_extension(extension):
-                return jsonify({'msg': f'Extensión {extension} no permitida. Solo se aceptan JPG y PNG.'}), 400
-
+            # El formato se valida por contenido dentro de FotosService.guardar
             try:
-                file_data = foto_file.read()
-                base64_puro = base64.b64encode(file_data).decode('utf-8')
-                if not validar_base64(base64_puro):
+                nueva_foto = FotosService.guardar(foto_file, nueva_solicitud.solicitud_id)
+                if not nueva_foto:
                     continue
-
-                nueva_foto = SolicitudFoto(
-                    solicitud_id=nueva_solicitud.solicitud_id,
-                    base64=base64_puro,
-                    extension=extension.lower()
-                )
-                db.session.add(nueva_foto)
                 fotos_creadas.append(nueva_foto)
+            except FotoDemasiadoGrandeError as e:
+                db.session.rollback()
+                return jsonify({'msg': str(e)}), 413
+            except FotoInvalidaError as e:
+                db.session.rollback()
+                return jsonify({'msg': f'{str(e)}. Solo se aceptan JPG y PNG.'}), 400
             except Exception as file_error:
                 print(f"Error procesando archivo {foto_file.filename}: {file_error}")
                 continue
 
         db.session.commit()
+        FotosService.generar_variantes(fotos_creadas)
 
         mensaje_notificacion = ""
         if parcelas_necesarias > 1:
             mensaje_notificacion = f"Su puesto requiere {parcelas_necesarias} parcelas. Costo total: ${costo_total:.2f}"
 
-        fotos_respuesta = []
-        for foto in fotos_creadas:
-            foto_data = foto.to_dict()
-            foto_data['image_url'] = foto.get_image_url()
-            fotos_respuesta.append(foto_data)
+        fotos_respuesta = [foto.to_descriptor() for foto in fotos_creadas]
 
         return jsonify({
             'msg': 'Solicitud creada exitosamente',
@@ -198,6 +186,9 @@ def crear_solicitud():
             'notificacion': mensaje_notificacion
         }), 201
 
+    except RequestEntityTooLarge:
+        db.session.rollback()
+        return jsonify({'msg': 'La solicitud supera el tamaño máximo permitido'}), 413
     except Exception as e:
         db.session.rollback()
         print("ERROR EN crear_solicitud():", str(e))
@@ -226,7 +217,7 @@ def editar_solicitud(solicitud_id):
             return jsonify({'msg': 'Solicitud no encontrada'}), 404
 
         estados_permitidos_edicion = ['Pendiente', 'Corrección Requerida']
-        estado_actual = EstadoSolicitud.query.get(solicitud.estado_solicitud_id)
+        estado_actual = Catalogos.estados_solicitud.por_id(solicitud.estado_solicitud_id)
         
         if estado_actual.nombre not in estados_permitidos_edicion:
             return jsonify({
@@ -325,6 +316,10 @@ def editar_solicitud(solicitud_id):
         if cambios_realizados:
             solicitud.fecha_gestion = datetime.utcnow()
             db.session.commit()
+            # El mapa de admin muestra nombre/DNI/teléfono del artesano
+            MapaService.registrar_cambios(
+                MapaService.parcelas_de_solicitudes([solicitud.solicitud_id]), CAMBIO_DATOS
+            )
             
             return jsonify({
                 'msg': 'Datos actualizados exitosamente',
@@ -359,7 +354,7 @@ def obtener_solicitud_artesano():
     solicitud = (
         Solicitud.query
         .filter(Solicitud.artesano_id == artesano.artesano_id)
-        .filter(db.extract('year', Solicitud.fecha_solicitud) == año_actual)
+        .filter(filtro_anio_solicitud(año_actual))
         .first()
     )
 
@@ -375,16 +370,7 @@ def obtener_solicitud_artesano():
         }), 200
     
     solicitud_data = solicitud.to_dict()
-    solicitud_data['fotos'] = [
-        {
-            'foto_id': foto.foto_id,
-            'solicitud_id': foto.solicitud_id,
-            'image_url': foto.get_image_url(),
-            'extension': foto.extension,
-            'fecha_creacion': foto.fecha_creacion.isoformat() if foto.fecha_creacion else None
-        }
-        for foto in solicitud.fotos_rel
-    ]
+    solicitud_data['fotos'] = [foto.to_descriptor() for foto in solicitud.fotos_rel]
     
     return jsonify({
         'perfil_artesano': {
@@ -422,16 +408,7 @@ def obtener_historial_solicitudes():
     solicitudes_data = []
     for solicitud in solicitudes:
         data = solicitud.to_dict()
-        data['fotos'] = [
-            {
-                'foto_id': foto.foto_id,
-                'solicitud_id': foto.solicitud_id,
-                'image_url': foto.get_image_url(),
-                'extension': foto.extension,
-                'fecha_creacion': foto.fecha_creacion.isoformat() if foto.fecha_creacion else None
-            }
-            for foto in solicitud.fotos_rel
-        ]
+        data['fotos'] = [foto.to_descriptor() for foto in solicitud.fotos_rel]
         solicitudes_data.append(data)
 
     return jsonify({
@@ -468,8 +445,10 @@ def cancelar_solicitud_artesano(solicitud_id):
             return jsonify({'error': 'Solicitud no encontrada'}), 404
 
         solicitud_info = solicitud.to_dict()
+        parcelas_liberadas = MapaService.parcelas_de_solicitudes([solicitud.solicitud_id])
         db.session.delete(solicitud)
         db.session.commit()
+        MapaService.registrar_cambios(parcelas_liberadas, CAMBIO_LIBERADA)
         notificacion = Notificacion(
             artesano_id=artesano.artesano_id,
             mensaje=f'Se eliminó la solicitud #{solicitud_info["solicitud_id"]} correctamente.',
@@ -530,43 +509,28 @@ def agregar_fotos_solicitud(solicitud_id):
             if not foto_file or foto_file.filename == '':
                 continue
 
-            # Obtener extensión del archivo
-            extension = foto_file.filename.split('.')[-1].lower()
-            if extension == 'jpeg':
-                extension = 'jpg'
-
-            # Validar extensión
-            if not validar_extension(extension):
-                return jsonify({'msg': f'Extensión {extension} no permitida. Solo se aceptan JPG y PNG.'}), 400
-
-            # Leer archivo y convertir a base64
+            # Copiar el archivo al blob store (valida formato y tamaño)
             try:
-                file_data = foto_file.read()
-                base64_puro = base64.b64encode(file_data).decode('utf-8')
-                
-                if not validar_base64(base64_puro):
+                nueva_foto = FotosService.guardar(foto_file, solicitud_id)
+                if not nueva_foto:
                     continue
-
-                nueva_foto = SolicitudFoto(
-                    solicitud_id=solicitud_id,
-                    base64=base64_puro,
-                    extension=extension
-                )
-                db.session.add(nueva_foto)
                 fotos_creadas.append(nueva_foto)
+            except FotoDemasiadoGrandeError as e:
+                db.session.rollback()
+                return jsonify({'msg': str(e)}), 413
+            except FotoInvalidaError as e:
+                db.session.rollback()
+                return jsonify({'msg': f'{str(e)}. Solo se aceptan JPG y PNG.'}), 400
                 
             except Exception as file_error:
                 print(f"Error procesando archivo {foto_file.filename}: {file_error}")
                 continue
 
         db.session.commit()
+        FotosService.generar_variantes(fotos_creadas)
         
         # Convertir fotos para respuesta (con image_url)
-        fotos_respuesta = []
-        for foto in fotos_creadas:
-            foto_data = foto.to_dict()
-            foto_data['image_url'] = foto.get_image_url()
-            fotos_respuesta.append(foto_data)
+        fotos_respuesta = [foto.to_descriptor() for foto in fotos_creadas]
         
         return jsonify({
             'msg': f'{len(fotos_creadas)} fotos agregadas exitosamente',
@@ -574,6 +538,9 @@ def agregar_fotos_solicitud(solicitud_id):
             'total_fotos': fotos_existentes + len(fotos_creadas)
         }), 201
         
+    except RequestEntityTooLarge:
+        db.session.rollback()
+        return jsonify({'msg': 'La solicitud supera el tamaño máximo permitido'}), 413
     except Exception as e:
         db.session.rollback()
         return jsonify({'msg': 'Error al agregar fotos', 'error': str(e)}), 500
@@ -602,8 +569,10 @@ def eliminar_foto_solicitud(foto_id):
         if not solicitud:
             return jsonify({'msg': 'No tiene permisos para eliminar esta foto'}), 403
         
+        blob_hash = foto.blob_hash
         db.session.delete(foto)
         db.session.commit()
+        FotosService.eliminar_blob_si_huerfano(blob_hash)
         
         return jsonify({'msg': 'Foto eliminada exitosamente'}), 200
         
@@ -635,19 +604,40 @@ def obtener_foto_completa(foto_id):
         if not solicitud:
             return jsonify({'msg': 'No tiene permisos para ver esta foto'}), 403
         
-        foto_data = {
-            'foto_id': foto.foto_id,
-            'solicitud_id': foto.solicitud_id,
-            'image_url': foto.get_image_url(),
-            'extension': foto.extension,
-            'fecha_creacion': foto.fecha_creacion.isoformat() if foto.fecha_creacion else None
-        }
-        
-        return jsonify({'foto': foto_data}), 200
+        return jsonify({'foto': foto.to_descriptor()}), 200
         
     except Exception as e:
         return jsonify({'msg': 'Error al obtener foto', 'error': str(e)}), 500
 
+@solicitud_bp.route('/fotos/<int:foto_id>/archivo', methods=['GET'])
+@jwt_required()
+def obtener_foto_archivo(foto_id):
+    """Bytes de la foto: para el artesano dueño, administradores y organizadores"""
+    try:
+        usuario = get_usuario_actual()
+        if not usuario:
+            return jsonify({'msg': 'Usuario no encontrado'}), 404
+
+        foto = SolicitudFoto.query.get(foto_id)
+        if not foto:
+            return jsonify({'msg': 'Foto no encontrada'}), 404
+
+        if usuario.rol_id not in (2, 3):
+            artesano = Artesano.query.filter_by(usuario_id=usuario.usuario_id).first()
+            solicitud = Solicitud.query.filter_by(
+                solicitud_id=foto.solicitud_id,
+                artesano_id=artesano.artesano_id
+            ).first() if artesano else None
+            if not solicitud:
+                return jsonify({'msg': 'No tiene permisos para ver esta foto'}), 403
+
+        return FotosService.enviar(foto, request.args.get('variante'))
+
+    except BlobNoEncontradoError:
+        return jsonify({'msg': 'Archivo de la foto no encontrado'}), 404
+    except Exception as e:
+        return jsonify({'msg': 'Error al obtener foto', 'error': str(e)}), 500
+
 @solicitud_bp.route('/<int:solicitud_id>/fotos-completas', methods=['GET'])
 @jwt_required()
 def obtener_fotos_completas_solicitud(solicitud_id):
@@ -670,15 +660,7 @@ def obtener_fotos_completas_solicitud(solicitud_id):
         
         fotos = SolicitudFoto.query.filter_by(solicitud_id=solicitud_id).all()
         
-        fotos_completas = []
-        for foto in fotos:
-            fotos_completas.append({
-                'foto_id': foto.foto_id,
-                'solicitud_id': foto.solicitud_id,
-                'image_url': foto.get_image_url(),
-                'extension': foto.extension,
-                'fecha_creacion': foto.fecha_creacion.isoformat() if foto.fecha_creacion else None
-            })
+        fotos_completas = [foto.to_descriptor() for foto in fotos]
         
         return jsonify({
             'fotos': fotos_completas
@@ -705,7 +687,7 @@ def obtener_rubro_solicitud_actual():
         solicitud = (
             Solicitud.query
             .filter(Solicitud.artesano_id == artesano.artesano_id)
-            .filter(db.extract('year', Solicitud.fecha_solicitud) == año_actual)
+            .filter(filtro_anio_solicitud(año_actual))
             .first()
         )
         
@@ -716,8 +698,8 @@ def obtener_rubro_solicitud_actual():
             }), 200
         
         # Verificar que esté en estado APROBADA
-        estado = EstadoSolicitud.query.get(solicitud.estado_solicitud_id)
-        if estado.nombre != 'Aprobada':
+        estado = Catalogos.estados_solicitud.por_id(solicitud.estado_solicitud_id)
+        if estado.nombre != ESTADO_SOLICITUD_APROBADA:
             return jsonify({
                 'tiene_solicitud': True,
                 'solicitud_aprobada': False,
@@ -727,7 +709,7 @@ def obtener_rubro_solicitud_actual():
         
         # Verificar si ya tiene parcela asignada
         parcela_asignada = SolicitudParcela.query.filter_by(
-            solicitud_id=solicitud.solicitud_id
+            solicitud_id=solicitud.solicitud_id, activa=True
         ).first()
         
         return jsonify({
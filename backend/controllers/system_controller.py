@@ -1,5 +1,6 @@
 # controllers/system_controller.py - ACTUALIZADO
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash
 from models.base import db
 from models.administrador import Administrador
@@ -23,6 +24,9 @@ from models.solicitud import Solicitud
 from models.solicitud_foto import SolicitudFoto
 from models.solicitud_parcela import SolicitudParcela
 from models.usuario import Usuario
+from utils.catalogos import Catalogos
+from utils.mercadopago_cliente import obtener_cliente_mp, metricas_mp
+from utils.perfil_consultas import PerfilConsultas, PERFIL_CONSULTAS_ACTIVO, PERFIL_N1_UMBRAL
 
 # Crear blueprint directamente en el controller
 system_bp = Blueprint('system_bp', __name__)
@@ -179,6 +183,7 @@ def init_db():
             admin_creado = True
 
         db.session.commit()
+        Catalogos.invalidar()
 
         return jsonify({
             'success': True,
@@ -241,6 +246,28 @@ def status():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
     
+@system_bp.route('/api/metrics', methods=['GET'])
+@jwt_required()
+def metrics():
+    """Consultas SQL por endpoint y llamadas a MercadoPago desde que arrancó el proceso (solo administradores)"""
+    user_identity = get_jwt_identity()
+    usuario = Usuario.query.get(int(user_identity.split('_')[1]))
+    if not usuario or usuario.rol_id != 2:
+        return jsonify({'error': 'Acceso denegado'}), 403
+
+    if request.args.get('reiniciar') == 'true':
+        PerfilConsultas.reiniciar()
+        cliente_mp = obtener_cliente_mp()
+        if cliente_mp:
+            cliente_mp.metricas.reiniciar()
+
+    return jsonify({
+        'activo': PERFIL_CONSULTAS_ACTIVO,
+        'umbral_n1': PERFIL_N1_UMBRAL,
+        'endpoints': PerfilConsultas.metricas(),
+        'mercadopago': metricas_mp()
+    }), 200
+
 @system_bp.route('/system/debug-tables', methods=['GET'])
 def debug_tables():
     """Endpoint temporal para debug de tablas de tokens"""
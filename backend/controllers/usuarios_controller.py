@@ -93,6 +93,20 @@ def buscar_usuarios_por_rol():
             return jsonify({'error': 'El parámetro rol_id es requerido'}), 400
         
         usuarios = Usuario.query.filter_by(rol_id=rol_id).all()
+
+        # Perfiles de todos los usuarios en una consulta por tabla
+        usuario_ids = [usuario.usuario_id for usuario in usuarios]
+        admins = {}
+        orgs = {}
+        if usuario_ids:
+            admins = {
+                admin.usuario_id: admin
+                for admin in Administrador.query.filter(Administrador.usuario_id.in_(usuario_ids)).all()
+            }
+            orgs = {
+                org.usuario_id: org
+                for org in Organizador.query.filter(Organizador.usuario_id.in_(usuario_ids)).all()
+            }
         
         resultado = []
         for usuario in usuarios:
@@ -100,7 +114,7 @@ def buscar_usuarios_por_rol():
             
             # Agregar información específica del perfil
             if usuario.rol_id == 2:  # Administrador
-                admin = Administrador.query.filter_by(usuario_id=usuario.usuario_id).first()
+                admin = admins.get(usuario.usuario_id)
                 if admin:
                     usuario_data.update({
                         'nombre': admin.nombre,
@@ -110,7 +124,7 @@ def buscar_usuarios_por_rol():
                         'administrador_id': admin.administrador_id
                     })
             elif usuario.rol_id == 3:  # Organizador
-                org = Organizador.query.filter_by(usuario_id=usuario.usuario_id).first()
+                org = orgs.get(usuario.usuario_id)
                 if org:
                     usuario_data.update({
                         'nombre': org.nombre,
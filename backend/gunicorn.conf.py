@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+# Producción, desde backend/:  gunicorn -c gunicorn.conf.py app:app
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# /mapa/stream deja una conexión abierta por cliente: con gevent cada una es
+# un greenlet y no ocupa un thread. Los cambios hechos en un worker llegan a
+# los clientes de los demás por Mapa_Evento (utils/mapa_relay.py).
+worker_class = 'gevent'
+workers = int(os.getenv('GUNICORN_WORKERS', str(multiprocessing.cpu_count() * 2 + 1)))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# Cada worker importa la app por su cuenta: MapaCache.epoca tiene que ser
+# distinta en cada uno y los threads de fondo arrancan después del fork
+preload_app = False
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
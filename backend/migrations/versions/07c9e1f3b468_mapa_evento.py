@@ -0,0 +1,36 @@
+"""Eventos del mapa compartidos entre workers
+
+Revision ID: 07c9e1f3b468
+Revises: f6b8d0e2a357
+Create Date: 2026-10-18 16:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '07c9e1f3b468'
+down_revision = 'f6b8d0e2a357'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all ya la crea en las bases que arrancaron con el modelo nuevo
+    if sa.inspect(op.get_bind()).has_table('Mapa_Evento'):
+        return
+
+    op.create_table(
+        'Mapa_Evento',
+        sa.Column('evento_id', sa.Integer(), primary_key=True),
+        sa.Column('origen', sa.String(length=32), nullable=False),
+        sa.Column('tipo', sa.String(length=20), nullable=False),
+        sa.Column('parcela_ids', sa.Text()),
+        sa.Column('fecha', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_Mapa_Evento_fecha', 'Mapa_Evento', ['fecha'])
+
+
+def downgrade():
+    op.drop_table('Mapa_Evento')
@@ -0,0 +1,60 @@
+"""Asignaciones de parcelas liberadas en lugar de borradas
+
+Revision ID: 18d0f2a4c579
+Revises: 07c9e1f3b468
+Create Date: 2026-10-18 18:10:00
+
+Agrega Solicitud_Parcela.activa (1 o NULL) y fecha_liberacion, y cambia el
+índice único a (parcela_id, temporada, activa): solo una asignación activa
+por parcela y temporada, y cualquier cantidad de liberadas como historial.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '18d0f2a4c579'
+down_revision = '07c9e1f3b468'
+branch_labels = None
+depends_on = None
+
+INDICE_NUEVO = 'uq_solicitud_parcela_parcela_temporada_activa'
+INDICE_ANTERIOR = 'uq_solicitud_parcela_parcela_temporada'
+
+
+def _restricciones(tabla):
+    inspector = sa.inspect(op.get_bind())
+    return (
+        {indice['name'] for indice in inspector.get_indexes(tabla)}
+        | {restriccion['name'] for restriccion in inspector.get_unique_constraints(tabla)}
+    )
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columnas = {columna['name'] for columna in inspector.get_columns('Solicitud_Parcela')}
+
+    if 'activa' not in columnas:
+        # Hasta ahora las liberadas se borraban: todas las filas están activas
+        op.add_column('Solicitud_Parcela', sa.Column(
+            'activa', sa.Boolean(), nullable=True, server_default=sa.text('1')
+        ))
+    if 'fecha_liberacion' not in columnas:
+        op.add_column('Solicitud_Parcela', sa.Column('fecha_liberacion', sa.DateTime(), nullable=True))
+
+    existentes = _restricciones('Solicitud_Parcela')
+    # El nuevo empieza por parcela_id: en MySQL sostiene la clave foránea
+    if INDICE_NUEVO not in existentes:
+        op.create_index(INDICE_NUEVO, 'Solicitud_Parcela', ['parcela_id', 'temporada', 'activa'], unique=True)
+    if INDICE_ANTERIOR in existentes:
+        op.drop_index(INDICE_ANTERIOR, table_name='Solicitud_Parcela')
+
+
+def downgrade():
+    # Sin la columna las liberadas volverían a contar como ocupadas
+    op.execute("DELETE FROM Solicitud_Parcela WHERE activa IS NULL")
+    op.create_index(INDICE_ANTERIOR, 'Solicitud_Parcela', ['parcela_id', 'temporada'], unique=True)
+    op.drop_index(INDICE_NUEVO, table_name='Solicitud_Parcela')
+    with op.batch_alter_table('Solicitud_Parcela') as tabla:
+        tabla.drop_column('fecha_liberacion')
+        tabla.drop_column('activa')
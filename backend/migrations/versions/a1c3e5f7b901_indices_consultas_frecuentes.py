@@ -0,0 +1,62 @@
+"""Índices para los filtros más usados
+
+Revision ID: a1c3e5f7b901
+Revises:
+Create Date: 2026-10-18 10:00:00
+
+Las bases creadas con schema.sql o db.create_all antes de este cambio solo
+tienen claves primarias y foráneas. Los índices que ya existan (por ejemplo
+en una base nueva creada desde los modelos) se saltean.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f7b901'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (tabla, nombre, columnas)
+INDICES = [
+    ('Solicitud', 'ix_solicitud_artesano_fecha', ['artesano_id', 'fecha_solicitud']),
+    ('Solicitud', 'ix_solicitud_estado_rubro', ['estado_solicitud_id', 'rubro_id']),
+    ('Solicitud', 'ix_solicitud_fecha_id', ['fecha_solicitud', 'solicitud_id']),
+    ('Notificacion', 'ix_notificacion_artesano_fecha', ['artesano_id', 'fecha_envio']),
+    ('Parcela', 'ix_parcela_mapa_fila_columna', ['mapa_id', 'fila', 'columna']),
+    ('Usuario', 'ix_Usuario_fecha_registro', ['fecha_registro']),
+]
+
+
+def _indices_existentes(tabla):
+    return {indice['name'] for indice in sa.inspect(op.get_bind()).get_indexes(tabla)}
+
+
+def _columnas_foraneas(tabla):
+    return {
+        columna
+        for fk in sa.inspect(op.get_bind()).get_foreign_keys(tabla)
+        for columna in fk['constrained_columns']
+    }
+
+
+def upgrade():
+    for tabla, nombre, columnas in INDICES:
+        if nombre not in _indices_existentes(tabla):
+            op.create_index(nombre, tabla, columnas)
+
+
+def downgrade():
+    es_mysql = op.get_bind().dialect.name == 'mysql'
+    for tabla, nombre, columnas in reversed(INDICES):
+        existentes = _indices_existentes(tabla)
+        if nombre not in existentes:
+            continue
+        # MySQL descarta el índice implícito de la clave foránea cuando otro
+        # índice empieza por esa columna: hay que devolvérselo antes de borrar
+        simple = f'ix_{tabla}_{columnas[0]}'
+        if es_mysql and columnas[0] in _columnas_foraneas(tabla) and simple not in existentes:
+            op.create_index(simple, tabla, [columnas[0]])
+        op.drop_index(nombre, table_name=tabla)
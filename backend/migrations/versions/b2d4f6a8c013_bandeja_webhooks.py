@@ -0,0 +1,43 @@
+"""Bandeja de webhooks de MercadoPago
+
+Revision ID: b2d4f6a8c013
+Revises: a1c3e5f7b901
+Create Date: 2026-10-18 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d4f6a8c013'
+down_revision = 'a1c3e5f7b901'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all ya la crea en las bases que arrancaron con el modelo nuevo
+    if sa.inspect(op.get_bind()).has_table('Webhook_Evento'):
+        return
+
+    op.create_table(
+        'Webhook_Evento',
+        sa.Column('evento_id', sa.Integer(), primary_key=True),
+        sa.Column('tipo', sa.String(length=50), nullable=False),
+        sa.Column('payment_id', sa.String(length=255), nullable=False),
+        sa.Column('payload', sa.Text()),
+        sa.Column('estado', sa.String(length=20), nullable=False),
+        sa.Column('intentos', sa.Integer(), nullable=False),
+        sa.Column('proximo_intento', sa.DateTime(), nullable=False),
+        sa.Column('ultimo_error', sa.Text()),
+        sa.Column('fecha_recepcion', sa.DateTime()),
+        sa.Column('fecha_procesado', sa.DateTime()),
+        sa.UniqueConstraint('tipo', 'payment_id', name='uq_webhook_evento_tipo_payment'),
+    )
+    op.create_index('ix_webhook_evento_estado_proximo', 'Webhook_Evento', ['estado', 'proximo_intento'])
+
+
+def downgrade():
+    op.drop_index('ix_webhook_evento_estado_proximo', table_name='Webhook_Evento')
+    op.drop_table('Webhook_Evento')
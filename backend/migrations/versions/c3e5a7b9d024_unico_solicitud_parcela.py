@@ -0,0 +1,61 @@
+"""Índice único de ocupación en Solicitud_Parcela
+
+Revision ID: c3e5a7b9d024
+Revises: b2d4f6a8c013
+Create Date: 2026-10-18 13:00:00
+
+Reemplaza a sql/migracion_unique_solicitud_parcela.sql. Antes de crear el
+índice libera las parcelas de solicitudes rechazadas o canceladas y, si
+quedan parcelas repetidas, conserva la asignación más antigua.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e5a7b9d024'
+down_revision = 'b2d4f6a8c013'
+branch_labels = None
+depends_on = None
+
+
+def _restricciones(tabla):
+    inspector = sa.inspect(op.get_bind())
+    return (
+        {indice['name'] for indice in inspector.get_indexes(tabla)}
+        | {restriccion['name'] for restriccion in inspector.get_unique_constraints(tabla)}
+    )
+
+
+def upgrade():
+    # db.create_all ya lo crea en las bases que arrancaron con el modelo nuevo
+    if 'uq_solicitud_parcela_parcela' in _restricciones('Solicitud_Parcela'):
+        return
+
+    op.execute("""
+        DELETE FROM Solicitud_Parcela
+        WHERE solicitud_id IN (
+            SELECT s.solicitud_id FROM Solicitud s
+            JOIN EstadoSolicitud e ON e.estado_solicitud_id = s.estado_solicitud_id
+            WHERE e.nombre IN ('Rechazada', 'Cancelada')
+        )
+    """)
+    # La tabla derivada evita el error 1093 de MySQL (subconsulta sobre la misma tabla)
+    op.execute("""
+        DELETE FROM Solicitud_Parcela
+        WHERE solicitud_parcela_id NOT IN (
+            SELECT conservar.id FROM (
+                SELECT MIN(solicitud_parcela_id) AS id FROM Solicitud_Parcela GROUP BY parcela_id
+            ) AS conservar
+        )
+    """)
+    op.create_index('uq_solicitud_parcela_parcela', 'Solicitud_Parcela', ['parcela_id'], unique=True)
+
+
+def downgrade():
+    if 'uq_solicitud_parcela_parcela' not in _restricciones('Solicitud_Parcela'):
+        return
+    # En MySQL el índice único también sostiene la clave foránea
+    if op.get_bind().dialect.name == 'mysql':
+        op.create_index('ix_Solicitud_Parcela_parcela_id', 'Solicitud_Parcela', ['parcela_id'])
+    op.drop_index('uq_solicitud_parcela_parcela', table_name='Solicitud_Parcela')
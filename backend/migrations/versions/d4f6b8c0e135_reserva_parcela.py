@@ -0,0 +1,41 @@
+"""Retenciones de parcelas durante el pago
+
+Revision ID: d4f6b8c0e135
+Revises: c3e5a7b9d024
+Create Date: 2026-10-18 13:05:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6b8c0e135'
+down_revision = 'c3e5a7b9d024'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all ya la crea en las bases que arrancaron con el modelo nuevo
+    if sa.inspect(op.get_bind()).has_table('Reserva_Parcela'):
+        return
+
+    op.create_table(
+        'Reserva_Parcela',
+        sa.Column('reserva_id', sa.Integer(), primary_key=True),
+        sa.Column('parcela_id', sa.Integer(),
+                  sa.ForeignKey('Parcela.parcela_id', ondelete='CASCADE'), nullable=False, unique=True),
+        sa.Column('solicitud_id', sa.Integer(),
+                  sa.ForeignKey('Solicitud.solicitud_id', ondelete='CASCADE'), nullable=False),
+        sa.Column('pago_id', sa.Integer(),
+                  sa.ForeignKey('Pago.pago_id', ondelete='SET NULL'), nullable=True),
+        sa.Column('fecha_creacion', sa.DateTime()),
+        sa.Column('expira_en', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_Reserva_Parcela_solicitud_id', 'Reserva_Parcela', ['solicitud_id'])
+    op.create_index('ix_Reserva_Parcela_expira_en', 'Reserva_Parcela', ['expira_en'])
+
+
+def downgrade():
+    op.drop_table('Reserva_Parcela')
@@ -0,0 +1,39 @@
+"""Fotos de solicitudes en el blob store
+
+Revision ID: e5a7c9d1f246
+Revises: d4f6b8c0e135
+Create Date: 2026-10-18 13:10:00
+
+Reemplaza a sql/migracion_blob_store_fotos.sql. Solo agrega las columnas:
+los archivos se mueven después, desde backend/, con
+    flask --app app migrar-fotos --lote 50
+y cada foto migrada queda con base64 = NULL. En MySQL conviene un
+OPTIMIZE TABLE Solicitud_Foto al terminar para recuperar el espacio.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c9d1f246'
+down_revision = 'd4f6b8c0e135'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columnas = {columna['name'] for columna in inspector.get_columns('Solicitud_Foto')}
+    if 'blob_hash' not in columnas:
+        op.add_column('Solicitud_Foto', sa.Column('blob_hash', sa.String(length=64), nullable=True))
+    if 'tamano' not in columnas:
+        op.add_column('Solicitud_Foto', sa.Column('tamano', sa.Integer(), nullable=True))
+    if 'ix_Solicitud_Foto_blob_hash' not in {indice['name'] for indice in inspector.get_indexes('Solicitud_Foto')}:
+        op.create_index('ix_Solicitud_Foto_blob_hash', 'Solicitud_Foto', ['blob_hash'])
+
+
+def downgrade():
+    op.drop_index('ix_Solicitud_Foto_blob_hash', table_name='Solicitud_Foto')
+    with op.batch_alter_table('Solicitud_Foto') as tabla:
+        tabla.drop_column('tamano')
+        tabla.drop_column('blob_hash')
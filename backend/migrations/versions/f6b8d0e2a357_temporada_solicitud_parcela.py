@@ -0,0 +1,80 @@
+"""Ocupación de parcelas por temporada
+
+Revision ID: f6b8d0e2a357
+Revises: e5a7c9d1f246
+Create Date: 2026-10-18 15:30:00
+
+Agrega Solicitud_Parcela.temporada (año de la solicitud) y reemplaza el
+índice único sobre parcela_id por uno sobre (parcela_id, temporada): las
+asignaciones de temporadas anteriores ya no bloquean la parcela.
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6b8d0e2a357'
+down_revision = 'e5a7c9d1f246'
+branch_labels = None
+depends_on = None
+
+INDICE_NUEVO = 'uq_solicitud_parcela_parcela_temporada'
+INDICE_ANTERIOR = 'uq_solicitud_parcela_parcela'
+
+
+def _restricciones(tabla):
+    inspector = sa.inspect(op.get_bind())
+    return (
+        {indice['name'] for indice in inspector.get_indexes(tabla)}
+        | {restriccion['name'] for restriccion in inspector.get_unique_constraints(tabla)}
+    )
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columnas = {columna['name'] for columna in inspector.get_columns('Solicitud_Parcela')}
+
+    if 'temporada' not in columnas:
+        op.add_column('Solicitud_Parcela', sa.Column('temporada', sa.Integer(), nullable=True))
+
+        solicitud_parcela = sa.table(
+            'Solicitud_Parcela', sa.column('solicitud_id', sa.Integer), sa.column('temporada', sa.Integer)
+        )
+        solicitud = sa.table(
+            'Solicitud', sa.column('solicitud_id', sa.Integer), sa.column('fecha_solicitud', sa.DateTime)
+        )
+        anio = sa.select(
+            sa.extract('year', solicitud.c.fecha_solicitud)
+        ).where(
+            solicitud.c.solicitud_id == solicitud_parcela.c.solicitud_id
+        ).scalar_subquery()
+        op.execute(solicitud_parcela.update().values(
+            temporada=sa.func.coalesce(anio, datetime.utcnow().year)
+        ))
+
+        with op.batch_alter_table('Solicitud_Parcela') as tabla:
+            tabla.alter_column('temporada', existing_type=sa.Integer(), nullable=False)
+
+    existentes = _restricciones('Solicitud_Parcela')
+    # El nuevo empieza por parcela_id: en MySQL sostiene la clave foránea
+    if INDICE_NUEVO not in existentes:
+        op.create_index(INDICE_NUEVO, 'Solicitud_Parcela', ['parcela_id', 'temporada'], unique=True)
+    if INDICE_ANTERIOR in existentes:
+        op.drop_index(INDICE_ANTERIOR, table_name='Solicitud_Parcela')
+
+
+def downgrade():
+    # Sin temporada solo puede quedar una asignación por parcela: la más reciente
+    op.execute("""
+        DELETE FROM Solicitud_Parcela
+        WHERE solicitud_parcela_id NOT IN (
+            SELECT conservar.id FROM (
+                SELECT MAX(solicitud_parcela_id) AS id FROM Solicitud_Parcela GROUP BY parcela_id
+            ) AS conservar
+        )
+    """)
+    op.create_index(INDICE_ANTERIOR, 'Solicitud_Parcela', ['parcela_id'], unique=True)
+    op.drop_index(INDICE_NUEVO, table_name='Solicitud_Parcela')
+    with op.batch_alter_table('Solicitud_Parcela') as tabla:
+        tabla.drop_column('temporada')
@@ -18,6 +18,9 @@ from .organizador import Organizador
 from .solicitud import Solicitud
 from .solicitud_foto import SolicitudFoto
 from .solicitud_parcela import SolicitudParcela
+from .reserva_parcela import ReservaParcela
+from .webhook_evento import WebhookEvento
+from .mapa_evento import MapaEvento
 from .pago import Pago
 from .notificacion import Notificacion
 from .historial_participacion import HistorialParticipacion
@@ -27,6 +30,6 @@ __all__ = [
     'db', 'Usuario', 'Rol', 'EstadoUsuario', 'Color', 'EstadoSolicitud',
     'EstadoPago', 'EstadoNotificacion', 'Rubro', 'Parcela', 'Mapa',
     'Tipo_parcela', 'LimiteRubro', 'Artesano', 'Administrador', 'Organizador',
-    'Solicitud', 'SolicitudFoto', 'SolicitudParcela', 'Pago', 'Notificacion',
+    'Solicitud', 'SolicitudFoto', 'SolicitudParcela', 'ReservaParcela', 'WebhookEvento', 'MapaEvento', 'Pago', 'Notificacion',
     'HistorialParticipacion','TokensBlacklist', 'ActiveToken'
 ]
\ No newline at end of file
@@ -0,0 +1,22 @@
+from .base import db
+from datetime import datetime
+
+
+class MapaEvento(db.Model):
+    """
+    Cambio del mapa anunciado por un proceso para los demás workers: cada
+    uno lee los eventos nuevos (utils/mapa_relay.py), invalida su cache y
+    avisa a sus clientes SSE. Sin parcela_ids es un cambio estructural.
+    """
+    __tablename__ = 'Mapa_Evento'
+
+    evento_id = db.Column(db.Integer, primary_key=True)
+    # Época (MapaCache.epoca) del proceso que hizo el cambio
+    origen = db.Column(db.String(32), nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)
+    # Lista JSON de IDs de parcelas
+    parcela_ids = db.Column(db.Text)
+    fecha = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<MapaEvento {self.evento_id} {self.tipo} de {self.origen}>'
@@ -2,6 +2,9 @@ from .base import db
 
 class Notificacion(db.Model):
     __tablename__ = 'Notificacion'
+    __table_args__ = (
+        db.Index('ix_notificacion_artesano_fecha', 'artesano_id', 'fecha_envio'),
+    )
     
     notificacion_id = db.Column(db.Integer, primary_key=True)
     artesano_id = db.Column(db.Integer, db.ForeignKey('Artesano.artesano_id'), nullable=False)
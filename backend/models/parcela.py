@@ -2,6 +2,9 @@ from .base import db
 
 class Parcela(db.Model):
     __tablename__ = 'Parcela'
+    __table_args__ = (
+        db.Index('ix_parcela_mapa_fila_columna', 'mapa_id', 'fila', 'columna'),
+    )
     
     parcela_id = db.Column(db.Integer, primary_key=True)
 
@@ -0,0 +1,32 @@
+from .base import db
+from datetime import datetime
+
+class ReservaParcela(db.Model):
+    """
+    Retención temporal de una parcela mientras el artesano paga.
+    Se crea al generar la preferencia de MercadoPago y se convierte en
+    Solicitud_Parcela cuando el pago se aprueba; si vence, la libera el
+    barrido periódico.
+    """
+    __tablename__ = 'Reserva_Parcela'
+
+    reserva_id = db.Column(db.Integer, primary_key=True)
+    # Una parcela solo puede estar retenida por una solicitud a la vez
+    parcela_id = db.Column(db.Integer, db.ForeignKey('Parcela.parcela_id', ondelete='CASCADE'), unique=True, nullable=False)
+    solicitud_id = db.Column(db.Integer, db.ForeignKey('Solicitud.solicitud_id', ondelete='CASCADE'), nullable=False, index=True)
+    pago_id = db.Column(db.Integer, db.ForeignKey('Pago.pago_id', ondelete='SET NULL'), nullable=True)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    expira_en = db.Column(db.DateTime, nullable=False, index=True)
+
+    def to_dict(self):
+        return {
+            'reserva_id': self.reserva_id,
+            'parcela_id': self.parcela_id,
+            'solicitud_id': self.solicitud_id,
+            'pago_id': self.pago_id,
+            'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None,
+            'expira_en': self.expira_en.isoformat() if self.expira_en else None
+        }
+
+    def __repr__(self):
+        return f'<ReservaParcela P:{self.parcela_id} S:{self.solicitud_id} hasta {self.expira_en}>'
@@ -5,6 +5,14 @@ from datetime import datetime
 # En models/solicitud.py, cambia nullable=False a nullable=True
 class Solicitud(db.Model):
     __tablename__ = 'Solicitud'
+    __table_args__ = (
+        # Solicitud del artesano en un año (rango sobre fecha_solicitud)
+        db.Index('ix_solicitud_artesano_fecha', 'artesano_id', 'fecha_solicitud'),
+        # Conteos por estado y rubro (capacidad, estadísticas, ocupación)
+        db.Index('ix_solicitud_estado_rubro', 'estado_solicitud_id', 'rubro_id'),
+        # Orden del dashboard de administración (keyset)
+        db.Index('ix_solicitud_fecha_id', 'fecha_solicitud', 'solicitud_id'),
+    )
     
     solicitud_id = db.Column(db.Integer, primary_key=True)
     artesano_id = db.Column(db.Integer, db.ForeignKey('Artesano.artesano_id'), nullable=False)
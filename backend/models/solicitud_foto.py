@@ -1,12 +1,18 @@
 from .base import db
 from datetime import datetime
+from flask import url_for
 from sqlalchemy.dialects.mysql import LONGTEXT
 class SolicitudFoto(db.Model):
     __tablename__ = 'Solicitud_Foto'
     
     foto_id = db.Column(db.Integer, primary_key=True)
     solicitud_id = db.Column(db.Integer, db.ForeignKey('Solicitud.solicitud_id', ondelete='CASCADE'), nullable=False)
-    base64 = db.Column(db.LargeBinary().with_variant(LONGTEXT, 'mysql'))
+    # Legado: fotos anteriores al blob store (ver flask migrar-fotos).
+    # Diferida: los listados nunca la cargan
+    base64 = db.deferred(db.Column(db.LargeBinary().with_variant(LONGTEXT, 'mysql')))
+    # sha256 del archivo en el blob store
+    blob_hash = db.Column(db.String(64), index=True)
+    tamano = db.Column(db.Integer)
     extension = db.Column(db.String(10), nullable=False)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -14,14 +20,32 @@ class SolicitudFoto(db.Model):
         return {
             'foto_id': self.foto_id,
             'solicitud_id': self.solicitud_id,
-            'base64': self.base64,
+            'tamano': self.tamano,
             'extension': self.extension,
             'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None
         }
     
-    def get_image_url(self):
-        """Reconstruye el Data URL completo cuando se necesite"""
-        return f"data:image/{self.extension};base64,{self.base64}"
+    def get_image_url(self, variante='original'):
+        """
+        URL del archivo (variante: miniatura, media u original sin EXIF).
+        Lleva el hash como versión: el contenido de una URL no cambia nunca
+        y el navegador puede cachearla sin revalidar.
+        """
+        params = {'v': self.blob_hash[:16], 'variante': variante} if self.blob_hash else {}
+        return url_for('solicitud_bp.obtener_foto_archivo', foto_id=self.foto_id, _external=True, **params)
+
+    def to_descriptor(self):
+        """Datos livianos para listados: la imagen se pide aparte por URL"""
+        return {
+            'foto_id': self.foto_id,
+            'solicitud_id': self.solicitud_id,
+            'tamano': self.tamano,
+            'extension': self.extension,
+            'image_url': self.get_image_url(),
+            'media_url': self.get_image_url('media'),
+            'miniatura_url': self.get_image_url('miniatura'),
+            'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None
+        }
     
     def __repr__(self):
-        return f'<SolicitudFoto {self.foto_id}>'
\ No newline at end of file
+        return f'<SolicitudFoto {self.foto_id}>'
@@ -2,18 +2,32 @@ from .base import db
 
 class SolicitudParcela(db.Model):
     __tablename__ = 'Solicitud_Parcela'
-    
+    # Una parcela solo puede estar asignada a una solicitud por temporada.
+    # Las filas liberadas tienen activa NULL y el índice único las ignora
+    # (admite varios NULL), así que se conservan como historial
+    __table_args__ = (
+        db.UniqueConstraint('parcela_id', 'temporada', 'activa', name='uq_solicitud_parcela_parcela_temporada_activa'),
+    )
+
     solicitud_parcela_id = db.Column(db.Integer, primary_key=True)
     solicitud_id = db.Column(db.Integer, db.ForeignKey('Solicitud.solicitud_id', ondelete='CASCADE'), nullable=False)
     parcela_id = db.Column(db.Integer, db.ForeignKey('Parcela.parcela_id'), nullable=False)
+    # Año de la solicitud (ver utils/ocupacion_parcelas.py)
+    temporada = db.Column(db.Integer, nullable=False)
+    # True mientras la parcela está asignada; NULL cuando se liberó
+    activa = db.Column(db.Boolean, nullable=True, default=True)
+    fecha_liberacion = db.Column(db.DateTime, nullable=True)
+
 
-    
     def to_dict(self):
         return {
             'solicitud_parcela_id': self.solicitud_parcela_id,
             'solicitud_id': self.solicitud_id,
-            'parcela_id': self.parcela_id
+            'parcela_id': self.parcela_id,
+            'temporada': self.temporada,
+            'activa': bool(self.activa),
+            'fecha_liberacion': self.fecha_liberacion.isoformat() if self.fecha_liberacion else None
         }
-    
+
     def __repr__(self):
-        return f'<SolicitudParcela S:{self.solicitud_id} P:{self.parcela_id}>'
\ No newline at end of file
+        return f'<SolicitudParcela S:{self.solicitud_id} P:{self.parcela_id} T:{self.temporada}>'
@@ -1,5 +1,5 @@
 from .base import db
-from passlib.hash import sha256_crypt
+from utils.password_policy import PasswordPolicy
 from datetime import datetime
 from sqlalchemy.orm import relationship
 
@@ -11,15 +11,23 @@ class Usuario(db.Model):
     contraseña = db.Column(db.String(255), nullable=False)
     estado_id = db.Column(db.Integer, db.ForeignKey('EstadoUsuario.estado_id'), nullable=False)
     rol_id = db.Column(db.Integer, db.ForeignKey('Rol.rol_id'), nullable=False)
-    fecha_registro = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_registro = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     artesano_perfil = db.relationship("Artesano", backref="usuario_perfil", uselist=False)
 
     def set_password(self, password):
-        self.contraseña = sha256_crypt.hash(password)
+        self.contraseña = PasswordPolicy.hash(password)
     
     def check_password(self, password):
-        return sha256_crypt.verify(password, self.contraseña)
+        """
+        Verifica la contraseña. Si el hash quedó con un esquema o costo
+        anterior a la política actual, lo reemplaza (se guarda con el
+        próximo commit de la sesión, p. ej. el del login).
+        """
+        valida, nuevo_hash = PasswordPolicy.verify_and_update(password, self.contraseña)
+        if valida and nuevo_hash:
+            self.contraseña = nuevo_hash
+        return valida
     
     def to_dict(self):
         return {
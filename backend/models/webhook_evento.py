@@ -0,0 +1,50 @@
+from .base import db
+from datetime import datetime
+
+# Estados de un evento en la bandeja de webhooks
+WEBHOOK_PENDIENTE = 'pendiente'
+WEBHOOK_PROCESANDO = 'procesando'
+WEBHOOK_PROCESADO = 'procesado'
+WEBHOOK_ERROR = 'error'
+
+
+class WebhookEvento(db.Model):
+    """
+    Notificación de MercadoPago recibida y todavía no aplicada (o ya
+    aplicada). Hay una sola fila por (tipo, payment_id): las entregas
+    repetidas del mismo evento no agregan trabajo.
+    """
+    __tablename__ = 'Webhook_Evento'
+    __table_args__ = (
+        db.UniqueConstraint('tipo', 'payment_id', name='uq_webhook_evento_tipo_payment'),
+        # Búsqueda de eventos listos para procesar
+        db.Index('ix_webhook_evento_estado_proximo', 'estado', 'proximo_intento'),
+    )
+
+    evento_id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    payment_id = db.Column(db.String(255), nullable=False)
+    payload = db.Column(db.Text)
+    estado = db.Column(db.String(20), nullable=False, default=WEBHOOK_PENDIENTE)
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    # Próximo intento; mientras se procesa es el vencimiento del bloqueo
+    proximo_intento = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ultimo_error = db.Column(db.Text)
+    fecha_recepcion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_procesado = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'evento_id': self.evento_id,
+            'tipo': self.tipo,
+            'payment_id': self.payment_id,
+            'estado': self.estado,
+            'intentos': self.intentos,
+            'proximo_intento': self.proximo_intento.isoformat() if self.proximo_intento else None,
+            'ultimo_error': self.ultimo_error,
+            'fecha_recepcion': self.fecha_recepcion.isoformat() if self.fecha_recepcion else None,
+            'fecha_procesado': self.fecha_procesado.isoformat() if self.fecha_procesado else None
+        }
+
+    def __repr__(self):
+        return f'<WebhookEvento {self.tipo}:{self.payment_id} {self.estado}>'
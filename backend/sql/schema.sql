@@ -67,6 +67,7 @@ CREATE TABLE Usuario (
     estado_id INT NOT NULL,
     rol_id INT NOT NULL,
     fecha_registro DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_Usuario_fecha_registro (fecha_registro),
     FOREIGN KEY (estado_id) REFERENCES EstadoUsuario(estado_id),
     FOREIGN KEY (rol_id) REFERENCES Rol(rol_id)
 );
@@ -111,6 +112,7 @@ CREATE TABLE Parcela (
     fila INT NOT NULL,
     columna INT NOT NULL,
     habilitada BOOLEAN DEFAULT TRUE,
+    INDEX ix_parcela_mapa_fila_columna (mapa_id, fila, columna),
     FOREIGN KEY (rubro_id) REFERENCES Rubro(rubro_id),
     FOREIGN KEY (mapa_id) REFERENCES Mapa(mapa_id),
     FOREIGN KEY (tipo_parcela_id) REFERENCES Tipo_parcela(tipo_parcela_id)
@@ -131,6 +133,9 @@ CREATE TABLE Solicitud (
     fecha_gestion DATETIME,
     comentarios_admin TEXT,
     terminos_aceptados BOOLEAN DEFAULT FALSE NOT NULL,
+    INDEX ix_solicitud_artesano_fecha (artesano_id, fecha_solicitud),
+    INDEX ix_solicitud_estado_rubro (estado_solicitud_id, rubro_id),
+    INDEX ix_solicitud_fecha_id (fecha_solicitud, solicitud_id),
     FOREIGN KEY (artesano_id) REFERENCES Artesano(artesano_id),
     FOREIGN KEY (estado_solicitud_id) REFERENCES EstadoSolicitud(estado_solicitud_id),
     FOREIGN KEY (administrador_id) REFERENCES Administrador(administrador_id),
@@ -141,8 +146,11 @@ CREATE TABLE Solicitud_Foto (
     foto_id INT AUTO_INCREMENT PRIMARY KEY,
     solicitud_id INT NOT NULL,
     base64 LONGTEXT,
+    blob_hash VARCHAR(64),
+    tamano INT,
     extension VARCHAR(10) NOT NULL,
     fecha_creacion DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_Solicitud_Foto_blob_hash (blob_hash),
     FOREIGN KEY (solicitud_id) REFERENCES Solicitud(solicitud_id) ON DELETE CASCADE
 );
 
@@ -150,6 +158,11 @@ CREATE TABLE Solicitud_Parcela (
     solicitud_parcela_id INT AUTO_INCREMENT PRIMARY KEY,
     solicitud_id INT NOT NULL,
     parcela_id INT NOT NULL,
+    temporada INT NOT NULL,
+    -- 1 mientras está asignada; NULL al liberarse (el índice único admite varios NULL)
+    activa BOOLEAN NULL DEFAULT 1,
+    fecha_liberacion DATETIME NULL,
+    CONSTRAINT uq_solicitud_parcela_parcela_temporada_activa UNIQUE (parcela_id, temporada, activa),
     FOREIGN KEY (solicitud_id) REFERENCES Solicitud(solicitud_id),
     FOREIGN KEY (parcela_id) REFERENCES Parcela(parcela_id)
 );
@@ -167,6 +180,45 @@ CREATE TABLE Pago (
     FOREIGN KEY (estado_pago_id) REFERENCES EstadoPago(estado_pago_id)
 );
 
+CREATE TABLE Reserva_Parcela (
+    reserva_id INT AUTO_INCREMENT PRIMARY KEY,
+    parcela_id INT UNIQUE NOT NULL,
+    solicitud_id INT NOT NULL,
+    pago_id INT,
+    fecha_creacion DATETIME DEFAULT CURRENT_TIMESTAMP,
+    expira_en DATETIME NOT NULL,
+    INDEX ix_Reserva_Parcela_solicitud_id (solicitud_id),
+    INDEX ix_Reserva_Parcela_expira_en (expira_en),
+    FOREIGN KEY (parcela_id) REFERENCES Parcela(parcela_id) ON DELETE CASCADE,
+    FOREIGN KEY (solicitud_id) REFERENCES Solicitud(solicitud_id) ON DELETE CASCADE,
+    FOREIGN KEY (pago_id) REFERENCES Pago(pago_id) ON DELETE SET NULL
+);
+
+-- Bandeja de notificaciones de MercadoPago (una fila por tipo + payment_id)
+CREATE TABLE Webhook_Evento (
+    evento_id INT AUTO_INCREMENT PRIMARY KEY,
+    tipo VARCHAR(50) NOT NULL,
+    payment_id VARCHAR(255) NOT NULL,
+    payload TEXT,
+    estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+    intentos INT NOT NULL DEFAULT 0,
+    proximo_intento DATETIME NOT NULL,
+    ultimo_error TEXT,
+    fecha_recepcion DATETIME DEFAULT CURRENT_TIMESTAMP,
+    fecha_procesado DATETIME,
+    CONSTRAINT uq_webhook_evento_tipo_payment UNIQUE (tipo, payment_id),
+    INDEX ix_webhook_evento_estado_proximo (estado, proximo_intento)
+);
+
+CREATE TABLE Mapa_Evento (
+    evento_id INT AUTO_INCREMENT PRIMARY KEY,
+    origen VARCHAR(32) NOT NULL,
+    tipo VARCHAR(20) NOT NULL,
+    parcela_ids TEXT,
+    fecha DATETIME NOT NULL,
+    INDEX ix_Mapa_Evento_fecha (fecha)
+);
+
 CREATE TABLE Notificacion (
     notificacion_id INT AUTO_INCREMENT PRIMARY KEY,
     artesano_id INT NOT NULL,
@@ -174,6 +226,7 @@ CREATE TABLE Notificacion (
     fecha_envio DATETIME DEFAULT CURRENT_TIMESTAMP,
     estado_notificacion_id INT NOT NULL,
     leido BOOLEAN DEFAULT FALSE,
+    INDEX ix_notificacion_artesano_fecha (artesano_id, fecha_envio),
     FOREIGN KEY (artesano_id) REFERENCES Artesano(artesano_id),
     FOREIGN KEY (estado_notificacion_id) REFERENCES EstadoNotificacion(estado_notificacion_id)
 );
@@ -0,0 +1,94 @@
+# tests/conftest.py
+"""
+Configuración común de los tests. Por defecto usan una base sqlite
+temporal; con TEST_DATABASE_URL se corren contra otra base (por ejemplo
+el MySQL de staging, que es donde importan los planes de consulta).
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_TEMPORAL = tempfile.mkdtemp(prefix='ferias-tests-')
+
+# Antes de importar la app: la configuración se lee al importar
+os.environ['DATABASE_URL'] = os.getenv(
+    'TEST_DATABASE_URL', 'sqlite:///' + os.path.join(_TEMPORAL, 'tests.db')
+)
+os.environ['SCHEDULER_ACTIVO'] = 'false'
+os.environ['WEBHOOK_WORKERS'] = '0'
+# Un solo proceso: la sincronización entre workers del índice de revocación
+# solo agregaría una consulta a algún request al azar (ver max_consultas)
+os.environ['TOKEN_REVOCATION_SYNC_SECONDS'] = '3600'
+# Las cabeceras X-DB-* de PerfilConsultas las usa la fixture max_consultas
+os.environ['PERFIL_CONSULTAS'] = 'true'
+os.environ.setdefault('BLOB_STORE_PATH', os.path.join(_TEMPORAL, 'blobs'))
+os.environ.setdefault('FOTOS_VARIANTES_PATH', os.path.join(_TEMPORAL, 'variantes'))
+os.environ.setdefault('COMPROBANTES_CACHE_PATH', os.path.join(_TEMPORAL, 'comprobantes'))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    import app as aplicacion
+    flask_app = aplicacion.app
+    flask_app.config['TESTING'] = True
+
+    respuesta = flask_app.test_client().get('/api/init-db')
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    return flask_app
+
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def contexto(app):
+    from models.base import db
+    with app.app_context():
+        yield
+        db.session.rollback()
+        db.session.remove()
+
+
+@pytest.fixture(scope='session')
+def auth_organizador(app):
+    respuesta = app.test_client().post('/auth/login', json={
+        'email': 'organizador@feria.com', 'password': 'org123'
+    })
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    return {'Authorization': 'Bearer ' + respuesta.json['access_token']}
+
+
+@pytest.fixture(scope='session')
+def auth_administrador(app, auth_organizador):
+    cliente = app.test_client()
+    respuesta = cliente.post('/api/usuarios/crear', headers=auth_organizador, json={
+        'email': 'admin@tests.com', 'password': 'admin123', 'rol_id': 2, 'nombre': 'Admin tests'
+    })
+    assert respuesta.status_code == 201, respuesta.get_data(as_text=True)
+    respuesta = cliente.post('/auth/login', json={'email': 'admin@tests.com', 'password': 'admin123'})
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    return {'Authorization': 'Bearer ' + respuesta.json['access_token']}
+
+
+@pytest.fixture
+def max_consultas(cliente):
+    """
+    Hace el request con el cliente de prueba y falla si ejecutó más de
+    'limite' sentencias SQL (cabecera X-DB-Queries de PerfilConsultas) o si
+    repitió alguna como un N+1. Devuelve la respuesta.
+
+        max_consultas(4, 'GET', '/api/v1/mapa/parcelas', headers=auth_organizador)
+    """
+    def verificar(limite, metodo, url, **kwargs):
+        respuesta = cliente.open(url, method=metodo, **kwargs)
+        consultas = int(respuesta.headers['X-DB-Queries'])
+        assert consultas <= limite, f"{metodo} {url}: {consultas} consultas, máximo {limite}"
+        assert respuesta.headers['X-DB-N1'] == '0', f"{metodo} {url}: sentencias repetidas (N+1)"
+        return respuesta
+    return verificar
@@ -0,0 +1,74 @@
+# tests/fabricas.py
+"""Datos mínimos para los tests, insertados directamente (sin commit)"""
+from datetime import datetime
+import itertools
+
+from models.base import db
+from models.mapa import Mapa
+from models.parcela import Parcela
+from models.usuario import Usuario
+from models.artesano import Artesano
+from models.solicitud import Solicitud
+from models.webhook_evento import WebhookEvento, WEBHOOK_PENDIENTE
+from utils.catalogos import Catalogos, ESTADO_SOLICITUD_APROBADA
+
+_secuencia = itertools.count(1)
+
+
+def crear_parcela():
+    mapa = Mapa.query.first()
+    if not mapa:
+        mapa = Mapa(cant_total_filas=0, cant_total_columnas=0)
+        db.session.add(mapa)
+        db.session.flush()
+    parcela = Parcela(mapa_id=mapa.mapa_id, fila=1000 + next(_secuencia), columna=1, habilitada=True, rubro_id=1)
+    db.session.add(parcela)
+    db.session.flush()
+    return parcela.parcela_id
+
+
+def crear_artesano(password=None):
+    """Usuario artesano con su perfil; con password puede hacer login. Devuelve (email, artesano_id)"""
+    n = next(_secuencia)
+    usuario = Usuario(email=f'artesano{n}@test.com', contraseña='-', estado_id=1, rol_id=1)
+    if password:
+        usuario.set_password(password)
+    db.session.add(usuario)
+    db.session.flush()
+    artesano = Artesano(usuario_id=usuario.usuario_id, nombre=f'Art {n}', dni=f'{n:08d}', telefono='1')
+    db.session.add(artesano)
+    db.session.flush()
+    return usuario.email, artesano.artesano_id
+
+
+def crear_solicitud(estado=ESTADO_SOLICITUD_APROBADA, fecha=None, rubro_id=1, artesano_id=None):
+    if artesano_id is None:
+        _, artesano_id = crear_artesano()
+    solicitud = Solicitud(
+        artesano_id=artesano_id,
+        estado_solicitud_id=Catalogos.estado_solicitud_id(estado),
+        rubro_id=rubro_id,
+        costo_total=0,
+        fecha_solicitud=fecha or datetime.utcnow(),
+        terminos_aceptados=True
+    )
+    db.session.add(solicitud)
+    db.session.flush()
+    return solicitud.solicitud_id
+
+
+def crear_evento_webhook(estado=WEBHOOK_PENDIENTE, payload='{}', intentos=0, proximo_intento=None,
+                         fecha_procesado=None, payment_id=None):
+    """Evento de la bandeja de webhooks. Devuelve el evento_id"""
+    evento = WebhookEvento(
+        tipo='payment',
+        payment_id=payment_id or f'EVENTO-{next(_secuencia)}',
+        payload=payload,
+        estado=estado,
+        intentos=intentos,
+        proximo_intento=proximo_intento or datetime.utcnow(),
+        fecha_procesado=fecha_procesado
+    )
+    db.session.add(evento)
+    db.session.flush()
+    return evento.evento_id
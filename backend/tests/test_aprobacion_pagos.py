@@ -0,0 +1,229 @@
+# tests/test_aprobacion_pagos.py
+"""
+Aprobación de pagos por cada camino (webhook de MercadoPago, simulación,
+aprobación de Pago Fácil y aprobación automática): solo los rechazos
+terminales liberan las parcelas retenidas, los estados intermedios o
+desconocidos las conservan, el plazo de la aprobación automática se
+cuenta con el mismo reloj que fecha_creacion y una parcela que otro tomó
+antes de la aprobación se informa sin frenar la asignación de las demás.
+"""
+from datetime import datetime, timedelta
+import itertools
+
+import pytest
+from sqlalchemy import insert
+
+import utils.aprobacion_pagos as aprobacion_pagos
+from models.base import db
+from models.notificacion import Notificacion
+from models.pago import Pago
+from models.parcela import Parcela
+from models.reserva_parcela import ReservaParcela
+from models.solicitud_parcela import SolicitudParcela
+from utils.aprobacion_pagos import ServicioAprobacionPagos, PAGO_AUTO_APROBACION_SEGUNDOS
+from utils.catalogos import (
+    Catalogos, ESTADO_PAGO_PENDIENTE, ESTADO_PAGO_PAGADO, ESTADO_PAGO_RECHAZADO, ESTADO_PAGO_CANCELADO
+)
+from utils.ocupacion_parcelas import OcupacionParcelas
+from utils.mercadopago_cliente import ClienteMercadoPagoLocal, configurar_cliente_mp
+from utils.reserva_parcelas import ReservaParcelas
+from utils.webhook_inbox import WebhookInbox
+from fabricas import crear_parcela, crear_solicitud
+
+_secuencia = itertools.count(1)
+
+
+@pytest.fixture(scope='module', autouse=True)
+def liberar_al_terminar(app):
+    """Las parcelas asignadas acá no deben impedir que otros módulos achiquen el mapa"""
+    with app.app_context():
+        ultima = db.session.query(db.func.max(Parcela.parcela_id)).scalar() or 0
+        db.session.remove()
+    yield
+    with app.app_context():
+        for modelo in (SolicitudParcela, ReservaParcela):
+            modelo.query.filter(modelo.parcela_id > ultima).delete(synchronize_session=False)
+        db.session.commit()
+        db.session.remove()
+
+
+def crear_pago(app, parcelas=2, fecha_creacion=None):
+    """Pago pendiente con sus parcelas retenidas, como lo deja crear_preferencia. Devuelve el preference_id"""
+    with app.app_context():
+        solicitud_id = crear_solicitud()
+        parcela_ids = [crear_parcela() for _ in range(parcelas)]
+        ReservaParcelas.retener(solicitud_id, parcela_ids)
+        pago = Pago(
+            solicitud_id=solicitud_id,
+            monto=100,
+            estado_pago_id=Catalogos.estado_pago_id(ESTADO_PAGO_PENDIENTE),
+            preference_id=f'PREF-TEST-{next(_secuencia)}',
+            fecha_creacion=fecha_creacion or datetime.now()
+        )
+        pago.set_parcelas_seleccionadas(parcela_ids)
+        db.session.add(pago)
+        db.session.flush()
+        ReservaParcelas.asociar_pago(solicitud_id, pago.pago_id)
+        db.session.commit()
+        preference_id = pago.preference_id
+        db.session.remove()
+    return preference_id
+
+
+def estado(app, preference_id):
+    """(estado del pago, parcelas retenidas, parcelas asignadas)"""
+    with app.app_context():
+        pago = Pago.query.filter_by(preference_id=preference_id).one()
+        retenidas = ReservaParcela.query.filter_by(solicitud_id=pago.solicitud_id).count()
+        asignadas = SolicitudParcela.query.filter_by(solicitud_id=pago.solicitud_id).count()
+        nombre = Catalogos.estados_pago.nombre_de(pago.estado_pago_id)
+        db.session.remove()
+    return nombre, retenidas, asignadas
+
+
+@pytest.fixture
+def mercadopago():
+    cliente = ClienteMercadoPagoLocal()
+    configurar_cliente_mp(cliente)
+    yield cliente
+    configurar_cliente_mp(None)
+
+
+def notificar(app, cliente, mercadopago, preference_id, status):
+    """Webhook de MP por la bandeja, procesado como lo haría el worker"""
+    payment_id = f'PAY-{next(_secuencia)}'
+    mercadopago.registrar_pago(payment_id, status, preference_id)
+    respuesta = cliente.post('/api/v1/pago/webhook', json={'type': 'payment', 'data': {'id': payment_id}})
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    with app.app_context():
+        while WebhookInbox.procesar_siguiente():
+            pass
+        db.session.remove()
+
+
+@pytest.mark.parametrize('status', ['pending', 'in_process', 'authorized', 'in_mediation', 'desconocido'])
+def test_webhook_no_terminal_conserva_la_retencion(app, cliente, mercadopago, status):
+    preference_id = crear_pago(app)
+    notificar(app, cliente, mercadopago, preference_id, status)
+    assert estado(app, preference_id) == (ESTADO_PAGO_PENDIENTE, 2, 0)
+
+
+@pytest.mark.parametrize('status, esperado', [
+    ('rejected', ESTADO_PAGO_RECHAZADO),
+    ('cancelled', ESTADO_PAGO_CANCELADO),
+])
+def test_webhook_rechazo_terminal_libera_la_retencion(app, cliente, mercadopago, status, esperado):
+    preference_id = crear_pago(app)
+    notificar(app, cliente, mercadopago, preference_id, status)
+    assert estado(app, preference_id) == (esperado, 0, 0)
+
+
+def test_webhook_aprobado_asigna_y_un_aviso_atrasado_no_lo_deshace(app, cliente, mercadopago):
+    preference_id = crear_pago(app)
+    notificar(app, cliente, mercadopago, preference_id, 'approved')
+    assert estado(app, preference_id) == (ESTADO_PAGO_PAGADO, 0, 2)
+
+    notificar(app, cliente, mercadopago, preference_id, 'in_process')
+    assert estado(app, preference_id) == (ESTADO_PAGO_PAGADO, 0, 2)
+
+
+@pytest.mark.parametrize('status, esperado', [
+    ('in_process', (ESTADO_PAGO_PENDIENTE, 2, 0)),
+    ('rejected', (ESTADO_PAGO_RECHAZADO, 0, 0)),
+    ('approved', (ESTADO_PAGO_PAGADO, 0, 2)),
+])
+def test_simular_webhook(app, cliente, status, esperado):
+    preference_id = crear_pago(app)
+    respuesta = cliente.post(f'/api/v1/pago/simular-webhook/{preference_id}', json={'estado': status})
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    assert estado(app, preference_id) == esperado
+
+
+def test_aprobar_pago_facil_es_idempotente(app, cliente):
+    preference_id = crear_pago(app)
+    respuesta = cliente.post(f'/api/v1/pago/aprobar-pago-facil/{preference_id}')
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    assert len(respuesta.json['parcelas_asignadas']) == 2
+
+    # Aprobar otra vez no reasigna nada
+    respuesta = cliente.post(f'/api/v1/pago/aprobar-pago-facil/{preference_id}')
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    assert respuesta.json['parcelas_asignadas'] == []
+    assert estado(app, preference_id) == (ESTADO_PAGO_PAGADO, 0, 2)
+
+
+def test_auto_aprobacion_respeta_el_plazo(app, monkeypatch):
+    monkeypatch.setattr(aprobacion_pagos, 'PAGO_AUTO_APROBACION', True)
+    # fecha_creacion es hora local (datetime.now()), como en crear_preferencia
+    vencido = crear_pago(app, fecha_creacion=datetime.now() - timedelta(seconds=PAGO_AUTO_APROBACION_SEGUNDOS + 5))
+    en_plazo = crear_pago(app, fecha_creacion=datetime.now() - timedelta(seconds=PAGO_AUTO_APROBACION_SEGUNDOS - 30))
+
+    with app.app_context():
+        aprobados = ServicioAprobacionPagos.auto_aprobar_pendientes()
+        ids = dict(db.session.query(Pago.preference_id, Pago.pago_id).filter(
+            Pago.preference_id.in_([vencido, en_plazo])
+        ).all())
+        db.session.remove()
+
+    assert ids[vencido] in aprobados
+    assert ids[en_plazo] not in aprobados
+    assert estado(app, vencido) == (ESTADO_PAGO_PAGADO, 0, 2)
+    assert estado(app, en_plazo) == (ESTADO_PAGO_PENDIENTE, 2, 0)
+
+
+def test_auto_aprobacion_apagada_no_aprueba(app, monkeypatch):
+    monkeypatch.setattr(aprobacion_pagos, 'PAGO_AUTO_APROBACION', False)
+    vencido = crear_pago(app, fecha_creacion=datetime.now() - timedelta(seconds=PAGO_AUTO_APROBACION_SEGUNDOS + 5))
+    with app.app_context():
+        assert ServicioAprobacionPagos.auto_aprobar_pendientes() == []
+        db.session.remove()
+    assert estado(app, vencido) == (ESTADO_PAGO_PENDIENTE, 2, 0)
+
+
+def test_check_and_auto_approve_usa_el_mismo_plazo(app, cliente, auth_organizador, monkeypatch):
+    import controllers.pago_controller as pago_controller
+    monkeypatch.setattr(pago_controller, 'PAGO_AUTO_APROBACION', True)
+    en_plazo = crear_pago(app, fecha_creacion=datetime.now() - timedelta(seconds=PAGO_AUTO_APROBACION_SEGUNDOS - 30))
+    vencido = crear_pago(app, fecha_creacion=datetime.now() - timedelta(seconds=PAGO_AUTO_APROBACION_SEGUNDOS + 5))
+
+    respuesta = cliente.get(f'/api/v1/pago/check-and-auto-approve/{en_plazo}', headers=auth_organizador)
+    assert respuesta.json['status'] == 'pending'
+    assert 0 < respuesta.json['segundos_para_autoaprobacion'] <= 30
+
+    respuesta = cliente.get(f'/api/v1/pago/check-and-auto-approve/{vencido}', headers=auth_organizador)
+    assert respuesta.json['status'] == 'auto_approved'
+    assert estado(app, vencido) == (ESTADO_PAGO_PAGADO, 0, 2)
+
+
+def test_parcela_tomada_entre_retencion_y_aprobacion(app, cliente):
+    preference_id = crear_pago(app, parcelas=3)
+    with app.app_context():
+        pago = Pago.query.filter_by(preference_id=preference_id).one()
+        tomada, *libres = pago.get_parcelas_seleccionadas()
+        # La retención venció y otra solicitud se quedó con la parcela
+        otra = crear_solicitud()
+        db.session.execute(insert(SolicitudParcela), [{
+            'solicitud_id': otra, 'parcela_id': tomada,
+            'temporada': OcupacionParcelas.temporada_de(pago.solicitud_id)
+        }])
+        db.session.commit()
+        solicitud_id, artesano_id = pago.solicitud_id, pago.solicitud.artesano_id
+        db.session.remove()
+
+    respuesta = cliente.post(f'/api/v1/pago/aprobar-pago-facil/{preference_id}')
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    assert respuesta.json['parcelas_asignadas'] == libres
+    assert respuesta.json['parcelas_en_conflicto'] == [tomada]
+
+    with app.app_context():
+        asignadas = dict(db.session.query(SolicitudParcela.parcela_id, SolicitudParcela.solicitud_id).filter(
+            SolicitudParcela.parcela_id.in_([tomada, *libres])
+        ).all())
+        mensajes = [n.mensaje for n in Notificacion.query.filter_by(artesano_id=artesano_id).all()]
+        db.session.remove()
+
+    assert asignadas == {tomada: otra, **{parcela_id: solicitud_id for parcela_id in libres}}
+    assert estado(app, preference_id) == (ESTADO_PAGO_PAGADO, 0, 2)
+    assert len(mensajes) == 1
+    assert 'Se asignaron 2 parcela(s)' in mensajes[0]
+    assert f'Las parcelas {tomada} ya no estaban disponibles' in mensajes[0]
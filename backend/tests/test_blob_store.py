@@ -0,0 +1,176 @@
+# tests/test_blob_store.py
+"""
+Blob store de fotos: deduplicación por contenido, límite de tamaño sin
+temporales colgados, borrado de los blobs de una subida que no llegó al
+commit (sin tocar los que otra subida volvió a publicar) y la gracia de
+los borrados de huérfanos frente a una subida del mismo contenido en curso.
+"""
+import hashlib
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+import utils.fotos_service as fotos_service
+from models.base import db
+from models.solicitud_foto import SolicitudFoto
+from utils.blob_store import LocalBlobStore, BlobDemasiadoGrandeError, obtener_blob_store
+from utils.fotos_service import FotosService, BLOB_GRACIA_SEGUNDOS
+from fabricas import crear_artesano, crear_solicitud
+
+
+def imagen_png(color):
+    """PNG chico y distinto por color"""
+    salida = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(salida, 'PNG')
+    return salida.getvalue()
+
+
+def archivo(datos, nombre='foto.png'):
+    return FileStorage(stream=io.BytesIO(datos), filename=nombre)
+
+
+def envejecer(blob_hash, segundos):
+    """Simula que el blob se publicó hace `segundos`"""
+    ruta = obtener_blob_store().ruta(blob_hash)
+    antes = time.time() - segundos
+    os.utime(ruta, (antes, antes))
+
+
+def temporales(raiz):
+    return [nombre for nombre in os.listdir(raiz) if nombre.startswith('.subida-')]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalBlobStore(str(tmp_path))
+
+
+def test_mismo_contenido_un_solo_archivo(store):
+    primero = store.guardar_bytes(b'contenido')
+    segundo = store.guardar_bytes(b'contenido')
+
+    assert primero.hash == segundo.hash
+    assert primero.nuevo and not segundo.nuevo
+    # Cada subida publica su copia: la versión cambia
+    assert primero.version != segundo.version
+    assert store.abrir(primero.hash).read() == b'contenido'
+    assert list(store.listar(time.time() + 1)) == [primero.hash]
+
+
+def test_demasiado_grande_no_deja_nada(store):
+    with pytest.raises(BlobDemasiadoGrandeError):
+        store.guardar(io.BytesIO(b'x' * 100), inicio=b'y' * 10, limite=50)
+    assert temporales(store.raiz) == []
+    assert list(store.listar(time.time() + 1)) == []
+
+
+def test_eliminar_respeta_version_y_antiguedad(store):
+    blob = store.guardar_bytes(b'versionado')
+    store.guardar_bytes(b'versionado')
+
+    assert not store.eliminar(blob.hash, version=blob.version)
+    assert not store.eliminar(blob.hash, anterior_a=time.time() - 60)
+    assert store.eliminar(blob.hash, anterior_a=time.time() + 1)
+    assert not store.existe(blob.hash)
+    assert not store.eliminar(blob.hash)
+
+
+def test_rollback_borra_los_blobs_nuevos_de_la_transaccion(app):
+    existente, nuevo = imagen_png('red'), imagen_png('green')
+    with app.app_context():
+        solicitud_id = crear_solicitud()
+        previa = FotosService.guardar(archivo(existente), solicitud_id)
+        db.session.commit()
+
+        repetida = FotosService.guardar(archivo(existente), solicitud_id)
+        descartada = FotosService.guardar(archivo(nuevo), solicitud_id)
+        assert obtener_blob_store().existe(descartada.blob_hash)
+        db.session.rollback()
+
+        # El blob nuevo se fue; el que ya tenía otra foto sigue
+        assert not obtener_blob_store().existe(descartada.blob_hash)
+        assert obtener_blob_store().existe(repetida.blob_hash)
+        assert previa.blob_hash == repetida.blob_hash
+        db.session.remove()
+
+
+def test_rollback_no_borra_lo_que_otra_subida_volvio_a_publicar(app):
+    datos = imagen_png('blue')
+    with app.app_context():
+        solicitud_id = crear_solicitud()
+        db.session.commit()
+        foto = FotosService.guardar(archivo(datos), solicitud_id)
+        # Otra subida del mismo contenido, que sí va a commitear su fila
+        obtener_blob_store().guardar_bytes(datos)
+        db.session.rollback()
+
+        assert obtener_blob_store().existe(foto.blob_hash)
+        db.session.remove()
+
+
+def test_subida_con_un_archivo_invalido_no_deja_blobs(app, cliente):
+    valida = imagen_png('yellow')
+    with app.app_context():
+        email, artesano_id = crear_artesano('clave123')
+        solicitud_id = crear_solicitud(artesano_id=artesano_id)
+        db.session.commit()
+        db.session.remove()
+    respuesta = cliente.post('/auth/login', json={'email': email, 'password': 'clave123'})
+    token = respuesta.json['access_token']
+
+    respuesta = cliente.post(
+        f'/solicitudes/{solicitud_id}/fotos',
+        headers={'Authorization': f'Bearer {token}'},
+        data={'fotos': [(io.BytesIO(valida), 'a.png'), (io.BytesIO(b'no es una imagen'), 'b.png')]},
+        content_type='multipart/form-data'
+    )
+    assert respuesta.status_code == 400, respuesta.get_data(as_text=True)
+
+    assert not obtener_blob_store().existe(hashlib.sha256(valida).hexdigest())
+    with app.app_context():
+        assert SolicitudFoto.query.filter_by(solicitud_id=solicitud_id).count() == 0
+        db.session.remove()
+    assert temporales(obtener_blob_store().raiz) == []
+
+
+def test_huerfano_reciente_queda_para_el_barrido(app):
+    datos = imagen_png('purple')
+    with app.app_context():
+        solicitud_id = crear_solicitud()
+        foto = FotosService.guardar(archivo(datos), solicitud_id)
+        db.session.commit()
+        blob_hash = foto.blob_hash
+        db.session.delete(foto)
+        db.session.commit()
+
+        # Recién publicado: puede ser de una subida en curso
+        assert not FotosService.eliminar_blob_si_huerfano(blob_hash)
+        assert obtener_blob_store().existe(blob_hash)
+
+        envejecer(blob_hash, BLOB_GRACIA_SEGUNDOS + 1)
+        assert FotosService.eliminar_blob_si_huerfano(blob_hash)
+        assert not obtener_blob_store().existe(blob_hash)
+        db.session.remove()
+
+
+def test_barrido_borra_solo_huerfanos_viejos(app, monkeypatch):
+    monkeypatch.setattr(fotos_service, 'BLOB_GRACIA_SEGUNDOS', 60)
+    store = obtener_blob_store()
+    with app.app_context():
+        solicitud_id = crear_solicitud()
+        usado = FotosService.guardar(archivo(imagen_png('orange')), solicitud_id).blob_hash
+        db.session.commit()
+        huerfano_viejo = store.guardar_bytes(imagen_png('black')).hash
+        huerfano_nuevo = store.guardar_bytes(imagen_png('white')).hash
+        for blob_hash in (usado, huerfano_viejo):
+            envejecer(blob_hash, 120)
+
+        assert FotosService.barrer_blobs_huerfanos(lote=1) >= 1
+        assert store.existe(usado)
+        assert not store.existe(huerfano_viejo)
+        assert store.existe(huerfano_nuevo)
+        db.session.remove()
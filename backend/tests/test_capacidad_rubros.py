@@ -0,0 +1,85 @@
+# tests/test_capacidad_rubros.py
+"""
+Límite de puestos por rubro: se considera alcanzado cuando las solicitudes
+aprobadas llegan al límite o lo superan (si se bajó después de aprobar), y
+los conteos salen de un solo GROUP BY por request, sin importar cuántas
+filas o rubros se muestren.
+"""
+from datetime import date
+
+import pytest
+
+from models.base import db
+from models.rubro import Rubro
+from models.limite_rubro import LimiteRubro
+from utils.capacidad_rubros import CapacidadRubros
+from utils.catalogos import ESTADO_SOLICITUD_PENDIENTE
+from fabricas import crear_solicitud
+
+
+@pytest.fixture(scope='module')
+def rubro(app):
+    """Rubro propio con límite de 2 puestos, una aprobada y dos pendientes"""
+    with app.app_context():
+        rubro = Rubro(tipo='Capacidad tests', precio_parcela=100, color_id=1, es_activo=True)
+        db.session.add(rubro)
+        db.session.flush()
+        db.session.add(LimiteRubro(rubro_id=rubro.rubro_id, max_puestos=2, fecha_vigencia=date(2026, 1, 1)))
+        crear_solicitud(rubro_id=rubro.rubro_id)
+        pendientes = [crear_solicitud(estado=ESTADO_SOLICITUD_PENDIENTE, rubro_id=rubro.rubro_id) for _ in range(2)]
+        db.session.commit()
+        rubro_id = rubro.rubro_id
+        db.session.remove()
+    return rubro_id, pendientes
+
+
+def aprobar(cliente, auth, solicitud_id):
+    return cliente.patch(
+        f'/api/v1/solicitudes/{solicitud_id}/estado', json={'estado_solicitud': 'Aprobada'}, headers=auth
+    )
+
+
+def cambiar_limite(app, rubro_id, max_puestos):
+    with app.app_context():
+        LimiteRubro.query.filter_by(rubro_id=rubro_id, es_activo=True).update({'max_puestos': max_puestos})
+        db.session.commit()
+        db.session.remove()
+
+
+def test_limite_se_alcanza_al_llegar_y_al_superarlo(app, cliente, auth_administrador, rubro):
+    rubro_id, (segunda, tercera) = rubro
+
+    with app.app_context():
+        assert CapacidadRubros.verificar(rubro_id) == (False, 1, 2)
+
+    # 1 de 2: se puede aprobar la segunda
+    assert aprobar(cliente, auth_administrador, segunda).status_code == 200
+
+    # 2 de 2: alcanzado
+    respuesta = aprobar(cliente, auth_administrador, tercera)
+    assert respuesta.status_code == 400
+    assert respuesta.json['limite_alcanzado'] is True
+    assert (respuesta.json['count_actual'], respuesta.json['limite_maximo']) == (2, 2)
+
+    # Límite bajado por debajo de las aprobadas: sigue alcanzado
+    cambiar_limite(app, rubro_id, 1)
+    try:
+        with app.app_context():
+            assert CapacidadRubros.verificar(rubro_id) == (True, 2, 1)
+        assert aprobar(cliente, auth_administrador, tercera).status_code == 400
+    finally:
+        cambiar_limite(app, rubro_id, 2)
+
+
+def test_rubro_sin_limite_no_se_alcanza(contexto):
+    assert CapacidadRubros.verificar(-1) == (False, 0, 0)
+
+
+@pytest.mark.parametrize('url, limite', [
+    ('/api/v1/solicitudes?limit=50', 7),
+    ('/api/v1/configuraciones/rubros', 5),
+    ('/api/v1/diversidad-rubros', 5),
+])
+def test_capacidad_en_una_consulta_por_request(max_consultas, auth_administrador, rubro, url, limite):
+    respuesta = max_consultas(limite, 'GET', url, headers=auth_administrador)
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
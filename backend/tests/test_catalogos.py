@@ -0,0 +1,118 @@
+# tests/test_catalogos.py
+"""
+Catálogos en memoria: búsqueda por id y nombre, recarga por TTL e
+invalidación, también con lectores concurrentes.
+"""
+import threading
+
+import pytest
+
+import utils.catalogos as catalogos
+from utils.catalogos import (
+    Catalogo, Catalogos, EntradaCatalogo, ESTADO_PAGO_CANCELADO, ESTADOS_PAGO_IDS_HISTORICOS
+)
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(catalogos.time, 'monotonic', reloj)
+    return reloj
+
+
+def catalogo_contado(entradas=None):
+    """Catálogo que cuenta cuántas veces se cargó"""
+    cargas = []
+
+    def cargar():
+        cargas.append(1)
+        return entradas or [EntradaCatalogo(1, 'Uno'), EntradaCatalogo(2, 'Dos', es_activo=False)]
+
+    return Catalogo('Prueba', cargar), cargas
+
+
+def test_busqueda_por_id_y_nombre():
+    catalogo, cargas = catalogo_contado()
+    assert catalogo.nombre_de(1) == 'Uno'
+    assert catalogo.id_de('Dos') == 2
+    assert catalogo.id_de('Tres', 99) == 99
+    assert [e.id for e in catalogo.activos()] == [1]
+    assert catalogo.primero_de(['Tres', 'Dos']).id == 2
+    assert len(cargas) == 1
+
+
+def test_recarga_al_vencer_el_ttl(reloj):
+    catalogo, cargas = catalogo_contado()
+    catalogo.todos()
+    reloj.ahora += catalogos.CATALOGOS_TTL_SEGUNDOS
+    catalogo.todos()
+    assert len(cargas) == 1
+
+    reloj.ahora += 1
+    catalogo.todos()
+    assert len(cargas) == 2
+
+
+def test_invalidar_recarga_en_la_proxima_lectura(reloj):
+    catalogo, cargas = catalogo_contado()
+    catalogo.todos()
+    catalogo.invalidar()
+    assert len(cargas) == 1
+    assert catalogo.nombre_de(1) == 'Uno'
+    assert len(cargas) == 2
+
+
+def test_invalidar_con_lectores_concurrentes():
+    catalogo, _ = catalogo_contado()
+    errores = []
+    detener = threading.Event()
+
+    def leer():
+        while not detener.is_set():
+            try:
+                assert catalogo.nombre_de(1) == 'Uno'
+                assert len(catalogo.todos()) == 2
+            except Exception as e:
+                errores.append(e)
+                return
+
+    lectores = [threading.Thread(target=leer) for _ in range(4)]
+    for lector in lectores:
+        lector.start()
+    for _ in range(2000):
+        catalogo.invalidar()
+    detener.set()
+    for lector in lectores:
+        lector.join()
+
+    assert not errores, errores[0]
+
+
+def test_registro_carga_las_tablas_de_referencia(contexto):
+    nombres = {catalogo.nombre for catalogo in Catalogos.todos()}
+    assert nombres == {'EstadoSolicitud', 'EstadoPago', 'EstadoNotificacion', 'Rol', 'Color', 'Rubro'}
+
+    Catalogos.invalidar()
+    for catalogo in Catalogos.todos():
+        assert catalogo.todos(), catalogo.nombre
+
+    rubro = Catalogos.rubros.todos()[0]
+    assert isinstance(rubro.precio_parcela, float)
+
+
+def test_estado_pago_usa_el_id_historico_si_falta_en_la_tabla(contexto, monkeypatch):
+    monkeypatch.setattr(Catalogos.estados_pago, '_cargar', lambda: [])
+    Catalogos.estados_pago.invalidar()
+    try:
+        assert Catalogos.estado_pago_id(ESTADO_PAGO_CANCELADO) == ESTADOS_PAGO_IDS_HISTORICOS[ESTADO_PAGO_CANCELADO]
+    finally:
+        monkeypatch.undo()
+        Catalogos.estados_pago.invalidar()
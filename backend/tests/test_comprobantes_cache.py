@@ -0,0 +1,126 @@
+# tests/test_comprobantes_cache.py
+"""
+Caché de comprobantes PDF: una generación por versión del pago, ETag y 304
+en la descarga, y borrado de los menos usados al pasar el tamaño máximo.
+"""
+import os
+import types
+from datetime import datetime, timedelta
+
+import pytest
+
+import utils.comprobantes_cache as comprobantes
+from models.base import db
+from models.pago import Pago
+from utils.comprobantes_cache import CacheComprobantes
+from utils.catalogos import Catalogos, ESTADO_PAGO_PAGADO
+from fabricas import crear_artesano, crear_solicitud
+
+PASSWORD = 'art123'
+
+
+@pytest.fixture(scope='module')
+def pago_aprobado(app):
+    """(headers del artesano, pago_id) de un pago aprobado"""
+    with app.app_context():
+        email, artesano_id = crear_artesano(password=PASSWORD)
+        pago = Pago(
+            solicitud_id=crear_solicitud(artesano_id=artesano_id),
+            monto=1000,
+            estado_pago_id=Catalogos.estado_pago_id(ESTADO_PAGO_PAGADO),
+            fecha_pago=datetime.utcnow()
+        )
+        db.session.add(pago)
+        db.session.commit()
+        pago_id = pago.pago_id
+        db.session.remove()
+
+    respuesta = app.test_client().post('/auth/login', json={'email': email, 'password': PASSWORD})
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    return {'Authorization': 'Bearer ' + respuesta.json['access_token']}, pago_id
+
+
+@pytest.fixture
+def renderizados(monkeypatch):
+    """Cuenta las veces que se arma un PDF"""
+    llamadas = []
+    original = CacheComprobantes._renderizar
+
+    def renderizar(pago):
+        llamadas.append(pago.pago_id)
+        return original(pago)
+
+    monkeypatch.setattr(CacheComprobantes, '_renderizar', staticmethod(renderizar))
+    return llamadas
+
+
+def url(pago_id):
+    return f'/api/v1/pago/descargar-comprobante/{pago_id}'
+
+
+def test_etag_y_304_sin_volver_a_generar(cliente, pago_aprobado, renderizados):
+    auth, pago_id = pago_aprobado
+
+    primera = cliente.get(url(pago_id), headers=auth)
+    assert primera.status_code == 200, primera.get_data(as_text=True)
+    assert primera.mimetype == 'application/pdf'
+    assert primera.data.startswith(b'%PDF')
+    assert primera.headers['Cache-Control'] == 'private, no-cache'
+    etag = primera.headers['ETag']
+
+    segunda = cliente.get(url(pago_id), headers={**auth, 'If-None-Match': etag})
+    assert segunda.status_code == 304
+    assert segunda.headers['ETag'] == etag
+
+    # Sin If-None-Match se sirve desde el disco
+    tercera = cliente.get(url(pago_id), headers=auth)
+    assert tercera.status_code == 200
+    assert tercera.data == primera.data
+    assert renderizados == [pago_id]
+
+
+def test_cambio_del_pago_cambia_la_clave(app, cliente, pago_aprobado, renderizados):
+    auth, pago_id = pago_aprobado
+    etag = cliente.get(url(pago_id), headers=auth).headers['ETag']
+
+    with app.app_context():
+        pago = Pago.query.get(pago_id)
+        anterior = CacheComprobantes.ruta(CacheComprobantes.clave(pago))
+        pago.fecha_actualizacion = pago.fecha_actualizacion + timedelta(seconds=1)
+        db.session.commit()
+        nueva = CacheComprobantes.ruta(CacheComprobantes.clave(pago))
+        db.session.remove()
+    assert nueva != anterior
+
+    respuesta = cliente.get(url(pago_id), headers={**auth, 'If-None-Match': etag})
+    assert respuesta.status_code == 200
+    assert respuesta.headers['ETag'] != etag
+    assert renderizados == [pago_id]
+    # La versión anterior se borra al guardar la nueva
+    assert os.path.exists(nueva)
+    assert not os.path.exists(anterior)
+
+
+def test_recortar_borra_los_menos_usados(tmp_path, monkeypatch):
+    monkeypatch.setattr(comprobantes, 'COMPROBANTES_CACHE_PATH', str(tmp_path))
+    version = datetime(2026, 1, 1)
+    pagos = [types.SimpleNamespace(pago_id=i, fecha_actualizacion=version, fecha_creacion=version) for i in (1, 2, 3)]
+
+    # Tres comprobantes de 100 bytes, usados por última vez en orden 1, 2, 3
+    for minutos, pago in enumerate(pagos):
+        ruta = CacheComprobantes.ruta(CacheComprobantes.clave(pago))
+        with open(ruta, 'wb') as archivo:
+            archivo.write(b'%PDF' + b'x' * 96)
+        marca = datetime(2026, 1, 1, 12, minutos).timestamp()
+        os.utime(ruta, (marca, marca))
+
+    # Leer el 1 lo vuelve el más reciente (sin generarlo de nuevo)
+    assert CacheComprobantes.obtener(pagos[0]).startswith(b'%PDF')
+
+    assert CacheComprobantes.recortar(max_bytes=250) == 1
+    quedan = sorted(os.listdir(tmp_path))
+    assert quedan == sorted(
+        os.path.basename(CacheComprobantes.ruta(CacheComprobantes.clave(p))) for p in (pagos[0], pagos[2])
+    )
+
+    assert CacheComprobantes.recortar(max_bytes=250) == 0
@@ -0,0 +1,77 @@
+# tests/test_consultas_por_endpoint.py
+"""
+Presupuesto de sentencias SQL de los endpoints calientes (fixture
+max_consultas). Los límites son los valores actuales: si un cambio los
+supera, o agrega un N+1, el test lo marca.
+"""
+import pytest
+
+from models.base import db
+from models.usuario import Usuario
+from models.artesano import Artesano
+from models.notificacion import Notificacion
+from utils.mapa_service import MapaCache
+
+
+@pytest.fixture(scope='module')
+def mapa_configurado(app, auth_organizador):
+    respuesta = app.test_client().post(
+        '/api/mapa/configurar', json={'filas': 10, 'columnas': 10}, headers=auth_organizador
+    )
+    assert respuesta.status_code in (200, 201), respuesta.get_data(as_text=True)
+
+
+@pytest.fixture(scope='module')
+def auth_artesano(app):
+    """Artesano con algunas notificaciones"""
+    with app.app_context():
+        usuario = Usuario(email='notificaciones@tests.com', estado_id=1, rol_id=1)
+        usuario.set_password('art123')
+        db.session.add(usuario)
+        db.session.flush()
+        artesano = Artesano(usuario_id=usuario.usuario_id, nombre='Art notif', dni='99000001', telefono='1')
+        db.session.add(artesano)
+        db.session.flush()
+        for i in range(10):
+            db.session.add(Notificacion(
+                artesano_id=artesano.artesano_id, mensaje=f'Aviso {i}', estado_notificacion_id=1, leido=False
+            ))
+        db.session.commit()
+        db.session.remove()
+
+    respuesta = app.test_client().post('/auth/login', json={
+        'email': 'notificaciones@tests.com', 'password': 'art123'
+    })
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    return {'Authorization': 'Bearer ' + respuesta.json['access_token']}
+
+
+@pytest.mark.parametrize('url', ['/api/v1/mapa/parcelas', '/api/v1/mapa/cambios'])
+def test_mapa_en_frio(mapa_configurado, max_consultas, auth_organizador, url):
+    MapaCache.invalidar()
+    respuesta = max_consultas(5, 'GET', url, headers=auth_organizador)
+    assert respuesta.status_code == 200
+
+
+def test_mapa_cacheado_no_consulta(mapa_configurado, max_consultas, auth_organizador):
+    max_consultas(5, 'GET', '/api/v1/mapa/parcelas', headers=auth_organizador)
+    respuesta = max_consultas(0, 'GET', '/api/v1/mapa/parcelas', headers=auth_organizador)
+    assert respuesta.status_code == 200
+
+
+def test_mapa_admin(mapa_configurado, max_consultas, auth_administrador):
+    MapaCache.invalidar()
+    respuesta = max_consultas(7, 'GET', '/api/v1/admin/parcelas', headers=auth_administrador)
+    assert respuesta.status_code == 200
+
+
+@pytest.mark.parametrize('rol_id', [1, 2, 3])
+def test_usuarios_por_rol(max_consultas, auth_organizador, auth_administrador, rol_id):
+    respuesta = max_consultas(3, 'GET', f'/api/usuarios/buscar/rol?rol_id={rol_id}', headers=auth_organizador)
+    assert respuesta.status_code == 200
+
+
+def test_notificaciones_de_artesano(max_consultas, auth_artesano):
+    respuesta = max_consultas(5, 'GET', '/api/v1/artesano/notificaciones', headers=auth_artesano)
+    assert respuesta.status_code == 200
+    assert respuesta.json['total'] == 10
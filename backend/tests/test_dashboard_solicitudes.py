@@ -0,0 +1,76 @@
+# tests/test_dashboard_solicitudes.py
+"""
+Paginación keyset del dashboard de solicitudes: recorrer las páginas da
+las mismas filas, en el mismo orden, que la lista completa, incluidas las
+solicitudes con la misma fecha y las que no tienen fecha.
+"""
+from datetime import datetime
+
+import pytest
+
+from models.base import db
+from models.solicitud import Solicitud
+from fabricas import crear_solicitud
+from utils.catalogos import ESTADO_SOLICITUD_PENDIENTE
+
+URL = '/api/v1/solicitudes'
+
+
+@pytest.fixture(scope='module')
+def solicitudes(app):
+    with app.app_context():
+        misma_fecha = datetime(2026, 2, 1, 10, 0, 0)
+        ids = [crear_solicitud(estado=ESTADO_SOLICITUD_PENDIENTE, fecha=misma_fecha) for _ in range(3)]
+        ids += [crear_solicitud(estado=ESTADO_SOLICITUD_PENDIENTE, fecha=datetime(2026, 1, d)) for d in (5, 6)]
+        sin_fecha = [crear_solicitud(estado=ESTADO_SOLICITUD_PENDIENTE) for _ in range(2)]
+        Solicitud.query.filter(Solicitud.solicitud_id.in_(sin_fecha)).update(
+            {'fecha_solicitud': None}, synchronize_session=False
+        )
+        db.session.commit()
+        db.session.remove()
+    return ids + sin_fecha
+
+
+def test_primera_pagina(cliente, auth_administrador, solicitudes):
+    completa = cliente.get(URL, headers=auth_administrador).json
+    respuesta = cliente.get(f'{URL}?limit=3', headers=auth_administrador)
+
+    assert respuesta.status_code == 200
+    assert [s['id'] for s in respuesta.json['solicitudes']] == [s['id'] for s in completa[:3]]
+    assert respuesta.json['total'] == len(completa)
+    assert respuesta.json['siguiente_cursor']
+
+
+def test_paginas_sin_duplicados_ni_faltantes(cliente, auth_administrador, solicitudes):
+    completa = [s['id'] for s in cliente.get(URL, headers=auth_administrador).json]
+    assert set(solicitudes) <= set(completa)
+
+    recorridas = []
+    cursor = None
+    while True:
+        url = f'{URL}?limit=3' + (f'&cursor={cursor}' if cursor else '')
+        respuesta = cliente.get(url, headers=auth_administrador)
+        assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+        recorridas += [s['id'] for s in respuesta.json['solicitudes']]
+        cursor = respuesta.json['siguiente_cursor']
+        if not cursor:
+            break
+
+    assert recorridas == completa
+    # Las solicitudes sin fecha quedan al final
+    assert recorridas[-2:] == sorted(solicitudes[-2:], reverse=True)
+
+
+def test_pagina_siguiente_desde_una_solicitud_sin_fecha(cliente, auth_administrador, solicitudes):
+    completa = [s['id'] for s in cliente.get(URL, headers=auth_administrador).json]
+    primera = cliente.get(f'{URL}?limit={len(completa) - 1}', headers=auth_administrador).json
+    assert primera['solicitudes'][-1]['fechaSolicitud'] is None
+
+    segunda = cliente.get(f"{URL}?limit=3&cursor={primera['siguiente_cursor']}", headers=auth_administrador).json
+    assert [s['id'] for s in segunda['solicitudes']] == completa[-1:]
+    assert segunda['siguiente_cursor'] is None
+
+
+def test_cursor_invalido(cliente, auth_administrador):
+    respuesta = cliente.get(f'{URL}?limit=3&cursor=no-es-un-cursor', headers=auth_administrador)
+    assert respuesta.status_code == 400
@@ -0,0 +1,270 @@
+# tests/test_fotos.py
+"""
+Subida de fotos: el formato se detecta por los primeros bytes y no por el
+nombre, y los límites de tamaño cortan el request con 413 tanto con
+Content-Length declarado (antes de leer el body) como sin él (mientras se
+lee) y por archivo. Al servirlas, ninguna respuesta lleva el EXIF del
+archivo subido, y las variantes WEBP se generan en segundo plano: mientras
+tanto se envía el original sin metadatos y sin caché.
+"""
+import io
+import os
+import time
+
+import pytest
+from PIL import Image, PngImagePlugin
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
+
+import utils.fotos_service as fotos_service
+from utils.fotos_metadatos import leer_sin_metadatos
+from utils.blob_store import obtener_blob_store
+from utils.fotos_variantes import VariantesFotos, VARIANTES
+from utils.hilos_nativos import HilosNativos
+from models.base import db
+from models.solicitud_foto import SolicitudFoto
+from utils.fotos_service import detectar_extension
+from fabricas import crear_artesano, crear_solicitud
+
+
+SECRETO = 'GPS -34.6037 -58.3816'
+
+
+def imagen(formato='PNG', tamano=(8, 8)):
+    """Ruido: no se comprime, el archivo pesa ~3 bytes por píxel"""
+    salida = io.BytesIO()
+    Image.frombytes('RGB', tamano, os.urandom(tamano[0] * tamano[1] * 3)).save(salida, formato)
+    return salida.getvalue()
+
+
+def imagen_con_metadatos(formato, tamano=(64, 48), orientacion=None):
+    """Foto con EXIF (y tEXt en PNG) que contiene SECRETO"""
+    exif = Image.Exif()
+    exif[0x010F] = 'Camara de prueba'
+    exif[0x010E] = SECRETO
+    if orientacion:
+        exif[0x0112] = orientacion
+    salida = io.BytesIO()
+    opciones = {'exif': exif.tobytes()}
+    if formato == 'PNG':
+        info = PngImagePlugin.PngInfo()
+        info.add_text('Comment', SECRETO)
+        opciones['pnginfo'] = info
+    else:
+        opciones['comment'] = SECRETO.encode()
+    Image.new('RGB', tamano, 'olive').save(salida, formato, **opciones)
+    return salida.getvalue()
+
+
+@pytest.fixture
+def artesano(app, cliente):
+    """(headers, solicitud_id) de un artesano logueado con una solicitud propia"""
+    with app.app_context():
+        email, artesano_id = crear_artesano('clave123')
+        solicitud_id = crear_solicitud(artesano_id=artesano_id)
+        db.session.commit()
+        db.session.remove()
+    respuesta = cliente.post('/auth/login', json={'email': email, 'password': 'clave123'})
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    return {'Authorization': 'Bearer ' + respuesta.json['access_token']}, solicitud_id
+
+
+def fotos_de(app, solicitud_id):
+    with app.app_context():
+        cantidad = SolicitudFoto.query.filter_by(solicitud_id=solicitud_id).count()
+        db.session.remove()
+    return cantidad
+
+
+@pytest.mark.parametrize('cabecera, esperada', [
+    (b'\xff\xd8\xff\xe0\x00\x10JFIF', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n\x00\x00', 'png'),
+    (b'GIF89a', None),
+    (b'<svg xmlns="http://www.w3.org/2000/svg">', None),
+    (b'%PDF-1.7', None),
+    (b'\x89PNG', None),
+    (b'', None),
+])
+def test_detectar_extension_por_firma(cabecera, esperada):
+    assert detectar_extension(cabecera) == esperada
+
+
+def test_nombre_de_imagen_con_contenido_de_otra_cosa(app, cliente, artesano):
+    headers, solicitud_id = artesano
+    respuesta = cliente.post(
+        f'/solicitudes/{solicitud_id}/fotos', headers=headers,
+        data={'fotos': [(io.BytesIO(b'<?php echo 1; ?>'), 'foto.jpg')]},
+        content_type='multipart/form-data'
+    )
+    assert respuesta.status_code == 400
+    assert 'no es una imagen' in respuesta.json['msg']
+    assert fotos_de(app, solicitud_id) == 0
+
+
+def test_formato_sale_del_contenido(app, cliente, artesano):
+    headers, solicitud_id = artesano
+    respuesta = cliente.post(
+        f'/solicitudes/{solicitud_id}/fotos', headers=headers,
+        data={'fotos': [(io.BytesIO(imagen('JPEG')), 'foto.png')]},
+        content_type='multipart/form-data'
+    )
+    assert respuesta.status_code == 201, respuesta.get_data(as_text=True)
+    assert respuesta.json['fotos_agregadas'][0]['extension'] == 'jpg'
+
+
+def test_content_length_excedido_se_rechaza_sin_leer_el_body(app, cliente, artesano, monkeypatch):
+    _, solicitud_id = artesano
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024)
+
+    class SinLectura(io.BytesIO):
+        def read(self, *args):
+            raise AssertionError('se leyó el body')
+
+        readline = readinto = read
+
+    # Sin token: el before_request responde antes que la autenticación
+    respuesta = cliente.post(
+        f'/solicitudes/{solicitud_id}/fotos', headers={'Content-Type': 'multipart/form-data; boundary=x'},
+        input_stream=SinLectura(), environ_overrides={'CONTENT_LENGTH': '4096'}
+    )
+    assert respuesta.status_code == 413
+    assert respuesta.json['msg'] == 'La solicitud supera el tamaño máximo permitido'
+    assert fotos_de(app, solicitud_id) == 0
+
+
+def test_body_sin_content_length_se_corta_al_pasar_el_limite(app, cliente, artesano, monkeypatch):
+    headers, solicitud_id = artesano
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 4096)
+    boundary, datos = encode_multipart({
+        'fotos': FileStorage(io.BytesIO(imagen(tamano=(256, 256))), filename='grande.png', content_type='image/png')
+    })
+    assert len(datos) > 4096
+
+    # Como un upload chunked: el servidor termina el stream y no hay Content-Length
+    respuesta = cliente.post(
+        f'/solicitudes/{solicitud_id}/fotos',
+        headers={**headers, 'Content-Type': f'multipart/form-data; boundary={boundary}'},
+        input_stream=io.BytesIO(datos), environ_overrides={'wsgi.input_terminated': True}
+    )
+    assert respuesta.status_code == 413, respuesta.get_data(as_text=True)
+    assert fotos_de(app, solicitud_id) == 0
+
+
+def test_archivo_que_supera_el_maximo_por_foto(app, cliente, artesano, monkeypatch):
+    headers, solicitud_id = artesano
+    monkeypatch.setattr(fotos_service, 'FOTOS_MAX_BYTES', 1024)
+    respuesta = cliente.post(
+        f'/solicitudes/{solicitud_id}/fotos', headers=headers,
+        data={'fotos': [(io.BytesIO(imagen()), 'chica.png'), (io.BytesIO(imagen(tamano=(256, 256))), 'grande.png')]},
+        content_type='multipart/form-data'
+    )
+    assert respuesta.status_code == 413
+    assert 'grande.png' in respuesta.json['msg']
+    assert fotos_de(app, solicitud_id) == 0
+
+
+@pytest.mark.parametrize('formato, extension', [('JPEG', 'jpg'), ('PNG', 'png')])
+def test_leer_sin_metadatos(formato, extension):
+    original = imagen_con_metadatos(formato)
+    # Lo que venga después del final de la imagen también se descarta
+    if formato == 'JPEG':
+        original += b'agregado ' + SECRETO.encode()
+    assert SECRETO.encode() in original
+
+    limpia = b''.join(leer_sin_metadatos(io.BytesIO(original), extension))
+
+    assert SECRETO.encode() not in limpia
+    with Image.open(io.BytesIO(limpia)) as resultado:
+        assert resultado.size == (64, 48)
+        assert not resultado.getexif()
+        resultado.load()
+
+
+def subir(cliente, headers, solicitud_id, datos, nombre):
+    respuesta = cliente.post(
+        f'/solicitudes/{solicitud_id}/fotos', headers=headers,
+        data={'fotos': [(io.BytesIO(datos), nombre)]},
+        content_type='multipart/form-data'
+    )
+    assert respuesta.status_code == 201, respuesta.get_data(as_text=True)
+    return respuesta.json['fotos_agregadas'][0]['foto_id']
+
+
+def test_sin_variante_se_envia_el_original_sin_exif(cliente, artesano):
+    headers, solicitud_id = artesano
+    foto_id = subir(cliente, headers, solicitud_id, imagen_con_metadatos('JPEG'), 'gps.jpg')
+
+    # La subida encoló las variantes: se espera a que esté 'original'
+    limite = time.monotonic() + 10
+    while True:
+        respuesta = cliente.get(f'/solicitudes/fotos/{foto_id}/archivo', headers=headers)
+        assert respuesta.status_code == 200
+        if respuesta.mimetype == 'image/webp' or time.monotonic() > limite:
+            break
+        time.sleep(0.05)
+
+    assert respuesta.mimetype == 'image/webp'
+    assert SECRETO.encode() not in respuesta.data
+    with Image.open(io.BytesIO(respuesta.data)) as resultado:
+        assert not resultado.getexif()
+
+
+@pytest.mark.parametrize('formato, nombre', [('JPEG', 'gps.jpg'), ('PNG', 'gps.png')])
+def test_sin_variante_disponible_se_envia_sin_metadatos(cliente, artesano, monkeypatch, formato, nombre):
+    headers, solicitud_id = artesano
+    foto_id = subir(cliente, headers, solicitud_id, imagen_con_metadatos(formato), nombre)
+    monkeypatch.setattr(VariantesFotos, 'obtener', classmethod(lambda cls, blob_hash, variante: None))
+
+    respuesta = cliente.get(f'/solicitudes/fotos/{foto_id}/archivo?variante=media', headers=headers)
+
+    assert respuesta.status_code == 200
+    assert respuesta.mimetype == f'image/{formato.lower()}'
+    assert SECRETO.encode() not in respuesta.data
+    with Image.open(io.BytesIO(respuesta.data)) as resultado:
+        assert not resultado.getexif()
+
+    etag = respuesta.headers['ETag']
+    respuesta = cliente.get(
+        f'/solicitudes/fotos/{foto_id}/archivo?variante=media', headers={**headers, 'If-None-Match': etag}
+    )
+    assert respuesta.status_code == 304
+
+
+def test_variantes_tamanos_y_formato():
+    # Cámara girada: EXIF orientación 6 (la imagen se ve de 1500x2000)
+    blob = obtener_blob_store().guardar_bytes(imagen_con_metadatos('JPEG', (2000, 1500), orientacion=6))
+
+    VariantesFotos.generar(blob.hash)
+
+    esperados = {'miniatura': (240, 320), 'media': (768, 1024), 'original': (1500, 2000)}
+    assert set(esperados) == set(VARIANTES)
+    for variante, tamano in esperados.items():
+        with Image.open(VariantesFotos.ruta(blob.hash, variante)) as resultado:
+            assert resultado.format == 'WEBP'
+            assert resultado.size == tamano
+            assert not resultado.getexif()
+
+
+def test_la_variante_se_genera_fuera_del_request(app, cliente, artesano, monkeypatch):
+    headers, solicitud_id = artesano
+    encoladas = []
+    monkeypatch.setattr(HilosNativos, 'enviar', classmethod(lambda cls, funcion, *args: encoladas.append((funcion, args))))
+    foto_id = subir(cliente, headers, solicitud_id, imagen_con_metadatos('PNG', (2000, 1500)), 'grande.png')
+    url = f'/solicitudes/fotos/{foto_id}/archivo?variante=miniatura'
+
+    # Pendiente: el original sin metadatos y sin caché, sin esperar a Pillow
+    respuesta = cliente.get(url, headers=headers)
+    assert respuesta.status_code == 200
+    assert respuesta.mimetype == 'image/png'
+    assert respuesta.cache_control.no_cache
+    assert SECRETO.encode() not in respuesta.data
+    assert len(encoladas) == 1
+
+    funcion, args = encoladas.pop()
+    funcion(*args)
+
+    respuesta = cliente.get(url, headers=headers)
+    assert respuesta.mimetype == 'image/webp'
+    assert respuesta.cache_control.immutable
+    with Image.open(io.BytesIO(respuesta.data)) as resultado:
+        assert resultado.size == (320, 240)
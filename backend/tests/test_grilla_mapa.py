@@ -0,0 +1,89 @@
+# tests/test_grilla_mapa.py
+"""
+Reducción del mapa: las parcelas ocupadas en la temporada actual la
+impiden, y también las que tienen asignaciones de temporadas anteriores o
+liberadas, que no se borran.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert
+
+from models.base import db
+from models.mapa import Mapa
+from models.parcela import Parcela
+from models.solicitud_parcela import SolicitudParcela
+from utils.grilla_mapa import GrillaMapa, ParcelasOcupadasError, ParcelasConHistorialError
+from utils.reserva_parcelas import ReservaParcelas
+from utils.ocupacion_parcelas import OcupacionParcelas
+from fabricas import crear_solicitud
+
+
+def crear_mapa(filas, columnas):
+    mapa = Mapa(cant_total_filas=0, cant_total_columnas=0)
+    db.session.add(mapa)
+    db.session.flush()
+    GrillaMapa.reconfigurar(mapa, filas, columnas)
+    db.session.flush()
+    return mapa
+
+
+def asignar(solicitud_id, parcela_id, temporada):
+    db.session.execute(insert(SolicitudParcela), [{
+        'solicitud_id': solicitud_id, 'parcela_id': parcela_id, 'temporada': temporada
+    }])
+
+
+def parcela_en(mapa, fila, columna):
+    return Parcela.query.filter_by(mapa_id=mapa.mapa_id, fila=fila, columna=columna).one().parcela_id
+
+
+def test_reducir_sin_asignaciones(contexto):
+    mapa = crear_mapa(3, 3)
+    db.session.commit()
+
+    resultado = GrillaMapa.reconfigurar(mapa, 2, 2)
+    db.session.commit()
+
+    assert resultado == {'creadas': 0, 'eliminadas': 5}
+    assert Parcela.query.filter_by(mapa_id=mapa.mapa_id).count() == 4
+
+
+def test_reducir_con_asignacion_de_temporada_anterior(contexto):
+    mapa = crear_mapa(3, 3)
+    anterior = OcupacionParcelas.temporada_actual() - 1
+    parcela_id = parcela_en(mapa, 3, 3)
+    asignar(crear_solicitud(fecha=datetime(anterior, 6, 1)), parcela_id, anterior)
+    db.session.commit()
+
+    with pytest.raises(ParcelasConHistorialError) as error:
+        GrillaMapa.reconfigurar(mapa, 2, 2)
+    db.session.rollback()
+
+    assert [p['parcela_id'] for p in error.value.parcelas] == [parcela_id]
+    assert SolicitudParcela.query.filter_by(parcela_id=parcela_id).count() == 1
+    assert Parcela.query.filter_by(mapa_id=mapa.mapa_id).count() == 9
+
+
+def test_reducir_con_asignacion_liberada(contexto):
+    mapa = crear_mapa(3, 3)
+    parcela_id = parcela_en(mapa, 3, 1)
+    solicitud_id = crear_solicitud()
+    asignar(solicitud_id, parcela_id, OcupacionParcelas.temporada_actual())
+    ReservaParcelas.liberar_solicitud(solicitud_id)
+    db.session.commit()
+
+    with pytest.raises(ParcelasConHistorialError) as error:
+        GrillaMapa.reconfigurar(mapa, 2, 2)
+    assert [p['parcela_id'] for p in error.value.parcelas] == [parcela_id]
+
+
+def test_reducir_con_parcela_ocupada_en_la_temporada(contexto):
+    mapa = crear_mapa(3, 3)
+    parcela_id = parcela_en(mapa, 1, 3)
+    asignar(crear_solicitud(), parcela_id, OcupacionParcelas.temporada_actual())
+    db.session.commit()
+
+    with pytest.raises(ParcelasOcupadasError) as error:
+        GrillaMapa.reconfigurar(mapa, 2, 2)
+    assert [p['parcela_id'] for p in error.value.ocupadas] == [parcela_id]
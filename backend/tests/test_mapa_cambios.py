@@ -0,0 +1,31 @@
+# tests/test_mapa_cambios.py
+"""GET /mapa/cambios: solo responde en forma incremental a la misma época"""
+import pytest
+
+from models.base import db
+from fabricas import crear_parcela
+
+
+@pytest.fixture
+def version_y_epoca(app, cliente, auth_organizador):
+    with app.app_context():
+        crear_parcela()
+        db.session.commit()
+    respuesta = cliente.get('/api/v1/mapa/parcelas', headers=auth_organizador)
+    assert respuesta.status_code == 200
+    return respuesta.json['version'], respuesta.json['epoca']
+
+
+def test_misma_epoca_recibe_solo_cambios(cliente, auth_organizador, version_y_epoca):
+    version, epoca = version_y_epoca
+    respuesta = cliente.get(f'/api/v1/mapa/cambios?desde={version}&epoca={epoca}', headers=auth_organizador)
+    assert respuesta.json['completo'] is False
+
+
+@pytest.mark.parametrize('epoca', [None, 'otra-epoca'])
+def test_sin_epoca_o_con_otra_recibe_el_mapa_completo(cliente, auth_organizador, version_y_epoca, epoca):
+    version, _ = version_y_epoca
+    url = f'/api/v1/mapa/cambios?desde={version}' + (f'&epoca={epoca}' if epoca else '')
+    respuesta = cliente.get(url, headers=auth_organizador)
+    assert respuesta.json['completo'] is True
+    assert 'parcelas' in respuesta.json
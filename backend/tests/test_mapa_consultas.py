@@ -0,0 +1,62 @@
+# tests/test_mapa_consultas.py
+"""
+El armado del mapa (público y de administración) hace la misma cantidad
+de consultas sin importar el tamaño de la grilla ni cuántas parcelas
+estén ocupadas.
+"""
+from sqlalchemy import insert
+
+from models.base import db
+from models.mapa import Mapa
+from models.parcela import Parcela
+from models.solicitud_parcela import SolicitudParcela
+from utils.mapa_service import MapaCache
+from utils.ocupacion_parcelas import OcupacionParcelas
+from fabricas import crear_solicitud
+
+# Crecientes: achicar el mapa con parcelas ocupadas no se permite
+TAMANIOS = (5, 20, 50)
+
+ENDPOINTS = ('/api/v1/mapa/parcelas', '/api/v1/admin/parcelas')
+
+
+def ocupar_diagonal(app, lado):
+    """Una solicitud por parcela de la diagonal: la ocupación crece con la grilla"""
+    with app.app_context():
+        mapa = Mapa.query.first()
+        temporada = OcupacionParcelas.temporada_actual()
+        libres = Parcela.query.filter(
+            Parcela.mapa_id == mapa.mapa_id,
+            Parcela.fila == Parcela.columna,
+            Parcela.fila <= lado,
+            ~Parcela.parcela_id.in_(OcupacionParcelas.consulta(SolicitudParcela.parcela_id, temporada=temporada))
+        ).all()
+        for parcela in libres:
+            db.session.execute(insert(SolicitudParcela), [{
+                'solicitud_id': crear_solicitud(), 'parcela_id': parcela.parcela_id, 'temporada': temporada
+            }])
+        db.session.commit()
+        db.session.remove()
+
+
+def test_consultas_del_mapa_no_dependen_del_tamanio(app, cliente, auth_organizador, auth_administrador):
+    consultas = {endpoint: [] for endpoint in ENDPOINTS}
+
+    for lado in TAMANIOS:
+        respuesta = cliente.post('/api/mapa/configurar', json={'filas': lado, 'columnas': lado}, headers=auth_organizador)
+        assert respuesta.status_code in (200, 201), respuesta.get_data(as_text=True)
+        ocupar_diagonal(app, lado)
+
+        for endpoint in ENDPOINTS:
+            # La primera vuelta carga los catálogos en memoria; se mide la segunda
+            MapaCache.invalidar()
+            cliente.get(endpoint, headers=auth_administrador)
+            MapaCache.invalidar()
+            respuesta = cliente.get(endpoint, headers=auth_administrador)
+            assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+            assert len(respuesta.json['parcelas']) == lado * lado
+            assert respuesta.headers['X-DB-N1'] == '0'
+            consultas[endpoint].append(int(respuesta.headers['X-DB-Queries']))
+
+    for endpoint, por_tamanio in consultas.items():
+        assert len(set(por_tamanio)) == 1, f"{endpoint}: {dict(zip(TAMANIOS, por_tamanio))} consultas por tamaño"
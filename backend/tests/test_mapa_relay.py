@@ -0,0 +1,54 @@
+# tests/test_mapa_relay.py
+"""Cambios del mapa entre workers: Mapa_Evento y MapaRelay"""
+import json
+
+import pytest
+
+from models.base import db
+from models.mapa_evento import MapaEvento
+from utils.mapa_service import MapaService, MapaCache, CAMBIO_OCUPADA
+from utils.mapa_relay import MapaRelay
+from fabricas import crear_parcela
+
+
+@pytest.fixture
+def relay(contexto):
+    MapaRelay._ultimo = None
+    MapaRelay._aplicados.clear()
+    MapaRelay.aplicar_pendientes()
+    return MapaRelay
+
+
+def test_aplica_los_cambios_de_otro_worker(relay):
+    parcela_id = crear_parcela()
+    db.session.add(MapaEvento(origen='otro-worker', tipo=CAMBIO_OCUPADA, parcela_ids=json.dumps([parcela_id])))
+    db.session.commit()
+    desde = MapaCache.version_actual()
+
+    assert relay.aplicar_pendientes() == 1
+    version, cambios = MapaCache.cambios_desde(desde)
+    assert version == desde + 1
+    assert cambios == {parcela_id: CAMBIO_OCUPADA}
+
+    # Un evento ya aplicado no se vuelve a aplicar
+    assert relay.aplicar_pendientes() == 0
+
+
+def test_saltea_los_cambios_propios(relay):
+    parcela_id = crear_parcela()
+    db.session.commit()
+    version = MapaService.registrar_cambios([parcela_id], CAMBIO_OCUPADA)
+
+    assert MapaEvento.query.filter_by(origen=MapaCache.epoca).count() >= 1
+    assert relay.aplicar_pendientes() == 0
+    assert MapaCache.version_actual() == version
+
+
+def test_cambio_estructural_de_otro_worker(relay):
+    db.session.add(MapaEvento(origen='otro-worker', tipo='datos', parcela_ids=None))
+    db.session.commit()
+    desde = MapaCache.version_actual()
+
+    assert relay.aplicar_pendientes() == 1
+    # El log se vació: los clientes atrasados reciben el mapa completo
+    assert MapaCache.cambios_desde(desde)[1] is None
@@ -0,0 +1,41 @@
+# tests/test_mapa_snapshot.py
+"""ETag de GET /mapa/parcelas: depende del contenido, no de la versión ni la época"""
+from models.base import db
+from utils.mapa_service import MapaCache
+from fabricas import crear_parcela
+
+
+def test_etag_sobrevive_a_una_invalidacion_sin_cambios(app, cliente, auth_organizador):
+    with app.app_context():
+        crear_parcela()
+        db.session.commit()
+    # Las fábricas escriben sin pasar por registrar_cambios
+    MapaCache.invalidar()
+
+    primera = cliente.get('/api/v1/mapa/parcelas', headers=auth_organizador)
+    assert primera.status_code == 200
+    etag = primera.headers['ETag']
+
+    # Otra versión (o el snapshot de otro worker) con el mismo contenido
+    MapaCache.invalidar()
+    MapaCache.epoca, epoca_original = 'otro-worker', MapaCache.epoca
+    try:
+        segunda = cliente.get('/api/v1/mapa/parcelas', headers={**auth_organizador, 'If-None-Match': etag})
+    finally:
+        MapaCache.epoca = epoca_original
+    assert segunda.status_code == 304
+    assert segunda.headers['ETag'] == etag
+
+
+def test_etag_cambia_con_el_contenido(app, cliente, auth_organizador):
+    etag = cliente.get('/api/v1/mapa/parcelas', headers=auth_organizador).headers['ETag']
+
+    with app.app_context():
+        crear_parcela()
+        db.session.commit()
+    MapaCache.invalidar()
+
+    respuesta = cliente.get('/api/v1/mapa/parcelas', headers={**auth_organizador, 'If-None-Match': etag})
+    assert respuesta.status_code == 200
+    assert respuesta.headers['ETag'] != etag
+    assert respuesta.json['version'] == MapaCache.version_actual()
@@ -0,0 +1,165 @@
+# tests/test_mercadopago_cliente.py
+"""
+Política de llamadas a MercadoPago sobre el cliente local: circuit breaker
+(cerrado → abierto → semiabierto → cerrado), reintentos con la misma clave
+de idempotencia y la separación entre rechazos (4xx) y fallas (5xx, 429).
+"""
+import pytest
+
+import utils.mercadopago_cliente as mp
+from utils.mercadopago_cliente import (
+    ClienteMercadoPagoLocal, ClienteMercadoPagoSDK, CircuitoMercadoPago,
+    ErrorMercadoPago, RechazoMercadoPago, CircuitoAbiertoError,
+    CIRCUITO_CERRADO, CIRCUITO_ABIERTO, CIRCUITO_SEMIABIERTO, MP_REINTENTOS
+)
+
+
+class ClienteGuionado(ClienteMercadoPagoLocal):
+    """
+    Cliente local que falla según un guion (cada elemento es None o la
+    excepción a lanzar antes de responder) y que puede perder las primeras
+    respuestas de crear_preferencia después de haberla creado.
+    """
+
+    def __init__(self, guion=(), respuestas_perdidas=0, **kwargs):
+        super().__init__(**kwargs)
+        self.guion = list(guion)
+        self.respuestas_perdidas = respuestas_perdidas
+        self.claves = []
+
+    def _simular_red(self):
+        if self.guion:
+            error = self.guion.pop(0)
+            if error:
+                raise error
+
+    def _crear_preferencia(self, datos, clave_idempotencia):
+        self.claves.append(clave_idempotencia)
+        preferencia = super()._crear_preferencia(datos, clave_idempotencia)
+        if self.respuestas_perdidas:
+            self.respuestas_perdidas -= 1
+            raise ErrorMercadoPago('timeout de lectura')
+        return preferencia
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture(autouse=True)
+def sin_esperas(monkeypatch):
+    monkeypatch.setattr(mp.time, 'sleep', lambda segundos: None)
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(mp.time, 'monotonic', reloj)
+    return reloj
+
+
+def test_respuesta_perdida_no_duplica_la_preferencia():
+    # El POST llega a MP y crea la preferencia, pero la respuesta se pierde
+    cliente = ClienteGuionado(respuestas_perdidas=1)
+
+    preferencia = cliente.crear_preferencia({'items': [], 'external_reference': 'pago-1'})
+
+    assert len(cliente.claves) == 2
+    assert cliente.claves[0] == cliente.claves[1]
+    assert len(cliente._preferencias) == 1
+    assert preferencia['external_reference'] == 'pago-1'
+    assert cliente.metricas.metricas()['crear_preferencia']['resultados'] == {'reintento': 1, 'ok': 1}
+
+
+def test_misma_clave_en_cada_reintento():
+    cliente = ClienteGuionado([ErrorMercadoPago('502')] * MP_REINTENTOS)
+    cliente.crear_preferencia({'items': []})
+    assert len(cliente.claves) == 1 + MP_REINTENTOS
+    assert len(set(cliente.claves)) == 1
+
+
+def test_falla_persistente_agota_los_reintentos():
+    cliente = ClienteGuionado([ErrorMercadoPago('503')] * (MP_REINTENTOS + 1))
+    with pytest.raises(ErrorMercadoPago):
+        cliente.obtener_pago('1')
+    resultados = cliente.metricas.metricas()['obtener_pago']['resultados']
+    assert resultados == {'reintento': MP_REINTENTOS, 'error': 1}
+
+
+def test_rechazo_no_se_reintenta_ni_abre_el_circuito():
+    circuito = CircuitoMercadoPago(fallos_umbral=1)
+    cliente = ClienteGuionado([RechazoMercadoPago('400'), None], circuito=circuito)
+    with pytest.raises(RechazoMercadoPago):
+        cliente.obtener_pago('1')
+    assert circuito.estado()['estado'] == CIRCUITO_CERRADO
+    assert cliente.guion == [None]
+
+
+@pytest.mark.parametrize('status, error', [
+    (400, RechazoMercadoPago),
+    (401, RechazoMercadoPago),
+    (422, RechazoMercadoPago),
+    (429, ErrorMercadoPago),
+    (500, ErrorMercadoPago),
+    (503, ErrorMercadoPago),
+])
+def test_4xx_es_rechazo_y_5xx_o_429_es_falla(status, error):
+    with pytest.raises(error) as excepcion:
+        ClienteMercadoPagoSDK._validar({'status': status, 'response': {}}, 'prueba')
+    if error is ErrorMercadoPago:
+        assert not isinstance(excepcion.value, RechazoMercadoPago)
+
+
+def test_respuesta_valida_y_respuesta_vacia():
+    assert ClienteMercadoPagoSDK._validar({'status': 200, 'response': {'id': 1}}, 'prueba') == {'id': 1}
+    with pytest.raises(ErrorMercadoPago):
+        ClienteMercadoPagoSDK._validar({'status': 200, 'response': None}, 'prueba')
+
+
+def test_circuito_cerrado_abierto_semiabierto_cerrado(reloj):
+    circuito = CircuitoMercadoPago(fallos_umbral=3, espera_segundos=30)
+    cliente = ClienteGuionado([ErrorMercadoPago('caído')] * 3, circuito=circuito)
+    cliente.registrar_pago('7', 'approved', 'pref-7')
+
+    # 1 + MP_REINTENTOS intentos fallidos seguidos abren el circuito
+    with pytest.raises(ErrorMercadoPago):
+        cliente.obtener_pago('7')
+    assert circuito.estado()['estado'] == CIRCUITO_ABIERTO
+    assert circuito.estado()['aperturas'] == 1
+
+    # Abierto: rechaza sin llamar
+    with pytest.raises(CircuitoAbiertoError):
+        cliente.obtener_pago('7')
+    assert cliente.metricas.metricas()['obtener_pago']['resultados']['circuito_abierto'] == 1
+
+    # Pasada la espera deja pasar una sola prueba
+    reloj.ahora += 30
+    circuito.permitir()
+    assert circuito.estado()['estado'] == CIRCUITO_SEMIABIERTO
+    with pytest.raises(CircuitoAbiertoError):
+        circuito.permitir()
+
+    # La prueba sale bien: se cierra
+    circuito.registrar_exito()
+    assert circuito.estado() == {'estado': CIRCUITO_CERRADO, 'fallos_seguidos': 0, 'aperturas': 1}
+    assert cliente.obtener_pago('7')['status'] == 'approved'
+
+
+def test_semiabierto_vuelve_a_abrirse_si_la_prueba_falla(reloj):
+    circuito = CircuitoMercadoPago(fallos_umbral=1, espera_segundos=30)
+    cliente = ClienteGuionado([ErrorMercadoPago('caído')] * 2, circuito=circuito)
+
+    with pytest.raises(CircuitoAbiertoError):
+        cliente.obtener_pago('1')
+    assert circuito.estado()['estado'] == CIRCUITO_ABIERTO
+
+    reloj.ahora += 30
+    with pytest.raises(CircuitoAbiertoError):
+        # La prueba falla, el circuito se reabre y el reintento ya no pasa
+        cliente.obtener_pago('1')
+    assert circuito.estado()['estado'] == CIRCUITO_ABIERTO
+    assert circuito.estado()['aperturas'] == 2
@@ -0,0 +1,64 @@
+# tests/test_password_policy.py
+"""
+Dónde corre el hash de contraseñas: sin gevent en el propio request; con
+gevent, los esquemas de hashlib en un thread nativo y los que retienen el
+GIL en el pool de procesos.
+"""
+import pytest
+
+import utils.password_policy as password_policy
+from utils.hilos_nativos import HilosNativos
+from utils.password_policy import PasswordPolicy, _crear_contexto
+
+
+@pytest.fixture
+def politica(monkeypatch):
+    """Instala una política (esquema, rondas) y devuelve en qué lugar se calculó cada hash"""
+    lugares = []
+    ejecutar = HilosNativos.ejecutar.__func__
+
+    def en_hilo_nativo(cls, funcion, *args):
+        lugares.append('hilo nativo')
+        return ejecutar(cls, funcion, *args)
+
+    monkeypatch.setattr(HilosNativos, 'ejecutar', classmethod(en_hilo_nativo))
+
+    def instalar(esquema, rondas, gevent):
+        config = {'esquema': esquema, 'rondas': rondas}
+        monkeypatch.setattr(PasswordPolicy, '_config', config)
+        monkeypatch.setattr(PasswordPolicy, '_contexto', _crear_contexto(config))
+        monkeypatch.setattr(password_policy, 'gevent_activo', lambda: gevent)
+        return lugares
+
+    yield instalar
+    PasswordPolicy._cerrar_procesos()
+
+
+def test_sin_gevent_se_calcula_en_el_request(politica):
+    lugares = politica('pbkdf2_sha256', 1000, gevent=False)
+    guardado = PasswordPolicy.hash('clave123')
+    assert PasswordPolicy.verify_and_update('clave123', guardado) == (True, None)
+    assert lugares == []
+    assert PasswordPolicy._executor is None
+
+
+def test_con_gevent_hashlib_va_a_un_thread_nativo(politica):
+    lugares = politica('pbkdf2_sha256', 1000, gevent=True)
+    guardado = PasswordPolicy.hash('clave123')
+    assert PasswordPolicy.verify_and_update('clave123', guardado) == (True, None)
+    assert lugares == ['hilo nativo', 'hilo nativo']
+    assert PasswordPolicy._executor is None
+
+
+def test_con_gevent_crypt_va_al_pool_de_procesos(politica):
+    lugares = politica('sha256_crypt', 1000, gevent=True)
+    guardado = PasswordPolicy.hash('clave123')
+
+    assert lugares == []
+    assert PasswordPolicy._executor is not None
+    assert guardado.startswith('$5$rounds=1000$')
+    # Un hash con otro costo se re-hashea también en el pool
+    viejo = _crear_contexto({'esquema': 'sha256_crypt', 'rondas': 1001}).hash('clave123')
+    valida, nuevo = PasswordPolicy.verify_and_update('clave123', viejo)
+    assert valida and nuevo.startswith('$5$rounds=1000$')
+    assert PasswordPolicy.verify_and_update('otra', guardado) == (False, None)
@@ -0,0 +1,77 @@
+# tests/test_planes_consultas.py
+"""
+EXPLAIN de cada consulta caliente: falla si alguna recorre una tabla
+completa en lugar de usar los índices de models/ y de las migraciones.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text, func
+
+from models.base import db
+from models.solicitud import Solicitud
+from models.solicitud_parcela import SolicitudParcela
+from models.notificacion import Notificacion
+from models.parcela import Parcela
+from models.usuario import Usuario
+from models.mapa_evento import MapaEvento
+from controllers.solicitud_controller import filtro_anio_solicitud
+from controllers.admin_controller import filtro_despues_del_cursor
+
+FECHA = datetime(2026, 3, 1, 12, 0, 0)
+
+CONSULTAS = {
+    'solicitudes_de_artesano_por_anio': lambda: Solicitud.query.filter(
+        Solicitud.artesano_id == 1, filtro_anio_solicitud(2026)
+    ),
+    'conteo_por_estado_y_rubro': lambda: db.session.query(
+        func.count(Solicitud.solicitud_id)
+    ).filter(
+        Solicitud.estado_solicitud_id == 2, Solicitud.rubro_id == 1
+    ),
+    'dashboard_pagina_siguiente': lambda: Solicitud.query.filter(
+        filtro_despues_del_cursor(FECHA, 50)
+    ).order_by(
+        Solicitud.fecha_solicitud.desc(), Solicitud.solicitud_id.desc()
+    ).limit(21),
+    'dashboard_pagina_sin_fecha': lambda: Solicitud.query.filter(
+        filtro_despues_del_cursor(None, 50)
+    ).order_by(
+        Solicitud.fecha_solicitud.desc(), Solicitud.solicitud_id.desc()
+    ).limit(21),
+    'ocupacion_de_parcela': lambda: SolicitudParcela.query.filter(
+        SolicitudParcela.parcela_id == 1
+    ),
+    'notificaciones_de_artesano': lambda: Notificacion.query.filter(
+        Notificacion.artesano_id == 1
+    ).order_by(Notificacion.fecha_envio.desc()).limit(20),
+    'parcela_por_posicion': lambda: Parcela.query.filter(
+        Parcela.mapa_id == 1, Parcela.fila == 2, Parcela.columna == 3
+    ),
+    'usuarios_registrados_desde': lambda: Usuario.query.filter(
+        Usuario.fecha_registro >= FECHA
+    ),
+    'eventos_del_mapa_pendientes': lambda: MapaEvento.query.filter(
+        MapaEvento.evento_id > 100
+    ).order_by(MapaEvento.evento_id),
+}
+
+
+def recorridos_completos(consulta):
+    """Tablas que el plan recorre enteras (sqlite o MySQL)"""
+    dialecto = db.engine.dialect
+    sql = str(consulta.statement.compile(dialect=dialecto, compile_kwargs={'literal_binds': True}))
+
+    if dialecto.name == 'sqlite':
+        filas = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+        detalles = [fila[-1] for fila in filas]
+        return [d for d in detalles if d.startswith('SCAN ') and ' USING ' not in d]
+
+    filas = db.session.execute(text('EXPLAIN ' + sql)).mappings().all()
+    return [f"{fila['table']} ({fila['type']})" for fila in filas if fila['type'] == 'ALL']
+
+
+@pytest.mark.parametrize('nombre', sorted(CONSULTAS))
+def test_consulta_caliente_usa_indice(contexto, nombre):
+    recorridos = recorridos_completos(CONSULTAS[nombre]())
+    assert not recorridos, f"{nombre} recorre la tabla completa: {recorridos}"
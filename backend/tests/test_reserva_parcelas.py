@@ -0,0 +1,170 @@
+# tests/test_reserva_parcelas.py
+"""
+Ocupación de parcelas: la reserva, el mapa y el índice único usan la misma
+definición, bajo concurrencia una parcela tiene un solo ganador, la
+temporada sale de la solicitud y no de cuándo se asigna, y liberar deja
+la fila como historial.
+"""
+from datetime import datetime
+import random
+import threading
+import time
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+from models.base import db
+from models.parcela import Parcela
+from models.solicitud import Solicitud
+from models.solicitud_parcela import SolicitudParcela
+from utils.catalogos import Catalogos, ESTADO_SOLICITUD_PARCIAL
+from utils.mapa_service import MapaService
+import utils.ocupacion_parcelas as ocupacion_parcelas
+from utils.ocupacion_parcelas import OcupacionParcelas
+from utils.reserva_parcelas import ReservaParcelas, ParcelaOcupadaError
+from fabricas import crear_parcela, crear_solicitud
+
+HILOS = 16
+INTENTOS_POR_HILO = 50
+
+
+def reservar_y_confirmar(solicitud_id, parcela_id):
+    asignadas, conflictos = ReservaParcelas.reservar(solicitud_id, [parcela_id])
+    if conflictos:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    return asignadas
+
+
+def test_reserva_concurrente_tiene_un_solo_ganador(app):
+    with app.app_context():
+        parcela_id = crear_parcela()
+        solicitudes = [crear_solicitud() for _ in range(HILOS)]
+        db.session.commit()
+
+    barrera = threading.Barrier(HILOS)
+    resultados = []
+
+    def competir(solicitud_id):
+        with app.app_context():
+            barrera.wait()
+            try:
+                for _ in range(INTENTOS_POR_HILO):
+                    try:
+                        asignadas = reservar_y_confirmar(solicitud_id, parcela_id)
+                        resultados.append('ganadora' if asignadas else 'conflicto')
+                        return
+                    except ParcelaOcupadaError:
+                        resultados.append('conflicto')
+                        return
+                    except OperationalError:
+                        # sqlite no tiene FOR UPDATE: el perdedor del lock reintenta
+                        db.session.rollback()
+                        time.sleep(random.uniform(0.005, 0.02))
+                resultados.append('sin respuesta')
+            except Exception as e:
+                resultados.append(repr(e))
+            finally:
+                db.session.remove()
+
+    hilos = [threading.Thread(target=competir, args=(solicitud_id,)) for solicitud_id in solicitudes]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(timeout=60)
+
+    assert len(resultados) == HILOS
+    assert resultados.count('ganadora') == 1, resultados
+    assert resultados.count('conflicto') == HILOS - 1, resultados
+
+    with app.app_context():
+        filas = SolicitudParcela.query.filter_by(parcela_id=parcela_id).all()
+        assert len(filas) == 1
+        assert filas[0].solicitud_id in solicitudes
+
+
+def test_asignacion_de_temporada_anterior_no_bloquea(contexto):
+    parcela_id = crear_parcela()
+    anterior = crear_solicitud(fecha=datetime(OcupacionParcelas.temporada_actual() - 1, 5, 1))
+    db.session.execute(insert(SolicitudParcela), [{
+        'solicitud_id': anterior, 'parcela_id': parcela_id,
+        'temporada': OcupacionParcelas.temporada_actual() - 1
+    }])
+    actual = crear_solicitud()
+    db.session.commit()
+
+    assert not OcupacionParcelas.esta_ocupada(parcela_id)
+    assert reservar_y_confirmar(actual, parcela_id) == [parcela_id]
+    assert OcupacionParcelas.esta_ocupada(parcela_id)
+
+
+def test_mapa_y_reserva_usan_la_misma_ocupacion(contexto):
+    parcela_id = crear_parcela()
+    solicitud_id = crear_solicitud()
+    db.session.commit()
+    assert reservar_y_confirmar(solicitud_id, parcela_id) == [parcela_id]
+
+    # Al completar sus parcelas la solicitud deja de estar 'Aprobada'
+    solicitud = Solicitud.query.get(solicitud_id)
+    solicitud.estado_solicitud_id = Catalogos.estado_solicitud_id(ESTADO_SOLICITUD_PARCIAL) or 1
+    db.session.commit()
+
+    mapa_id = Parcela.query.get(parcela_id).mapa_id
+    assert parcela_id in MapaService.obtener_ocupacion(mapa_id, parcela_ids=[parcela_id])
+
+    otra = crear_solicitud()
+    db.session.commit()
+    assert reservar_y_confirmar(otra, parcela_id) == []
+
+
+def test_solicitud_de_diciembre_asignada_en_enero_queda_en_su_temporada(contexto):
+    parcela_id = crear_parcela()
+    anio = OcupacionParcelas.temporada_actual() - 1
+    diciembre = crear_solicitud(fecha=datetime(anio, 12, 20))
+    db.session.commit()
+
+    assert reservar_y_confirmar(diciembre, parcela_id) == [parcela_id]
+    fila = SolicitudParcela.query.filter_by(solicitud_id=diciembre).one()
+    assert fila.temporada == OcupacionParcelas.temporada_de_fecha(datetime(anio, 12, 20))
+
+
+@pytest.mark.parametrize('mes_inicio, fecha, temporada', [
+    (1, datetime(2025, 12, 20), 2025),
+    (1, datetime(2026, 1, 10), 2026),
+    (9, datetime(2025, 8, 31), 2025),
+    (9, datetime(2025, 12, 20), 2026),
+    (9, datetime(2026, 1, 10), 2026),
+])
+def test_temporada_segun_el_calendario_de_la_feria(monkeypatch, mes_inicio, fecha, temporada):
+    monkeypatch.setattr(ocupacion_parcelas, 'TEMPORADA_MES_INICIO', mes_inicio)
+    assert OcupacionParcelas.temporada_de_fecha(fecha) == temporada
+
+
+def test_rechazar_marca_las_filas_como_liberadas(app, cliente, auth_administrador):
+    with app.app_context():
+        parcela_id = crear_parcela()
+        rechazada = crear_solicitud()
+        otra = crear_solicitud()
+        db.session.commit()
+        assert reservar_y_confirmar(rechazada, parcela_id) == [parcela_id]
+        db.session.remove()
+
+    respuesta = cliente.patch(
+        f'/api/v1/solicitudes/{rechazada}/estado', json={'estado_solicitud': 'Rechazada'}, headers=auth_administrador
+    )
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+
+    with app.app_context():
+        fila = SolicitudParcela.query.filter_by(solicitud_id=rechazada).one()
+        assert fila.activa is None and fila.fecha_liberacion is not None
+        assert not OcupacionParcelas.esta_ocupada(parcela_id, temporada=fila.temporada)
+
+        # La fila liberada no bloquea la parcela en su temporada
+        assert reservar_y_confirmar(otra, parcela_id) == [parcela_id]
+        filas = SolicitudParcela.query.filter_by(parcela_id=parcela_id).order_by(
+            SolicitudParcela.solicitud_parcela_id
+        ).all()
+        assert [(f.solicitud_id, f.activa) for f in filas] == [(rechazada, None), (otra, True)]
+        db.session.remove()
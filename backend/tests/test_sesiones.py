@@ -0,0 +1,117 @@
+# tests/test_sesiones.py
+"""
+Sesión única por usuario (TokenManager.open_session): con logins
+simultáneos se abre una sola sesión, también al reemplazar una vencida, y
+un login rechazado por sesión vigente guarda igual el re-hash de la
+contraseña.
+"""
+from datetime import datetime, timedelta, timezone
+import threading
+import uuid
+
+from passlib.hash import sha256_crypt
+from sqlalchemy.exc import OperationalError
+
+from models.base import db
+from models.usuario import Usuario
+from models.active_token import ActiveToken
+from utils.password_policy import PasswordPolicy, _crear_contexto
+from utils.token_manager import TokenManager
+from fabricas import crear_artesano
+
+HILOS = 8
+
+
+def crear_usuario(app, password=None):
+    with app.app_context():
+        email, _ = crear_artesano(password)
+        db.session.commit()
+        usuario_id = Usuario.query.filter_by(email=email).one().usuario_id
+        db.session.remove()
+    return email, usuario_id
+
+
+def logins_simultaneos(app, usuario_id):
+    """HILOS llamadas a open_session a la vez; devuelve los resultados"""
+    barrera = threading.Barrier(HILOS)
+    resultados = []
+
+    def login():
+        with app.app_context():
+            barrera.wait()
+            vence = datetime.now(timezone.utc) + timedelta(minutes=5)
+            try:
+                # sqlite no tiene bloqueo de filas: el que no consigue
+                # escribir reintenta, como haría el cliente
+                for _ in range(50):
+                    try:
+                        resultados.append(TokenManager.open_session(usuario_id, str(uuid.uuid4()), vence))
+                        return
+                    except OperationalError:
+                        db.session.rollback()
+                resultados.append('sin respuesta')
+            except Exception as e:
+                resultados.append(repr(e))
+            finally:
+                db.session.remove()
+
+    hilos = [threading.Thread(target=login) for _ in range(HILOS)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(timeout=60)
+    return resultados
+
+
+def test_logins_simultaneos_abren_una_sola_sesion(app):
+    _, usuario_id = crear_usuario(app)
+
+    resultados = logins_simultaneos(app, usuario_id)
+
+    assert resultados.count(True) == 1, resultados
+    assert resultados.count(False) == HILOS - 1, resultados
+    with app.app_context():
+        assert ActiveToken.query.filter_by(usuario_id=usuario_id).count() == 1
+
+
+def test_logins_simultaneos_sobre_sesion_vencida(app):
+    _, usuario_id = crear_usuario(app)
+    with app.app_context():
+        db.session.add(ActiveToken(
+            usuario_id=usuario_id, jti=str(uuid.uuid4()),
+            expires_at=datetime.now(timezone.utc) - timedelta(minutes=1)
+        ))
+        db.session.commit()
+        db.session.remove()
+
+    resultados = logins_simultaneos(app, usuario_id)
+
+    assert resultados.count(True) == 1, resultados
+    assert resultados.count(False) == HILOS - 1, resultados
+    with app.app_context():
+        sesion = ActiveToken.query.filter_by(usuario_id=usuario_id).one()
+        assert sesion.expires_at > datetime.utcnow()
+
+
+def test_login_rechazado_guarda_el_rehash(app, cliente, monkeypatch):
+    email, usuario_id = crear_usuario(app)
+    with app.app_context():
+        usuario = db.session.get(Usuario, usuario_id)
+        # Hash con un costo distinto al de la política
+        usuario.contraseña = sha256_crypt.using(rounds=1001).hash('clave123')
+        db.session.commit()
+        db.session.remove()
+    monkeypatch.setattr(PasswordPolicy, '_contexto', _crear_contexto({'esquema': 'sha256_crypt', 'rondas': 1000}))
+
+    with app.app_context():
+        vence = datetime.now(timezone.utc) + timedelta(minutes=5)
+        assert TokenManager.open_session(usuario_id, str(uuid.uuid4()), vence)
+        db.session.remove()
+
+    respuesta = cliente.post('/auth/login', json={'email': email, 'password': 'clave123'})
+    assert respuesta.status_code == 409, respuesta.get_data(as_text=True)
+
+    with app.app_context():
+        guardado = db.session.get(Usuario, usuario_id).contraseña
+        assert sha256_crypt.from_string(guardado).rounds == 1000
+        assert sha256_crypt.verify('clave123', guardado)
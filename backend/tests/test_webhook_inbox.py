@@ -0,0 +1,215 @@
+# tests/test_webhook_inbox.py
+"""
+Bandeja de webhooks de MercadoPago: deduplicación de entregas repetidas
+(y re-activación con una notificación distinta del mismo pago), el
+bloqueo con vencimiento al tomar un evento, la espera exponencial de los
+reintentos y la purga de eventos procesados viejos.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import utils.webhook_inbox as webhook_inbox
+from models.base import db
+from models.webhook_evento import WebhookEvento, WEBHOOK_PENDIENTE, WEBHOOK_PROCESANDO, WEBHOOK_PROCESADO, WEBHOOK_ERROR
+from utils.mercadopago_cliente import ErrorMercadoPago
+from utils.webhook_inbox import (
+    WebhookInbox, REGISTRO_NUEVO, REGISTRO_REACTIVADO, REGISTRO_DUPLICADO,
+    WEBHOOK_BLOQUEO_SEGUNDOS, WEBHOOK_BACKOFF_BASE_SEGUNDOS, WEBHOOK_BACKOFF_MAX_SEGUNDOS,
+    WEBHOOK_MAX_INTENTOS, WEBHOOK_RETENCION_DIAS
+)
+from fabricas import crear_evento_webhook
+
+# Antes que cualquier evento de otros tests: es el que toma _tomar
+MUY_ANTIGUO = datetime(2000, 1, 1)
+
+
+@pytest.fixture(autouse=True)
+def bandeja(contexto):
+    """Cada test ve solo sus eventos; al terminar no deja ninguno listo"""
+    yield
+    db.session.rollback()
+    WebhookEvento.query.filter(WebhookEvento.payment_id.like('EVENTO-%')).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def evento(evento_id):
+    db.session.expire_all()
+    return db.session.get(WebhookEvento, evento_id)
+
+
+def aproximadamente(valor, esperado, tolerancia=5):
+    return abs((valor - esperado).total_seconds()) <= tolerancia
+
+
+def test_entregas_repetidas_no_agregan_trabajo():
+    payment_id = 'EVENTO-repetido'
+    payload = WebhookInbox.serializar({'type': 'payment', 'data': {'id': payment_id}})
+
+    assert WebhookInbox.registrar('payment', payment_id, payload) == REGISTRO_NUEVO
+    for _ in range(3):
+        assert WebhookInbox.registrar('payment', payment_id, payload) == REGISTRO_DUPLICADO
+    assert WebhookEvento.query.filter_by(payment_id=payment_id).count() == 1
+
+    # Ya procesado, la misma notificación sigue siendo un duplicado
+    WebhookEvento.query.filter_by(payment_id=payment_id).update({'estado': WEBHOOK_PROCESADO})
+    db.session.commit()
+    assert WebhookInbox.registrar('payment', payment_id, payload) == REGISTRO_DUPLICADO
+    assert WebhookEvento.query.filter_by(payment_id=payment_id).one().estado == WEBHOOK_PROCESADO
+
+
+def test_el_cuerpo_se_normaliza_antes_de_comparar():
+    assert WebhookInbox.serializar({'a': 1, 'b': {'c': 2}}) == WebhookInbox.serializar({'b': {'c': 2}, 'a': 1})
+
+
+@pytest.mark.parametrize('estado', [WEBHOOK_PROCESADO, WEBHOOK_ERROR, WEBHOOK_PROCESANDO])
+def test_notificacion_distinta_reactiva_el_evento(estado):
+    evento_id = crear_evento_webhook(
+        estado=estado, payload='{"action": "payment.created"}', intentos=3,
+        proximo_intento=datetime.utcnow() + timedelta(hours=1)
+    )
+    db.session.commit()
+    payment_id = evento(evento_id).payment_id
+
+    resultado = WebhookInbox.registrar('payment', payment_id, '{"action": "payment.updated"}')
+
+    assert resultado == REGISTRO_REACTIVADO
+    reactivado = evento(evento_id)
+    assert reactivado.estado == WEBHOOK_PENDIENTE
+    assert reactivado.intentos == 0
+    assert reactivado.payload == '{"action": "payment.updated"}'
+    assert reactivado.proximo_intento <= datetime.utcnow()
+
+
+def test_notificacion_distinta_de_un_pendiente_no_lo_modifica():
+    # El pendiente todavía no se procesó: cuando lo haga va a leer el estado actual en MP
+    evento_id = crear_evento_webhook(payload='{"action": "payment.created"}', intentos=2)
+    db.session.commit()
+    payment_id = evento(evento_id).payment_id
+
+    assert WebhookInbox.registrar('payment', payment_id, '{"action": "payment.updated"}') == REGISTRO_DUPLICADO
+    assert evento(evento_id).intentos == 2
+    assert evento(evento_id).payload == '{"action": "payment.created"}'
+
+
+def test_tomar_bloquea_el_evento_hasta_que_vence():
+    evento_id = crear_evento_webhook(proximo_intento=MUY_ANTIGUO)
+    futuro_id = crear_evento_webhook(proximo_intento=datetime.utcnow() + timedelta(hours=1))
+    db.session.commit()
+
+    tomado = WebhookInbox._tomar()
+    assert tomado.evento_id == evento_id
+    tomado = evento(evento_id)
+    assert tomado.estado == WEBHOOK_PROCESANDO
+    assert tomado.intentos == 1
+    assert aproximadamente(tomado.proximo_intento, datetime.utcnow() + timedelta(seconds=WEBHOOK_BLOQUEO_SEGUNDOS))
+
+    # Bloqueado: otro worker no lo toma (ni al que todavía no le toca)
+    assert WebhookInbox._tomar() is None
+    assert evento(futuro_id).estado == WEBHOOK_PENDIENTE
+
+    # El worker que lo tenía murió: vencido el bloqueo, otro lo retoma
+    WebhookEvento.query.filter_by(evento_id=evento_id).update({'proximo_intento': MUY_ANTIGUO})
+    db.session.commit()
+    retomado = WebhookInbox._tomar()
+    assert retomado.evento_id == evento_id
+    assert evento(evento_id).intentos == 2
+
+
+def test_tomar_no_pisa_a_otro_worker(monkeypatch):
+    evento_id = crear_evento_webhook(proximo_intento=MUY_ANTIGUO)
+    db.session.commit()
+
+    # Entre la consulta del candidato y el UPDATE, otro worker lo toma
+    update_original = db.Query.update
+    tomas = []
+
+    def otro_worker_primero(query, valores, **kwargs):
+        if not tomas:
+            tomas.append(1)
+            WebhookEvento.query.filter_by(evento_id=evento_id).update({
+                'estado': WEBHOOK_PROCESANDO,
+                'proximo_intento': datetime.utcnow() + timedelta(seconds=WEBHOOK_BLOQUEO_SEGUNDOS)
+            })
+        return update_original(query, valores, **kwargs)
+
+    monkeypatch.setattr(db.Query, 'update', otro_worker_primero)
+
+    assert WebhookInbox._tomar() is None
+    assert evento(evento_id).intentos == 0
+
+
+@pytest.mark.parametrize('intentos', [1, 3, 5])
+def test_fallar_reintenta_con_espera_exponencial(monkeypatch, intentos):
+    monkeypatch.setattr(webhook_inbox.random, 'uniform', lambda a, b: 1.0)
+    evento_id = crear_evento_webhook(estado=WEBHOOK_PROCESANDO, intentos=intentos)
+    db.session.commit()
+
+    WebhookInbox._fallar(evento(evento_id), ErrorMercadoPago('502'))
+
+    fallido = evento(evento_id)
+    espera = min(WEBHOOK_BACKOFF_BASE_SEGUNDOS * 2 ** (intentos - 1), WEBHOOK_BACKOFF_MAX_SEGUNDOS)
+    assert fallido.estado == WEBHOOK_PENDIENTE
+    assert fallido.ultimo_error == '502'
+    assert aproximadamente(fallido.proximo_intento, datetime.utcnow() + timedelta(seconds=espera), tolerancia=2)
+
+
+def test_fallar_respeta_el_tope_y_el_jitter(monkeypatch):
+    monkeypatch.setattr(webhook_inbox.random, 'uniform', lambda a, b: b)
+    monkeypatch.setattr(webhook_inbox, 'WEBHOOK_MAX_INTENTOS', 20)
+    # 2 * 2^14 segundos superaría el tope
+    evento_id = crear_evento_webhook(estado=WEBHOOK_PROCESANDO, intentos=15)
+    db.session.commit()
+
+    WebhookInbox._fallar(evento(evento_id), ErrorMercadoPago('503'))
+
+    espera = (evento(evento_id).proximo_intento - datetime.utcnow()).total_seconds()
+    assert espera <= WEBHOOK_BACKOFF_MAX_SEGUNDOS * 1.2 + 1
+    assert espera >= WEBHOOK_BACKOFF_MAX_SEGUNDOS * 1.2 - 5
+
+
+def test_procesar_agota_los_intentos_y_descarta(monkeypatch):
+    def aplicar_pago(payment_id):
+        raise ErrorMercadoPago('caído')
+
+    monkeypatch.setattr(WebhookInbox, 'aplicar_pago', staticmethod(aplicar_pago))
+    evento_id = crear_evento_webhook(intentos=WEBHOOK_MAX_INTENTOS - 1, proximo_intento=MUY_ANTIGUO)
+    db.session.commit()
+
+    assert WebhookInbox.procesar_siguiente()
+
+    descartado = evento(evento_id)
+    assert descartado.intentos == WEBHOOK_MAX_INTENTOS
+    assert descartado.estado == WEBHOOK_ERROR
+    assert descartado.ultimo_error == 'caído'
+
+
+def test_reactivado_mientras_se_procesaba_no_se_pisa():
+    evento_id = crear_evento_webhook(proximo_intento=MUY_ANTIGUO, payload='{"v": 1}')
+    db.session.commit()
+    tomado = WebhookInbox._tomar()
+    assert tomado.evento_id == evento_id
+
+    # Llega otra notificación del mismo pago mientras se aplica
+    assert WebhookInbox.registrar('payment', tomado.payment_id, '{"v": 2}') == REGISTRO_REACTIVADO
+    WebhookInbox._finalizar(tomado, WEBHOOK_PROCESADO, None)
+
+    assert evento(evento_id).estado == WEBHOOK_PENDIENTE
+
+
+def test_purgar_borra_solo_procesados_viejos():
+    viejo = datetime.utcnow() - timedelta(days=WEBHOOK_RETENCION_DIAS + 1)
+    reciente = datetime.utcnow() - timedelta(days=WEBHOOK_RETENCION_DIAS - 1)
+    procesado_viejo = crear_evento_webhook(estado=WEBHOOK_PROCESADO, fecha_procesado=viejo)
+    conservados = [
+        crear_evento_webhook(estado=WEBHOOK_PROCESADO, fecha_procesado=reciente),
+        crear_evento_webhook(estado=WEBHOOK_ERROR, proximo_intento=viejo),
+        crear_evento_webhook(estado=WEBHOOK_PENDIENTE, proximo_intento=datetime.utcnow() + timedelta(hours=1)),
+    ]
+    db.session.commit()
+
+    assert WebhookInbox.purgar() >= 1
+
+    assert evento(procesado_viejo) is None
+    for evento_id in conservados:
+        assert evento(evento_id) is not None
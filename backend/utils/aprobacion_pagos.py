@@ -0,0 +1,196 @@
+# utils/aprobacion_pagos.py
+from models.base import db
+from models.notificacion import Notificacion
+from models.pago import Pago
+from models.solicitud import Solicitud
+from utils.comprobantes_cache import CacheComprobantes
+from utils.catalogos import (
+    Catalogos, ESTADOS_SOLICITUD_PAGADA,
+    ESTADO_PAGO_PENDIENTE, ESTADO_PAGO_PAGADO, ESTADO_PAGO_RECHAZADO, ESTADO_PAGO_CANCELADO
+)
+from utils.mapa_service import MapaService, CAMBIO_OCUPADA, CAMBIO_LIBERADA
+from utils.reserva_parcelas import ReservaParcelas
+from datetime import datetime, timedelta
+import os
+
+# Estado de MercadoPago -> nombre en EstadoPago. Solo los rechazos
+# terminales liberan las parcelas retenidas; los estados intermedios
+# (en revisión, autorizado sin capturar, en mediación) siguen pendientes
+ESTADO_PAGO_POR_STATUS_MP = {
+    "approved": ESTADO_PAGO_PAGADO,
+    "pending": ESTADO_PAGO_PENDIENTE,
+    "in_process": ESTADO_PAGO_PENDIENTE,
+    "authorized": ESTADO_PAGO_PENDIENTE,
+    "in_mediation": ESTADO_PAGO_PENDIENTE,
+    "rejected": ESTADO_PAGO_RECHAZADO,
+    "cancelled": ESTADO_PAGO_CANCELADO,
+    "refunded": ESTADO_PAGO_CANCELADO,
+    "charged_back": ESTADO_PAGO_CANCELADO,
+}
+
+_ACCESS_TOKEN = os.getenv("MERCADOPAGO_ACCESS_TOKEN", "")
+_SANDBOX = not _ACCESS_TOKEN or _ACCESS_TOKEN.startswith("TEST")
+
+# Aprobación automática de pagos que siguen pendientes (solo pensada para
+# sandbox, donde Pago Fácil nunca se acredita); en producción queda apagada
+PAGO_AUTO_APROBACION = os.getenv(
+    "PAGO_AUTO_APROBACION", "true" if _SANDBOX else "false"
+).lower() == "true"
+PAGO_AUTO_APROBACION_SEGUNDOS = int(os.getenv("PAGO_AUTO_APROBACION_SEGUNDOS", "60"))
+
+# Cada cuánto revisa el scheduler los pagos pendientes
+PAGO_AUTO_APROBACION_BARRIDO_SEGUNDOS = int(os.getenv("PAGO_AUTO_APROBACION_BARRIDO_SEGUNDOS", "15"))
+
+
+class ResultadoPago:
+    """Qué cambió al aplicar un estado a un pago"""
+
+    def __init__(self, pago, aprobado_ahora=False, asignadas=None, conflictos=None, liberadas=None, ignorado=False):
+        self.pago = pago
+        self.aprobado_ahora = aprobado_ahora
+        self.asignadas = asignadas or []
+        self.conflictos = conflictos or []
+        self.liberadas = liberadas or []
+        self.ignorado = ignorado
+
+
+class ServicioAprobacionPagos:
+    """
+    Único camino para cambiar el estado de un pago: webhook de MercadoPago,
+    simulaciones de sandbox, aprobaciones de Pago Fácil y la aprobación
+    automática. Todo ocurre en una transacción: estado del pago, estado de
+    la solicitud y asignación de las parcelas (en bloque, con bloqueo de
+    filas). Es idempotente: aprobar un pago ya aprobado no reasigna nada.
+    """
+
+    @staticmethod
+    def aplicar_estado(pago, status, payment_id=None):
+        """
+        Aplica un status de MercadoPago ('approved', 'pending', ...) al pago
+        y hace commit. Un status desconocido no cambia nada (el pago y sus
+        retenciones quedan como estaban). Lanza ParcelaOcupadaError si otra
+        transacción asignó una parcela a la vez.
+        """
+        if status not in ESTADO_PAGO_POR_STATUS_MP:
+            print(f"Pago {pago.pago_id}: status de MercadoPago desconocido '{status}', se ignora")
+            return ResultadoPago(pago, ignorado=True)
+
+        estado_anterior = pago.estado_pago_id
+        id_pagado = Catalogos.estado_pago_id(ESTADO_PAGO_PAGADO)
+        nuevo_estado = Catalogos.estado_pago_id(ESTADO_PAGO_POR_STATUS_MP[status])
+
+        # Un aviso atrasado (pending, in_process...) no deshace un pago ya aprobado
+        if estado_anterior == id_pagado and nuevo_estado == Catalogos.estado_pago_id(ESTADO_PAGO_PENDIENTE):
+            return ResultadoPago(pago, ignorado=True)
+
+        pago.estado_pago_id = nuevo_estado
+        if payment_id:
+            pago.payment_id = payment_id
+        pago.fecha_pago = datetime.now()
+
+        print(f"Pago {pago.pago_id}: {status} (anterior: {estado_anterior}, nuevo: {nuevo_estado})")
+
+        resultado = ResultadoPago(pago)
+
+        # Rechazo terminal: las parcelas retenidas vuelven a estar libres
+        if nuevo_estado in (Catalogos.estado_pago_id(ESTADO_PAGO_RECHAZADO), Catalogos.estado_pago_id(ESTADO_PAGO_CANCELADO)):
+            resultado.liberadas = ReservaParcelas.liberar_reservas(pago.solicitud_id)
+
+        if nuevo_estado == id_pagado and estado_anterior != id_pagado:
+            resultado.aprobado_ahora = True
+
+            estado_pagada = Catalogos.estados_solicitud.primero_de(ESTADOS_SOLICITUD_PAGADA)
+            solicitud = Solicitud.query.get(pago.solicitud_id)
+            if solicitud and estado_pagada:
+                solicitud.estado_solicitud_id = estado_pagada.id
+            elif solicitud:
+                print(f"No se encontró estado 'Pagada' para la solicitud {pago.solicitud_id}")
+
+            resultado.asignadas, resultado.conflictos = ReservaParcelas.reservar(
+                pago.solicitud_id, pago.get_parcelas_seleccionadas()
+            )
+            for parcela_id in resultado.conflictos:
+                print(f"Parcela {parcela_id} ya está asignada a otra solicitud")
+            print(f"Solicitud {pago.solicitud_id}: {len(resultado.asignadas)} parcela(s) asignada(s)")
+
+            if solicitud:
+                ServicioAprobacionPagos._notificar_asignacion(solicitud, resultado)
+
+        db.session.commit()
+
+        if resultado.asignadas:
+            MapaService.registrar_cambios(resultado.asignadas, CAMBIO_OCUPADA)
+        if resultado.liberadas:
+            MapaService.registrar_cambios(resultado.liberadas, CAMBIO_LIBERADA)
+        if resultado.aprobado_ahora:
+            # El artesano suele descargar el comprobante apenas ve el pago aprobado
+            CacheComprobantes.encolar(pago.pago_id)
+        return resultado
+
+    @staticmethod
+    def _notificar_asignacion(solicitud, resultado):
+        """Avisa al artesano qué parcelas quedaron asignadas y cuáles no (sin commit)"""
+        mensaje = f'Tu pago de la solicitud #{solicitud.solicitud_id} fue aprobado. '
+        if resultado.asignadas:
+            mensaje += f'Se asignaron {len(resultado.asignadas)} parcela(s).'
+        else:
+            mensaje += 'No se asignaron parcelas.'
+        if resultado.conflictos:
+            ocupadas = ', '.join(str(parcela_id) for parcela_id in resultado.conflictos)
+            mensaje += (f' Las parcelas {ocupadas} ya no estaban disponibles: '
+                        f'puedes elegir otras desde el mapa.')
+
+        db.session.add(Notificacion(
+            artesano_id=solicitud.artesano_id,
+            mensaje=mensaje,
+            estado_notificacion_id=Catalogos.estados_notificacion.id_de('Enviada', 1),
+            leido=False
+        ))
+
+    @staticmethod
+    def aprobar(pago, payment_id=None):
+        return ServicioAprobacionPagos.aplicar_estado(pago, "approved", payment_id)
+
+    @staticmethod
+    def vence_auto_aprobacion(pago):
+        """
+        Momento a partir del cual un pago pendiente se aprueba solo. Hora
+        local, igual que fecha_creacion (crear_preferencia usa datetime.now())
+        """
+        return pago.fecha_creacion + timedelta(seconds=PAGO_AUTO_APROBACION_SEGUNDOS)
+
+    @staticmethod
+    def auto_aprobar_pendientes():
+        """
+        Tarea programada: aprueba los pagos pendientes con más de
+        PAGO_AUTO_APROBACION_SEGUNDOS. Cada pago en su propia transacción.
+        """
+        if not PAGO_AUTO_APROBACION:
+            return []
+
+        limite = datetime.now() - timedelta(seconds=PAGO_AUTO_APROBACION_SEGUNDOS)
+        pago_ids = [
+            pago_id for (pago_id,) in db.session.query(Pago.pago_id).filter(
+                Pago.estado_pago_id == Catalogos.estado_pago_id(ESTADO_PAGO_PENDIENTE),
+                Pago.preference_id.isnot(None),
+                Pago.fecha_creacion <= limite
+            ).order_by(Pago.pago_id).all()
+        ]
+
+        aprobados = []
+        for pago_id in pago_ids:
+            try:
+                # Se relee con bloqueo: el webhook puede haberlo aprobado recién
+                pago = Pago.query.filter_by(pago_id=pago_id).with_for_update().first()
+                if not pago or pago.estado_pago_id != Catalogos.estado_pago_id(ESTADO_PAGO_PENDIENTE):
+                    db.session.rollback()
+                    continue
+                ServicioAprobacionPagos.aprobar(pago, f"AUTO_PF_{datetime.now().timestamp()}")
+                aprobados.append(pago_id)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error auto-aprobando el pago {pago_id}: {e}")
+
+        if aprobados:
+            print(f"Pagos auto-aprobados: {aprobados}")
+        return aprobados
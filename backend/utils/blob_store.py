@@ -0,0 +1,220 @@
+# utils/blob_store.py
+from collections import namedtuple
+from contextlib import contextmanager
+import hashlib
+import io
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se serializa dentro del proceso
+    fcntl = None
+
+# Backend de almacenamiento de archivos (por ahora solo 'local')
+BLOB_STORE_BACKEND = os.getenv('BLOB_STORE_BACKEND', 'local')
+
+# Directorio raíz del almacenamiento local
+BLOB_STORE_PATH = os.getenv(
+    'BLOB_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'storage', 'blobs')
+)
+
+TAMANO_BLOQUE = 64 * 1024
+
+# Resultado de guardar: nuevo indica que el archivo no existía; version
+# identifica esta publicación (otra subida del mismo contenido la cambia)
+BlobGuardado = namedtuple('BlobGuardado', 'hash tamano nuevo version')
+
+
+class BlobNoEncontradoError(Exception):
+    """El hash pedido no existe en el almacenamiento"""
+
+
+class BlobDemasiadoGrandeError(Exception):
+    """El stream superó el límite de bytes; no se guardó nada"""
+
+
+class BlobStore:
+    """
+    Almacenamiento de archivos direccionado por contenido: la clave de
+    cada archivo es el sha256 de sus bytes, así dos subidas iguales
+    comparten un único archivo. Las filas de la base guardan solo el hash.
+    """
+
+    def guardar(self, stream, inicio=b'', limite=None):
+        """
+        Copia el stream por bloques, precedido por `inicio` (bytes ya leídos
+        del stream). Devuelve un BlobGuardado. Con `limite` corta apenas lo
+        supera y lanza BlobDemasiadoGrandeError.
+        """
+        raise NotImplementedError
+
+    def guardar_bytes(self, datos):
+        return self.guardar(io.BytesIO(datos))
+
+    def abrir(self, blob_hash):
+        """Archivo binario de solo lectura"""
+        raise NotImplementedError
+
+    def ruta(self, blob_hash):
+        """Ruta local si el backend la tiene (permite send_file con sendfile), si no None"""
+        return None
+
+    def existe(self, blob_hash):
+        raise NotImplementedError
+
+    def eliminar(self, blob_hash, version=None, anterior_a=None):
+        """
+        Borra el archivo. Con version, solo si nadie lo volvió a publicar
+        desde esa subida; con anterior_a (timestamp), solo si su última
+        publicación es anterior. Devuelve True si lo borró.
+        """
+        raise NotImplementedError
+
+    def listar(self, anterior_a):
+        """Hashes publicados por última vez antes de anterior_a (timestamp)"""
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Archivos en disco bajo raiz/ab/cd/<hash>. Cada subida publica su copia
+    con un rename atómico, aunque el contenido ya estuviera: así el inode y
+    la fecha del archivo identifican la última publicación, y un borrado que
+    compite con una subida del mismo contenido (todavía sin su fila en la
+    base) puede detectarla. Publicar y borrar se serializan por hash con un
+    flock, también entre workers.
+    """
+
+    _locks = {}
+    _locks_lock = threading.Lock()
+
+    def __init__(self, raiz):
+        self.raiz = raiz
+        os.makedirs(os.path.join(self.raiz, '.bloqueos'), exist_ok=True)
+
+    def _ruta(self, blob_hash):
+        if len(blob_hash) != 64 or not all(c in '0123456789abcdef' for c in blob_hash):
+            raise BlobNoEncontradoError(blob_hash)
+        return os.path.join(self.raiz, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    @contextmanager
+    def _bloqueo(self, blob_hash):
+        """Exclusión por prefijo del hash: entre threads y entre procesos"""
+        prefijo = blob_hash[:2]
+        with self._locks_lock:
+            lock = self._locks.setdefault(prefijo, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.raiz, '.bloqueos', prefijo), 'a') as archivo:
+                fcntl.flock(archivo, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(archivo, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _version(ruta):
+        try:
+            estado = os.stat(ruta)
+        except FileNotFoundError:
+            return None
+        return (estado.st_ino, estado.st_mtime_ns)
+
+    def guardar(self, stream, inicio=b'', limite=None):
+        # Se escribe a un temporal en el mismo disco y se renombra al final:
+        # nunca queda un blob a medias bajo su hash
+        hasher = hashlib.sha256()
+        tamano = 0
+        fd, temporal = tempfile.mkstemp(prefix='.subida-', dir=self.raiz)
+        try:
+            with os.fdopen(fd, 'wb') as destino:
+                bloque = inicio or stream.read(TAMANO_BLOQUE)
+                while bloque:
+                    tamano += len(bloque)
+                    if limite is not None and tamano > limite:
+                        raise BlobDemasiadoGrandeError(limite)
+                    hasher.update(bloque)
+                    destino.write(bloque)
+                    bloque = stream.read(TAMANO_BLOQUE)
+
+            blob_hash = hasher.hexdigest()
+            final = self._ruta(blob_hash)
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            with self._bloqueo(blob_hash):
+                nuevo = not os.path.exists(final)
+                os.replace(temporal, final)
+                version = self._version(final)
+            return BlobGuardado(blob_hash, tamano, nuevo, version)
+        except Exception:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+    def abrir(self, blob_hash):
+        try:
+            return open(self._ruta(blob_hash), 'rb')
+        except FileNotFoundError:
+            raise BlobNoEncontradoError(blob_hash)
+
+    def ruta(self, blob_hash):
+        ruta = self._ruta(blob_hash)
+        if not os.path.exists(ruta):
+            raise BlobNoEncontradoError(blob_hash)
+        return ruta
+
+    def existe(self, blob_hash):
+        try:
+            return os.path.exists(self._ruta(blob_hash))
+        except BlobNoEncontradoError:
+            return False
+
+    def eliminar(self, blob_hash, version=None, anterior_a=None):
+        try:
+            ruta = self._ruta(blob_hash)
+        except BlobNoEncontradoError:
+            return False
+        with self._bloqueo(blob_hash):
+            actual = self._version(ruta)
+            if actual is None:
+                return False
+            if version is not None and actual != version:
+                return False
+            if anterior_a is not None and actual[1] >= anterior_a * 1e9:
+                return False
+            os.remove(ruta)
+            return True
+
+    def listar(self, anterior_a):
+        for directorio, subdirectorios, archivos in os.walk(self.raiz):
+            # .bloqueos y temporales de subidas en curso
+            subdirectorios[:] = [d for d in subdirectorios if not d.startswith('.')]
+            for nombre in archivos:
+                if nombre.startswith('.') or len(nombre) != 64:
+                    continue
+                try:
+                    if os.stat(os.path.join(directorio, nombre)).st_mtime < anterior_a:
+                        yield nombre
+                except FileNotFoundError:
+                    continue
+
+
+_BACKENDS = {
+    'local': lambda: LocalBlobStore(BLOB_STORE_PATH),
+}
+
+_store = None
+
+
+def obtener_blob_store():
+    """Instancia única del backend configurado en BLOB_STORE_BACKEND"""
+    global _store
+    if _store is None:
+        if BLOB_STORE_BACKEND not in _BACKENDS:
+            raise ValueError(f"BLOB_STORE_BACKEND '{BLOB_STORE_BACKEND}' no soportado")
+        _store = _BACKENDS[BLOB_STORE_BACKEND]()
+    return _store
@@ -0,0 +1,88 @@
+# utils/capacidad_rubros.py
+from flask import g, has_app_context
+from models.base import db
+from models.solicitud import Solicitud
+from models.limite_rubro import LimiteRubro
+from utils.catalogos import Catalogos, ESTADO_SOLICITUD_APROBADA, ESTADO_SOLICITUD_PENDIENTE
+from sqlalchemy import func
+
+
+class CapacidadRubros:
+    """
+    Límites y conteos de solicitudes por rubro calculados de una vez: un
+    GROUP BY (rubro, estado) y una consulta de límites activos, en lugar de
+    tres consultas por cada fila o rubro. El resultado se guarda en flask.g
+    y se reutiliza durante todo el request.
+    """
+
+    @staticmethod
+    def obtener():
+        """
+        {rubro_id: {'limite', 'limite_id', 'aprobadas', 'pendientes', 'total'}}
+        Los rubros sin solicitudes ni límite no aparecen (ver para_rubro).
+        """
+        if has_app_context() and 'capacidad_rubros' in g:
+            return g.capacidad_rubros
+
+        capacidad = CapacidadRubros._calcular()
+        if has_app_context():
+            g.capacidad_rubros = capacidad
+        return capacidad
+
+    @staticmethod
+    def invalidar():
+        """Descarta lo calculado en este request (después de aprobar o cambiar límites)"""
+        if has_app_context():
+            g.pop('capacidad_rubros', None)
+
+    @staticmethod
+    def _calcular():
+        id_aprobada = Catalogos.estado_solicitud_id(ESTADO_SOLICITUD_APROBADA)
+        id_pendiente = Catalogos.estado_solicitud_id(ESTADO_SOLICITUD_PENDIENTE)
+
+        capacidad = {}
+
+        conteos = db.session.query(
+            Solicitud.rubro_id, Solicitud.estado_solicitud_id, func.count(Solicitud.solicitud_id)
+        ).group_by(Solicitud.rubro_id, Solicitud.estado_solicitud_id).all()
+        for rubro_id, estado_id, cantidad in conteos:
+            datos = capacidad.setdefault(rubro_id, CapacidadRubros._vacio())
+            datos['total'] += cantidad
+            if estado_id == id_aprobada:
+                datos['aprobadas'] += cantidad
+            elif estado_id == id_pendiente:
+                datos['pendientes'] += cantidad
+
+        # Si hubiera más de un límite activo para un rubro vale el primero
+        limites = db.session.query(
+            LimiteRubro.rubro_id, LimiteRubro.max_puestos, LimiteRubro.limite_id
+        ).filter(LimiteRubro.es_activo == True).order_by(LimiteRubro.limite_id).all()
+        for rubro_id, max_puestos, limite_id in limites:
+            datos = capacidad.setdefault(rubro_id, CapacidadRubros._vacio())
+            if datos['limite_id'] is None:
+                datos['limite'] = max_puestos
+                datos['limite_id'] = limite_id
+
+        return capacidad
+
+    @staticmethod
+    def _vacio():
+        return {'limite': None, 'limite_id': None, 'aprobadas': 0, 'pendientes': 0, 'total': 0}
+
+    @staticmethod
+    def para_rubro(rubro_id):
+        return CapacidadRubros.obtener().get(rubro_id) or CapacidadRubros._vacio()
+
+    @staticmethod
+    def limite_activo(rubro_id):
+        """(max_puestos, limite_id) o (None, None) si el rubro no tiene límite"""
+        datos = CapacidadRubros.para_rubro(rubro_id)
+        return datos['limite'], datos['limite_id']
+
+    @staticmethod
+    def verificar(rubro_id):
+        """(limite_alcanzado, aprobadas, limite); sin límite configurado: (False, 0, 0)"""
+        datos = CapacidadRubros.para_rubro(rubro_id)
+        if not datos['limite']:
+            return False, 0, 0
+        return datos['aprobadas'] >= datos['limite'], datos['aprobadas'], datos['limite']
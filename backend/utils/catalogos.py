@@ -0,0 +1,230 @@
+# utils/catalogos.py
+from models.base import db
+from models.estado_solicitud import EstadoSolicitud
+from models.estado_pago import EstadoPago
+from models.estado_notificacion import EstadoNotificacion
+from models.rol import Rol
+from models.rubro import Rubro
+from models.color import Color
+import os
+import threading
+import time
+
+# Red de seguridad entre procesos: cada worker recarga los catálogos cada
+# tanto aunque la invalidación explícita haya ocurrido en otro worker
+CATALOGOS_TTL_SEGUNDOS = float(os.getenv('CATALOGOS_TTL_SEGUNDOS', '60'))
+
+# Nombres de los estados que usa el código
+ESTADO_SOLICITUD_PENDIENTE = 'Pendiente'
+ESTADO_SOLICITUD_APROBADA = 'Aprobada'
+ESTADO_SOLICITUD_RECHAZADA = 'Rechazada'
+ESTADO_SOLICITUD_CANCELADA = 'Cancelada'
+ESTADO_SOLICITUD_PARCIAL = 'Parcialmente Asignada'
+
+# Estados a los que pasa una solicitud pagada, en orden de preferencia
+ESTADOS_SOLICITUD_PAGADA = ('Pagada', 'Completada', 'Parcialmente Asignada', 'Finalizada')
+
+ESTADO_PAGO_PENDIENTE = 'Pendiente'
+ESTADO_PAGO_PAGADO = 'Pagado'
+ESTADO_PAGO_RECHAZADO = 'Rechazado'
+ESTADO_PAGO_CANCELADO = 'Cancelado'
+
+# IDs con los que se sembró EstadoPago; se usan si la tabla no tiene el nombre
+ESTADOS_PAGO_IDS_HISTORICOS = {
+    ESTADO_PAGO_PENDIENTE: 1,
+    ESTADO_PAGO_PAGADO: 2,
+    ESTADO_PAGO_RECHAZADO: 3,
+    ESTADO_PAGO_CANCELADO: 4,
+}
+
+
+class EntradaCatalogo:
+    """Fila de una tabla de referencia, desacoplada de la sesión de SQLAlchemy"""
+
+    def __init__(self, id, nombre, es_activo=True, **extra):
+        self.id = id
+        self.nombre = nombre
+        self.es_activo = es_activo
+        for campo, valor in extra.items():
+            setattr(self, campo, valor)
+
+    def __repr__(self):
+        return f'<EntradaCatalogo {self.id} {self.nombre}>'
+
+
+class Catalogo:
+    """
+    Tabla de referencia en memoria con búsqueda por id y por nombre en O(1).
+    Se carga la primera vez que se usa, se recarga al invalidarla y, como
+    máximo, cada CATALOGOS_TTL_SEGUNDOS.
+    """
+
+    def __init__(self, nombre, cargar):
+        self.nombre = nombre
+        self._cargar = cargar
+        self._lock = threading.RLock()
+        # (por_id, por_nombre): se reemplaza entero, nunca se vacía
+        self._indices = None
+        self._cargado_en = None
+
+    def _vencido(self):
+        cargado_en = self._cargado_en
+        return cargado_en is None or time.monotonic() - cargado_en > CATALOGOS_TTL_SEGUNDOS
+
+    def _datos(self):
+        indices = self._indices
+        if indices is None or self._vencido():
+            with self._lock:
+                if self._indices is None or self._vencido():
+                    self.recargar()
+                indices = self._indices
+        return indices
+
+    def recargar(self):
+        with self._lock:
+            entradas = self._cargar()
+            # Se reemplazan los dos índices juntos: los lectores nunca ven uno a medias
+            self._indices = (
+                {e.id: e for e in entradas},
+                {e.nombre: e for e in entradas},
+            )
+            self._cargado_en = time.monotonic()
+
+    def invalidar(self):
+        """Vence el catálogo: el próximo lector lo recarga, los que ya leyeron siguen con el anterior"""
+        with self._lock:
+            self._cargado_en = None
+
+    def por_id(self, id):
+        return self._datos()[0].get(id)
+
+    def por_nombre(self, nombre):
+        return self._datos()[1].get(nombre)
+
+    def id_de(self, nombre, defecto=None):
+        entrada = self.por_nombre(nombre)
+        return entrada.id if entrada else defecto
+
+    def nombre_de(self, id, defecto=None):
+        entrada = self.por_id(id)
+        return entrada.nombre if entrada else defecto
+
+    def primero_de(self, nombres):
+        """Primera entrada que exista entre los nombres dados"""
+        for nombre in nombres:
+            entrada = self.por_nombre(nombre)
+            if entrada:
+                return entrada
+        return None
+
+    def buscar(self, **campos):
+        """Primera entrada con esos valores (recorre la tabla: son pocas filas)"""
+        for entrada in self.todos():
+            if all(getattr(entrada, campo, None) == valor for campo, valor in campos.items()):
+                return entrada
+        return None
+
+    def todos(self):
+        return list(self._datos()[0].values())
+
+    def activos(self):
+        return [e for e in self.todos() if e.es_activo]
+
+
+def _cargar_estados_solicitud():
+    return [
+        EntradaCatalogo(id_, nombre, es_activo)
+        for id_, nombre, es_activo in db.session.query(
+            EstadoSolicitud.estado_solicitud_id, EstadoSolicitud.nombre, EstadoSolicitud.es_activo
+        ).order_by(EstadoSolicitud.estado_solicitud_id).all()
+    ]
+
+
+def _cargar_estados_pago():
+    return [
+        EntradaCatalogo(id_, tipo, es_activo)
+        for id_, tipo, es_activo in db.session.query(
+            EstadoPago.estado_pago_id, EstadoPago.tipo, EstadoPago.es_activo
+        ).order_by(EstadoPago.estado_pago_id).all()
+    ]
+
+
+def _cargar_estados_notificacion():
+    return [
+        EntradaCatalogo(id_, nombre, es_activo)
+        for id_, nombre, es_activo in db.session.query(
+            EstadoNotificacion.estado_notificacion_id, EstadoNotificacion.nombre, EstadoNotificacion.es_activo
+        ).order_by(EstadoNotificacion.estado_notificacion_id).all()
+    ]
+
+
+def _cargar_roles():
+    return [
+        EntradaCatalogo(id_, tipo, es_activo)
+        for id_, tipo, es_activo in db.session.query(
+            Rol.rol_id, Rol.tipo, Rol.es_activo
+        ).order_by(Rol.rol_id).all()
+    ]
+
+
+def _cargar_colores():
+    return [
+        EntradaCatalogo(id_, nombre, es_activo, codigo_hex=codigo_hex)
+        for id_, nombre, codigo_hex, es_activo in db.session.query(
+            Color.color_id, Color.nombre, Color.codigo_hex, Color.es_activo
+        ).order_by(Color.color_id).all()
+    ]
+
+
+def _cargar_rubros():
+    filas = db.session.query(
+        Rubro.rubro_id, Rubro.tipo, Rubro.precio_parcela, Rubro.color_id, Rubro.es_activo, Color.codigo_hex
+    ).outerjoin(Color, Rubro.color_id == Color.color_id).order_by(Rubro.rubro_id).all()
+    return [
+        EntradaCatalogo(
+            rubro_id, tipo, es_activo,
+            precio_parcela=float(precio) if precio is not None else 0.0,
+            color_id=color_id,
+            codigo_hex=codigo_hex
+        )
+        for rubro_id, tipo, precio, color_id, es_activo, codigo_hex in filas
+    ]
+
+
+class Catalogos:
+    """
+    Registro de las tablas de referencia. Los estados y roles no cambian en
+    ejecución; rubros y colores los edita el administrador, por eso quien los
+    modifica llama a Catalogos.rubros.invalidar() después del commit.
+    """
+
+    estados_solicitud = Catalogo('EstadoSolicitud', _cargar_estados_solicitud)
+    estados_pago = Catalogo('EstadoPago', _cargar_estados_pago)
+    estados_notificacion = Catalogo('EstadoNotificacion', _cargar_estados_notificacion)
+    roles = Catalogo('Rol', _cargar_roles)
+    colores = Catalogo('Color', _cargar_colores)
+    rubros = Catalogo('Rubro', _cargar_rubros)
+
+    @classmethod
+    def todos(cls):
+        return [cls.estados_solicitud, cls.estados_pago, cls.estados_notificacion, cls.roles, cls.colores, cls.rubros]
+
+    @classmethod
+    def cargar(cls):
+        """Carga inicial (al arrancar la app, dentro del app context)"""
+        for catalogo in cls.todos():
+            catalogo.recargar()
+        print(f"Catálogos cargados: {', '.join(f'{c.nombre}({len(c.todos())})' for c in cls.todos())}")
+
+    @classmethod
+    def invalidar(cls):
+        for catalogo in cls.todos():
+            catalogo.invalidar()
+
+    @classmethod
+    def estado_solicitud_id(cls, nombre):
+        return cls.estados_solicitud.id_de(nombre)
+
+    @classmethod
+    def estado_pago_id(cls, nombre):
+        return cls.estados_pago.id_de(nombre, ESTADOS_PAGO_IDS_HISTORICOS.get(nombre))
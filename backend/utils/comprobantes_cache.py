@@ -0,0 +1,210 @@
+# utils/comprobantes_cache.py
+from concurrent.futures import ThreadPoolExecutor
+from flask import request, Response, current_app, send_file
+from models.base import db
+from models.pago import Pago
+from models.solicitud import Solicitud
+from models.artesano import Artesano
+from models.usuario import Usuario
+from models.rubro import Rubro
+from models.parcela import Parcela
+from models.solicitud_parcela import SolicitudParcela
+from utils.pdf_generator import generar_comprobante_pago
+import glob
+import io
+import os
+import tempfile
+import threading
+
+# Caché en disco de los comprobantes ya generados
+COMPROBANTES_CACHE_PATH = os.getenv(
+    'COMPROBANTES_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'storage', 'comprobantes')
+)
+
+# Tamaño máximo de la caché; al superarlo se borran los menos usados
+COMPROBANTES_CACHE_MAX_MB = float(os.getenv('COMPROBANTES_CACHE_MAX_MB', '200'))
+
+# Threads que generan comprobantes en segundo plano al aprobar un pago
+COMPROBANTES_WORKERS = int(os.getenv('COMPROBANTES_WORKERS', '1'))
+
+
+class CacheComprobantes:
+    """
+    Comprobantes PDF generados una sola vez por (pago_id,
+    fecha_actualizacion): cualquier cambio del pago cambia la clave y la
+    versión anterior se borra. Se guardan en disco y, cuando la caché
+    pasa de COMPROBANTES_CACHE_MAX_MB, se eliminan los de uso más
+    antiguo (cada lectura actualiza la fecha de modificación). Al
+    aprobarse un pago se generan en segundo plano.
+    """
+
+    _executor = None
+    _en_proceso = set()
+    _lock = threading.Lock()
+
+    @classmethod
+    def _pool(cls):
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=COMPROBANTES_WORKERS, thread_name_prefix='comprobantes'
+                )
+            return cls._executor
+
+    @staticmethod
+    def clave(pago):
+        version = pago.fecha_actualizacion or pago.fecha_creacion
+        return f"{pago.pago_id}-{version.strftime('%Y%m%d%H%M%S%f') if version else '0'}"
+
+    @staticmethod
+    def ruta(clave):
+        return os.path.join(COMPROBANTES_CACHE_PATH, f"{clave}.pdf")
+
+    @staticmethod
+    def _renderizar(pago):
+        """Arma el PDF con los datos actuales de la base"""
+        solicitud = Solicitud.query.get(pago.solicitud_id)
+        artesano = Artesano.query.get(solicitud.artesano_id)
+        usuario = Usuario.query.get(artesano.usuario_id)
+        rubro = Rubro.query.get(solicitud.rubro_id)
+        parcelas = [
+            {"parcela_id": parcela_id, "fila": fila, "columna": columna}
+            for parcela_id, fila, columna in db.session.query(
+                Parcela.parcela_id, Parcela.fila, Parcela.columna
+            ).join(
+                SolicitudParcela, SolicitudParcela.parcela_id == Parcela.parcela_id
+            ).filter(
+                SolicitudParcela.solicitud_id == solicitud.solicitud_id,
+                SolicitudParcela.activa == True
+            ).all()
+        ]
+        return generar_comprobante_pago(
+            pago=pago,
+            solicitud=solicitud,
+            artesano=artesano,
+            usuario=usuario,
+            rubro=rubro,
+            parcelas=parcelas
+        )
+
+    @classmethod
+    def obtener(cls, pago):
+        """Bytes del comprobante; lo genera y lo guarda si no está en caché"""
+        clave = cls.clave(pago)
+        destino = cls.ruta(clave)
+        try:
+            with open(destino, 'rb') as archivo:
+                datos = archivo.read()
+            os.utime(destino)
+            return datos
+        except FileNotFoundError:
+            pass
+
+        print(f"Generando comprobante para pago {pago.pago_id}...")
+        datos = cls._renderizar(pago)
+        cls._guardar(pago.pago_id, destino, datos)
+        return datos
+
+    @classmethod
+    def _guardar(cls, pago_id, destino, datos):
+        os.makedirs(COMPROBANTES_CACHE_PATH, exist_ok=True)
+        fd, temporal = tempfile.mkstemp(prefix='.comprobante-', dir=COMPROBANTES_CACHE_PATH)
+        try:
+            with os.fdopen(fd, 'wb') as salida:
+                salida.write(datos)
+            os.replace(temporal, destino)
+        except Exception:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+        # Versiones anteriores del mismo pago ya no se van a pedir
+        for ruta in glob.glob(os.path.join(COMPROBANTES_CACHE_PATH, f"{pago_id}-*.pdf")):
+            if ruta != destino:
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+        cls.recortar()
+
+    @staticmethod
+    def recortar(max_bytes=None):
+        """Borra los comprobantes usados hace más tiempo hasta quedar bajo el límite"""
+        if max_bytes is None:
+            max_bytes = COMPROBANTES_CACHE_MAX_MB * 1024 * 1024
+
+        archivos = []
+        total = 0
+        for entrada in os.scandir(COMPROBANTES_CACHE_PATH):
+            if not entrada.name.endswith('.pdf'):
+                continue
+            try:
+                stat = entrada.stat()
+            except FileNotFoundError:
+                continue
+            archivos.append((stat.st_mtime, stat.st_size, entrada.path))
+            total += stat.st_size
+        if total <= max_bytes:
+            return 0
+
+        borrados = 0
+        for _, tamano, ruta in sorted(archivos):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            total -= tamano
+            borrados += 1
+        print(f"Caché de comprobantes: {borrados} archivo(s) eliminados por tamaño")
+        return borrados
+
+    @classmethod
+    def encolar(cls, pago_id):
+        """Genera el comprobante en segundo plano (llamar después del commit); no espera"""
+        with cls._lock:
+            if pago_id in cls._en_proceso:
+                return
+            cls._en_proceso.add(pago_id)
+        app = current_app._get_current_object()
+        cls._pool().submit(cls._generar_en_segundo_plano, app, pago_id)
+
+    @classmethod
+    def _generar_en_segundo_plano(cls, app, pago_id):
+        with app.app_context():
+            try:
+                pago = Pago.query.get(pago_id)
+                if pago:
+                    cls.obtener(pago)
+            except Exception as e:
+                print(f"Error generando el comprobante del pago {pago_id}: {str(e)}")
+            finally:
+                db.session.remove()
+                with cls._lock:
+                    cls._en_proceso.discard(pago_id)
+
+    @classmethod
+    def enviar(cls, pago, filename):
+        """
+        Respuesta con el comprobante como descarga. ETag = clave del
+        comprobante; responde 304 a If-None-Match sin leer el archivo.
+        """
+        etag = cls.clave(pago)
+        if request.if_none_match.contains(etag):
+            respuesta = Response(status=304)
+            respuesta.set_etag(etag)
+        else:
+            respuesta = send_file(
+                io.BytesIO(cls.obtener(pago)),
+                as_attachment=True,
+                download_name=filename,
+                mimetype='application/pdf',
+                etag=etag,
+                conditional=True
+            )
+
+        # Datos personales: solo el navegador lo guarda, y revalida siempre
+        respuesta.headers['Cache-Control'] = 'private, no-cache'
+        return respuesta
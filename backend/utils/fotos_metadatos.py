@@ -0,0 +1,113 @@
+# utils/fotos_metadatos.py
+"""
+Copia de un JPG o PNG sin metadatos, recorriendo la estructura del archivo
+sin decodificar la imagen: se saltean los segmentos/chunks con EXIF (GPS,
+modelo de cámara), XMP, IPTC y comentarios y se copia el resto tal cual.
+Es lo que se envía cuando no hay una variante WEBP para servir.
+"""
+import struct
+
+from utils.blob_store import TAMANO_BLOQUE
+
+# JPEG: APP1 (EXIF y XMP), APP13 (IPTC / Photoshop) y COM
+MARCADORES_JPEG_DESCARTADOS = {0xE1, 0xED, 0xFE}
+# Marcadores sin longitud
+MARCADORES_JPEG_SUELTOS = {0x01, *range(0xD0, 0xD8)}
+SOS = 0xDA
+EOI = b'\xff\xd9'
+
+FIRMA_PNG = b'\x89PNG\r\n\x1a\n'
+CHUNKS_PNG_DESCARTADOS = {b'eXIf', b'tEXt', b'zTXt', b'iTXt'}
+
+
+class MetadatosInvalidosError(Exception):
+    """La estructura del archivo no es la de un JPG/PNG válido"""
+
+
+def _leer(archivo, cantidad):
+    datos = archivo.read(cantidad)
+    if len(datos) != cantidad:
+        raise MetadatosInvalidosError('archivo truncado')
+    return datos
+
+
+def _copiar(archivo, cantidad):
+    while cantidad:
+        bloque = _leer(archivo, min(cantidad, TAMANO_BLOQUE))
+        cantidad -= len(bloque)
+        yield bloque
+
+
+def _jpeg(archivo):
+    if _leer(archivo, 2) != b'\xff\xd8':
+        raise MetadatosInvalidosError('falta SOI')
+    yield b'\xff\xd8'
+
+    while True:
+        if _leer(archivo, 1) != b'\xff':
+            raise MetadatosInvalidosError('marcador inválido')
+        marcador = _leer(archivo, 1)[0]
+        while marcador == 0xFF:  # bytes de relleno
+            marcador = _leer(archivo, 1)[0]
+        if marcador in MARCADORES_JPEG_SUELTOS:
+            yield bytes((0xFF, marcador))
+            continue
+
+        cabecera = _leer(archivo, 2)
+        longitud = struct.unpack('>H', cabecera)[0] - 2
+        if longitud < 0:
+            raise MetadatosInvalidosError('segmento con longitud inválida')
+        if marcador in MARCADORES_JPEG_DESCARTADOS:
+            archivo.seek(longitud, 1)
+            continue
+
+        yield bytes((0xFF, marcador)) + cabecera
+        yield from _copiar(archivo, longitud)
+        if marcador == SOS:
+            break
+
+    # Datos comprimidos hasta EOI (0xFFD9 no aparece antes: los 0xFF van
+    # seguidos de 0x00 o de un RST). Lo que sigue a EOI (miniaturas MPF u
+    # otros agregados, que pueden llevar su propio EXIF) se descarta
+    anterior = b''
+    while True:
+        bloque = archivo.read(TAMANO_BLOQUE)
+        if not bloque:
+            raise MetadatosInvalidosError('falta EOI')
+        fin = (anterior[-1:] + bloque).find(EOI)
+        if fin != -1:
+            yield bloque[:fin + 2 - len(anterior[-1:])]
+            return
+        yield bloque
+        anterior = bloque
+
+
+def _png(archivo):
+    if _leer(archivo, 8) != FIRMA_PNG:
+        raise MetadatosInvalidosError('falta la firma PNG')
+    yield FIRMA_PNG
+
+    while True:
+        cabecera = _leer(archivo, 8)
+        longitud, tipo = struct.unpack('>I4s', cabecera)
+        if tipo in CHUNKS_PNG_DESCARTADOS:
+            archivo.seek(longitud + 4, 1)
+            continue
+        yield cabecera
+        # Datos y CRC
+        yield from _copiar(archivo, longitud + 4)
+        if tipo == b'IEND':
+            return
+
+
+def leer_sin_metadatos(archivo, extension):
+    """
+    Bloques del archivo (binario, con seek) sin sus metadatos. Lanza
+    MetadatosInvalidosError si la estructura no es válida; como es un
+    generador, puede hacerlo después de haber entregado algunos bloques.
+    """
+    if extension in ('jpg', 'jpeg'):
+        return _jpeg(archivo)
+    if extension == 'png':
+        return _png(archivo)
+    raise MetadatosInvalidosError(f'formato no soportado: {extension}')
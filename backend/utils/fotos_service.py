@@ -0,0 +1,310 @@
+# utils/fotos_service.py
+from flask import Response, request, send_file, stream_with_context
+from models.base import db
+from models.solicitud_foto import SolicitudFoto
+from utils.blob_store import obtener_blob_store, BlobDemasiadoGrandeError, TAMANO_BLOQUE
+from utils.fotos_variantes import VariantesFotos, VARIANTES
+from utils.fotos_metadatos import leer_sin_metadatos, MetadatosInvalidosError
+from sqlalchemy import event
+from sqlalchemy.orm import load_only
+import base64
+import hashlib
+import io
+import os
+import time
+
+MIMETYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+}
+
+# Firmas de los formatos aceptados: el tipo sale del contenido, no del nombre
+FIRMAS_IMAGEN = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+)
+
+# Límite por archivo y por request (5 fotos + campos del formulario)
+FOTOS_MAX_BYTES = int(os.getenv('FOTOS_MAX_MB', '10')) * 1024 * 1024
+FOTOS_MAX_REQUEST_BYTES = 5 * FOTOS_MAX_BYTES + 1024 * 1024
+
+# Las URLs de fotos llevan el hash del contenido: se cachean un año sin revalidar
+FOTOS_CACHE_SEGUNDOS = 365 * 24 * 3600
+
+# Filas por lote al migrar fotos base64 al blob store
+MIGRACION_FOTOS_LOTE = 50
+
+# Un blob publicado hace menos que esto puede ser de una subida cuya fila
+# todavía no se commiteó: no se borra aunque nadie lo referencie
+BLOB_GRACIA_SEGUNDOS = int(os.getenv('BLOB_GRACIA_SEGUNDOS', '600'))
+BLOB_BARRIDO_SEGUNDOS = 3600
+BLOB_BARRIDO_LOTE = 500
+
+# Clave en session.info de los blobs que escribió la transacción en curso
+_BLOBS_PENDIENTES = 'blobs_pendientes'
+
+
+class FotoInvalidaError(Exception):
+    """El archivo subido no es una imagen aceptada"""
+
+
+class FotoDemasiadoGrandeError(FotoInvalidaError):
+    """El archivo supera FOTOS_MAX_BYTES"""
+
+
+def detectar_extension(cabecera):
+    """'jpg' / 'png' según los primeros bytes, o None"""
+    for firma, extension in FIRMAS_IMAGEN:
+        if cabecera.startswith(firma):
+            return extension
+    return None
+
+
+class FotosService:
+    """Fotos de solicitudes guardadas en el blob store (la fila solo tiene el hash)"""
+
+    @staticmethod
+    def guardar(foto_file, solicitud_id):
+        """
+        Copia el upload al blob store por bloques y agrega la fila (sin
+        commit). El formato se detecta con el primer bloque y el límite de
+        tamaño se controla mientras se copia: la memoria usada no depende
+        del tamaño del archivo. Devuelve la SolicitudFoto o None si el
+        archivo está vacío. Lanza FotoInvalidaError / FotoDemasiadoGrandeError.
+        """
+        cabecera = foto_file.stream.read(TAMANO_BLOQUE)
+        if not cabecera:
+            return None
+
+        extension = detectar_extension(cabecera)
+        if not extension:
+            raise FotoInvalidaError(f'{foto_file.filename} no es una imagen JPG o PNG')
+
+        try:
+            blob = obtener_blob_store().guardar(
+                foto_file.stream, inicio=cabecera, limite=FOTOS_MAX_BYTES
+            )
+        except BlobDemasiadoGrandeError:
+            raise FotoDemasiadoGrandeError(
+                f'{foto_file.filename} supera el máximo de {FOTOS_MAX_BYTES // (1024 * 1024)} MB'
+            )
+        FotosService._registrar_blob_pendiente(blob)
+
+        foto = SolicitudFoto(
+            solicitud_id=solicitud_id,
+            blob_hash=blob.hash,
+            tamano=blob.tamano,
+            extension=extension
+        )
+        db.session.add(foto)
+        return foto
+
+    @staticmethod
+    def _registrar_blob_pendiente(blob):
+        """
+        Anota en la sesión el blob que escribió esta subida. Si la
+        transacción termina sin commit (otro archivo del mismo request era
+        inválido, falló el commit, etc.) se borra en _descartar_blobs. Solo
+        los blobs nuevos: uno que ya existía es de otra foto. Con el mismo
+        archivo dos veces vale la última publicación.
+        """
+        pendientes = db.session.info.setdefault(_BLOBS_PENDIENTES, {})
+        if blob.nuevo or blob.hash in pendientes:
+            pendientes[blob.hash] = blob.version
+
+    @staticmethod
+    def _confirmar_blobs(session):
+        session.info.pop(_BLOBS_PENDIENTES, None)
+
+    @staticmethod
+    def _descartar_blobs(session, transaccion):
+        """
+        Al terminar la transacción externa sin commit, borra los blobs que
+        escribió. Si otra subida volvió a publicar el mismo contenido desde
+        entonces, el archivo cambió de versión y se deja: es de ella.
+        """
+        if transaccion.parent is not None:
+            return
+        pendientes = session.info.pop(_BLOBS_PENDIENTES, None)
+        if not pendientes:
+            return
+        store = obtener_blob_store()
+        for blob_hash, version in pendientes.items():
+            try:
+                if store.eliminar(blob_hash, version=version):
+                    VariantesFotos.eliminar(blob_hash)
+            except Exception as e:
+                print(f"No se pudo borrar el blob {blob_hash} de una subida descartada: {str(e)}")
+
+    @staticmethod
+    def generar_variantes(fotos):
+        """Encola miniatura/media/original de las fotos (llamar después del commit)"""
+        VariantesFotos.encolar([foto.blob_hash for foto in fotos])
+
+    @staticmethod
+    def enviar(foto, variante='original'):
+        """
+        Respuesta con los bytes de una variante de la foto (desde disco usa
+        sendfile). Sin variante, o con una desconocida, se envía 'original':
+        el archivo re-codificado sin EXIF, como las URLs de get_image_url.
+        Si la variante todavía se está generando (en segundo plano, el
+        request no la espera) o no se puede generar, se envía el archivo
+        subido sin sus metadatos (GPS); en el primer caso sin caché, para
+        que el navegador pida la variante cuando esté. ETag = hash del
+        contenido; responde 304 a If-None-Match.
+        """
+        if variante not in VARIANTES:
+            variante = 'original'
+
+        ruta_variante = VariantesFotos.obtener(foto.blob_hash, variante) if foto.blob_hash else None
+        provisoria = False
+        if ruta_variante:
+            respuesta = send_file(
+                ruta_variante,
+                mimetype='image/webp',
+                etag=f"{foto.blob_hash}-{variante}",
+                conditional=True,
+                max_age=FOTOS_CACHE_SEGUNDOS
+            )
+        elif foto.blob_hash:
+            respuesta = FotosService._enviar_sin_metadatos(
+                obtener_blob_store().abrir(foto.blob_hash), foto.extension, foto.blob_hash
+            )
+            provisoria = not VariantesFotos.fallo(foto.blob_hash)
+        else:
+            # Foto todavía no migrada
+            datos = base64.b64decode(foto.base64)
+            respuesta = FotosService._enviar_sin_metadatos(
+                io.BytesIO(datos), foto.extension, hashlib.sha256(datos).hexdigest()
+            )
+
+        # Son fotos de usuarios autenticados: solo caché del navegador
+        respuesta.cache_control.public = False
+        respuesta.cache_control.private = True
+        if provisoria:
+            respuesta.cache_control.max_age = 0
+            respuesta.cache_control.no_cache = True
+        else:
+            respuesta.cache_control.immutable = True
+        return respuesta
+
+    @staticmethod
+    def _enviar_sin_metadatos(archivo, extension, blob_hash):
+        """Respuesta en streaming con el archivo subido menos su EXIF/XMP/IPTC"""
+        def bloques():
+            with archivo:
+                try:
+                    yield from leer_sin_metadatos(archivo, extension)
+                except MetadatosInvalidosError as e:
+                    # Nunca se completa con el archivo crudo: queda truncado
+                    print(f"Foto {blob_hash} con estructura inválida: {str(e)}")
+
+        respuesta = Response(
+            stream_with_context(bloques()),
+            mimetype=MIMETYPES.get(extension, 'application/octet-stream')
+        )
+        respuesta.set_etag(f"{blob_hash}-sin-metadatos")
+        respuesta.cache_control.max_age = FOTOS_CACHE_SEGUNDOS
+        respuesta.make_conditional(request)
+        if respuesta.status_code == 304:
+            archivo.close()
+        return respuesta
+
+    @staticmethod
+    def eliminar_blob_si_huerfano(blob_hash):
+        """
+        Borra el archivo si ninguna foto lo usa (llamar después del commit).
+        Si se publicó hace menos de BLOB_GRACIA_SEGUNDOS puede ser de una
+        subida del mismo contenido en curso: queda para barrer_blobs_huerfanos.
+        """
+        if not blob_hash:
+            return False
+        if SolicitudFoto.query.filter_by(blob_hash=blob_hash).first() is not None:
+            return False
+        if not obtener_blob_store().eliminar(blob_hash, anterior_a=time.time() - BLOB_GRACIA_SEGUNDOS):
+            return False
+        VariantesFotos.eliminar(blob_hash)
+        return True
+
+    @staticmethod
+    def barrer_blobs_huerfanos(lote=BLOB_BARRIDO_LOTE):
+        """
+        Borra los blobs que ninguna foto referencia y que no se publicaron
+        en los últimos BLOB_GRACIA_SEGUNDOS (los que dejaron los borrados
+        dentro de la gracia o un worker que murió a mitad de una subida).
+        Devuelve la cantidad borrada.
+        """
+        limite = time.time() - BLOB_GRACIA_SEGUNDOS
+        store = obtener_blob_store()
+        borrados = 0
+
+        def barrer(hashes):
+            usados = {h for (h,) in db.session.query(SolicitudFoto.blob_hash).filter(
+                SolicitudFoto.blob_hash.in_(hashes)
+            ).distinct()}
+            cantidad = 0
+            for blob_hash in hashes:
+                if blob_hash not in usados and store.eliminar(blob_hash, anterior_a=limite):
+                    VariantesFotos.eliminar(blob_hash)
+                    cantidad += 1
+            return cantidad
+
+        hashes = []
+        for blob_hash in store.listar(limite):
+            hashes.append(blob_hash)
+            if len(hashes) >= lote:
+                borrados += barrer(hashes)
+                hashes = []
+        if hashes:
+            borrados += barrer(hashes)
+        db.session.rollback()
+
+        if borrados:
+            print(f"Blobs huérfanos borrados: {borrados}")
+        return borrados
+
+    @staticmethod
+    def migrar_base64(lote=MIGRACION_FOTOS_LOTE):
+        """
+        Pasa las fotos base64 al blob store de a `lote` filas, con un commit
+        por lote para no cargar toda la tabla en memoria. Devuelve la
+        cantidad de fotos migradas.
+        """
+        store = obtener_blob_store()
+        migradas = 0
+        ultimo_id = 0
+        while True:
+            fotos = SolicitudFoto.query.options(
+                load_only(SolicitudFoto.foto_id, SolicitudFoto.base64)
+            ).filter(
+                SolicitudFoto.foto_id > ultimo_id,
+                SolicitudFoto.blob_hash.is_(None),
+                SolicitudFoto.base64.isnot(None)
+            ).order_by(SolicitudFoto.foto_id).limit(lote).all()
+            if not fotos:
+                break
+
+            for foto in fotos:
+                ultimo_id = foto.foto_id
+                try:
+                    datos = base64.b64decode(foto.base64)
+                except Exception as e:
+                    print(f"Foto {foto.foto_id} con base64 inválido, se deja como está: {e}")
+                    continue
+                blob = store.guardar_bytes(datos)
+                foto.blob_hash, foto.tamano = blob.hash, blob.tamano
+                foto.base64 = None
+                migradas += 1
+
+            db.session.commit()
+            db.session.expunge_all()
+            print(f"Fotos migradas al blob store: {migradas} (hasta foto_id {ultimo_id})")
+
+        return migradas
+
+
+# La sesión de Flask-SQLAlchemy es única por proceso: los eventos cubren
+# cualquier commit o rollback después de FotosService.guardar
+event.listen(db.session, 'after_commit', FotosService._confirmar_blobs)
+event.listen(db.session, 'after_transaction_end', FotosService._descartar_blobs)
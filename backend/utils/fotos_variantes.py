@@ -0,0 +1,131 @@
+# utils/fotos_variantes.py
+from PIL import Image, ImageOps
+from utils.blob_store import obtener_blob_store
+from utils.hilos_nativos import HilosNativos
+import os
+import tempfile
+
+# Lado mayor en píxeles de cada variante (None = tamaño original)
+VARIANTES = {
+    'miniatura': 320,
+    'media': 1024,
+    'original': None,
+}
+
+FORMATO_VARIANTES = 'WEBP'
+EXTENSION_VARIANTES = 'webp'
+CALIDAD_VARIANTES = int(os.getenv('FOTOS_VARIANTES_CALIDAD', '80'))
+
+# Caché en disco de las variantes generadas
+FOTOS_VARIANTES_PATH = os.getenv(
+    'FOTOS_VARIANTES_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'storage', 'variantes')
+)
+
+
+class VariantesFotos:
+    """
+    Miniatura, tamaño medio y original re-codificados en WEBP y sin EXIF
+    (se aplica la orientación antes de descartarlo). Se generan siempre en
+    segundo plano, en threads nativos (HilosNativos: Pillow suelta el GIL y
+    el loop de gevent sigue atendiendo): al subir la foto y, si alguien
+    pide una variante que todavía no está, en ese momento; mientras tanto
+    obtener devuelve None. Como la clave es el hash del archivo, fotos
+    repetidas comparten sus variantes.
+    """
+
+    # Solo se modifican con operaciones atómicas de set: dos greenlets o
+    # threads que encolan el mismo hash a la vez, a lo sumo generan dos veces
+    # (cada archivo se escribe con un rename atómico)
+    _en_proceso = set()
+    # Imágenes que Pillow no pudo procesar: no se reintentan en cada request
+    _fallidas = set()
+
+    @staticmethod
+    def ruta(blob_hash, variante):
+        return os.path.join(
+            FOTOS_VARIANTES_PATH, blob_hash[:2], f"{blob_hash}-{variante}.{EXTENSION_VARIANTES}"
+        )
+
+    @classmethod
+    def encolar(cls, blob_hashes):
+        """Programa la generación de todas las variantes; no espera"""
+        for blob_hash in set(filter(None, blob_hashes)):
+            if blob_hash in cls._en_proceso or blob_hash in cls._fallidas:
+                continue
+            cls._en_proceso.add(blob_hash)
+            HilosNativos.enviar(cls._generar_en_segundo_plano, blob_hash)
+
+    @classmethod
+    def _generar_en_segundo_plano(cls, blob_hash):
+        try:
+            cls.generar(blob_hash)
+        except Exception as e:
+            cls._fallidas.add(blob_hash)
+            print(f"Error generando variantes de {blob_hash}: {str(e)}")
+        finally:
+            cls._en_proceso.discard(blob_hash)
+
+    @classmethod
+    def generar(cls, blob_hash, variantes=None):
+        """Genera las variantes que falten a partir de una sola decodificación"""
+        pendientes = [
+            nombre for nombre in (variantes or VARIANTES)
+            if not os.path.exists(cls.ruta(blob_hash, nombre))
+        ]
+        if not pendientes:
+            return
+
+        with obtener_blob_store().abrir(blob_hash) as archivo:
+            with Image.open(archivo) as imagen:
+                imagen = ImageOps.exif_transpose(imagen)
+                if imagen.mode not in ('RGB', 'RGBA'):
+                    imagen = imagen.convert('RGBA' if 'transparency' in imagen.info else 'RGB')
+
+                # De mayor a menor: cada reducción parte de la anterior
+                pendientes.sort(key=lambda nombre: -(VARIANTES[nombre] or 10 ** 9))
+                for nombre in pendientes:
+                    lado = VARIANTES[nombre]
+                    if lado:
+                        imagen.thumbnail((lado, lado), Image.LANCZOS)
+                    cls._escribir(imagen, cls.ruta(blob_hash, nombre))
+
+    @staticmethod
+    def _escribir(imagen, destino):
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        fd, temporal = tempfile.mkstemp(prefix='.variante-', dir=os.path.dirname(destino))
+        try:
+            with os.fdopen(fd, 'wb') as salida:
+                # Sin exif=: el archivo resultante no lleva metadatos
+                imagen.save(salida, FORMATO_VARIANTES, quality=CALIDAD_VARIANTES, method=4)
+            os.replace(temporal, destino)
+        except Exception:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+    @classmethod
+    def eliminar(cls, blob_hash):
+        cls._fallidas.discard(blob_hash)
+        for nombre in VARIANTES:
+            try:
+                os.remove(cls.ruta(blob_hash, nombre))
+            except FileNotFoundError:
+                pass
+
+    @classmethod
+    def obtener(cls, blob_hash, variante):
+        """
+        Ruta de la variante si ya está generada. Si no, encola la generación
+        y devuelve None: el request no espera a Pillow.
+        """
+        destino = cls.ruta(blob_hash, variante)
+        if os.path.exists(destino):
+            return destino
+        cls.encolar([blob_hash])
+        return None
+
+    @classmethod
+    def fallo(cls, blob_hash):
+        """True si la imagen no se pudo procesar (no va a tener variantes)"""
+        return blob_hash in cls._fallidas
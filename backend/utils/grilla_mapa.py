@@ -0,0 +1,121 @@
+# utils/grilla_mapa.py
+from models.base import db
+from models.parcela import Parcela
+from models.solicitud_parcela import SolicitudParcela
+from models.reserva_parcela import ReservaParcela
+from utils.ocupacion_parcelas import OcupacionParcelas
+from sqlalchemy import insert, or_
+
+# Filas por INSERT al crear parcelas (un mapa de 100x100 son 10.000)
+GRILLA_LOTE_INSERCION = 1000
+
+
+class ParcelasOcupadasError(Exception):
+    """Al reducir el mapa quedarían afuera parcelas ocupadas en la temporada actual"""
+
+    def __init__(self, ocupadas):
+        super().__init__('No se puede reducir el mapa: hay parcelas ocupadas.')
+        self.ocupadas = ocupadas
+
+
+class ParcelasConHistorialError(Exception):
+    """
+    Al reducir el mapa se borrarían parcelas con asignaciones de otras
+    temporadas o liberadas, que son el historial de participación
+    """
+
+    def __init__(self, parcelas):
+        super().__init__('No se puede reducir el mapa: hay parcelas con asignaciones de temporadas anteriores.')
+        self.parcelas = parcelas
+
+
+class GrillaMapa:
+    """
+    Cambio de tamaño del mapa por diferencia de conjuntos: se leen las
+    celdas (fila, columna) existentes en una consulta, se borran las que
+    quedan fuera con un DELETE y se insertan las que faltan por lotes. La
+    verificación de ocupación y la de historial de las celdas que se
+    eliminan son una consulta cada una. No hace commit.
+    """
+
+    @staticmethod
+    def _fuera_de(filas, columnas):
+        return or_(Parcela.fila > filas, Parcela.columna > columnas)
+
+    @staticmethod
+    def reconfigurar(mapa, filas, columnas):
+        """
+        Deja el mapa con exactamente filas x columnas parcelas. Devuelve
+        {'creadas', 'eliminadas'}; lanza ParcelasOcupadasError si alguna de
+        las parcelas que se eliminan está ocupada en la temporada actual y
+        ParcelasConHistorialError si alguna tiene asignaciones de otras
+        temporadas o liberadas (no se borra historial).
+        """
+        fuera = GrillaMapa._fuera_de(filas, columnas)
+
+        ocupadas = OcupacionParcelas.consulta(
+            Parcela.parcela_id, Parcela.fila, Parcela.columna, mapa_id=mapa.mapa_id
+        ).filter(fuera).order_by(Parcela.fila, Parcela.columna).all()
+
+        if ocupadas:
+            raise ParcelasOcupadasError([
+                {'parcela_id': parcela_id, 'fila': fila, 'columna': columna}
+                for parcela_id, fila, columna in ocupadas
+            ])
+
+        sobrantes = db.session.query(Parcela.parcela_id).filter(Parcela.mapa_id == mapa.mapa_id, fuera)
+
+        # Lo que queda en Solicitud_Parcela son asignaciones de temporadas
+        # anteriores o liberadas (las actuales ya se rechazaron arriba)
+        con_historial = db.session.query(Parcela.parcela_id, Parcela.fila, Parcela.columna).filter(
+            Parcela.mapa_id == mapa.mapa_id, fuera,
+            Parcela.parcela_id.in_(db.session.query(SolicitudParcela.parcela_id))
+        ).order_by(Parcela.fila, Parcela.columna).all()
+
+        if con_historial:
+            raise ParcelasConHistorialError([
+                {'parcela_id': parcela_id, 'fila': fila, 'columna': columna}
+                for parcela_id, fila, columna in con_historial
+            ])
+
+        # Las retenciones de pago sobre parcelas que desaparecen se descartan
+        ReservaParcela.query.filter(
+            ReservaParcela.parcela_id.in_(sobrantes.scalar_subquery())
+        ).delete(synchronize_session=False)
+
+        eliminadas = Parcela.query.filter(
+            Parcela.mapa_id == mapa.mapa_id, fuera
+        ).delete(synchronize_session=False)
+
+        existentes = set(
+            db.session.query(Parcela.fila, Parcela.columna).filter(Parcela.mapa_id == mapa.mapa_id).all()
+        )
+        deseadas = {
+            (fila, columna)
+            for fila in range(1, filas + 1)
+            for columna in range(1, columnas + 1)
+        }
+        faltantes = sorted(deseadas - existentes)
+        GrillaMapa._insertar(mapa.mapa_id, faltantes)
+
+        # Las parcelas borradas por DELETE masivo pueden seguir en la sesión
+        db.session.expire_all()
+        mapa.cant_total_filas = filas
+        mapa.cant_total_columnas = columnas
+
+        return {'creadas': len(faltantes), 'eliminadas': eliminadas}
+
+    @staticmethod
+    def _insertar(mapa_id, celdas):
+        for inicio in range(0, len(celdas), GRILLA_LOTE_INSERCION):
+            db.session.execute(insert(Parcela), [
+                {
+                    'fila': fila,
+                    'columna': columna,
+                    'habilitada': True,
+                    'mapa_id': mapa_id,
+                    'rubro_id': None,
+                    'tipo_parcela_id': None,
+                }
+                for fila, columna in celdas[inicio:inicio + GRILLA_LOTE_INSERCION]
+            ])
@@ -0,0 +1,61 @@
+# utils/hilos_nativos.py
+"""
+Trabajo de CPU fuera del loop de eventos. Con los workers gevent de
+gunicorn.conf.py, threading está parcheado: un ThreadPoolExecutor crea
+greenlets y el trabajo bloquea a todos los requests del worker. Acá se usa
+el pool de threads nativos del hub de gevent cuando gevent parcheó
+threading, y un ThreadPoolExecutor común si no (flask run, tests, scripts).
+Solo sirve para código que suelta el GIL (Pillow, hashlib, etc.).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+# Tamaño del pool cuando no hay gevent (con gevent se ajusta el del hub)
+HILOS_NATIVOS = int(os.getenv('HILOS_NATIVOS', '4'))
+
+
+def gevent_activo():
+    """True si gevent parcheó threading (workers gevent de gunicorn)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class HilosNativos:
+    """Pool de threads del sistema operativo, compartido por el proceso"""
+
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _pool(cls):
+        if gevent_activo():
+            import gevent
+            pool = gevent.get_hub().threadpool
+            if pool.maxsize < HILOS_NATIVOS:
+                pool.maxsize = HILOS_NATIVOS
+            return pool
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=HILOS_NATIVOS, thread_name_prefix='nativo')
+            return cls._executor
+
+    @classmethod
+    def ejecutar(cls, funcion, *args):
+        """Corre funcion en un thread nativo y espera el resultado (con gevent, solo espera este greenlet)"""
+        pool = cls._pool()
+        if isinstance(pool, ThreadPoolExecutor):
+            return pool.submit(funcion, *args).result()
+        return pool.spawn(funcion, *args).get()
+
+    @classmethod
+    def enviar(cls, funcion, *args):
+        """Corre funcion en un thread nativo sin esperar; los errores los maneja funcion"""
+        pool = cls._pool()
+        if isinstance(pool, ThreadPoolExecutor):
+            pool.submit(funcion, *args)
+        else:
+            pool.spawn(funcion, *args)
@@ -0,0 +1,87 @@
+# utils/mapa_eventos.py
+from collections import deque
+import json
+import os
+import threading
+import time
+
+# Cada cuánto se manda un comentario para mantener viva la conexión
+MAPA_STREAM_HEARTBEAT_SEGUNDOS = float(os.getenv('MAPA_STREAM_HEARTBEAT_SEGUNDOS', '15'))
+
+# Eventos recientes que se guardan para clientes que reconectan con Last-Event-ID
+MAPA_STREAM_BUFFER = int(os.getenv('MAPA_STREAM_BUFFER', '256'))
+
+
+class MapaEventosHub:
+    """
+    Fan-out de cambios del mapa para los clientes SSE de /mapa/stream.
+
+    Cada evento se serializa una sola vez al publicarse y todos los clientes
+    leen el mismo buffer compartido: un cliente esperando no consume CPU ni
+    consultas a la base, solo espera en la condición hasta el próximo evento
+    o heartbeat. Con workers gevent (gunicorn.conf.py) cada conexión es un
+    greenlet, no un thread. El hub es del proceso: los cambios hechos en
+    otros workers los publica acá MapaRelay.
+    """
+
+    _condicion = threading.Condition()
+    _eventos = deque(maxlen=MAPA_STREAM_BUFFER)
+    _seq = 0
+    _suscriptores = 0
+
+    @classmethod
+    def hay_suscriptores(cls):
+        return cls._suscriptores > 0
+
+    @classmethod
+    def publicar(cls, evento, datos):
+        """Serializa el evento una vez y despierta a todos los clientes"""
+        with cls._condicion:
+            cls._seq += 1
+            mensaje = (
+                f"id: {cls._seq}\n"
+                f"event: {evento}\n"
+                f"data: {json.dumps(datos, ensure_ascii=False, separators=(',', ':'))}\n\n"
+            ).encode('utf-8')
+            cls._eventos.append((cls._seq, mensaje))
+            cls._condicion.notify_all()
+
+    @classmethod
+    def _pendientes(cls, ultimo_id):
+        """Eventos posteriores a ultimo_id, o None si el buffer ya no los tiene"""
+        if not cls._eventos or ultimo_id >= cls._seq:
+            return []
+        if ultimo_id < cls._eventos[0][0] - 1:
+            return None
+        return [(seq, mensaje) for seq, mensaje in cls._eventos if seq > ultimo_id]
+
+    @classmethod
+    def escuchar(cls, ultimo_id=None):
+        """Generador de mensajes SSE para un cliente"""
+        with cls._condicion:
+            cls._suscriptores += 1
+            if ultimo_id is None or ultimo_id > cls._seq:
+                ultimo_id = cls._seq
+
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                with cls._condicion:
+                    pendientes = cls._pendientes(ultimo_id)
+                    if pendientes == []:
+                        cls._condicion.wait(timeout=MAPA_STREAM_HEARTBEAT_SEGUNDOS)
+                        pendientes = cls._pendientes(ultimo_id)
+                    seq_actual = cls._seq
+
+                if pendientes is None:
+                    # El cliente se perdió eventos: debe recargar el mapa completo
+                    ultimo_id = seq_actual
+                    yield f"id: {seq_actual}\nevent: resync\ndata: {{}}\n\n".encode('utf-8')
+                elif pendientes:
+                    ultimo_id = pendientes[-1][0]
+                    yield b"".join(mensaje for _, mensaje in pendientes)
+                else:
+                    yield f": ping {int(time.time())}\n\n".encode('utf-8')
+        finally:
+            with cls._condicion:
+                cls._suscriptores -= 1
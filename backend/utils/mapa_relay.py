@@ -0,0 +1,114 @@
+# utils/mapa_relay.py
+from models.base import db
+from models.mapa_evento import MapaEvento
+from utils.mapa_service import MapaService, MapaCache
+from sqlalchemy import func
+from collections import deque
+from datetime import datetime, timedelta
+import json
+import os
+import threading
+import traceback
+
+# Cada cuánto lee cada worker los cambios anunciados por los demás (0 = no lee)
+MAPA_RELAY_POLL_SEGUNDOS = float(os.getenv('MAPA_RELAY_POLL_SEGUNDOS', '1'))
+
+# Los IDs autoincrementales pueden confirmarse fuera de orden: se relee este
+# margen por debajo del último visto y se saltean los ya aplicados
+MAPA_RELAY_MARGEN_IDS = 50
+
+# Horas que se conservan los eventos
+MAPA_EVENTOS_RETENCION_HORAS = int(os.getenv('MAPA_EVENTOS_RETENCION_HORAS', '24'))
+MAPA_EVENTOS_LIMPIEZA_SEGUNDOS = 3600
+
+
+class MapaRelay:
+    """
+    Lleva a este proceso los cambios del mapa hechos en otros workers. El
+    worker que escribe aplica el cambio localmente y lo anuncia en
+    Mapa_Evento (MapaService.anunciar); acá un thread por proceso lee los
+    eventos nuevos con una consulta por el índice primario, invalida la
+    cache local y reenvía las celdas a los clientes SSE conectados a este
+    worker. Los eventos propios se saltean: ya se aplicaron al escribir.
+    """
+
+    _thread = None
+    _detener = threading.Event()
+    _ultimo = None
+    _aplicados = deque(maxlen=1000)
+
+    @classmethod
+    def iniciar(cls, app):
+        if MAPA_RELAY_POLL_SEGUNDOS <= 0:
+            print("Relay de eventos del mapa desactivado (MAPA_RELAY_POLL_SEGUNDOS=0)")
+            return
+        if cls._thread and cls._thread.is_alive():
+            return
+
+        cls._detener.clear()
+        cls._thread = threading.Thread(
+            target=cls._bucle, args=(app,), name='mapa-relay', daemon=True
+        )
+        cls._thread.start()
+        print(f"Relay de eventos del mapa iniciado (cada {MAPA_RELAY_POLL_SEGUNDOS}s)")
+
+    @classmethod
+    def detener(cls):
+        cls._detener.set()
+
+    @classmethod
+    def _bucle(cls, app):
+        while not cls._detener.is_set():
+            with app.app_context():
+                try:
+                    cls.aplicar_pendientes()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error en el relay de eventos del mapa: {str(e)}")
+                    traceback.print_exc()
+                finally:
+                    db.session.remove()
+            cls._detener.wait(MAPA_RELAY_POLL_SEGUNDOS)
+
+    @classmethod
+    def aplicar_pendientes(cls):
+        """Aplica los eventos de otros workers posteriores al último visto. Devuelve cuántos"""
+        if cls._ultimo is None:
+            # Al arrancar la cache está vacía: solo interesa lo que venga
+            cls._ultimo = db.session.query(func.max(MapaEvento.evento_id)).scalar() or 0
+            cls._aplicados.extend(
+                evento_id for (evento_id,) in db.session.query(MapaEvento.evento_id).filter(
+                    MapaEvento.evento_id > cls._ultimo - MAPA_RELAY_MARGEN_IDS
+                )
+            )
+            return 0
+
+        eventos = MapaEvento.query.filter(
+            MapaEvento.evento_id > cls._ultimo - MAPA_RELAY_MARGEN_IDS
+        ).order_by(MapaEvento.evento_id).all()
+
+        aplicados = 0
+        for evento in eventos:
+            if evento.evento_id in cls._aplicados:
+                continue
+            cls._aplicados.append(evento.evento_id)
+            cls._ultimo = max(cls._ultimo, evento.evento_id)
+            if evento.origen == MapaCache.epoca:
+                continue
+
+            if evento.parcela_ids is None:
+                MapaService.aplicar_invalidacion()
+            else:
+                MapaService.aplicar_cambios(json.loads(evento.parcela_ids), evento.tipo)
+            aplicados += 1
+        return aplicados
+
+    @staticmethod
+    def purgar():
+        """Borra los eventos de más de MAPA_EVENTOS_RETENCION_HORAS"""
+        limite = datetime.utcnow() - timedelta(hours=MAPA_EVENTOS_RETENCION_HORAS)
+        borrados = MapaEvento.query.filter(
+            MapaEvento.fecha < limite
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return borrados
@@ -0,0 +1,419 @@
+# utils/mapa_service.py
+from flask import request, Response
+from models.base import db
+from models.mapa import Mapa
+from models.parcela import Parcela
+from models.solicitud import Solicitud
+from models.solicitud_parcela import SolicitudParcela
+from models.artesano import Artesano
+from models.reserva_parcela import ReservaParcela
+from models.mapa_evento import MapaEvento
+from utils.mapa_eventos import MapaEventosHub
+from utils.ocupacion_parcelas import OcupacionParcelas
+from utils.catalogos import Catalogos
+from sqlalchemy import insert
+from collections import deque
+from datetime import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+COLOR_POR_DEFECTO = '#CCCCCC'
+
+# Los cambios hechos por otro worker llegan por Mapa_Evento (MapaRelay); el TTL
+# acota cuánto puede durar un snapshot viejo si ese aviso se pierde.
+MAPA_CACHE_TTL_SEGUNDOS = float(os.getenv('MAPA_CACHE_TTL_SEGUNDOS', '5'))
+
+# Cantidad de transiciones de parcelas que se guardan para /mapa/cambios
+MAPA_CAMBIOS_MAX = int(os.getenv('MAPA_CAMBIOS_MAX', '5000'))
+
+# Tipos de transición registrados en el log de cambios
+CAMBIO_OCUPADA = 'ocupada'
+CAMBIO_LIBERADA = 'liberada'
+CAMBIO_RESERVADA = 'reservada'
+CAMBIO_HABILITADA = 'habilitada'
+CAMBIO_DESHABILITADA = 'deshabilitada'
+CAMBIO_RUBRO = 'rubro'
+CAMBIO_DATOS = 'datos'
+
+
+class MapaSnapshot:
+    """
+    Payload del mapa ya serializado, con su versión y ETag. El ETag es el
+    hash del contenido sin 'version' ni 'epoca': es el mismo en todos los
+    workers y no cambia si una escritura no alteró el mapa. Por eso es
+    débil (el cuerpo difiere en esos dos campos).
+    """
+
+    def __init__(self, version, body, etag, creado_en):
+        self.version = version
+        self.body = body
+        self.etag = etag
+        self.creado_en = creado_en
+
+
+class MapaCache:
+    """
+    Cache en proceso de los snapshots del mapa (vista pública y vista admin)
+    y log circular de transiciones de parcelas. Cada escritura sobre parcelas
+    u ocupación incrementa la versión, lo que descarta los snapshots anteriores.
+    """
+
+    _lock = threading.Lock()
+    _version = 1
+    _snapshots = {}
+
+    # Identifica esta instancia del proceso: las versiones de otro worker o de
+    # un arranque anterior no son comparables con las de este
+    epoca = uuid.uuid4().hex[:12]
+
+    # (version, parcela_id, tipo) de las últimas transiciones
+    _cambios = deque(maxlen=MAPA_CAMBIOS_MAX)
+    # Versión más vieja desde la que el log permite reconstruir los cambios
+    _version_base = 1
+
+    @classmethod
+    def version_actual(cls):
+        return cls._version
+
+    @classmethod
+    def invalidar(cls, parcela_ids=None, tipo=CAMBIO_DATOS):
+        """
+        Incrementa la versión. Con parcela_ids registra la transición de esas
+        parcelas; sin ellas (cambio estructural) vacía el log y los clientes
+        atrasados reciben el mapa completo.
+        """
+        with cls._lock:
+            cls._version += 1
+            cls._snapshots = {}
+
+            if parcela_ids is None:
+                cls._cambios.clear()
+                cls._version_base = cls._version
+                return cls._version
+
+            for parcela_id in parcela_ids:
+                if len(cls._cambios) == cls._cambios.maxlen:
+                    # La entrada que sale deja incompleta a su versión
+                    cls._version_base = cls._cambios[0][0]
+                cls._cambios.append((cls._version, parcela_id, tipo))
+            return cls._version
+
+    @classmethod
+    def cambios_desde(cls, desde):
+        """
+        Devuelve (version, {parcela_id: tipo}) con lo cambiado después de
+        'desde', o (version, None) si el log ya no alcanza para reconstruirlo.
+        """
+        with cls._lock:
+            version = cls._version
+            if desde > version or desde < cls._version_base:
+                return version, None
+
+            cambios = {}
+            for version_cambio, parcela_id, tipo in cls._cambios:
+                if version_cambio > desde:
+                    cambios[parcela_id] = tipo
+            return version, cambios
+
+    @classmethod
+    def obtener(cls, clave):
+        snapshot = cls._snapshots.get(clave)
+        if not snapshot or snapshot.version != cls._version:
+            return None
+        if time.monotonic() - snapshot.creado_en > MAPA_CACHE_TTL_SEGUNDOS:
+            return None
+        return snapshot
+
+    @classmethod
+    def guardar(cls, clave, snapshot):
+        with cls._lock:
+            # Si hubo una escritura mientras se armaba, no se cachea
+            if snapshot.version == cls._version:
+                cls._snapshots[clave] = snapshot
+
+
+class MapaService:
+    """
+    Motor de ocupación del mapa: arma el payload completo de parcelas con una
+    cantidad constante de consultas (parcelas, rubros+colores y ocupación),
+    sin importar el tamaño de la grilla.
+    """
+
+    @staticmethod
+    def obtener_rubros_info():
+        """Devuelve {rubro_id: {'tipo', 'color'}} desde el catálogo de rubros"""
+        return {
+            rubro.id: {'tipo': rubro.nombre, 'color': rubro.codigo_hex or COLOR_POR_DEFECTO}
+            for rubro in Catalogos.rubros.todos()
+        }
+
+    @staticmethod
+    def obtener_ocupacion(mapa_id, parcela_ids=None, incluir_artesano=False):
+        """
+        Devuelve {parcela_id: artesano_info | None} para las parcelas del mapa
+        ocupadas en la temporada actual (ver OcupacionParcelas), en una sola
+        consulta.
+        """
+        if parcela_ids is not None and not parcela_ids:
+            return {}
+
+        columnas = [SolicitudParcela.parcela_id]
+        if incluir_artesano:
+            columnas += [Artesano.artesano_id, Artesano.nombre, Artesano.dni, Artesano.telefono]
+
+        query = OcupacionParcelas.consulta(*columnas, mapa_id=mapa_id, parcela_ids=parcela_ids)
+
+        if incluir_artesano:
+            query = query.join(
+                Solicitud, SolicitudParcela.solicitud_id == Solicitud.solicitud_id
+            ).outerjoin(Artesano, Solicitud.artesano_id == Artesano.artesano_id)
+
+        ocupacion = {}
+        for fila in query.all():
+            if fila.parcela_id in ocupacion:
+                continue
+            artesano_info = None
+            if incluir_artesano and fila.artesano_id:
+                artesano_info = {
+                    'artesano_id': fila.artesano_id,
+                    'nombre': fila.nombre,
+                    'dni': fila.dni,
+                    'telefono': fila.telefono
+                }
+            ocupacion[fila.parcela_id] = artesano_info
+
+        return ocupacion
+
+    @staticmethod
+    def obtener_reservas(parcela_ids=None):
+        """IDs de parcelas con una retención de pago vigente, en una sola consulta"""
+        query = db.session.query(ReservaParcela.parcela_id).filter(
+            ReservaParcela.expira_en > datetime.utcnow()
+        )
+        if parcela_ids is not None:
+            if not parcela_ids:
+                return set()
+            query = query.filter(ReservaParcela.parcela_id.in_(parcela_ids))
+        return {parcela_id for (parcela_id,) in query.all()}
+
+    @staticmethod
+    def construir_parcelas(mapa_id, parcela_ids=None, admin=False):
+        """
+        Serializa las parcelas del mapa (o solo las indicadas en parcela_ids)
+        con su rubro, color y estado de ocupación.
+        """
+        query = Parcela.query.filter_by(mapa_id=mapa_id)
+        if parcela_ids is not None:
+            if not parcela_ids:
+                return []
+            query = query.filter(Parcela.parcela_id.in_(parcela_ids))
+
+        parcelas = query.order_by(Parcela.fila, Parcela.columna).all()
+        rubros_info = MapaService.obtener_rubros_info()
+        ocupacion = MapaService.obtener_ocupacion(
+            mapa_id, parcela_ids=parcela_ids, incluir_artesano=admin
+        )
+        reservas = MapaService.obtener_reservas(parcela_ids=parcela_ids)
+
+        parcelas_data = []
+        for parcela in parcelas:
+            parcela_data = {
+                'parcela_id': parcela.parcela_id,
+                'fila': parcela.fila,
+                'columna': parcela.columna,
+                'habilitada': parcela.habilitada,
+                'rubro_id': parcela.rubro_id
+            }
+
+            if admin:
+                parcela_data['mapa_id'] = parcela.mapa_id
+                parcela_data['tipo_parcela_id'] = parcela.tipo_parcela_id
+
+            rubro_info = rubros_info.get(parcela.rubro_id)
+            if rubro_info:
+                parcela_data['rubro_info'] = dict(rubro_info)
+
+            parcela_data['ocupada'] = parcela.parcela_id in ocupacion
+            parcela_data['reservada'] = (
+                not parcela_data['ocupada'] and parcela.parcela_id in reservas
+            )
+
+            if admin and ocupacion.get(parcela.parcela_id):
+                parcela_data['artesano_info'] = ocupacion[parcela.parcela_id]
+
+            parcelas_data.append(parcela_data)
+
+        return parcelas_data
+
+    @staticmethod
+    def construir_payload(mapa, admin=False):
+        """Payload completo de GET /mapa/parcelas y /admin/parcelas"""
+        parcelas_data = MapaService.construir_parcelas(mapa.mapa_id, admin=admin)
+
+        return {
+            'parcelas': parcelas_data,
+            'mapa': {
+                'mapa_id': mapa.mapa_id,
+                'cant_total_filas': mapa.cant_total_filas,
+                'cant_total_columnas': mapa.cant_total_columnas
+            },
+            'total': len(parcelas_data)
+        }
+
+    @staticmethod
+    def obtener_snapshot(admin=False):
+        """
+        Devuelve el snapshot serializado del mapa para la versión actual,
+        armándolo solo si no está en cache. None si no hay mapa configurado.
+        """
+        clave = 'admin' if admin else 'publico'
+        snapshot = MapaCache.obtener(clave)
+        if snapshot:
+            return snapshot
+
+        version = MapaCache.version_actual()
+        mapa = Mapa.query.first()
+        if not mapa:
+            return None
+
+        payload = MapaService.construir_payload(mapa, admin=admin)
+        contenido = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        etag = hashlib.sha1(contenido).hexdigest()
+
+        # version y epoca se agregan al final sin volver a serializar las parcelas
+        control = json.dumps({'version': version, 'epoca': MapaCache.epoca}, separators=(',', ':')).encode('utf-8')
+        body = contenido[:-1] + b',' + control[1:]
+
+        snapshot = MapaSnapshot(version, body, etag, time.monotonic())
+        MapaCache.guardar(clave, snapshot)
+        return snapshot
+
+    @staticmethod
+    def invalidar_cache():
+        """Cambio estructural del mapa (p. ej. redimensionado): fuerza recarga completa"""
+        version = MapaService.aplicar_invalidacion()
+        MapaService.anunciar(CAMBIO_DATOS)
+        return version
+
+    @staticmethod
+    def registrar_cambios(parcela_ids, tipo=CAMBIO_DATOS):
+        """Llamar después de cada commit que modifique esas parcelas o su ocupación"""
+        parcela_ids = list(parcela_ids)
+        if not parcela_ids:
+            return MapaCache.version_actual()
+        version = MapaService.aplicar_cambios(parcela_ids, tipo)
+        MapaService.anunciar(tipo, parcela_ids)
+        return version
+
+    @staticmethod
+    def aplicar_invalidacion():
+        """Invalida la cache de este proceso y pide a sus clientes SSE recargar"""
+        version = MapaCache.invalidar()
+        if MapaEventosHub.hay_suscriptores():
+            MapaEventosHub.publicar('resync', {'version': version, 'epoca': MapaCache.epoca})
+        return version
+
+    @staticmethod
+    def aplicar_cambios(parcela_ids, tipo):
+        """Registra el cambio en este proceso y lo envía a sus clientes SSE"""
+        version = MapaCache.invalidar(parcela_ids=parcela_ids, tipo=tipo)
+        if MapaEventosHub.hay_suscriptores():
+            MapaService.publicar_cambios(version, parcela_ids, tipo)
+        return version
+
+    @staticmethod
+    def anunciar(tipo, parcela_ids=None):
+        """
+        Deja el cambio en Mapa_Evento para los demás workers (MapaRelay).
+        Usa su propia transacción: la escritura que lo originó ya hizo
+        commit y un error acá no debe deshacerla.
+        """
+        try:
+            with db.engine.begin() as conexion:
+                conexion.execute(insert(MapaEvento.__table__), {
+                    'origen': MapaCache.epoca,
+                    'tipo': tipo,
+                    'parcela_ids': json.dumps(parcela_ids) if parcela_ids is not None else None,
+                    'fecha': datetime.utcnow()
+                })
+        except Exception as e:
+            # Los demás workers lo verán al vencer el TTL de su cache
+            print(f"Error anunciando cambios del mapa: {str(e)}")
+
+    @staticmethod
+    def publicar_cambios(version, parcela_ids, tipo):
+        """Arma las celdas cambiadas una sola vez y las envía a los clientes SSE"""
+        try:
+            mapa = Mapa.query.first()
+            if not mapa:
+                return
+            parcelas_data = MapaService.construir_parcelas(mapa.mapa_id, parcela_ids=parcela_ids)
+            for parcela_data in parcelas_data:
+                parcela_data['cambio'] = tipo
+            MapaEventosHub.publicar('parcelas', {
+                'version': version,
+                'epoca': MapaCache.epoca,
+                'parcelas': parcelas_data
+            })
+        except Exception as e:
+            # El commit ya se hizo: un error acá no debe romper la escritura
+            print(f"Error publicando cambios del mapa: {str(e)}")
+            MapaEventosHub.publicar('resync', {'version': version, 'epoca': MapaCache.epoca})
+
+    @staticmethod
+    def parcelas_de_solicitudes(solicitud_ids):
+        """IDs de parcelas asignadas a las solicitudes indicadas"""
+        if not solicitud_ids:
+            return []
+        filas = db.session.query(SolicitudParcela.parcela_id).filter(
+            SolicitudParcela.solicitud_id.in_(solicitud_ids),
+            SolicitudParcela.activa == True
+        ).all()
+        return [parcela_id for (parcela_id,) in filas]
+
+    @staticmethod
+    def obtener_cambios(desde):
+        """
+        Payload de GET /mapa/cambios: solo las celdas que cambiaron desde la
+        versión 'desde', o None si el cliente debe pedir el mapa completo.
+        """
+        version, cambios = MapaCache.cambios_desde(desde)
+        if cambios is None:
+            return None
+
+        mapa = Mapa.query.first()
+        if not mapa:
+            return None
+
+        parcelas_data = MapaService.construir_parcelas(mapa.mapa_id, parcela_ids=list(cambios))
+        for parcela_data in parcelas_data:
+            parcela_data['cambio'] = cambios[parcela_data['parcela_id']]
+
+        # Parcelas que cambiaron pero ya no existen en el mapa
+        presentes = {p['parcela_id'] for p in parcelas_data}
+        eliminadas = [parcela_id for parcela_id in cambios if parcela_id not in presentes]
+
+        return {
+            'completo': False,
+            'version': version,
+            'epoca': MapaCache.epoca,
+            'parcelas': parcelas_data,
+            'eliminadas': eliminadas,
+            'total': len(parcelas_data)
+        }
+
+    @staticmethod
+    def responder_snapshot(snapshot):
+        """Respuesta HTTP con ETag; 304 sin cuerpo si el cliente ya tiene ese contenido"""
+        if request.if_none_match.contains_weak(snapshot.etag):
+            response = Response(status=304)
+        else:
+            response = Response(snapshot.body, mimetype='application/json')
+        response.set_etag(snapshot.etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.headers['X-Mapa-Version'] = str(snapshot.version)
+        return response
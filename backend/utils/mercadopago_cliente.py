@@ -0,0 +1,427 @@
+# utils/mercadopago_cliente.py
+import bisect
+import itertools
+import os
+import random
+import threading
+import time
+import uuid
+
+import mercadopago
+import requests
+from mercadopago.config import RequestOptions
+from mercadopago.http import HttpClient
+from requests.adapters import HTTPAdapter
+
+# 'sdk' usa la API de MercadoPago; 'local' responde desde memoria (pruebas, desarrollo sin red)
+MERCADOPAGO_CLIENTE = os.getenv('MERCADOPAGO_CLIENTE', 'sdk')
+
+# Timeouts por llamada (segundos): conectar y esperar la respuesta
+MP_TIMEOUT_CONEXION = float(os.getenv('MP_TIMEOUT_CONEXION', '3.05'))
+MP_TIMEOUT_LECTURA = float(os.getenv('MP_TIMEOUT_LECTURA', '8'))
+
+# Conexiones keep-alive que se conservan abiertas hacia api.mercadopago.com
+MP_POOL_CONEXIONES = int(os.getenv('MP_POOL_CONEXIONES', '10'))
+
+# Reintentos ante timeouts, errores de red, 429 y 5xx; espera aleatoria
+# entre 0 y base * 2^intento (con tope) para no reintentar todos a la vez
+MP_REINTENTOS = int(os.getenv('MP_REINTENTOS', '2'))
+MP_REINTENTO_BASE_SEGUNDOS = float(os.getenv('MP_REINTENTO_BASE_SEGUNDOS', '0.2'))
+MP_REINTENTO_MAX_SEGUNDOS = 2
+
+# Tras MP_CIRCUITO_FALLOS fallas seguidas se deja de llamar a MP durante
+# MP_CIRCUITO_ESPERA_SEGUNDOS; después pasa una sola llamada de prueba
+MP_CIRCUITO_FALLOS = int(os.getenv('MP_CIRCUITO_FALLOS', '5'))
+MP_CIRCUITO_ESPERA_SEGUNDOS = float(os.getenv('MP_CIRCUITO_ESPERA_SEGUNDOS', '30'))
+
+# Cliente local: latencia y proporción de fallas simuladas (pruebas de carga)
+MP_LOCAL_LATENCIA_MS = float(os.getenv('MP_LOCAL_LATENCIA_MS', '0'))
+MP_LOCAL_TASA_ERROR = float(os.getenv('MP_LOCAL_TASA_ERROR', '0'))
+
+# Límites (ms) de los intervalos del histograma de latencias
+LATENCIA_LIMITES_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+CIRCUITO_CERRADO = 'cerrado'
+CIRCUITO_ABIERTO = 'abierto'
+CIRCUITO_SEMIABIERTO = 'semiabierto'
+
+OPERACION_OBTENER_PAGO = 'obtener_pago'
+OPERACION_CREAR_PREFERENCIA = 'crear_preferencia'
+
+
+class ErrorMercadoPago(Exception):
+    """MercadoPago no respondió o respondió con error: la operación se puede reintentar"""
+
+
+class RechazoMercadoPago(ErrorMercadoPago):
+    """MercadoPago rechazó la operación (4xx): reintentar no cambia el resultado"""
+
+
+class CircuitoAbiertoError(ErrorMercadoPago):
+    """MercadoPago viene fallando y no se lo llama hasta que pase la espera"""
+
+
+class CircuitoMercadoPago:
+    """
+    Circuit breaker de las llamadas a MercadoPago. Cerrado deja pasar
+    todo; abierto rechaza al instante (los workers no quedan colgados
+    esperando a un MP caído); semiabierto deja pasar una llamada de
+    prueba y según su resultado vuelve a cerrarse o a abrirse.
+    """
+
+    def __init__(self, fallos_umbral=MP_CIRCUITO_FALLOS, espera_segundos=MP_CIRCUITO_ESPERA_SEGUNDOS):
+        self.fallos_umbral = fallos_umbral
+        self.espera_segundos = espera_segundos
+        self._lock = threading.Lock()
+        self._estado = CIRCUITO_CERRADO
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+        self.aperturas = 0
+
+    def permitir(self):
+        """Lanza CircuitoAbiertoError si la llamada no debe hacerse"""
+        with self._lock:
+            if self._estado == CIRCUITO_CERRADO:
+                return
+            if self._estado == CIRCUITO_ABIERTO:
+                restante = self._abierto_desde + self.espera_segundos - time.monotonic()
+                if restante > 0:
+                    raise CircuitoAbiertoError(
+                        f'MercadoPago no disponible, se reintenta en {restante:.0f}s'
+                    )
+                self._estado = CIRCUITO_SEMIABIERTO
+                self._prueba_en_curso = False
+            if self._prueba_en_curso:
+                raise CircuitoAbiertoError('MercadoPago no disponible, verificando conexión')
+            self._prueba_en_curso = True
+
+    def registrar_exito(self):
+        with self._lock:
+            if self._estado != CIRCUITO_CERRADO:
+                print("Circuito de MercadoPago cerrado")
+            self._estado = CIRCUITO_CERRADO
+            self._fallos = 0
+            self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            if self._estado == CIRCUITO_SEMIABIERTO or self._fallos >= self.fallos_umbral:
+                if self._estado != CIRCUITO_ABIERTO:
+                    self.aperturas += 1
+                    print(f"Circuito de MercadoPago abierto tras {self._fallos} falla(s) seguidas")
+                self._estado = CIRCUITO_ABIERTO
+                self._abierto_desde = time.monotonic()
+                self._prueba_en_curso = False
+
+    def estado(self):
+        with self._lock:
+            return {
+                'estado': self._estado,
+                'fallos_seguidos': self._fallos,
+                'aperturas': self.aperturas
+            }
+
+
+class MetricasMercadoPago:
+    """Histograma de latencias y contadores de resultado por operación"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operaciones = {}
+
+    def registrar(self, operacion, duracion_ms, resultado):
+        """resultado: 'ok', 'error', 'rechazo', 'circuito_abierto' o 'reintento'"""
+        with self._lock:
+            datos = self._operaciones.get(operacion)
+            if datos is None:
+                datos = self._operaciones[operacion] = {
+                    'llamadas': 0,
+                    'resultados': {},
+                    'tiempo_total_ms': 0.0,
+                    'tiempo_max_ms': 0.0,
+                    'histograma': [0] * (len(LATENCIA_LIMITES_MS) + 1)
+                }
+            datos['resultados'][resultado] = datos['resultados'].get(resultado, 0) + 1
+            if duracion_ms is None:
+                return
+            datos['llamadas'] += 1
+            datos['tiempo_total_ms'] += duracion_ms
+            datos['tiempo_max_ms'] = max(datos['tiempo_max_ms'], duracion_ms)
+            datos['histograma'][bisect.bisect_left(LATENCIA_LIMITES_MS, duracion_ms)] += 1
+
+    @staticmethod
+    def _percentil(histograma, total, fraccion):
+        """Límite superior del intervalo donde cae el percentil (None = más que el último)"""
+        objetivo = total * fraccion
+        acumulado = 0
+        for indice, cantidad in enumerate(histograma):
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                return LATENCIA_LIMITES_MS[indice] if indice < len(LATENCIA_LIMITES_MS) else None
+        return None
+
+    def metricas(self):
+        with self._lock:
+            resumen = {}
+            for operacion, datos in self._operaciones.items():
+                llamadas = datos['llamadas']
+                etiquetas = [f'<={limite}ms' for limite in LATENCIA_LIMITES_MS] + [f'>{LATENCIA_LIMITES_MS[-1]}ms']
+                resumen[operacion] = {
+                    'llamadas': llamadas,
+                    'resultados': dict(datos['resultados']),
+                    'tiempo_promedio_ms': round(datos['tiempo_total_ms'] / llamadas, 2) if llamadas else 0,
+                    'tiempo_max_ms': round(datos['tiempo_max_ms'], 2),
+                    'p50_ms': self._percentil(datos['histograma'], llamadas, 0.5) if llamadas else None,
+                    'p95_ms': self._percentil(datos['histograma'], llamadas, 0.95) if llamadas else None,
+                    'p99_ms': self._percentil(datos['histograma'], llamadas, 0.99) if llamadas else None,
+                    'histograma': dict(zip(etiquetas, datos['histograma']))
+                }
+            return resumen
+
+    def reiniciar(self):
+        with self._lock:
+            self._operaciones = {}
+
+
+class ClienteMercadoPago:
+    """
+    Llamadas a MercadoPago con la misma política para todas: circuit
+    breaker, reintentos con espera aleatoria y métricas de latencia. Las
+    subclases implementan _obtener_pago y _crear_preferencia.
+    """
+
+    def __init__(self, circuito=None, metricas=None):
+        self.circuito = circuito or CircuitoMercadoPago()
+        self.metricas = metricas or MetricasMercadoPago()
+
+    def obtener_pago(self, payment_id):
+        """Datos del pago (dict con status, preference_id, ...) o None si MP no lo conoce"""
+        return self._llamar(OPERACION_OBTENER_PAGO, lambda clave: self._obtener_pago(payment_id))
+
+    def crear_preferencia(self, datos):
+        """Crea la preferencia de pago y devuelve la respuesta de MP (id, init_point, ...)"""
+        return self._llamar(OPERACION_CREAR_PREFERENCIA, lambda clave: self._crear_preferencia(datos, clave))
+
+    def _obtener_pago(self, payment_id):
+        raise NotImplementedError
+
+    def _crear_preferencia(self, datos, clave_idempotencia):
+        raise NotImplementedError
+
+    def _llamar(self, operacion, funcion):
+        """
+        Ejecuta funcion(clave_idempotencia). Los reintentos reusan la
+        clave, así un POST que llegó a MP pero cuya respuesta se perdió
+        no crea una segunda preferencia.
+        """
+        clave = uuid.uuid4().hex
+        intento = 0
+        while True:
+            try:
+                self.circuito.permitir()
+            except CircuitoAbiertoError:
+                self.metricas.registrar(operacion, None, 'circuito_abierto')
+                raise
+
+            inicio = time.perf_counter()
+            try:
+                respuesta = funcion(clave)
+            except RechazoMercadoPago:
+                # MP respondió: el servicio funciona aunque rechace el pedido
+                self.circuito.registrar_exito()
+                self.metricas.registrar(operacion, (time.perf_counter() - inicio) * 1000, 'rechazo')
+                raise
+            except ErrorMercadoPago as e:
+                self.circuito.registrar_fallo()
+                duracion_ms = (time.perf_counter() - inicio) * 1000
+                if intento >= MP_REINTENTOS:
+                    self.metricas.registrar(operacion, duracion_ms, 'error')
+                    raise
+                self.metricas.registrar(operacion, duracion_ms, 'reintento')
+                espera = random.uniform(
+                    0, min(MP_REINTENTO_BASE_SEGUNDOS * 2 ** intento, MP_REINTENTO_MAX_SEGUNDOS)
+                )
+                intento += 1
+                print(f"MercadoPago {operacion} falló ({e}), reintento {intento} en {espera:.2f}s")
+                time.sleep(espera)
+            else:
+                self.circuito.registrar_exito()
+                self.metricas.registrar(operacion, (time.perf_counter() - inicio) * 1000, 'ok')
+                return respuesta
+
+
+class HttpSesionMercadoPago(HttpClient):
+    """
+    Transporte HTTP para el SDK de MercadoPago. El SDK abre una sesión
+    nueva (conexión TLS nueva) por llamada y espera hasta 60s; este
+    comparte una requests.Session con pool keep-alive entre threads y
+    aplica MP_TIMEOUT_CONEXION / MP_TIMEOUT_LECTURA. Los reintentos los
+    hace ClienteMercadoPago, no urllib3.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(
+            pool_connections=1, pool_maxsize=MP_POOL_CONEXIONES, max_retries=0
+        )
+        self.session.mount('https://', adaptador)
+        self.session.mount('http://', adaptador)
+        self.timeout = (MP_TIMEOUT_CONEXION, MP_TIMEOUT_LECTURA)
+
+    def request(self, method, url, headers=None, params=None, data=None, **_opciones_sdk):
+        try:
+            respuesta = self.session.request(
+                method, url, headers=headers, params=params, data=data, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise ErrorMercadoPago(f'{method} {url}: {e}')
+
+        resultado = {'status': respuesta.status_code, 'response': None}
+        if respuesta.status_code != 204 and respuesta.content:
+            try:
+                resultado['response'] = respuesta.json()
+            except ValueError:
+                raise ErrorMercadoPago(f'{method} {url}: respuesta no es JSON ({respuesta.status_code})')
+        return resultado
+
+    def get(self, url, headers, params=None, **opciones):
+        return self.request('GET', url, headers=headers, params=params)
+
+    def post(self, url, headers, data=None, params=None, **opciones):
+        return self.request('POST', url, headers=headers, params=params, data=data)
+
+    def put(self, url, headers, data=None, params=None, **opciones):
+        return self.request('PUT', url, headers=headers, params=params, data=data)
+
+    def delete(self, url, headers, params=None, **opciones):
+        return self.request('DELETE', url, headers=headers, params=params)
+
+
+class ClienteMercadoPagoSDK(ClienteMercadoPago):
+    def __init__(self, access_token, **kwargs):
+        super().__init__(**kwargs)
+        self.access_token = access_token
+        self.http = HttpSesionMercadoPago()
+        self.sdk = mercadopago.SDK(
+            access_token,
+            http_client=self.http,
+            request_options=RequestOptions(access_token=access_token, max_retries=0)
+        )
+
+    @staticmethod
+    def _validar(respuesta, descripcion):
+        status = respuesta.get('status') or 0
+        if status == 429 or status >= 500:
+            raise ErrorMercadoPago(f'MP respondió {status} ({descripcion})')
+        if status >= 400:
+            raise RechazoMercadoPago(f'MP rechazó la operación ({descripcion}, {status}): {respuesta.get("response")}')
+        if respuesta.get('response') is None:
+            raise ErrorMercadoPago(f'Respuesta inválida de MP ({descripcion}): {respuesta}')
+        return respuesta['response']
+
+    def _obtener_pago(self, payment_id):
+        respuesta = self.sdk.payment().get(payment_id)
+        if respuesta.get('status') == 404:
+            return None
+        return self._validar(respuesta, f'pago {payment_id}')
+
+    def _crear_preferencia(self, datos, clave_idempotencia):
+        opciones = RequestOptions(
+            access_token=self.access_token,
+            max_retries=0,
+            custom_headers={'x-idempotency-key': clave_idempotencia}
+        )
+        respuesta = self.sdk.preference().create(datos, opciones)
+        return self._validar(respuesta, 'preferencia')
+
+
+class ClienteMercadoPagoLocal(ClienteMercadoPago):
+    """
+    Pasarela en memoria: crea preferencias y devuelve los pagos cargados
+    con registrar_pago(), sin llamadas de red. Con latencia_ms y
+    tasa_error simula un MP lento o inestable en pruebas de carga.
+    """
+
+    def __init__(self, latencia_ms=MP_LOCAL_LATENCIA_MS, tasa_error=MP_LOCAL_TASA_ERROR, **kwargs):
+        super().__init__(**kwargs)
+        self.latencia_ms = latencia_ms
+        self.tasa_error = tasa_error
+        self._pagos = {}
+        self._preferencias = {}
+        self._secuencia = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _simular_red(self):
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+        if self.tasa_error and random.random() < self.tasa_error:
+            raise ErrorMercadoPago('Falla simulada del cliente local')
+
+    def registrar_pago(self, payment_id, status, preference_id, **extra):
+        with self._lock:
+            self._pagos[str(payment_id)] = dict(
+                extra, id=payment_id, status=status, preference_id=preference_id
+            )
+
+    def _obtener_pago(self, payment_id):
+        self._simular_red()
+        with self._lock:
+            pago = self._pagos.get(str(payment_id))
+            return dict(pago) if pago else None
+
+    def _crear_preferencia(self, datos, clave_idempotencia):
+        self._simular_red()
+        with self._lock:
+            # Igual que MP: la misma clave de idempotencia devuelve la misma preferencia
+            if clave_idempotencia in self._preferencias:
+                return dict(self._preferencias[clave_idempotencia])
+            preference_id = f'LOCAL-{next(self._secuencia)}'
+            preferencia = {
+                'id': preference_id,
+                'items': datos.get('items', []),
+                'external_reference': datos.get('external_reference'),
+                'init_point': f'http://localhost/checkout?pref_id={preference_id}',
+                'sandbox_init_point': f'http://localhost/checkout?pref_id={preference_id}'
+            }
+            self._preferencias[clave_idempotencia] = preferencia
+            return dict(preferencia)
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+
+def obtener_cliente_mp():
+    """Cliente configurado en MERCADOPAGO_CLIENTE, o None si no hay access token"""
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None:
+            if MERCADOPAGO_CLIENTE == 'local':
+                _cliente = ClienteMercadoPagoLocal()
+            else:
+                access_token = os.getenv('MERCADOPAGO_ACCESS_TOKEN', '')
+                if access_token:
+                    _cliente = ClienteMercadoPagoSDK(access_token)
+        return _cliente
+
+
+def configurar_cliente_mp(cliente):
+    """Reemplaza el cliente (p. ej. por un ClienteMercadoPagoLocal en pruebas)"""
+    global _cliente
+    with _cliente_lock:
+        _cliente = cliente
+
+
+def metricas_mp():
+    """Latencias, resultados y estado del circuito del cliente actual"""
+    with _cliente_lock:
+        cliente = _cliente
+    if cliente is None:
+        return {'cliente': None}
+    return {
+        'cliente': type(cliente).__name__,
+        'circuito': cliente.circuito.estado(),
+        'operaciones': cliente.metricas.metricas()
+    }
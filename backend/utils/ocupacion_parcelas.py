@@ -0,0 +1,83 @@
+# utils/ocupacion_parcelas.py
+from models.base import db
+from models.parcela import Parcela
+from models.solicitud import Solicitud
+from models.solicitud_parcela import SolicitudParcela
+from datetime import datetime
+import os
+
+# Mes en que abre la inscripción a la feria del año siguiente: las
+# solicitudes hechas desde ese mes son de la temporada siguiente (con 1 la
+# temporada es el año calendario). Cambiarlo con asignaciones cargadas
+# requiere recalcular Solicitud_Parcela.temporada
+TEMPORADA_MES_INICIO = int(os.getenv('TEMPORADA_MES_INICIO', '1'))
+
+
+class OcupacionParcelas:
+    """
+    Definición única de parcela ocupada, la misma para la reserva, el mapa,
+    la grilla y el panel de administración: tiene una fila activa en
+    Solicitud_Parcela de la temporada de la feria. Las solicitudes
+    rechazadas o canceladas marcan sus filas como liberadas al cambiar de
+    estado, así que no hace falta mirar el estado. El índice único
+    (parcela_id, temporada, activa) garantiza lo mismo en la base.
+
+    La temporada sale siempre de la fecha de la solicitud según el
+    calendario de la feria (TEMPORADA_MES_INICIO), nunca de cuándo se
+    aprueba o se paga: una solicitud de diciembre aprobada en enero sigue
+    en su temporada.
+    """
+
+    @staticmethod
+    def temporada_de_fecha(fecha):
+        """Temporada de la feria a la que corresponde una fecha"""
+        if TEMPORADA_MES_INICIO > 1 and fecha.month >= TEMPORADA_MES_INICIO:
+            return fecha.year + 1
+        return fecha.year
+
+    @staticmethod
+    def temporada_actual():
+        """Temporada con la inscripción abierta (mismo reloj que Solicitud.fecha_solicitud)"""
+        return OcupacionParcelas.temporada_de_fecha(datetime.utcnow())
+
+    @staticmethod
+    def temporada_de(solicitud_id):
+        """Temporada a la que pertenecen las parcelas de la solicitud"""
+        fecha = db.session.query(Solicitud.fecha_solicitud).filter(
+            Solicitud.solicitud_id == solicitud_id
+        ).scalar()
+        return OcupacionParcelas.temporada_de_fecha(fecha) if fecha else OcupacionParcelas.temporada_actual()
+
+    @staticmethod
+    def consulta(*columnas, temporada=None, mapa_id=None, parcela_ids=None):
+        """
+        Query sobre las asignaciones activas de la temporada (por defecto
+        la actual).
+        Con mapa_id se une a Parcela, así que admite columnas y filtros de
+        la parcela.
+        """
+        if temporada is None:
+            temporada = OcupacionParcelas.temporada_actual()
+
+        query = db.session.query(*(columnas or (SolicitudParcela,))).select_from(
+            SolicitudParcela
+        ).filter(
+            SolicitudParcela.temporada == temporada,
+            SolicitudParcela.activa == True
+        )
+
+        if mapa_id is not None:
+            query = query.join(
+                Parcela, Parcela.parcela_id == SolicitudParcela.parcela_id
+            ).filter(Parcela.mapa_id == mapa_id)
+
+        if parcela_ids is not None:
+            query = query.filter(SolicitudParcela.parcela_id.in_(parcela_ids))
+
+        return query
+
+    @staticmethod
+    def esta_ocupada(parcela_id, temporada=None):
+        return OcupacionParcelas.consulta(
+            SolicitudParcela.solicitud_parcela_id, temporada=temporada, parcela_ids=[parcela_id]
+        ).first() is not None
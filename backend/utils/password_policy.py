@@ -0,0 +1,145 @@
+# utils/password_policy.py
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+from utils.hilos_nativos import HilosNativos, gevent_activo
+import multiprocessing
+import os
+import threading
+
+# Esquemas soportados sin dependencias extra (passlib puro / hashlib)
+ESQUEMAS_SOPORTADOS = ('sha256_crypt', 'sha512_crypt', 'pbkdf2_sha256')
+
+# Esquema con el que se generaron las contraseñas existentes
+ESQUEMA_LEGADO = 'sha256_crypt'
+
+# Esquemas que calcula hashlib (C) soltando el GIL: con gevent van a un
+# thread nativo. Los demás (crypt del sistema o Python puro) lo retienen
+# todo el cálculo y van a un pool de procesos
+ESQUEMAS_SIN_GIL = ('pbkdf2_sha256',)
+
+# Procesos del pool por worker de gunicorn
+PASSWORD_HASH_PROCESOS = int(os.getenv('PASSWORD_HASH_PROCESOS', '2'))
+
+
+def _configuracion():
+    """Política de hash leída del entorno"""
+    esquema = os.getenv('PASSWORD_SCHEME', ESQUEMA_LEGADO)
+    if esquema not in ESQUEMAS_SOPORTADOS:
+        print(f"PASSWORD_SCHEME '{esquema}' no soportado, se usa {ESQUEMA_LEGADO}")
+        esquema = ESQUEMA_LEGADO
+
+    rondas = os.getenv('PASSWORD_ROUNDS')
+    return {
+        'esquema': esquema,
+        'rondas': int(rondas) if rondas else None
+    }
+
+
+def _crear_contexto(config):
+    esquemas = [config['esquema']]
+    if ESQUEMA_LEGADO not in esquemas:
+        esquemas.append(ESQUEMA_LEGADO)
+
+    opciones = {
+        'schemes': esquemas,
+        'default': config['esquema'],
+        # Todo lo que no sea el esquema por defecto se re-hashea al loguear
+        'deprecated': 'auto'
+    }
+    if config['rondas']:
+        # min = max = default: un hash con otro costo (mayor o menor) se actualiza
+        prefijo = config['esquema']
+        opciones[f'{prefijo}__default_rounds'] = config['rondas']
+        opciones[f'{prefijo}__min_rounds'] = config['rondas']
+        opciones[f'{prefijo}__max_rounds'] = config['rondas']
+    return CryptContext(**opciones)
+
+
+# Funciones de módulo para que el pool de procesos pueda serializarlas
+_contextos_por_config = {}
+
+
+def _contexto_para(config):
+    clave = (config['esquema'], config['rondas'])
+    if clave not in _contextos_por_config:
+        _contextos_por_config[clave] = _crear_contexto(config)
+    return _contextos_por_config[clave]
+
+
+def _hash(config, password):
+    return _contexto_para(config).hash(password)
+
+
+def _verificar_y_actualizar(config, password, hash_guardado):
+    return _contexto_para(config).verify_and_update(password, hash_guardado)
+
+
+class PasswordPolicy:
+    """
+    Hash de contraseñas con esquema y costo configurables (PASSWORD_SCHEME,
+    PASSWORD_ROUNDS). Con los workers gevent de gunicorn el cálculo no
+    puede correr en el greenlet del request: bloquearía el loop y con él a
+    todos los requests del worker durante cada login. Los esquemas de
+    ESQUEMAS_SIN_GIL corren en un thread nativo (HilosNativos) y los demás
+    en un pool de PASSWORD_HASH_PROCESOS procesos; el greenlet espera el
+    resultado sin bloquear a los otros. Sin gevent (flask run, tests,
+    scripts) el request ya es un thread nativo y se calcula ahí mismo. Ver
+    bench/hash_contrasenas.py.
+    """
+
+    _config = None
+    _contexto = None
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def config(cls):
+        if cls._config is None:
+            cls._config = _configuracion()
+        return cls._config
+
+    @classmethod
+    def contexto(cls):
+        if cls._contexto is None:
+            cls._contexto = _crear_contexto(cls.config())
+            print(f"Política de contraseñas: {cls.config()}")
+        return cls._contexto
+
+    @classmethod
+    def _procesos(cls):
+        # spawn: el worker ya tiene threads (scheduler, webhooks) y un fork
+        # podría heredar un lock tomado
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=PASSWORD_HASH_PROCESOS, mp_context=multiprocessing.get_context('spawn')
+                )
+            return cls._executor
+
+    @classmethod
+    def _cerrar_procesos(cls):
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown()
+                cls._executor = None
+
+    @classmethod
+    def _ejecutar(cls, metodo, funcion_de_modulo, *args):
+        """metodo del contexto en este proceso, o funcion_de_modulo(config, ...) en el pool de procesos"""
+        if not gevent_activo():
+            return metodo(*args)
+        if cls.config()['esquema'] in ESQUEMAS_SIN_GIL:
+            return HilosNativos.ejecutar(metodo, *args)
+        return cls._procesos().submit(funcion_de_modulo, cls.config(), *args).result()
+
+    @classmethod
+    def hash(cls, password):
+        return cls._ejecutar(cls.contexto().hash, _hash, password)
+
+    @classmethod
+    def verify_and_update(cls, password, hash_guardado):
+        """
+        Devuelve (valida, nuevo_hash). nuevo_hash no es None cuando la
+        contraseña es correcta pero el hash usa un esquema o costo viejo.
+        """
+        return cls._ejecutar(cls.contexto().verify_and_update, _verificar_y_actualizar, password, hash_guardado)
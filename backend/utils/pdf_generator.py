@@ -4,19 +4,18 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.colors import HexColor
 from reportlab.platypus import Table, TableStyle
 from datetime import datetime
-import tempfile
+import io
 
 def generar_comprobante_pago(pago, solicitud, artesano, usuario, rubro, parcelas):
     """
     Genera un comprobante de pago en PDF - VERSIÓN CORREGIDA
+    Devuelve los bytes del PDF (se arma en memoria, sin archivos temporales)
     """
     try:
-        # Crear archivo temporal
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        pdf_path = temp_file.name
+        buffer = io.BytesIO()
         
         # Crear canvas PDF
-        c = canvas.Canvas(pdf_path, pagesize=A4)
+        c = canvas.Canvas(buffer, pagesize=A4)
         width, height = A4
         
         # ============ CONFIGURACIONES ============
@@ -209,8 +208,8 @@ def generar_comprobante_pago(pago, solicitud, artesano, usuario, rubro, parcelas
         # ============ GUARDAR PDF ============
         c.save()
         
-        print(f"PDF generado correctamente: {pdf_path}")
-        return pdf_path
+        print(f"PDF generado correctamente: comprobante del pago {pago.pago_id}")
+        return buffer.getvalue()
         
     except Exception as e:
         print(f"Error generando PDF: {e}")
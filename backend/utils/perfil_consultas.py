@@ -0,0 +1,141 @@
+# utils/perfil_consultas.py
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import os
+import threading
+import time
+
+PERFIL_CONSULTAS_ACTIVO = os.getenv('PERFIL_CONSULTAS', 'true').lower() == 'true'
+
+# Una misma sentencia ejecutada al menos estas veces en un request es un N+1
+PERFIL_N1_UMBRAL = int(os.getenv('PERFIL_N1_UMBRAL', '5'))
+
+# Requests con más tiempo de base que esto se registran aunque no tengan N+1
+PERFIL_LENTO_MS = float(os.getenv('PERFIL_LENTO_MS', '500'))
+
+# Largo con el que se muestran las sentencias en logs y métricas
+LARGO_SENTENCIA = 200
+
+
+class PerfilConsultas:
+    """
+    Cuenta las sentencias SQL y el tiempo de base de cada request (eventos
+    before/after_cursor_execute) y marca como N+1 las sentencias que se
+    repiten con distintos parámetros. El resultado va en las cabeceras
+    X-DB-Queries / X-DB-Time-Ms / X-DB-N1, en el log si hay N+1 o el
+    request es lento, y acumulado por endpoint en /api/metrics. Las
+    consultas fuera de un request (scheduler, threads) no se cuentan.
+    """
+
+    _lock = threading.Lock()
+    _metricas = {}
+
+    @classmethod
+    def registrar(cls, app):
+        if not PERFIL_CONSULTAS_ACTIVO:
+            return
+        event.listen(Engine, 'before_cursor_execute', cls._antes_de_ejecutar)
+        event.listen(Engine, 'after_cursor_execute', cls._despues_de_ejecutar)
+        app.before_request(cls._iniciar)
+        app.after_request(cls._cerrar)
+
+    @staticmethod
+    def _iniciar():
+        g.perfil_consultas = {'consultas': 0, 'tiempo': 0.0, 'sentencias': {}}
+
+    @staticmethod
+    def _perfil_actual():
+        if not has_request_context():
+            return None
+        return g.get('perfil_consultas')
+
+    @classmethod
+    def _antes_de_ejecutar(cls, conn, cursor, statement, parameters, context, executemany):
+        if cls._perfil_actual() is not None:
+            conn.info.setdefault('perfil_inicio', []).append(time.perf_counter())
+
+    @classmethod
+    def _despues_de_ejecutar(cls, conn, cursor, statement, parameters, context, executemany):
+        perfil = cls._perfil_actual()
+        inicios = conn.info.get('perfil_inicio')
+        if perfil is None or not inicios:
+            return
+        perfil['tiempo'] += time.perf_counter() - inicios.pop()
+        perfil['consultas'] += 1
+        perfil['sentencias'][statement] = perfil['sentencias'].get(statement, 0) + 1
+
+    @classmethod
+    def _cerrar(cls, response):
+        perfil = g.pop('perfil_consultas', None)
+        if perfil is None:
+            return response
+
+        tiempo_ms = perfil['tiempo'] * 1000
+        repetidas = sorted(
+            ((veces, sentencia) for sentencia, veces in perfil['sentencias'].items() if veces >= PERFIL_N1_UMBRAL),
+            reverse=True
+        )
+
+        response.headers['X-DB-Queries'] = str(perfil['consultas'])
+        response.headers['X-DB-Time-Ms'] = f'{tiempo_ms:.1f}'
+        response.headers['X-DB-N1'] = str(len(repetidas))
+
+        endpoint = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+        if repetidas or tiempo_ms >= PERFIL_LENTO_MS:
+            detalle = '; '.join(
+                f"x{veces} {cls._abreviar(sentencia)}" for veces, sentencia in repetidas[:3]
+            )
+            print(
+                f"Consultas {endpoint}: {perfil['consultas']} en {tiempo_ms:.1f} ms"
+                + (f" - posible N+1: {detalle}" if repetidas else "")
+            )
+
+        cls._acumular(endpoint, perfil['consultas'], tiempo_ms, repetidas)
+        return response
+
+    @staticmethod
+    def _abreviar(sentencia):
+        sentencia = ' '.join(sentencia.split())
+        return sentencia if len(sentencia) <= LARGO_SENTENCIA else sentencia[:LARGO_SENTENCIA] + '...'
+
+    @classmethod
+    def _acumular(cls, endpoint, consultas, tiempo_ms, repetidas):
+        with cls._lock:
+            datos = cls._metricas.setdefault(endpoint, {
+                'requests': 0,
+                'consultas_total': 0,
+                'consultas_max': 0,
+                'tiempo_ms_total': 0.0,
+                'requests_con_n1': 0,
+                'ultimo_n1': None,
+            })
+            datos['requests'] += 1
+            datos['consultas_total'] += consultas
+            datos['consultas_max'] = max(datos['consultas_max'], consultas)
+            datos['tiempo_ms_total'] += tiempo_ms
+            if repetidas:
+                veces, sentencia = repetidas[0]
+                datos['requests_con_n1'] += 1
+                datos['ultimo_n1'] = {'veces': veces, 'sentencia': cls._abreviar(sentencia)}
+
+    @classmethod
+    def metricas(cls):
+        """Resumen por endpoint, ordenado por cantidad total de consultas"""
+        with cls._lock:
+            copia = {endpoint: dict(datos) for endpoint, datos in cls._metricas.items()}
+
+        resumen = []
+        for endpoint, datos in copia.items():
+            datos['endpoint'] = endpoint
+            datos['consultas_promedio'] = round(datos['consultas_total'] / datos['requests'], 1)
+            datos['tiempo_ms_promedio'] = round(datos['tiempo_ms_total'] / datos['requests'], 1)
+            datos['tiempo_ms_total'] = round(datos['tiempo_ms_total'], 1)
+            resumen.append(datos)
+        resumen.sort(key=lambda datos: -datos['consultas_total'])
+        return resumen
+
+    @classmethod
+    def reiniciar(cls):
+        with cls._lock:
+            cls._metricas = {}
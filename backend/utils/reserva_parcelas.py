@@ -0,0 +1,271 @@
+# utils/reserva_parcelas.py
+from models.base import db
+from models.parcela import Parcela
+from models.solicitud_parcela import SolicitudParcela
+from models.reserva_parcela import ReservaParcela
+from utils.mapa_service import MapaService, CAMBIO_LIBERADA
+from utils.ocupacion_parcelas import OcupacionParcelas
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+from datetime import datetime, timedelta
+import os
+import random
+import time
+
+# Estados en los que la solicitud deja de ocupar sus parcelas
+ESTADOS_QUE_LIBERAN = ('Rechazada', 'Cancelada')
+
+# Códigos de MySQL: 1213 deadlock, 1205 lock wait timeout
+CODIGOS_REINTENTABLES = (1213, 1205)
+REINTENTOS_MAXIMOS = 3
+
+# Tiempo que una parcela queda retenida entre la preferencia de MP y el pago
+RESERVA_PARCELA_MINUTOS = int(os.getenv('RESERVA_PARCELA_MINUTOS', '60'))
+
+# Cada cuánto corre el barrido de retenciones vencidas
+RESERVA_BARRIDO_SEGUNDOS = int(os.getenv('RESERVA_BARRIDO_SEGUNDOS', '60'))
+
+
+class ParcelaOcupadaError(Exception):
+    """Otra transacción asignó o retuvo la parcela antes que esta (violó un índice único)"""
+
+
+class ReservaParcelas:
+    """
+    Asignación atómica de parcelas a solicitudes. La garantía final la da
+    el índice único sobre Solicitud_Parcela (parcela_id, temporada,
+    activa); los SELECT ... FOR UPDATE ordenados por ID serializan a los
+    que compiten por la misma parcela para que el perdedor reciba un
+    conflicto y no un error de la base. Qué cuenta como ocupada lo define OcupacionParcelas.
+    """
+
+    @staticmethod
+    def reservar(solicitud_id, parcela_ids):
+        """
+        Asigna las parcelas libres a la solicitud dentro de la transacción
+        actual (sin commit). Devuelve (asignadas, conflictos); asignadas
+        incluye las que ya eran de esta solicitud. La ocupación de todas
+        se consulta de una vez y las nuevas filas van en un solo INSERT
+        de varias filas. Lanza ParcelaOcupadaError si el índice único
+        detecta una carrera.
+        """
+        parcela_ids = sorted(set(parcela_ids))
+        if not parcela_ids:
+            return [], []
+        temporada = OcupacionParcelas.temporada_de(solicitud_id)
+
+        # Bloquear en orden fijo evita deadlocks entre reservas cruzadas
+        existentes = {
+            p.parcela_id for p in Parcela.query.filter(
+                Parcela.parcela_id.in_(parcela_ids)
+            ).order_by(Parcela.parcela_id).with_for_update().all()
+        }
+
+        # Lectura con bloqueo: ve las asignaciones ya confirmadas por otros
+        ocupadas = ReservaParcelas._ocupadas(parcela_ids, temporada)
+        retenidas = ReservaParcelas._retenidas_vigentes(parcela_ids)
+
+        asignadas = []
+        conflictos = []
+        nuevas = []
+        for parcela_id in parcela_ids:
+            if parcela_id not in existentes:
+                conflictos.append(parcela_id)
+            elif parcela_id in ocupadas:
+                if ocupadas[parcela_id] == solicitud_id:
+                    asignadas.append(parcela_id)
+                else:
+                    conflictos.append(parcela_id)
+            elif retenidas.get(parcela_id, solicitud_id) != solicitud_id:
+                # Retenida por otro artesano que está pagando
+                conflictos.append(parcela_id)
+            else:
+                nuevas.append(parcela_id)
+                asignadas.append(parcela_id)
+
+        try:
+            if nuevas:
+                db.session.execute(insert(SolicitudParcela), [
+                    {'solicitud_id': solicitud_id, 'parcela_id': parcela_id, 'temporada': temporada}
+                    for parcela_id in nuevas
+                ])
+
+            # Las retenciones propias se convierten en asignación; las de
+            # parcelas en conflicto ya no sirven
+            ReservaParcela.query.filter(
+                ReservaParcela.solicitud_id == solicitud_id,
+                ReservaParcela.parcela_id.in_(parcela_ids)
+            ).delete(synchronize_session=False)
+
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            raise ParcelaOcupadaError()
+
+        return asignadas, conflictos
+
+    @staticmethod
+    def retener(solicitud_id, parcela_ids, pago_id=None):
+        """
+        Retiene las parcelas para la solicitud por RESERVA_PARCELA_MINUTOS,
+        reemplazando sus retenciones anteriores (sin commit).
+        Devuelve (retenidas, conflictos); si hay conflictos no retiene nada.
+        """
+        parcela_ids = sorted(set(parcela_ids))
+        ahora = datetime.utcnow()
+
+        existentes = {
+            p.parcela_id for p in Parcela.query.filter(
+                Parcela.parcela_id.in_(parcela_ids)
+            ).order_by(Parcela.parcela_id).with_for_update().all()
+        }
+        ocupadas = ReservaParcelas._ocupadas(parcela_ids, OcupacionParcelas.temporada_de(solicitud_id))
+        retenidas = ReservaParcelas._retenidas_vigentes(parcela_ids, ahora)
+
+        conflictos = [
+            parcela_id for parcela_id in parcela_ids
+            if parcela_id not in existentes
+            or parcela_id in ocupadas
+            or retenidas.get(parcela_id, solicitud_id) != solicitud_id
+        ]
+        if conflictos:
+            return [], conflictos
+
+        # Reemplazar la selección anterior de esta solicitud y las vencidas
+        ReservaParcelas.liberar_reservas(solicitud_id)
+        ReservaParcela.query.filter(
+            ReservaParcela.parcela_id.in_(parcela_ids),
+            ReservaParcela.expira_en <= ahora
+        ).delete(synchronize_session=False)
+
+        expira_en = ahora + timedelta(minutes=RESERVA_PARCELA_MINUTOS)
+        for parcela_id in parcela_ids:
+            db.session.add(ReservaParcela(
+                parcela_id=parcela_id,
+                solicitud_id=solicitud_id,
+                pago_id=pago_id,
+                fecha_creacion=ahora,
+                expira_en=expira_en
+            ))
+
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            raise ParcelaOcupadaError()
+
+        return parcela_ids, []
+
+    @staticmethod
+    def asociar_pago(solicitud_id, pago_id):
+        """Vincula las retenciones de la solicitud con su pago (sin commit)"""
+        ReservaParcela.query.filter_by(
+            solicitud_id=solicitud_id
+        ).update({'pago_id': pago_id}, synchronize_session=False)
+
+    @staticmethod
+    def liberar_reservas(solicitud_id):
+        """Borra las retenciones de la solicitud (sin commit). Devuelve las parcelas liberadas"""
+        filas = db.session.query(ReservaParcela.parcela_id).filter_by(
+            solicitud_id=solicitud_id
+        ).all()
+        parcela_ids = [parcela_id for (parcela_id,) in filas]
+        if parcela_ids:
+            ReservaParcela.query.filter_by(
+                solicitud_id=solicitud_id
+            ).delete(synchronize_session=False)
+        return parcela_ids
+
+    @staticmethod
+    def expirar_reservas():
+        """
+        Barrido periódico: borra en bloque las retenciones vencidas y hace
+        commit. Devuelve las parcelas liberadas.
+        """
+        filas = db.session.query(
+            ReservaParcela.reserva_id, ReservaParcela.parcela_id
+        ).filter(
+            ReservaParcela.expira_en <= datetime.utcnow()
+        ).all()
+        if not filas:
+            return []
+
+        ReservaParcela.query.filter(
+            ReservaParcela.reserva_id.in_([reserva_id for reserva_id, _ in filas])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return [parcela_id for _, parcela_id in filas]
+
+    @staticmethod
+    def barrer_reservas_vencidas():
+        """Tarea programada: expira retenciones y avisa al mapa"""
+        liberadas = ReservaParcelas.expirar_reservas()
+        if liberadas:
+            MapaService.registrar_cambios(liberadas, CAMBIO_LIBERADA)
+            print(f"Retenciones vencidas liberadas: {len(liberadas)} parcela(s)")
+        return liberadas
+
+    @staticmethod
+    def _ocupadas(parcela_ids, temporada):
+        """{parcela_id: solicitud_id} de las asignaciones confirmadas de la temporada, con bloqueo"""
+        return dict(
+            OcupacionParcelas.consulta(
+                SolicitudParcela.parcela_id, SolicitudParcela.solicitud_id,
+                temporada=temporada, parcela_ids=parcela_ids
+            ).with_for_update().all()
+        )
+
+    @staticmethod
+    def _retenidas_vigentes(parcela_ids, ahora=None):
+        """{parcela_id: solicitud_id} de las retenciones no vencidas, con bloqueo"""
+        return dict(
+            db.session.query(
+                ReservaParcela.parcela_id, ReservaParcela.solicitud_id
+            ).filter(
+                ReservaParcela.parcela_id.in_(parcela_ids),
+                ReservaParcela.expira_en > (ahora or datetime.utcnow())
+            ).with_for_update().all()
+        )
+
+    @staticmethod
+    def liberar_solicitud(solicitud_id, parcela_ids=None):
+        """
+        Marca como liberadas las asignaciones activas de la solicitud (o solo
+        las de parcela_ids), sin commit: las filas quedan como historial.
+        Devuelve las parcelas liberadas.
+        """
+        query = SolicitudParcela.query.filter(
+            SolicitudParcela.solicitud_id == solicitud_id,
+            SolicitudParcela.activa == True
+        )
+        if parcela_ids is not None:
+            query = query.filter(SolicitudParcela.parcela_id.in_(parcela_ids))
+
+        liberadas = [parcela_id for (parcela_id,) in query.with_entities(SolicitudParcela.parcela_id).all()]
+        if liberadas:
+            query.update({
+                SolicitudParcela.activa: None,
+                SolicitudParcela.fecha_liberacion: datetime.utcnow(),
+            }, synchronize_session=False)
+        return liberadas
+
+    @staticmethod
+    def es_reintentable(error):
+        codigo = getattr(getattr(error, 'orig', None), 'args', [None])[0]
+        return codigo in CODIGOS_REINTENTABLES
+
+    @staticmethod
+    def con_reintentos(funcion, *args, **kwargs):
+        """
+        Ejecuta una unidad de trabajo completa (incluido su commit) y la
+        repite si la base la abortó por deadlock o timeout de bloqueo.
+        """
+        for intento in range(1, REINTENTOS_MAXIMOS + 1):
+            try:
+                return funcion(*args, **kwargs)
+            except OperationalError as e:
+                db.session.rollback()
+                if intento == REINTENTOS_MAXIMOS or not ReservaParcelas.es_reintentable(e):
+                    raise
+                print(f"Reintentando reserva de parcelas ({intento}/{REINTENTOS_MAXIMOS}): {str(e)}")
+                time.sleep(random.uniform(0.01, 0.05) * intento)
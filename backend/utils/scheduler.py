@@ -0,0 +1,72 @@
+# utils/scheduler.py
+import os
+import threading
+import time
+import traceback
+
+from models.base import db
+
+
+class Programador:
+    """
+    Tareas periódicas en un thread daemon del proceso, cada una ejecutada
+    dentro del app context. Reemplaza los chequeos que antes se hacían en
+    cada request (vencimientos, limpiezas).
+    """
+
+    _tareas = []
+    _thread = None
+    _detener = threading.Event()
+
+    @classmethod
+    def registrar(cls, nombre, intervalo_segundos, funcion):
+        cls._tareas.append({
+            'nombre': nombre,
+            'intervalo': intervalo_segundos,
+            'funcion': funcion,
+            'proxima': time.monotonic() + intervalo_segundos
+        })
+
+    @classmethod
+    def iniciar(cls, app):
+        """Arranca el thread una sola vez; SCHEDULER_ACTIVO=false lo desactiva"""
+        if os.getenv('SCHEDULER_ACTIVO', 'true').lower() != 'true':
+            print("Programador de tareas desactivado (SCHEDULER_ACTIVO=false)")
+            return
+        if cls._thread and cls._thread.is_alive():
+            return
+
+        cls._detener.clear()
+        cls._thread = threading.Thread(
+            target=cls._bucle, args=(app,), name='programador', daemon=True
+        )
+        cls._thread.start()
+        print(f"Programador de tareas iniciado: {[t['nombre'] for t in cls._tareas]}")
+
+    @classmethod
+    def detener(cls):
+        cls._detener.set()
+
+    @classmethod
+    def _bucle(cls, app):
+        while not cls._detener.is_set():
+            ahora = time.monotonic()
+            for tarea in cls._tareas:
+                if ahora >= tarea['proxima']:
+                    cls._ejecutar(app, tarea)
+                    tarea['proxima'] = time.monotonic() + tarea['intervalo']
+
+            espera = min((t['proxima'] for t in cls._tareas), default=ahora + 60) - time.monotonic()
+            cls._detener.wait(max(espera, 0.5))
+
+    @classmethod
+    def _ejecutar(cls, app, tarea):
+        with app.app_context():
+            try:
+                tarea['funcion']()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error en tarea programada '{tarea['nombre']}': {str(e)}")
+                traceback.print_exc()
+            finally:
+                db.session.remove()
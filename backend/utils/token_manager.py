@@ -2,18 +2,162 @@
 from models.base import db
 from models.active_token import ActiveToken
 from models.token_blacklist import TokensBlacklist
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from datetime import datetime, timezone, timedelta
 import logging
 import os
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+# Cada cuánto cada worker consulta si otro proceso revocó tokens
+TOKEN_REVOCATION_SYNC_SECONDS = float(os.getenv('TOKEN_REVOCATION_SYNC_SECONDS', '2'))
+
+# Limpieza periódica de tokens vencidos (fuera del login y de las métricas)
+TOKEN_CLEANUP_INTERVAL_SECONDS = int(os.getenv('TOKEN_CLEANUP_INTERVAL_SECONDS', '300'))
+TOKEN_CLEANUP_BATCH_SIZE = int(os.getenv('TOKEN_CLEANUP_BATCH_SIZE', '500'))
+
+# Códigos de MySQL: 1213 deadlock, 1205 lock wait timeout
+LOCK_ERROR_CODES = (1213, 1205)
+
+
+def _as_utc(value):
+    """MySQL devuelve DATETIME sin zona: se asume UTC"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class RevokedTokenIndex:
+    """
+    Índice en memoria de los JTI revocados (tokens_blacklist), para que el
+    chequeo de cada request autenticado no consulte la base.
+
+    Se carga al iniciar y se actualiza en el mismo proceso cuando se revoca un
+    token. Los demás workers se sincronizan con un contador de generación
+    (MAX(id), COUNT(*)) consultado como mucho cada TOKEN_REVOCATION_SYNC_SECONDS:
+    si solo hubo inserciones se leen las filas nuevas por PK; si hubo borrados
+    (limpieza o reset) se recarga completo. Las entradas vencidas se podan
+    por expires_at, ya que un token vencido lo rechaza el propio JWT.
+    """
+
+    _lock = threading.Lock()
+    _jtis = {}
+    _generation = None
+    _loaded = False
+    _checked_at = 0.0
+
+    @classmethod
+    def load(cls):
+        """Carga completa desde la base (requiere app context)"""
+        now = datetime.now(timezone.utc)
+        max_id, count = db.session.query(
+            func.max(TokensBlacklist.id), func.count(TokensBlacklist.id)
+        ).one()
+        rows = db.session.query(
+            TokensBlacklist.jti, TokensBlacklist.expires_at
+        ).filter(
+            TokensBlacklist.expires_at > now
+        ).all()
+
+        with cls._lock:
+            cls._jtis = {jti: _as_utc(expires_at) for jti, expires_at in rows}
+            cls._generation = (max_id or 0, count)
+            cls._loaded = True
+            cls._checked_at = time.monotonic()
+        logger.info(f" Índice de revocación cargado: {len(rows)} tokens revocados vigentes")
+
+    @classmethod
+    def add(cls, jti, expires_at):
+        """Registra una revocación hecha por este proceso (después del commit)"""
+        with cls._lock:
+            cls._jtis[jti] = _as_utc(expires_at)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._jtis = {}
+            cls._generation = None
+            cls._loaded = False
+
+    @classmethod
+    def sync(cls):
+        """Trae las revocaciones hechas por otros workers si la generación cambió"""
+        max_id, count = db.session.query(
+            func.max(TokensBlacklist.id), func.count(TokensBlacklist.id)
+        ).one()
+        max_id = max_id or 0
+
+        if (max_id, count) == cls._generation:
+            cls._prune()
+            return
+
+        last_max, last_count = cls._generation
+        new_rows = []
+        if max_id > last_max:
+            new_rows = db.session.query(
+                TokensBlacklist.jti, TokensBlacklist.expires_at
+            ).filter(
+                TokensBlacklist.id > last_max
+            ).all()
+
+        if max_id < last_max or last_count + len(new_rows) != count:
+            # Hubo borrados: se recarga todo
+            cls.load()
+            return
+
+        with cls._lock:
+            for jti, expires_at in new_rows:
+                cls._jtis[jti] = _as_utc(expires_at)
+            cls._generation = (max_id, count)
+        cls._prune()
+
+    @classmethod
+    def _prune(cls):
+        now = datetime.now(timezone.utc)
+        with cls._lock:
+            expired = [jti for jti, expires_at in cls._jtis.items() if expires_at and expires_at <= now]
+            for jti in expired:
+                del cls._jtis[jti]
+
+    @classmethod
+    def is_revoked(cls, jti):
+        if not cls._loaded:
+            cls.load()
+        elif time.monotonic() - cls._checked_at >= TOKEN_REVOCATION_SYNC_SECONDS:
+            cls._checked_at = time.monotonic()
+            try:
+                cls.sync()
+            except Exception as e:
+                # Sin base se sigue con el índice local
+                logger.error(f" Error sincronizando índice de revocación: {str(e)}")
+        return jti in cls._jtis
+
+
 class TokenManager:
+
+    # Resultado de las últimas limpiezas, expuesto en las métricas
+    cleanup_stats = {
+        'runs': 0,
+        'last_run_at': None,
+        'last_duration_ms': None,
+        'last_deleted': {'active_tokens': 0, 'blacklist': 0},
+        'total_deleted': {'active_tokens': 0, 'blacklist': 0},
+        'last_error': None
+    }
     
     @staticmethod
     def get_active_session(usuario_id):
+        """Sesión vigente del usuario; las vencidas se ignoran hasta que las borre la limpieza"""
         try:
-            session = ActiveToken.query.filter_by(usuario_id=usuario_id).first()
+            session = ActiveToken.query.filter(
+                ActiveToken.usuario_id == usuario_id,
+                ActiveToken.expires_at > datetime.now(timezone.utc)
+            ).first()
             if session:
                 logger.info(f" Sesión activa encontrada para usuario {usuario_id}: JTI={session.jti}, Expira={session.expires_at}")
             else:
@@ -29,7 +173,8 @@ class TokenManager:
         try:
             logger.info(f" TERMINATE_SESSION llamado para usuario: {usuario_id}")
             
-            active_session = TokenManager.get_active_session(usuario_id)
+            # Incluye sesiones vencidas: la fila ocupa la PK usuario_id
+            active_session = ActiveToken.query.filter_by(usuario_id=usuario_id).first()
 
             if not active_session:
                 logger.info(f" No se encontró sesión activa para usuario {usuario_id}")
@@ -44,6 +189,8 @@ class TokenManager:
             
             if already_blacklisted:
                 logger.info(f" JTI {active_session.jti} ya está en blacklist")
+            elif _as_utc(active_session.expires_at) <= datetime.now(timezone.utc):
+                logger.info(f" JTI {active_session.jti} ya expiró, no hace falta revocarlo")
             else:
                 
                 token_for_blacklist = TokensBlacklist(
@@ -55,8 +202,11 @@ class TokenManager:
                 logger.info(f" Token {active_session.jti} movido a blacklist")
 
            
+            revoked_jti = active_session.jti
+            revoked_expires_at = active_session.expires_at
             db.session.delete(active_session)
             db.session.commit()
+            RevokedTokenIndex.add(revoked_jti, revoked_expires_at)
             
             logger.info(f" Sesión terminada exitosamente para usuario {usuario_id}")
             return True
@@ -92,6 +242,81 @@ class TokenManager:
             logger.error(f" ERROR en add_active_session: {str(e)}")
             return False
 
+    @staticmethod
+    def open_session(usuario_id, jti, expires_at):
+        """
+        Login en una sola transacción, empezando por el INSERT de la sesión:
+        si ya hay una fila del usuario, el índice único lo detecta (un
+        SELECT ... FOR UPDATE sobre una fila inexistente en MySQL solo toma
+        un gap lock y dos logins podían pasar a la vez). Una sesión vencida
+        se reemplaza con un UPDATE condicional; una vigente rechaza el
+        login. En ambos casos se hace commit, así que los cambios previos de
+        la sesión (el re-hash de check_password) se guardan igual.
+        Devuelve True si la sesión quedó abierta.
+        """
+        try:
+            now = datetime.now(timezone.utc)
+            values = {
+                'usuario_id': usuario_id,
+                'jti': jti,
+                'created_at': now,
+                'updated_at': None,
+                'expires_at': expires_at
+            }
+
+            if not TokenManager._insert_session(values):
+                # Ya había sesión: se toma solo si venció (su token ya no es
+                # válido y no hace falta revocarlo)
+                taken = ActiveToken.query.filter(
+                    ActiveToken.usuario_id == usuario_id,
+                    ActiveToken.expires_at <= now
+                ).update(
+                    {k: v for k, v in values.items() if k != 'usuario_id'},
+                    synchronize_session=False
+                )
+                if not taken:
+                    db.session.commit()
+                    logger.info(f" Usuario {usuario_id} ya tiene sesión activa")
+                    return False
+
+            db.session.commit()
+            logger.info(f" Nueva sesión activa para usuario {usuario_id}")
+            return True
+
+        except OperationalError as e:
+            db.session.rollback()
+            # Dos logins del mismo usuario sobre una sesión vencida: el que
+            # pierde el bloqueo es el segundo y se rechaza como tal
+            if getattr(getattr(e, 'orig', None), 'args', [None])[0] in LOCK_ERROR_CODES:
+                logger.info(f" Login concurrente del usuario {usuario_id} rechazado: {str(e)}")
+                return False
+            logger.error(f" ERROR en open_session: {str(e)}")
+            raise
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f" ERROR en open_session: {str(e)}")
+            raise
+
+    @staticmethod
+    def _insert_session(values):
+        """INSERT de la sesión; False si el usuario ya tenía una fila (sin commit)"""
+        dialect = db.session.get_bind().dialect.name
+
+        if dialect == 'mysql':
+            stmt = mysql_insert(ActiveToken.__table__).values(**values).prefix_with('IGNORE')
+            return db.session.execute(stmt).rowcount == 1
+        if dialect == 'sqlite':
+            stmt = sqlite_insert(ActiveToken.__table__).values(**values)
+            stmt = stmt.on_conflict_do_nothing(index_elements=['usuario_id'])
+            return db.session.execute(stmt).rowcount == 1
+
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(ActiveToken.__table__).values(**values))
+            return True
+        except IntegrityError:
+            return False
+
     @staticmethod
     def is_token_revoked(jti):
         """Verifica si un token está en la lista negra"""
@@ -99,9 +324,8 @@ class TokenManager:
             if not jti:
                 return True
                 
-            blacklisted = TokensBlacklist.query.filter_by(jti=jti).first()
-            
-            if blacklisted:
+            # Índice en memoria: sin consulta a la base en cada request
+            if RevokedTokenIndex.is_revoked(jti):
                 logger.info(f" Token {jti} está revocado")
                 return True
                 
@@ -112,55 +336,79 @@ class TokenManager:
             return True  
 
     @staticmethod
-    def cleanup_expired_tokens():
-        """Limpia tokens expirados - MÁS AGRESIVO EN DESARROLLO"""
+    def cleanup_expired_tokens(batch_size=None):
+        """
+        Borra en lotes los tokens vencidos de active_tokens y tokens_blacklist.
+        Lo corre el programador de tareas (y el comando 'flask limpiar-tokens'),
+        no el login. Cada lote es una transacción corta para no bloquear las tablas.
+        """
+        batch_size = batch_size or TOKEN_CLEANUP_BATCH_SIZE
+        started = time.monotonic()
+        stats = TokenManager.cleanup_stats
         try:
             current_time = datetime.now(timezone.utc)
             logger.info(f" Limpiando tokens expirados a las {current_time}")
-            
-            
-            expired_active = ActiveToken.query.filter(
-                ActiveToken.expires_at < current_time
-            ).delete()
-            
-            
+
+            active_filter = ActiveToken.expires_at < current_time
             if os.getenv('FLASK_ENV') == 'development' or os.getenv('FLASK_DEBUG') == '1':
+                # Desarrollo: también sesiones de más de un día
                 one_day_ago = current_time - timedelta(days=1)
-                old_active = ActiveToken.query.filter(
-                    ActiveToken.created_at < one_day_ago
-                ).delete()
-                logger.info(f" Desarrollo: {old_active} tokens antiguos eliminados")
-            
-          
-            expired_blacklist = TokensBlacklist.query.filter(
-                TokensBlacklist.expires_at < current_time
-            ).delete()
-            
-            db.session.commit()
-            
+                active_filter = active_filter | (ActiveToken.created_at < one_day_ago)
+
+            expired_active = TokenManager._delete_in_batches(
+                ActiveToken, ActiveToken.usuario_id, active_filter, batch_size
+            )
+            expired_blacklist = TokenManager._delete_in_batches(
+                TokensBlacklist, TokensBlacklist.id, TokensBlacklist.expires_at < current_time, batch_size
+            )
+
+            stats['runs'] += 1
+            stats['last_run_at'] = current_time.isoformat()
+            stats['last_duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+            stats['last_deleted'] = {'active_tokens': expired_active, 'blacklist': expired_blacklist}
+            stats['total_deleted']['active_tokens'] += expired_active
+            stats['total_deleted']['blacklist'] += expired_blacklist
+            stats['last_error'] = None
+
             logger.info(f" Limpieza: {expired_active} tokens activos y {expired_blacklist} tokens blacklist expirados eliminados")
             return True
             
         except Exception as e:
             db.session.rollback()
+            stats['last_error'] = str(e)
             logger.error(f" Error en cleanup de tokens: {str(e)}")
             return False
 
+    @staticmethod
+    def _delete_in_batches(model, pk_column, condition, batch_size):
+        """DELETE por lotes de PK, con commit por lote. Devuelve la cantidad borrada"""
+        total = 0
+        while True:
+            ids = [row[0] for row in db.session.query(pk_column).filter(condition).limit(batch_size).all()]
+            if not ids:
+                return total
+            model.query.filter(pk_column.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            total += len(ids)
+            if len(ids) < batch_size:
+                return total
+
     @staticmethod
     def get_active_users_metrics():
         try:
-            TokenManager.cleanup_expired_tokens()
-
             from models.usuario import Usuario
             
-            active_sessions = ActiveToken.query.all()
+            # Solo lectura: las sesiones vencidas las borra la limpieza periódica
+            now = datetime.now(timezone.utc)
+            active_sessions = ActiveToken.query.filter(ActiveToken.expires_at > now).all()
             active_user_ids = [session.usuario_id for session in active_sessions]
             
             if not active_user_ids:
                 return {
                     'total_active': 0,
                     'active_users': [],
-                    'by_role': {'admin': 0, 'artesano': 0}
+                    'by_role': {'admin': 0, 'artesano': 0},
+                    'token_cleanup': TokenManager.cleanup_stats
                 }
 
             active_users = Usuario.query.filter(Usuario.usuario_id.in_(active_user_ids)).all()
@@ -177,7 +425,7 @@ class TokenManager:
                 active_session = next((s for s in active_sessions if s.usuario_id == user.usuario_id), None)
                 
                 if active_session:
-                    inactive_seconds = (datetime.now(timezone.utc) - active_session.created_at).total_seconds()
+                    inactive_seconds = (now - _as_utc(active_session.created_at)).total_seconds()
                     
                     active_users_list.append({
                         'user_id': user.usuario_id,
@@ -195,7 +443,8 @@ class TokenManager:
                 'by_role': {
                     'admin': admin_count,
                     'artesano': artesano_count
-                }
+                },
+                'token_cleanup': TokenManager.cleanup_stats
             }
             
         except Exception as e:
@@ -206,8 +455,7 @@ class TokenManager:
     def can_user_login(usuario_id):
         """Verifica si un usuario puede hacer login (no tiene sesión activa)"""
         try:
-            TokenManager.cleanup_expired_tokens()
-            
+            # Sin limpieza acá: get_active_session ya ignora las sesiones vencidas
             active_session = TokenManager.get_active_session(usuario_id)
             
             if active_session:
@@ -238,7 +486,7 @@ class TokenManager:
                     'jti': session.jti,
                     'created_at': session.created_at.isoformat(),
                     'expires_at': session.expires_at.isoformat(),
-                    'is_expired': session.expires_at < datetime.now(timezone.utc)
+                    'is_expired': _as_utc(session.expires_at) < datetime.now(timezone.utc)
                 })
             
             return result
@@ -258,6 +506,7 @@ class TokenManager:
             TokensBlacklist.query.delete()
             
             db.session.commit()
+            RevokedTokenIndex.clear()
             
             logger.info(f" RESET NUCLEAR: {count_before} sesiones eliminadas")
             return count_before
@@ -0,0 +1,276 @@
+# utils/webhook_inbox.py
+from models.base import db
+from models.pago import Pago
+from models.webhook_evento import (
+    WebhookEvento, WEBHOOK_PENDIENTE, WEBHOOK_PROCESANDO, WEBHOOK_PROCESADO, WEBHOOK_ERROR
+)
+from utils.aprobacion_pagos import ServicioAprobacionPagos
+from utils.mercadopago_cliente import obtener_cliente_mp, ErrorMercadoPago
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import json
+import os
+import random
+import threading
+import traceback
+
+# Threads que procesan la bandeja (0 = no se procesa en este proceso)
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '2'))
+
+# Reintentos con espera exponencial: base * 2^(intento-1), con tope
+WEBHOOK_MAX_INTENTOS = int(os.getenv('WEBHOOK_MAX_INTENTOS', '8'))
+WEBHOOK_BACKOFF_BASE_SEGUNDOS = float(os.getenv('WEBHOOK_BACKOFF_BASE_SEGUNDOS', '2'))
+WEBHOOK_BACKOFF_MAX_SEGUNDOS = 600
+
+# Si un worker muere procesando, otro retoma el evento pasado este tiempo
+WEBHOOK_BLOQUEO_SEGUNDOS = 120
+
+# Espera máxima de un worker sin eventos (registrar() lo despierta antes)
+WEBHOOK_POLL_SEGUNDOS = 5
+
+# Días que se conservan los eventos ya procesados
+WEBHOOK_RETENCION_DIAS = int(os.getenv('WEBHOOK_RETENCION_DIAS', '30'))
+WEBHOOK_LIMPIEZA_SEGUNDOS = 3600
+
+REGISTRO_NUEVO = 'nuevo'
+REGISTRO_REACTIVADO = 'reactivado'
+REGISTRO_DUPLICADO = 'duplicado'
+
+
+class WebhookInbox:
+    """
+    Bandeja durable de notificaciones de MercadoPago. El endpoint solo
+    guarda el evento (un INSERT) y responde; un pool de threads lo aplica
+    después, con reintentos y espera exponencial si MP o la base fallan.
+    Hay una fila por (tipo, payment_id): los reintentos de MP y las
+    entregas repetidas traen el mismo cuerpo y no agregan trabajo. Una
+    notificación distinta del mismo pago (MP avisa así los cambios de
+    estado) vuelve a encolar el evento.
+    """
+
+    _aviso = threading.Event()
+    _detener = threading.Event()
+    _threads = []
+
+    @staticmethod
+    def extraer(data):
+        """(tipo, payment_id) de la notificación, o (tipo, None) si no trae pago"""
+        tipo = data.get("type") or data.get("topic") or "payment"
+        payment_id = None
+        if data.get("type") == "payment":
+            payment_id = (data.get("data") or {}).get("id")
+        elif "id" in data:
+            payment_id = data.get("id")
+        return tipo, str(payment_id) if payment_id else None
+
+    @staticmethod
+    def serializar(data):
+        """Cuerpo normalizado: dos entregas de la misma notificación dan el mismo texto"""
+        return json.dumps(data, sort_keys=True, default=str)
+
+    @classmethod
+    def registrar(cls, tipo, payment_id, payload):
+        """
+        Guarda el evento (con commit) y devuelve REGISTRO_NUEVO,
+        REGISTRO_REACTIVADO (notificación nueva de un pago ya visto) o
+        REGISTRO_DUPLICADO (misma notificación otra vez).
+        """
+        ahora = datetime.utcnow()
+        try:
+            db.session.add(WebhookEvento(
+                tipo=tipo,
+                payment_id=payment_id,
+                payload=payload,
+                estado=WEBHOOK_PENDIENTE,
+                intentos=0,
+                proximo_intento=ahora
+            ))
+            db.session.commit()
+            resultado = REGISTRO_NUEVO
+        except IntegrityError:
+            db.session.rollback()
+            # Ya estaba: se vuelve a encolar solo si es otra notificación
+            # y no quedó pendiente (el pendiente va a leer el estado actual)
+            reactivados = WebhookEvento.query.filter(
+                WebhookEvento.tipo == tipo,
+                WebhookEvento.payment_id == payment_id,
+                WebhookEvento.estado != WEBHOOK_PENDIENTE,
+                db.or_(WebhookEvento.payload.is_(None), WebhookEvento.payload != payload)
+            ).update({
+                WebhookEvento.estado: WEBHOOK_PENDIENTE,
+                WebhookEvento.intentos: 0,
+                WebhookEvento.proximo_intento: ahora,
+                WebhookEvento.payload: payload,
+            }, synchronize_session=False)
+            db.session.commit()
+            resultado = REGISTRO_REACTIVADO if reactivados else REGISTRO_DUPLICADO
+
+        if resultado != REGISTRO_DUPLICADO:
+            cls._aviso.set()
+        return resultado
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+    @classmethod
+    def iniciar(cls, app):
+        if WEBHOOK_WORKERS <= 0:
+            print("Procesamiento de webhooks desactivado (WEBHOOK_WORKERS=0)")
+            return
+        if any(thread.is_alive() for thread in cls._threads):
+            return
+
+        cls._detener.clear()
+        cls._threads = [
+            threading.Thread(target=cls._bucle, args=(app,), name=f'webhooks-{i}', daemon=True)
+            for i in range(WEBHOOK_WORKERS)
+        ]
+        for thread in cls._threads:
+            thread.start()
+        print(f"Bandeja de webhooks iniciada con {WEBHOOK_WORKERS} workers")
+
+    @classmethod
+    def detener(cls):
+        cls._detener.set()
+        cls._aviso.set()
+
+    @classmethod
+    def _bucle(cls, app):
+        while not cls._detener.is_set():
+            with app.app_context():
+                try:
+                    procesado = cls.procesar_siguiente()
+                except Exception as e:
+                    db.session.rollback()
+                    procesado = False
+                    print(f"Error en el worker de webhooks: {str(e)}")
+                    traceback.print_exc()
+                finally:
+                    db.session.remove()
+
+            if not procesado:
+                cls._aviso.wait(WEBHOOK_POLL_SEGUNDOS)
+                cls._aviso.clear()
+
+    @classmethod
+    def procesar_siguiente(cls):
+        """Toma y aplica un evento listo. False si no había ninguno"""
+        evento = cls._tomar()
+        if evento is None:
+            return False
+
+        try:
+            detalle = cls.aplicar_pago(evento.payment_id)
+        except Exception as e:
+            db.session.rollback()
+            cls._fallar(evento, e)
+        else:
+            print(f"Webhook {evento.tipo}:{evento.payment_id} procesado: {detalle}")
+            cls._finalizar(evento, WEBHOOK_PROCESADO, None)
+        return True
+
+    @staticmethod
+    def _tomar():
+        """
+        Marca como 'procesando' el evento listo más antiguo con un UPDATE
+        condicional: si otro worker lo tomó primero no se modifica ninguna
+        fila. También retoma eventos cuyo bloqueo venció.
+        """
+        ahora = datetime.utcnow()
+        while True:
+            candidato = db.session.query(WebhookEvento.evento_id, WebhookEvento.estado).filter(
+                WebhookEvento.estado.in_([WEBHOOK_PENDIENTE, WEBHOOK_PROCESANDO]),
+                WebhookEvento.proximo_intento <= ahora
+            ).order_by(WebhookEvento.proximo_intento, WebhookEvento.evento_id).first()
+            if candidato is None:
+                db.session.commit()
+                return None
+
+            tomados = WebhookEvento.query.filter(
+                WebhookEvento.evento_id == candidato.evento_id,
+                WebhookEvento.estado == candidato.estado,
+                WebhookEvento.proximo_intento <= ahora
+            ).update({
+                WebhookEvento.estado: WEBHOOK_PROCESANDO,
+                WebhookEvento.intentos: WebhookEvento.intentos + 1,
+                WebhookEvento.proximo_intento: ahora + timedelta(seconds=WEBHOOK_BLOQUEO_SEGUNDOS),
+            }, synchronize_session=False)
+            db.session.commit()
+            if tomados:
+                return WebhookEvento.query.get(candidato.evento_id)
+
+    @staticmethod
+    def _finalizar(evento, estado, error, proximo_intento=None):
+        # Si mientras se procesaba llegó otra notificación, el evento volvió
+        # a 'pendiente' y no se pisa: se procesa de nuevo
+        WebhookEvento.query.filter(
+            WebhookEvento.evento_id == evento.evento_id,
+            WebhookEvento.estado == WEBHOOK_PROCESANDO
+        ).update({
+            WebhookEvento.estado: estado,
+            WebhookEvento.ultimo_error: error,
+            WebhookEvento.proximo_intento: proximo_intento or datetime.utcnow(),
+            WebhookEvento.fecha_procesado: datetime.utcnow() if estado == WEBHOOK_PROCESADO else None,
+        }, synchronize_session=False)
+        db.session.commit()
+
+    @classmethod
+    def _fallar(cls, evento, error):
+        if evento.intentos >= WEBHOOK_MAX_INTENTOS:
+            print(f"Webhook {evento.tipo}:{evento.payment_id} descartado tras {evento.intentos} intentos: {error}")
+            cls._finalizar(evento, WEBHOOK_ERROR, str(error))
+            return
+
+        espera = min(
+            WEBHOOK_BACKOFF_BASE_SEGUNDOS * 2 ** (evento.intentos - 1), WEBHOOK_BACKOFF_MAX_SEGUNDOS
+        ) * random.uniform(0.8, 1.2)
+        print(f"Webhook {evento.tipo}:{evento.payment_id} falló (intento {evento.intentos}), "
+              f"reintento en {espera:.0f}s: {error}")
+        cls._finalizar(
+            evento, WEBHOOK_PENDIENTE, str(error), datetime.utcnow() + timedelta(seconds=espera)
+        )
+
+    @staticmethod
+    def purgar():
+        """Borra los eventos procesados hace más de WEBHOOK_RETENCION_DIAS"""
+        limite = datetime.utcnow() - timedelta(days=WEBHOOK_RETENCION_DIAS)
+        borrados = WebhookEvento.query.filter(
+            WebhookEvento.estado == WEBHOOK_PROCESADO,
+            WebhookEvento.fecha_procesado < limite
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        if borrados:
+            print(f"Eventos de webhook purgados: {borrados}")
+        return borrados
+
+    # ------------------------------------------------------------------
+    # Aplicación del pago
+    # ------------------------------------------------------------------
+    @staticmethod
+    def aplicar_pago(payment_id):
+        """
+        Consulta el pago en MercadoPago y le aplica el estado con
+        ServicioAprobacionPagos. Devuelve un detalle para el log; lanza
+        excepción si hay que reintentar.
+        """
+        cliente = obtener_cliente_mp()
+        if cliente is None:
+            raise ErrorMercadoPago('MercadoPago no configurado')
+
+        payment_data = cliente.obtener_pago(payment_id)
+        if payment_data is None:
+            return f'MercadoPago no conoce el pago {payment_id}'
+
+        preference_id = payment_data.get("preference_id")
+        if not preference_id:
+            return 'El pago no tiene preference_id'
+
+        pago = Pago.query.filter_by(preference_id=preference_id).first()
+        if not pago:
+            return f'Pago no encontrado para preference_id {preference_id}'
+
+        status = payment_data.get("status")
+        resultado = ServicioAprobacionPagos.aplicar_estado(pago, status, payment_id)
+        if resultado.ignorado:
+            return f'Pago {payment_id}: se ignora el estado {status}'
+        return f'Pago {payment_id}: {status}'